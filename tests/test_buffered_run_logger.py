@@ -0,0 +1,115 @@
+from threading import Event
+
+import test_base
+from xtlib.storage import buffered_run_logger
+from xtlib.storage.buffered_run_logger import BufferedRunLogger
+
+class FakeStore():
+    ''' records the batched writes of the logger (Store.log_run_events); can hold a write until released '''
+    def __init__(self, hold=False, fail=False):
+        self.batches = []
+        self.fail = fail
+        self.writing = Event()
+        self.released = Event()
+        if not hold:
+            self.released.set()
+
+    def log_run_events(self, ws_name, run_name, records, updates=None, is_aml=False):
+        self.writing.set()
+        self.released.wait()
+
+        if self.fail:
+            raise IOError("injected failure")
+
+        self.batches.append((ws_name, run_name, list(records), dict(updates or {})))
+
+class FakeAtexit():
+    def __init__(self):
+        self.funcs = []
+
+    def register(self, func):
+        self.funcs.append(func)
+
+    def unregister(self, func):
+        self.funcs.remove(func)
+
+class TestBufferedRunLogger(test_base.TestBase):
+    '''
+    buffered run logging: records are queued, written in batches by a background thread, and flushed at close/exit.
+    '''
+    def setup_method(self, method):
+        self.atexit = buffered_run_logger.atexit
+        buffered_run_logger.atexit = FakeAtexit()
+
+    def teardown_method(self, method):
+        buffered_run_logger.atexit = self.atexit
+
+    def make_records(self, count):
+        return [{"time": str(i), "event": "metrics", "data": {"step": i}} for i in range(count)]
+
+    def test_batched_writes(self):
+        store = FakeStore()
+        logger = BufferedRunLogger(store, "ws1", "run1", max_records=10, max_ms=60000)
+
+        records = self.make_records(25)
+        for record in records:
+            self.assertTrue(logger.log_record(record))
+        logger.update_run_props({"metric_names": ["step"]})
+        logger.close()
+
+        # records are written in order, at most max_records per write; run props ride along with a batch
+        written = [record for ws_name, run_name, batch, updates in store.batches for record in batch]
+        self.assertTrue(written == records)
+        self.assertTrue(all(len(batch) <= 10 for ws_name, run_name, batch, updates in store.batches))
+        self.assertTrue(len(store.batches) <= 4)
+        self.assertTrue([updates for ws_name, run_name, batch, updates in store.batches if updates] == [{"metric_names": ["step"]}])
+
+        counters = logger.get_counters()
+        self.assertTrue(counters["queued"] == 25 and counters["flushed"] == 25 and counters["dropped"] == 0)
+        self.assertTrue(counters["pending"] == 0)
+
+    def test_full_queue_drops_records(self):
+        store = FakeStore(hold=True)
+        logger = BufferedRunLogger(store, "ws1", "run1", max_records=1, queue_size=5)
+
+        # the first record is being written (and held), so the others wait in the queue
+        logger.log_record(self.make_records(1)[0])
+        self.assertTrue(store.writing.wait(10))
+
+        results = [logger.log_record(record) for record in self.make_records(10)]
+        self.assertTrue(results == [True]*5 + [False]*5)
+
+        store.released.set()
+        logger.close()
+
+        counters = logger.get_counters()
+        self.assertTrue(counters["flushed"] == 6 and counters["dropped"] == 5)
+
+    def test_close_and_exit(self):
+        store = FakeStore()
+        logger = BufferedRunLogger(store, "ws1", "run1", max_ms=60000)
+        self.assertTrue(buffered_run_logger.atexit.funcs == [logger.close])
+
+        for record in self.make_records(3):
+            logger.log_record(record)
+
+        # a normal process exit flushes the queued records
+        buffered_run_logger.atexit.funcs[0]()
+        self.assertTrue(len(store.batches) == 1 and len(store.batches[0][2]) == 3)
+        self.assertTrue(buffered_run_logger.atexit.funcs == [])
+
+        # records logged after close are dropped; close can be called again
+        self.assertTrue(not logger.log_record(self.make_records(1)[0]))
+        logger.close()
+        self.assertTrue(logger.get_counters()["dropped"] == 1 and len(store.batches) == 1)
+
+    def test_write_errors_are_counted(self):
+        store = FakeStore(fail=True)
+        logger = BufferedRunLogger(store, "ws1", "run1", max_ms=60000)
+
+        for record in self.make_records(4):
+            logger.log_record(record)
+        logger.close()
+
+        counters = logger.get_counters()
+        self.assertTrue(counters["errors"] == 1 and counters["dropped"] == 4 and counters["flushed"] == 0)
@@ -0,0 +1,152 @@
+import test_base
+from xtlib.storage.store import Store
+from xtlib.storage.mongo_db import MongoDB
+
+class FakeCounters():
+    ''' the ws_counters collection, with the pymongo methods used to allocate ids '''
+    def __init__(self):
+        self.docs = {}
+        self.updates = 0
+
+    def find(self, fd):
+        return FakeCursor([self.docs[fd["_id"]]] if fd["_id"] in self.docs else [])
+
+    def insert_one(self, doc):
+        self.docs[doc["_id"]] = dict(doc)
+
+    def find_and_modify(self, fd, update, new):
+        doc = self.docs[fd["_id"]]
+        before = dict(doc)
+        self.updates += 1
+
+        for key, value in update["$inc"].items():
+            doc[key] = doc.get(key, 0) + value
+
+        return doc if new else before
+
+class FakeCursor(list):
+    def limit(self, count):
+        return FakeCursor(self[:count])
+
+    def count(self):
+        return len(self)
+
+class FakeRunCollection():
+    ''' the run documents of a workspace, with the pymongo methods used to create and update runs in bulk '''
+    def __init__(self):
+        self.docs = {}
+        self.requests = []
+
+    def insert_many(self, docs, ordered=True):
+        self.requests.append("insert_many")
+        for doc in docs:
+            if not doc["_id"] in self.docs:
+                self.docs[doc["_id"]] = doc
+
+    def bulk_write(self, requests, ordered=True):
+        self.requests.append("bulk_write")
+
+        for request in requests:
+            doc = self.docs.setdefault(request._filter["_id"], {"_id": request._filter["_id"]})
+            doc.update(request._doc.get("$set", {}))
+
+            for key, value in request._doc.get("$push", {}).items():
+                doc.setdefault(key, []).extend(value["$each"])
+
+    def find(self, fd, fields):
+        self.requests.append("find")
+        return [{"_id": doc_id} for doc_id in fd["_id"]["$in"] if doc_id in self.docs]
+
+class FakeDatabase(dict):
+    ''' the workspace collections (by name) and the ws_counters collection '''
+    def __init__(self):
+        super().__init__()
+        self.ws_counters = FakeCounters()
+
+    def __missing__(self, ws_name):
+        return self.setdefault(ws_name, FakeRunCollection())
+
+class FakeMongoDB(MongoDB):
+    ''' MongoDB with in-memory collections (no connection to mongo-db) '''
+    def __init__(self):
+        self.mongo_db = FakeDatabase()
+        self.run_times = {}
+        self.names = []
+
+    def mongo_with_retries(self, name, mongo_cmd, ignore_error=False):
+        self.names.append(name)
+        return mongo_cmd()
+
+class FakeHelper():
+    ''' the workspace methods of StoreBlobObjs used to reserve run names '''
+    def get_legacy_next_run_id(self, ws_name):
+        return None
+
+class TestBulkRuns(test_base.TestBase):
+    '''
+    creating the runs of a multi-node job in bulk: a block of run ids is reserved with one counter update, the run
+    documents are inserted with one request, and an event is logged to all runs with one bulk_write.
+    '''
+    def setup_method(self, method):
+        self.mongo = FakeMongoDB()
+        self.runs = self.mongo.mongo_db["ws1"]
+        self.counters = self.mongo.mongo_db.ws_counters
+
+    def make_dd(self, run_name, box_name):
+        return {"run_name": run_name, "ws": "ws1", "box_name": box_name, "create_time": "t0", "event": "created",
+            "time": "t0"}
+
+    def test_reserve_run_ids(self):
+        # a new workspace starts at 1
+        self.assertTrue(self.mongo.reserve_run_ids("ws1", 5) == [1, 2, 3, 4, 5])
+        self.assertTrue(self.mongo.reserve_run_ids("ws1", 3) == [6, 7, 8])
+        self.assertTrue(self.mongo.get_next_run_id("ws1") == 9)
+        self.assertTrue(self.counters.updates == 3)
+
+        # a legacy workspace continues from its next run id
+        self.assertTrue(self.mongo.reserve_run_ids("ws2", 2, default_next=40) == [40, 41])
+
+    def test_reserve_run_names(self):
+        store = Store.__new__(Store)
+        store.mongo = self.mongo
+        store.helper = FakeHelper()
+
+        self.assertTrue(store._reserve_run_names("ws1", 3) == ["run1", "run2", "run3"])
+
+        # a block that overlaps existing runs is skipped
+        self.runs.docs["run5"] = {"_id": "run5"}
+        self.assertTrue(store._reserve_run_names("ws1", 3) == ["run7", "run8", "run9"])
+        self.assertTrue(self.runs.requests.count("find") == 3)
+
+    def test_create_mongo_runs(self):
+        dds = [self.make_dd("run{}".format(i), "azure-batch-{}".format(i)) for i in range(1, 4)]
+        log_records_list = [[{"time": "t0", "event": "created", "data": dd},
+            {"time": "t0", "event": "status-change", "data": {"status": "queued"}}] for dd in dds]
+
+        self.mongo.create_mongo_runs("ws1", dds, log_records_list)
+
+        # one insert of the run documents, and one bulk_write of the properties set by their log records
+        self.assertTrue(self.runs.requests == ["insert_many", "bulk_write"])
+        self.assertTrue(self.mongo.names == ["create_mongo_runs", "create_mongo_runs"])
+
+        for dd, log_records in zip(dds, log_records_list):
+            doc = self.runs.docs[dd["run_name"]]
+            self.assertTrue(doc["status"] == "queued" and doc["duration"] == 0 and doc["log_records"] == log_records)
+            self.assertTrue(not "event" in doc and not "time" in doc)
+            self.assertTrue(self.mongo.run_times[("ws1", dd["run_name"])] == {"create_time": "t0"})
+
+        # existing runs are found with a single query
+        self.assertTrue(self.mongo.get_existing_run_names("ws1", ["run0", "run1", "run3", "run4"]) == ["run1", "run3"])
+
+    def test_add_runs_event(self):
+        dds = [self.make_dd("run{}".format(i), "local") for i in range(1, 4)]
+        self.mongo.create_mongo_runs("ws1", dds, [[] for dd in dds])
+
+        record = {"time": "t1", "event": "status-change", "data": {"status": "queued"}}
+        self.mongo.add_runs_event("ws1", ["run1", "run2", "run3"], record)
+
+        self.assertTrue(self.runs.requests == ["insert_many", "bulk_write"])
+
+        for dd in dds:
+            doc = self.runs.docs[dd["run_name"]]
+            self.assertTrue(doc["status"] == "queued" and doc["log_records"] == [record] and "last_time" in doc)
@@ -0,0 +1,69 @@
+import test_base
+from xtlib.storage.mongo_db import MongoDB
+
+class FakeRunCollection():
+    ''' the run documents of a workspace, with the pymongo collection methods used for child runs '''
+    def __init__(self):
+        self.docs = {}
+        self.indexes = []
+
+    def update_one(self, fd, update_doc):
+        doc = self.docs[fd["_id"]]
+
+        for key, value in update_doc.get("$inc", {}).items():
+            doc[key] = doc.get(key, 0) + value
+        doc.update(update_doc.get("$set", {}))
+
+    def find(self, fd, fields):
+        return [{"_id": doc["_id"]} for doc in self.docs.values() if all(doc.get(key) == value for key, value in fd.items())]
+
+    def create_index(self, name):
+        self.indexes.append(name)
+
+class FakeMongoDB(MongoDB):
+    ''' MongoDB with in-memory collections (no connection to mongo-db) '''
+    def __init__(self):
+        self.mongo_db = {}
+        self.parent_indexes = set()
+        self.names = []
+
+    def mongo_with_retries(self, name, mongo_cmd, ignore_error=False):
+        self.names.append(name)
+        return mongo_cmd()
+
+class TestChildRuns(test_base.TestBase):
+    '''
+    child run bookkeeping: the parent gets a constant-size update per child, and children are found by parent_name.
+    '''
+    def setup_method(self, method):
+        self.mongo = FakeMongoDB()
+        self.runs = self.mongo.mongo_db["ws1"] = FakeRunCollection()
+        self.runs.docs["run1"] = {"_id": "run1", "is_parent": True, "last_time": "t0"}
+
+    def add_child(self, child_name):
+        # as done by Store.start_child_run()
+        self.runs.docs[child_name] = {"_id": child_name, "is_child": True, "parent_name": "run1"}
+        self.mongo.add_child_run("ws1", "run1", child_name)
+
+    def test_add_child_runs(self):
+        for i in range(3):
+            self.add_child("run1.{}".format(1+i))
+
+        # the parent has a count (not a log record) per child, and a new last_time (for run caches)
+        parent = self.runs.docs["run1"]
+        self.assertTrue(parent["child_count"] == 3 and parent["last_child"] == "run1.3")
+        self.assertTrue(parent["last_time"] != "t0")
+        self.assertTrue(not "log_records" in parent)
+
+        # the parent_name index is only ensured once per workspace
+        self.assertTrue(self.runs.indexes == ["parent_name"])
+        self.assertTrue(self.mongo.names.count("add_child_run") == 3)
+
+    def test_get_child_run_names(self):
+        self.assertTrue(self.mongo.get_child_run_names("ws1", "run1") == [])
+
+        self.add_child("run1.1")
+        self.add_child("run1.2")
+        self.runs.docs["run2.1"] = {"_id": "run2.1", "is_child": True, "parent_name": "run2"}
+
+        self.assertTrue(self.mongo.get_child_run_names("ws1", "run1") == ["run1.1", "run1.2"])
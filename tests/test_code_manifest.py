@@ -0,0 +1,83 @@
+import os
+import shutil
+import tempfile
+
+import test_base
+from xtlib import capture
+from xtlib import constants
+from xtlib.helpers import code_manifest
+from xtlib.storage.store_objects import StoreBlobObjs
+
+class TestCodeManifest(test_base.TestBase):
+    '''
+    content-addressed code snapshots: only new file contents are uploaded, and nodes rebuild the tree from the manifest.
+    '''
+    def setup_method(self, method):
+        self.TEST_DIR = tempfile.mkdtemp()
+        self.WS = "manifest-test"
+        self.SOURCE_DIR = self.TEST_DIR + "/source"
+
+        storage_creds = {"provider": "store-emulator", "path": self.TEST_DIR + "/store"}
+        self.store = StoreBlobObjs(storage_creds, provider_code_path="xtlib.storage.store_emulator.EmulatorStore")
+        self.provider = self.store.provider
+        self.provider.create_container(self.WS)
+
+        self.hash_cache = code_manifest.HashCache(self.TEST_DIR + "/code_hashes.json")
+
+        for i in range(50):
+            # every 10th file is a copy of file0
+            text = "file {}\n".format(0 if i % 10 == 0 else i) * 100
+            self.write_file("pkg{}/file{}.py".format(i % 5, i), text)
+
+    def teardown_method(self, method):
+        shutil.rmtree(self.TEST_DIR)
+
+    def write_file(self, name, text):
+        fn = self.SOURCE_DIR + "/" + name
+        os.makedirs(os.path.dirname(fn), exist_ok=True)
+        with open(fn, "wt") as outfile:
+            outfile.write(text)
+
+    def upload(self):
+        filenames = []
+        for root, dirs, files in os.walk(self.SOURCE_DIR):
+            filenames += [os.path.join(root, fn) for fn in files]
+
+        self.provider.reset_request_counts()
+
+        fn_manifest = self.TEST_DIR + "/" + constants.CODE_MANIFEST_FN
+        capture.upload_code_blobs(self.store, self.WS, filenames, 1+len(self.SOURCE_DIR), fn_manifest, self.hash_cache)
+
+        return self.provider.get_request_counts().get("put_blob", 0)
+
+    def test_upload_only_new_contents(self):
+        self.assertTrue(self.upload() == 46)
+
+        # an unchanged tree uploads only the manifest (which is not a code blob)
+        self.assertTrue(self.upload() == 0)
+
+        self.write_file("pkg1/file1.py", "changed\n")
+        self.write_file("pkg1/new.py", "file 0\n" * 100)
+        self.assertTrue(self.upload() == 1)
+
+    def test_restore_from_manifest(self):
+        self.upload()
+        cache_dir = self.TEST_DIR + "/code_cache"
+
+        for run in ["run1", "run2"]:
+            dest_dir = self.TEST_DIR + "/" + run
+            os.makedirs(dest_dir)
+            shutil.copy(self.TEST_DIR + "/" + constants.CODE_MANIFEST_FN, dest_dir)
+
+            self.provider.reset_request_counts()
+            names = capture.restore_before_if_found(self.store, self.WS, dest_dir, silent=True, cache_dir=cache_dir)
+
+            # the second run finds all of its files in the blob cache
+            downloads = self.provider.get_request_counts().get("get_blob", 0)
+            self.assertTrue(downloads == (46 if run == "run1" else 0))
+
+            self.assertTrue(len(names) == 50)
+            self.assertTrue(not os.path.exists(dest_dir + "/" + constants.CODE_MANIFEST_FN))
+
+            with open(dest_dir + "/pkg0/file10.py") as infile:
+                self.assertTrue(infile.read() == "file 0\n" * 100)
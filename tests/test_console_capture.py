@@ -0,0 +1,108 @@
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+from threading import Thread
+
+import test_base
+from xtlib import utils
+from xtlib import controller
+from xtlib.run_info import RunInfo
+
+# a chatty app: per-batch progress bars (using "\r") and a summary line per epoch
+CHATTY_APP = r'''
+import sys
+for epoch in range(20):
+    for batch in range(1000):
+        sys.stdout.write("\repoch {} batch {}".format(epoch, batch))
+    sys.stdout.write("\r\nepoch {} done\n".format(epoch))
+sys.stdout.write("last line, no newline")
+'''
+
+class ExitRecorder():
+    def __init__(self):
+        self.exited = []
+
+    def exit_handler(self, run_info, called_from_thread_watcher=False):
+        run_info.close_console()
+        self.exited.append(run_info.run_name)
+
+class TestConsoleCapture(test_base.TestBase):
+    '''
+    capturing the console output of a chatty run (chunked pipe reads and a buffered console file), and feeding it to
+    attached clients.
+    '''
+    def setup_method(self, method):
+        self.TEST_DIR = tempfile.mkdtemp()
+
+    def teardown_method(self, method):
+        shutil.rmtree(self.TEST_DIR)
+
+    def make_run_info(self, run_name):
+        context = utils.dict_to_object({"repeats_remaining": None, "job_id": "job1", "exper_name": None,
+            "username": "tester", "search_style": "single"})
+
+        run_info = RunInfo(run_name, "ws1", [], None, None, context, "running", show_output=False)
+        run_info.set_console_fn(self.TEST_DIR + "/" + run_name + "/output/console.txt")
+        return run_info
+
+    def test_capture_chatty_run(self):
+        run_info = self.make_run_info("run1")
+        recorder = ExitRecorder()
+
+        process = subprocess.Popen([sys.executable, "-c", CHATTY_APP], stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            universal_newlines=True)
+
+        controller.read_from_pipe(process.stdout, run_info, recorder, True)
+        process.wait()
+
+        with open(run_info.console_fn, newline="") as infile:
+            text = infile.read()
+
+        # same text (and newline translation) as reading the pipe line by line
+        expected = subprocess.run([sys.executable, "-c", CHATTY_APP], stdout=subprocess.PIPE, universal_newlines=True).stdout
+
+        self.assertTrue(recorder.exited == ["run1"])
+        self.assertTrue(text == expected)
+        self.assertTrue("\nepoch 0 done\n" in text)
+        self.assertTrue(run_info.recent_output[-1] == "last line, no newline")
+
+    def test_slow_client(self):
+        run_info = self.make_run_info("run2")
+        received = []
+
+        def slow_callback(run_name, text):
+            time.sleep(.1)
+            received.append(text)
+
+        run_info.show_output = True
+        run_info.acallbacks.append(slow_callback)
+        run_info.callback_sender = Thread(target=run_info.send_to_callbacks, daemon=True)
+        run_info.callback_sender.start()
+
+        started = time.time()
+        for i in range(100):
+            run_info.process_run_output("line {}\n".format(i))
+
+        while len("".join(received).splitlines()) < 100 and time.time() - started < 10:
+            time.sleep(.05)
+
+        # output that arrived while the client was busy is sent in one message
+        self.assertTrue("".join(received) == "".join(["line {}\n".format(i) for i in range(100)]))
+        self.assertTrue(len(received) < 10)
+
+        # the sender thread exits when the run has ended and no clients are attached
+        sender = run_info.callback_sender
+        run_info.close_callbacks()
+        self.assertTrue(sender.is_alive())
+
+        with run_info.lock:
+            run_info.acallbacks.clear()
+        with run_info.callback_changed:
+            run_info.callback_changed.notify()
+
+        sender.join(5)
+        self.assertTrue(not sender.is_alive() and not run_info.callback_sender)
+
+        run_info.close_console()
@@ -0,0 +1,143 @@
+import os
+import sys
+import time
+import pytest
+import subprocess
+from threading import Thread, Lock
+
+import test_base
+from xtlib import controller
+from xtlib.helpers.bag import Bag
+
+class QueueController(controller.XTController):
+    '''
+    the controller's queue processing, with runs that are a trivial script (no store, rundirs, or run wrapup).
+    '''
+    def __init__(self, concurrent, exit_runs=True):
+        # don't call XTController.__init__ (no rpyc service, stdout capture, or MRC file here)
+        self.concurrent = concurrent
+        self.exit_runs = exit_runs
+        self.runs = {}
+        self.queue = []
+        self.queue_signalled = False
+        self.tombstones = []
+        self.started_runs = []
+        self.start_times = []
+        self.lock = Lock()
+
+    def on_idle(self):
+        pass
+
+    def process_queue_entry(self, run_info):
+        with self.lock:
+            self.started_runs.append(run_info.run_name)
+            self.start_times.append(time.time())
+
+        if not self.exit_runs:
+            return
+
+        process = subprocess.Popen([sys.executable, "-c", "pass"])
+        Thread(target=self.wait_for_exit, args=(run_info, process), daemon=True).start()
+
+    def wait_for_exit(self, run_info, process):
+        process.wait()
+        run_info.status = "completed"
+
+        # as done by exit_handler()
+        self.signal_queue()
+
+    def queue_run(self, run_name, priority=controller.PRIORITY_NORMAL):
+        run_info = Bag()
+        run_info.run_name = run_name
+        run_info.workspace = "ws1"
+        run_info.status = "queued"
+        run_info.priority = priority
+        run_info.run_as_parent = False
+        run_info.parent_prep_needed = False
+        run_info.context = None
+
+        self.add_to_runs(run_info)
+
+        with controller.queue_lock:
+            self.add_to_queue(run_info)
+
+class TestControllerQueue(test_base.TestBase):
+    '''
+    starting queued runs: runs are started when signalled (not once per poll), filling all free slots.
+    '''
+    def test_priority_order(self):
+        ctr = QueueController(concurrent=1)
+
+        ctr.queue_run("run1")
+        ctr.queue_run("run2")
+        ctr.queue_run("run3", controller.PRIORITY_RESUMED)
+        ctr.queue_run("run4")
+        ctr.queue_run("run5", controller.PRIORITY_RESUMED)
+
+        names = [run_info.run_name for run_info in ctr.queue]
+        self.assertTrue(names == ["run3", "run5", "run1", "run2", "run4"])
+
+    def test_free_slots_filled_per_check(self):
+        ctr = QueueController(concurrent=4, exit_runs=False)
+
+        for i in range(10):
+            ctr.queue_run("run{}".format(i))
+
+        # a single check starts a run for each free slot (not one run per poll)
+        ctr.queue_check()
+        self.assertTrue(ctr.started_runs == ["run0", "run1", "run2", "run3"])
+
+        ctr.queue_check()
+        self.assertTrue(len(ctr.started_runs) == 4)
+
+        # two runs end
+        ctr.runs["ws1/run0"].status = "completed"
+        ctr.runs["ws1/run2"].status = "completed"
+        ctr.queue_check()
+        self.assertTrue(ctr.started_runs[4:] == ["run4", "run5"])
+
+    def test_runs_started_when_signalled(self):
+        runs = 32
+        ctr = QueueController(concurrent=8)
+
+        # with no polling, runs are only started when the queue is signalled (as runs are queued and exit)
+        poll_secs = controller.QUEUE_POLL_SECS
+        controller.QUEUE_POLL_SECS = None
+
+        try:
+            Thread(target=ctr.bg_queue_worker, daemon=True).start()
+
+            started = time.time()
+            for i in range(runs):
+                ctr.queue_run("run{}".format(i))
+
+            while len(ctr.started_runs) < runs and time.time() - started < 60:
+                time.sleep(.01)
+        finally:
+            controller.QUEUE_POLL_SECS = poll_secs
+
+        self.assertTrue(sorted(ctr.started_runs) == sorted(["run{}".format(i) for i in range(runs)]))
+
+    @pytest.mark.benchmark
+    @pytest.mark.skipif(os.environ.get("XT_BENCHMARKS", "false").lower() != "true", reason="Skip benchmarks unless explicitly called")
+    def test_runs_started_per_second(self):
+        runs = 64
+        ctr = QueueController(concurrent=16)
+
+        Thread(target=ctr.bg_queue_worker, daemon=True).start()
+
+        started = time.time()
+        for i in range(runs):
+            ctr.queue_run("run{}".format(i))
+
+        while len(ctr.start_times) < runs and time.time() - started < 60:
+            time.sleep(.01)
+
+        elapsed = max(ctr.start_times) - started
+        rate = runs / elapsed
+
+        print("started {} trivial runs (concurrent=16) in {:.2f} secs: {:.1f} runs/sec".format(runs, elapsed, rate))
+
+        # polling once per second (starting 1 run per poll) would be 1 run/sec
+        self.assertTrue(len(ctr.start_times) == runs)
+        self.assertTrue(rate > 5)
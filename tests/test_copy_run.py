@@ -0,0 +1,101 @@
+import shutil
+import tempfile
+
+import test_base
+from xtlib import constants
+from xtlib.storage.store_file import FileStore
+from xtlib.storage.store_objects import StoreBlobObjs
+from xtlib.storage.store_interface import COPY_PENDING
+
+class PendingCopyFileStore(FileStore):
+    ''' a provider written before get_copy_statuses was added (it is optional; see store_interface.py) '''
+    get_copy_statuses = None
+
+    def copy_blob(self, source_container, source_blob_path, dest_container, dest_blob_path):
+        super().copy_blob(source_container, source_blob_path, dest_container, dest_blob_path)
+        return COPY_PENDING
+
+class TestCopyRunFileStorage(test_base.TestBase):
+    '''
+    copying a run (concurrent blob copies).
+    '''
+    def setup_class(cls):
+        """
+        Setup once for all tests
+        """
+        cls.TEST_DIR = tempfile.mkdtemp()
+        cls.WS = "copy-test"
+        cls.FILES = 200
+
+        storage_creds = {"provider": "store-file", "path": cls.TEST_DIR}
+        cls.store = StoreBlobObjs(storage_creds, provider_code_path="xtlib.storage.store_file.FileStore")
+        cls.provider = cls.store.provider
+
+        cls.provider.create_container(cls.WS)
+
+        cls.provider.create_blob(cls.WS, cls.run_blob(cls, "run1", constants.RUN_LOG), '{"event": "created"}\n')
+        for i in range(cls.FILES):
+            cls.provider.create_blob(cls.WS, cls.run_blob(cls, "run1", "output/checkpoint{}.txt".format(i)), "x"*i)
+
+    def teardown_class(cls):
+        """
+        Teardown once after all tests
+        """
+        shutil.rmtree(cls.TEST_DIR)
+
+    def run_blob(self, run_name, fn):
+        return constants.RUNS_DIR + "/" + run_name + "/" + fn
+
+    def test_dry_run(self):
+        totals = self.store.copy_run(self.WS, "run1", self.WS, "run2", dry_run=True)
+
+        self.assertTrue(totals["blobs"] == 1 + self.FILES)
+        self.assertTrue(totals["bytes"] == len('{"event": "created"}\n') + sum(range(self.FILES)))
+        self.assertTrue(not self.store.does_run_exist(self.WS, "run2"))
+
+    def test_copy_run(self):
+        totals = self.store.copy_run(self.WS, "run1", self.WS, "run3")
+        self.assertTrue(totals["blobs"] == 1 + self.FILES)
+
+        names = self.provider.list_blobs(self.WS, path=constants.RUNS_DIR + "/run3/")
+        self.assertTrue(len(names) == 1 + self.FILES)
+        self.assertTrue(self.provider.get_blob_text(self.WS, self.run_blob("run3", "output/checkpoint9.txt")) == "x"*9)
+
+        # writes to the source run must not change the copy
+        self.provider.append_blob(self.WS, self.run_blob("run1", constants.RUN_LOG), '{"event": "ended"}\n')
+        self.provider.create_blob(self.WS, self.run_blob("run1", "output/checkpoint9.txt"), "changed")
+
+        self.assertTrue(self.provider.get_blob_text(self.WS, self.run_blob("run3", constants.RUN_LOG)).count("\n") == 1)
+        self.assertTrue(self.provider.get_blob_text(self.WS, self.run_blob("run3", "output/checkpoint9.txt")) == "x"*9)
+
+        got_failure = False
+        try:
+            self.store.copy_run(self.WS, "run1", self.WS, "run3")
+        except BaseException:
+            got_failure = True
+
+        self.assertTrue(got_failure)
+
+    def test_copy_is_independent_of_other_stores(self):
+        # another process's store, with a pooled append handle on the source blob
+        other = FileStore({"provider": "store-file", "path": self.TEST_DIR})
+        log_path = self.run_blob("run4", constants.RUN_LOG)
+
+        other.append_blob(self.WS, log_path, "line 1\n")
+        self.provider.copy_blob(self.WS, log_path, self.WS, self.run_blob("run5", constants.RUN_LOG))
+        other.append_blob(self.WS, log_path, "line 2\n")
+        other.close()
+
+        self.assertTrue(self.provider.get_blob_text(self.WS, log_path) == "line 1\nline 2\n")
+        self.assertTrue(self.provider.get_blob_text(self.WS, self.run_blob("run5", constants.RUN_LOG)) == "line 1\n")
+
+    def test_copy_without_get_copy_statuses(self):
+        store = StoreBlobObjs({"provider": "store-file", "path": self.TEST_DIR}, 
+            provider_code_path="xtlib.storage.store_file.FileStore")
+        store.provider = PendingCopyFileStore({"provider": "store-file", "path": self.TEST_DIR})
+
+        # pending copies are not waited for
+        totals = store.copy_run(self.WS, "run1", self.WS, "run6")
+        self.assertTrue(totals["blobs"] == 1 + self.FILES)
+        self.assertTrue(len(self.provider.list_blobs(self.WS, path=constants.RUNS_DIR + "/run6/")) == 1 + self.FILES)
+        store.close()
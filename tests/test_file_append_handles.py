@@ -0,0 +1,92 @@
+import time
+import shutil
+import tempfile
+
+import test_base
+from xtlib.storage.store_file import FileStore
+from xtlib.storage.store_objects import StoreBlobObjs
+
+class ClosingFileStore(FileStore):
+    ''' records its close() calls '''
+    closes = 0
+
+    def close(self):
+        self.closes += 1
+        super().close()
+
+class UnclosableFileStore(FileStore):
+    ''' a provider written before close was added (it is optional; see store_interface.py) '''
+    close = None
+
+class TestFileAppendHandles(test_base.TestBase):
+    '''
+    pooled append handles of the file storage provider: LRU limit, flush policies, and close.
+    '''
+    def setup_method(self, method):
+        self.TEST_DIR = tempfile.mkdtemp()
+
+    def teardown_method(self, method):
+        shutil.rmtree(self.TEST_DIR)
+
+    def make_store(self, **props):
+        storage_creds = {"provider": "store-file", "path": self.TEST_DIR}
+        storage_creds.update(props)
+
+        store = FileStore(storage_creds)
+        store.create_container("c1")
+        return store
+
+    def append_lines(self, store, files, count):
+        for i in range(count):
+            store.append_blob("c1", "runs/run{}/run.log".format(i % files), "line {}\n".format(i))
+
+    def test_lru_limit(self):
+        store = self.make_store(**{"max-handles": 3})
+        self.append_lines(store, 10, 100)
+
+        self.assertTrue(len(store.append_handles.handles) == 3)
+        self.assertTrue(store.get_blob_text("c1", "runs/run0/run.log").count("\n") == 10)
+
+        store.close()
+        self.assertTrue(not store.append_handles.handles)
+
+    def test_flush_policies(self):
+        for flush in ["write", "interval", "close"]:
+            store = self.make_store(flush=flush, **{"flush-ms": 50})
+            self.append_lines(store, 2, 10)
+
+            # reads thru the store always see its own appends
+            self.assertTrue(store.get_blob_text("c1", "runs/run1/run.log").count("\n") == 5)
+
+            self.append_lines(store, 2, 10)
+            if flush == "interval":
+                time.sleep(.2)
+                self.assertTrue(not store.append_handles.dirty)
+
+            store.close()
+            with open(self.TEST_DIR + "/c1/runs/run0/run.log") as infile:
+                self.assertTrue(len(infile.readlines()) == 10)
+
+            store.delete_container("c1")
+
+    def test_durable(self):
+        store = self.make_store(durable=True, flush="close")
+        self.append_lines(store, 1, 5)
+        self.assertTrue(not store.append_handles.dirty)
+
+        with open(self.TEST_DIR + "/c1/runs/run0/run.log") as infile:
+            self.assertTrue(len(infile.readlines()) == 5)
+
+        store.close()
+
+    def test_store_close(self):
+        storage_creds = {"provider": "store-file", "path": self.TEST_DIR}
+        helper = StoreBlobObjs(storage_creds, provider_code_path="xtlib.storage.store_file.FileStore")
+
+        helper.provider = ClosingFileStore(storage_creds)
+        helper.close()
+        self.assertTrue(helper.provider.closes == 1)
+
+        # providers without close() have nothing to release
+        helper.provider = UnclosableFileStore(storage_creds)
+        helper.close()
@@ -0,0 +1,92 @@
+import random
+from hyperopt import hp, tpe, rand
+
+import test_base
+from xtlib import utils
+from xtlib import run_helper
+from xtlib.hparams import hp_search_bayesian
+from xtlib.hparams.hp_search_bayesian import BayesianSearch
+
+class RecordingSuggest():
+    ''' a hyperopt suggest algorithm (rand or tpe) that records how often it is called '''
+    def __init__(self, algo):
+        self.algo = algo
+        self.calls = 0
+
+    def suggest(self, new_ids, domain, trials, seed):
+        self.calls += 1
+        return self.algo.suggest(new_ids, domain, trials, seed)
+
+class TestBayesianSearch(test_base.TestBase):
+    '''
+    the warm-started bayesian search: completed runs are added to a persistent Trials, and the pending suggestions
+    of a batch go to a scratch copy.
+    '''
+    def setup_method(self, method):
+        self.rand = hp_search_bayesian.rand
+        self.tpe = hp_search_bayesian.tpe
+        hp_search_bayesian.rand = RecordingSuggest(rand)
+        hp_search_bayesian.tpe = RecordingSuggest(tpe)
+
+        self.context = utils.dict_to_object({"primary_metric": "acc", "maximize_metric": True})
+        self.hp_records = [{"name": "lr", "value": "[.001, .1]", "space_func": hp.uniform("lr", .001, .1)},
+            {"name": "opt", "value": "sgd, adam", "space_func": hp.choice("opt", ["sgd", "adam"])}]
+        self.random = random.Random(1)
+
+    def teardown_method(self, method):
+        hp_search_bayesian.rand = self.rand
+        hp_search_bayesian.tpe = self.tpe
+
+    def make_runs(self, count, first):
+        return [{"run_name": "run1.{}".format(first + i), "hparams": {"lr": self.random.uniform(.001, .1),
+            "opt": self.random.choice(["sgd", "adam"])}, "metrics": {"acc": self.random.random()}} for i in range(count)]
+
+    def test_warm_start(self):
+        search = BayesianSearch()
+        runs = self.make_runs(10, 1)
+
+        arg_dict = search.search("run1.11", None, self.context, self.hp_records, runs)
+        trials = search.trials
+        self.assertTrue(len(trials) == 10)
+        self.assertTrue(search.max_tid == max(run_helper.get_int_from_run_name(run["run_name"]) for run in runs))
+        self.assertTrue(.001 <= arg_dict["lr"] <= .1 and arg_dict["opt"] in ["sgd", "adam"])
+
+        # only the new runs are added, to the same Trials
+        runs += self.make_runs(5, 11)
+        search.search("run1.16", None, self.context, self.hp_records, runs)
+        self.assertTrue(search.trials is trials and len(trials) == 15)
+        self.assertTrue(trials.losses() == [-run["metrics"]["acc"] for run in runs])
+
+        # runs that don't match the space (or have no metric) are skipped
+        runs += [{"run_name": "run1.21", "hparams": {"lr": .01, "opt": "rmsprop"}, "metrics": {"acc": .5}},
+            {"run_name": "run1.22", "hparams": {"lr": .01, "opt": "sgd"}, "metrics": {}}]
+        search.search("run1.23", None, self.context, self.hp_records, runs)
+        self.assertTrue(len(trials) == 15)
+
+        # a changed search space starts over
+        self.hp_records[0] = {"name": "lr", "value": "[.001, .5]", "space_func": hp.uniform("lr", .001, .5)}
+        search.search("run1.24", None, self.context, self.hp_records, runs[:3])
+        self.assertTrue(search.trials is not trials and len(search.trials) == 3)
+
+    def test_batch_uses_scratch_trials(self):
+        search = BayesianSearch()
+        runs = self.make_runs(10, 1)
+
+        arg_dicts = search.search_batch("run1.11", None, self.context, self.hp_records, runs, 5)
+        self.assertTrue(len(arg_dicts) == 5)
+        self.assertTrue(len(set(arg_dict["lr"] for arg_dict in arg_dicts)) == 5)
+
+        # the pending suggestions are not added to our (completed only) Trials
+        self.assertTrue(len(search.trials) == 10)
+        self.assertTrue(all(trial["result"]["status"] == "ok" for trial in search.trials.trials))
+        self.assertTrue(hp_search_bayesian.tpe.calls == 5 and hp_search_bayesian.rand.calls == 0)
+
+    def test_random_until_enough_completed_trials(self):
+        search = BayesianSearch()
+
+        # pending suggestions don't count as completed trials
+        search.search_batch("run1.3", None, self.context, self.hp_records, self.make_runs(2, 1), 5)
+        self.assertTrue(hp_search_bayesian.rand.calls == 5 and hp_search_bayesian.tpe.calls == 0)
+
+        search.search("run1.9", None, self.context, self.hp_records, self.make_runs(3, 1))
+        self.assertTrue(hp_search_bayesian.tpe.calls == 1)
@@ -0,0 +1,94 @@
+import json
+import random
+
+import test_base
+from xtlib import utils
+from xtlib import constants
+from xtlib.hparams import hp_search_dgd
+from xtlib.hparams.hp_search_dgd import DGDSearch, DGD
+
+class FakeStore():
+    ''' the job file methods used for DGD snapshots '''
+    def __init__(self):
+        self.job_files = {}
+
+    def does_job_file_exist(self, job_id, fn):
+        return (job_id, fn) in self.job_files
+
+    def read_job_file(self, job_id, fn):
+        return self.job_files[(job_id, fn)]
+
+    def create_job_file(self, job_id, fn, text):
+        self.job_files[(job_id, fn)] = text
+
+class TestDGDSearch(test_base.TestBase):
+    '''
+    the incremental DGD runset index: it matches an index built from all runs, and is snapshotted and resumed.
+    '''
+    def setup_method(self, method):
+        self.snapshot_interval = hp_search_dgd.SNAPSHOT_INTERVAL
+        hp_search_dgd.SNAPSHOT_INTERVAL = 0
+
+        self.store = FakeStore()
+        self.context = utils.dict_to_object({"aggregate_dest": "job", "dest_name": "job1", "ws": "ws1",
+            "primary_metric": "acc"})
+        self.hp_records = [{"name": "lr", "value": "0.1, 0.01, 0.001"}, {"name": "layers", "value": "1, 2, 3"},
+            {"name": "seed", "value": "5"}]
+        self.rand = random.Random(1)
+
+    def teardown_method(self, method):
+        hp_search_dgd.SNAPSHOT_INTERVAL = self.snapshot_interval
+
+    def make_runs(self, count, first_end_id):
+        return [{"hparams": {"lr": self.rand.choice([.1, .01, .001]), "layers": self.rand.choice([1, 2, 3]), "seed": 5},
+            "metrics": {"acc": self.rand.random()}, "end_id": first_end_id + i} for i in range(count)]
+
+    def get_index(self, dgd):
+        runsets = sorted((runset.config_str, runset.num_runs, round(runset.metric, 9)) for runset in dgd.runsets)
+        return runsets, dgd.best_runset.metric, dgd.run_count, dgd.single_run_runsets, dgd.max_runs_per_runset
+
+    def build_full(self, runs):
+        dgd = DGD()
+        dgd.build(None, self.hp_records, runs, "acc", report=False)
+        return dgd
+
+    def test_incremental_matches_full_build(self):
+        search = DGDSearch()
+        runs = []
+
+        for i in range(6):
+            runs += self.make_runs(7, 1 + len(runs))
+            arg_dict = search.search("run1.{}".format(i), self.store, self.context, self.hp_records, runs)
+
+            self.assertTrue(self.get_index(search.dgd) == self.get_index(self.build_full(runs)))
+            self.assertTrue(arg_dict["seed"] == 5 and arg_dict["lr"] in [.1, .01, .001])
+
+        # the best runset is found again when its mean drops
+        best = search.dgd.best_runset
+        lr, layers = [search.dgd.hparams[hp_id].settings[setting_id].value for hp_id, setting_id in best.hp_id__setting_id__list]
+        runs += [{"hparams": {"lr": lr, "layers": layers, "seed": 5}, "metrics": {"acc": -100}, "end_id": 1 + len(runs)}]
+
+        search.search("run1.6", self.store, self.context, self.hp_records, runs)
+        self.assertTrue(search.dgd.best_runset is not best)
+        self.assertTrue(self.get_index(search.dgd) == self.get_index(self.build_full(runs)))
+
+    def test_snapshot_and_resume(self):
+        runs = self.make_runs(20, 1)
+        DGDSearch().search("run1.1", self.store, self.context, self.hp_records, runs)
+
+        state = json.loads(self.store.job_files[("job1", constants.DGD_STATE_FN)])
+        self.assertTrue(state["end_id"] == 20 and sum(num_runs for ids, num_runs, score_sum in state["runsets"]) == 20)
+
+        # a restarted controller resumes from the snapshot, and skips the runs that ended before it was taken
+        runs += self.make_runs(5, 21)
+        search = DGDSearch()
+        search.search("run1.2", self.store, self.context, self.hp_records, runs)
+
+        self.assertTrue(search.dgd.run_count == 25)
+        self.assertTrue(self.get_index(search.dgd) == self.get_index(self.build_full(runs)))
+
+        # a changed hp-config ignores the snapshot
+        self.hp_records[1]["value"] = "1, 2, 3, 4"
+        search = DGDSearch()
+        search.search("run1.3", self.store, self.context, self.hp_records, runs[-5:])
+        self.assertTrue(search.dgd.run_count == 5)
@@ -0,0 +1,94 @@
+import copy
+
+import test_base
+from xtlib import constants
+from xtlib.storage import mongo_hp_suggestions
+from xtlib.storage.mongo_hp_suggestions import MongoHpSuggestions
+
+class FakeJobs():
+    '''
+    the "__jobs__" collection updates used for hp suggestions.  Like our backend, find_and_modify() ignores
+    positional ("$") projections and returns the whole array.
+    '''
+    def __init__(self, job_id):
+        self.doc = {"_id": job_id, "hp_suggestions": []}
+
+    def find_and_modify(self, fd, update, fields, new):
+        status = fd["hp_suggestions"]["$elemMatch"]["status"]
+        entry = next((e for e in self.doc["hp_suggestions"] if e["status"] == status), None)
+        if not entry:
+            return None
+
+        before = copy.deepcopy(self.doc)
+        for key, value in update["$set"].items():
+            entry[key.split(".")[-1]] = value
+
+        return copy.deepcopy(self.doc if new else before)
+
+    def update_one(self, fd, update):
+        suggestions = self.doc["hp_suggestions"]
+
+        for key, cond in fd.items():
+            if key.startswith("hp_suggestions.") and cond == {"$exists": True}:
+                if len(suggestions) <= int(key.split(".")[1]):
+                    return
+
+        if "$push" in update:
+            suggestions += copy.deepcopy(update["$push"]["hp_suggestions"]["$each"])
+
+        if "$pull" in update:
+            status = update["$pull"]["hp_suggestions"]["status"]
+            self.doc["hp_suggestions"] = [e for e in suggestions if e["status"] != status]
+
+class FakeMongo():
+    def __init__(self, job_id):
+        self.mongo_db = {"__jobs__": FakeJobs(job_id)}
+
+    def mongo_with_retries(self, name, cmd):
+        return cmd()
+
+class TestHpSuggestions(test_base.TestBase):
+    '''
+    the job-level queue of pre-generated hparam sets: adding a batch and claiming its entries from any node.
+    '''
+    def setup_method(self, method):
+        self.mongo = FakeMongo("job1")
+        self.jobs = self.mongo.mongo_db["__jobs__"]
+        self.max_suggestions = mongo_hp_suggestions.MAX_SUGGESTIONS
+
+    def teardown_method(self, method):
+        mongo_hp_suggestions.MAX_SUGGESTIONS = self.max_suggestions
+
+    def test_add_and_claim(self):
+        node0 = MongoHpSuggestions(self.mongo, "job1", "node0")
+        node1 = MongoHpSuggestions(self.mongo, "job1", "node1")
+
+        self.assertTrue(node0.claim_suggestion("run1.1") is None)
+
+        node0.add_suggestions("run1.1", {"lr": 1}, [{"lr": 2}, {"lr": 3}])
+
+        # each claim returns the element it claimed (not the first element of the array)
+        self.assertTrue(node1.claim_suggestion("run1.2") == {"lr": 2})
+        self.assertTrue(node0.claim_suggestion("run1.3") == {"lr": 3})
+        self.assertTrue(node1.claim_suggestion("run1.4") is None)
+
+        entries = self.jobs.doc["hp_suggestions"]
+        self.assertTrue([(e["run_name"], e["node_id"], e["status"]) for e in entries] == [("run1.1", "node0", constants.STARTED),
+            ("run1.2", "node1", constants.STARTED), ("run1.3", "node0", constants.STARTED)])
+
+    def test_only_claimed_entries_are_trimmed(self):
+        mongo_hp_suggestions.MAX_SUGGESTIONS = 5
+        node0 = MongoHpSuggestions(self.mongo, "job1", "node0")
+
+        node0.add_suggestions("run1.1", {"lr": 1}, [{"lr": 2}, {"lr": 3}])
+        self.assertTrue(len(self.jobs.doc["hp_suggestions"]) == 3)
+
+        node0.claim_suggestion("run1.2")
+
+        # past the limit: the claimed entries are removed, and no unclaimed one is dropped
+        node0.add_suggestions("run1.4", {"lr": 4}, [{"lr": 5}, {"lr": 6}, {"lr": 7}])
+        entries = self.jobs.doc["hp_suggestions"]
+        self.assertTrue([e["arg_dict"]["lr"] for e in entries] == [3, 5, 6, 7])
+
+        self.assertTrue([node0.claim_suggestion("run1.{}".format(i)) for i in range(5, 10)] ==
+            [{"lr": 3}, {"lr": 5}, {"lr": 6}, {"lr": 7}, None])
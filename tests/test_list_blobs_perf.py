@@ -0,0 +1,113 @@
+import shutil
+import tempfile
+import datetime
+
+import test_base
+from xtlib import utils
+from xtlib.storage.store_objects import StoreBlobObjs
+
+class TestListBlobsFileStorage(test_base.TestBase):
+    '''
+    building the folder listing of "xt list blobs".
+    '''
+    def setup_class(cls):
+        """
+        Setup once for all tests
+        """
+        cls.TEST_DIR = tempfile.mkdtemp()
+        cls.CONTAINER = "list-blobs-test"
+
+        cls.TOP_DIRS = 20
+        cls.SUB_DIRS = 10
+        cls.FILES = 5
+
+        storage_creds = {"provider": "store-file", "path": cls.TEST_DIR}
+        cls.store = StoreBlobObjs(storage_creds, provider_code_path="xtlib.storage.store_file.FileStore")
+        cls.provider = cls.store.provider
+
+        cls.provider.create_container(cls.CONTAINER)
+
+        for t in range(cls.TOP_DIRS):
+            for s in range(cls.SUB_DIRS):
+                for f in range(cls.FILES):
+                    cls.provider.create_blob(cls.CONTAINER, "top{}/sub{}/file{}.txt".format(t, s, f), "text")
+
+    def teardown_class(cls):
+        """
+        Teardown once after all tests
+        """
+        shutil.rmtree(cls.TEST_DIR)
+
+    def make_blobs(self, names):
+        modified = datetime.datetime.now()
+        blobs = []
+
+        for name in names:
+            props = utils.PropertyBag()
+            props.content_length = 10
+            props.last_modified = modified
+
+            blob = utils.PropertyBag()
+            blob.name = name
+            blob.properties = props
+            blobs.append(blob)
+
+        return blobs
+
+    def build_folders(self, names, base_path, subdirs):
+        folders = self.store._build_folders_from_blobs(self.make_blobs(names), "ws1", base_path, subdirs)
+        return {folder["folder_name"]: (folder["level"], folder["dirs"], [fi["name"] for fi in folder["files"]]) 
+            for folder in folders}
+
+    def test_file_provider_listing(self):
+        dd = self.store._list_directories(self.CONTAINER, "", None, subdirs=True)
+        folders = dd["folders"]
+
+        self.assertTrue(len(folders) == 1 + self.TOP_DIRS + self.TOP_DIRS*self.SUB_DIRS)
+
+        base = folders[0]
+        self.assertTrue(sorted(base["dirs"]) == sorted(["top{}".format(t) for t in range(self.TOP_DIRS)]))
+
+        for folder in folders[1:]:
+            if folder["level"] == 1:
+                self.assertTrue(len(folder["dirs"]) == self.SUB_DIRS)
+                self.assertTrue(not folder["files"])
+            else:
+                self.assertTrue(not folder["dirs"])
+                self.assertTrue(len(folder["files"]) == self.FILES)
+
+        # one level only
+        dd = self.store._list_directories(self.CONTAINER, "", None, subdirs=0)
+        folders = dd["folders"]
+        self.assertTrue(len(folders) == 1)
+        self.assertTrue(len(folders[0]["dirs"]) == self.TOP_DIRS)
+
+        # wildcard filter
+        names = self.store._list_wild_blobs(self.CONTAINER, "top1/sub1", "file1*")
+        self.assertTrue(names == ["top1/sub1/file1.txt"])
+
+    def test_build_folders(self):
+        names = ["runs/run1/output/model0.pt", "runs/run1/output/model1.pt", "runs/run2/output/model0.pt", 
+            "runs/run2/logs/log.txt", "runs/run1/logs/log.txt"]
+
+        # each dir is added once to its parent, in the order first seen
+        folders = self.build_folders(names, "", True)
+        self.assertTrue(folders == {
+            "/ws1": (0, ["runs"], []),
+            "/ws1/runs": (1, ["run1", "run2"], []),
+            "/ws1/runs/run1": (2, ["output", "logs"], []),
+            "/ws1/runs/run1/output": (3, [], ["model0.pt", "model1.pt"]),
+            "/ws1/runs/run1/logs": (3, [], ["log.txt"]),
+            "/ws1/runs/run2": (2, ["output", "logs"], []),
+            "/ws1/runs/run2/output": (3, [], ["model0.pt"]),
+            "/ws1/runs/run2/logs": (3, [], ["log.txt"]),
+            })
+
+        # levels are relative to the base path
+        folders = self.build_folders(names, "runs", True)
+        self.assertTrue(folders["/ws1/runs"] == (0, ["run1", "run2"], []))
+        self.assertTrue(folders["/ws1/runs/run2/logs"] == (2, [], ["log.txt"]))
+
+        # one level only
+        folders = self.build_folders(names + ["notes.txt"], "", False)
+        self.assertTrue(folders == {"/ws1": (0, ["runs"], ["notes.txt"])})
@@ -0,0 +1,125 @@
+import copy
+import shutil
+import tempfile
+import numpy as np
+
+import test_base
+from xtlib.storage import metric_cache
+from xtlib.storage.metric_cache import MetricCache
+
+class FakeMongo():
+    ''' the run log_records of a workspace, as returned by MongoDB.get_info_for_runs() '''
+    def __init__(self):
+        self.log_records_by_run = {}
+        self.fetched = []
+
+    def get_info_for_runs(self, ws_name, filter_dict, fields_dict=None):
+        run_names = filter_dict["_id"]["$in"]
+        self.fetched += run_names
+        return [{"_id": run_name, "log_records": copy.deepcopy(self.log_records_by_run[run_name])} for run_name in run_names]
+
+class TestMetricCache(test_base.TestBase):
+    '''
+    the columnar metric cache: cache keys, column dtypes, and round trips of metric sets thru the .npz cache files.
+    '''
+    def setup_method(self, method):
+        self.TEST_DIR = tempfile.mkdtemp()
+        self.cache = MetricCache(self.TEST_DIR)
+        self.mongo = FakeMongo()
+
+    def teardown_method(self, method):
+        shutil.rmtree(self.TEST_DIR)
+
+    def add_run(self, run_name, count, end_id):
+        log_records = [{"event": "started", "time": "t0", "data": {}}]
+        log_records += [{"event": "metrics", "time": "t{:03d}".format(1+i), "data": {"__step_name__": "batch", "batch": i, 
+            "loss": 1/(1+i), "acc": i/count}} for i in range(count)]
+        log_records += [{"event": "metrics", "time": "t{:03d}".format(1+count), "data": {"epoch": 1, "test-acc": .9}}]
+
+        self.mongo.log_records_by_run[run_name] = log_records
+        return {"_id": run_name, "ws": "ws1", "end_id": end_id, "last_time": "t{:03d}".format(1+count)}
+
+    def get_metric_records(self, run_name):
+        records = []
+        for lr in self.mongo.log_records_by_run[run_name]:
+            if lr["event"] == "metrics":
+                dd = dict(lr["data"])
+                dd["__time__"] = lr["time"]
+                records.append({"event": "metrics", "time": lr["time"], "data": dd})
+        return records
+
+    def make_metric_set(self, records):
+        keys = list(records[0])
+        return {"keys": keys, "columns": metric_cache.records_to_columns(keys, records)}
+
+    def test_column_dtypes(self):
+        records = [{"step": 1, "loss": .5, "best": True, "phase": "train", "note": 7, "lr": 1},
+            {"step": 2, "loss": None, "best": False, "phase": "eval", "note": "diverged", "lr": .5}]
+        columns = self.make_metric_set(records)["columns"]
+
+        self.assertTrue(columns["step"].dtype == np.int64)
+        self.assertTrue(columns["loss"].dtype == np.float64 and np.isnan(columns["loss"][1]))
+        self.assertTrue(columns["best"].dtype == np.bool_)
+        self.assertTrue(columns["phase"].dtype.kind == "U")
+        self.assertTrue(columns["lr"].dtype == np.float64)
+
+        # mixed columns keep their values (not their str())
+        self.assertTrue(columns["note"].dtype == object and columns["note"].tolist() == [7, "diverged"])
+
+    def test_mixed_and_bool_columns_round_trip(self):
+        records = [{"step": 1, "best": True, "note": 7, "flags": [1, 2]},
+            {"step": 2, "best": False, "note": "diverged", "flags": None},
+            {"step": 3, "best": True, "note": 2.5, "flags": [3, 4]}]
+
+        self.cache.save("ws1", "run1", "5|t5", [self.make_metric_set(records)])
+        metric_sets = self.cache.load("ws1", "run1", "5|t5")
+
+        columns = metric_sets[0]["columns"]
+        self.assertTrue(columns["best"].dtype == np.bool_)
+        self.assertTrue(columns["note"].dtype == object and columns["flags"].dtype == object)
+        self.assertTrue(metric_cache.columns_to_records(metric_sets[0]) == records)
+
+        # only the requested columns are loaded
+        metric_sets = self.cache.load("ws1", "run1", "5|t5", col_names=["note"])
+        self.assertTrue(metric_sets[0]["keys"] == ["note"] and metric_sets[0]["columns"]["note"].tolist() == [7, "diverged", 2.5])
+
+    def test_cache_keys(self):
+        run_records = [self.add_run("run1", 10, end_id=12), self.add_run("run2", 5, end_id=7)]
+
+        self.cache.get_metric_sets_for_runs(self.mongo, run_records)
+        self.assertTrue(self.mongo.fetched == ["run1", "run2"])
+
+        # cached runs are not fetched again...
+        self.cache.get_metric_sets_for_runs(self.mongo, run_records)
+        self.assertTrue(self.mongo.fetched == ["run1", "run2"])
+
+        # ... until they log something new
+        run_records[1] = self.add_run("run2", 8, end_id=10)
+        sets_by_run = self.cache.get_metric_sets_for_runs(self.mongo, run_records)
+        self.assertTrue(self.mongo.fetched == ["run1", "run2", "run2"])
+        self.assertTrue(len(sets_by_run["run2"][0]["columns"]["loss"]) == 8)
+
+        self.assertTrue(self.cache.get_cache_key(run_records[1]) == "10|t009")
+        self.assertTrue(self.cache.load("ws1", "run2", "7|t006") is None)
+
+    def test_columns_round_trip(self):
+        run_records = [self.add_run("run1", 10, end_id=12)]
+
+        # fetched (and cached) metric sets, then the same sets loaded from the cache
+        for i in range(2):
+            sets_by_run = self.cache.get_metric_sets_for_runs(self.mongo, run_records)
+            log_records = metric_cache.column_sets_to_log_records(sets_by_run["run1"])
+            self.assertTrue(log_records == self.get_metric_records("run1"))
+
+        self.assertTrue(self.mongo.fetched == ["run1"])
+        self.assertTrue([ms["keys"] for ms in sets_by_run["run1"]] == [["__step_name__", "batch", "loss", "acc", "__time__"],
+            ["epoch", "test-acc", "__time__"]])
+
+    def test_selected_columns(self):
+        run_records = [self.add_run("run1", 10, end_id=12)]
+
+        # the set's logged step column ("batch") is loaded with the requested columns
+        for i in range(2):
+            sets_by_run = self.cache.get_metric_sets_for_runs(self.mongo, run_records, col_names=["loss", "__step_name__"])
+            self.assertTrue([ms["keys"] for ms in sets_by_run["run1"]] == [["__step_name__", "batch", "loss"]])
+            self.assertTrue(sets_by_run["run1"][0]["columns"]["batch"].tolist() == list(range(10)))
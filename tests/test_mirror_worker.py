@@ -0,0 +1,147 @@
+import os
+import time
+import shutil
+import tempfile
+
+import test_base
+from xtlib.mirror_worker import MirrorWorker, MyHandler
+from xtlib.storage.store_objects import StoreBlobObjs
+from xtlib.storage.store_emulator import EmulatorStore
+
+class AppendlessEmulatorStore(EmulatorStore):
+    ''' a provider written before append_blob_from_bytes was added (it is optional; see store_interface.py) '''
+    append_blob_from_bytes = None
+
+class EmulatorRunStore():
+    '''
+    the run file methods of Store used by the mirror worker, on the storage emulator (no mongo needed).
+    '''
+    def __init__(self, path):
+        storage_creds = {"provider": "store-emulator", "path": path}
+        self.helper = StoreBlobObjs(storage_creds, provider_code_path="xtlib.storage.store_emulator.EmulatorStore")
+        self.provider = self.helper.provider
+
+    def append_bytes_to_run_file(self, ws_name, run_name, run_fn, data, recreate=False):
+        rf = self.helper.run_files(ws_name, run_name, use_blobs=True)
+        return rf.append_bytes(run_fn, data, recreate=recreate)
+
+class TestMirrorWorker(test_base.TestBase):
+    '''
+    mirroring of run files: uploads are debounced, and a file that only grows is uploaded as appends of its new bytes.
+    '''
+    def setup_method(self, method):
+        self.TEST_DIR = tempfile.mkdtemp()
+        self.WS = "mirror-test"
+        self.RUN_DIR = self.TEST_DIR + "/rundir"
+        os.makedirs(self.RUN_DIR + "/logs")
+
+        self.store = EmulatorRunStore(self.TEST_DIR + "/store")
+        self.provider = self.store.provider
+        self.provider.create_container(self.WS)
+
+    def teardown_method(self, method):
+        shutil.rmtree(self.TEST_DIR)
+
+    def start_worker(self, quiet_secs, max_delay_secs, uploads_per_sec=100):
+        worker = MirrorWorker(self.store, self.RUN_DIR, "storage", "logs/**", None, self.WS, "run1", quiet_secs=quiet_secs,
+            max_delay_secs=max_delay_secs, uploads_per_sec=uploads_per_sec)
+        worker.start()
+        return worker
+
+    def append_lines(self, fn, count, delay):
+        with open(self.RUN_DIR + "/logs/" + fn, "at") as outfile:
+            for i in range(count):
+                outfile.write("step {}: loss=0.1234, acc=0.5678\n".format(i))
+                outfile.flush()
+                time.sleep(delay)
+
+    def wait_for_idle(self, worker, timeout=10):
+        started = time.time()
+        while time.time() - started < timeout:
+            status = worker.get_status()
+            if status["check_count"] and not status["queued_files"]:
+                return status
+            time.sleep(.05)
+        return worker.get_status()
+
+    def read_mirrored(self, fn):
+        return self.provider.get_blob_range(self.WS, "runs/run1/mirrored/" + fn)
+
+    def read_local(self, fn):
+        with open(self.RUN_DIR + "/logs/" + fn, "rb") as infile:
+            return infile.read()
+
+    def test_debounce_and_append(self):
+        worker = self.start_worker(quiet_secs=.5, max_delay_secs=10)
+
+        # a burst of writes is uploaded once, after it goes quiet
+        self.append_lines("log.txt", 50, .005)
+        status = self.wait_for_idle(worker)
+        self.assertTrue(status["send_count"] == 1)
+        self.assertTrue(self.read_mirrored("log.txt") == self.read_local("log.txt"))
+
+        # more writes are uploaded as just the new bytes
+        self.provider.reset_request_counts()
+        size = len(self.read_local("log.txt"))
+
+        self.append_lines("log.txt", 10, .005)
+        time.sleep(.2)
+        self.assertTrue(worker.get_status()["queued_bytes"] > 0)
+
+        status = self.wait_for_idle(worker)
+        counts = self.provider.get_request_counts()
+
+        self.assertTrue(status["append_count"] == 1)
+        self.assertTrue(status["bytes_sent"] == len(self.read_local("log.txt")))
+        self.assertTrue(counts.get("append_block") == 1 and not counts.get("create_blob"))
+        self.assertTrue(self.read_mirrored("log.txt") == self.read_local("log.txt"))
+        self.assertTrue(len(self.read_local("log.txt")) > size)
+
+        # a rewritten file is uploaded in full
+        with open(self.RUN_DIR + "/logs/log.txt", "wt") as outfile:
+            outfile.write("rewritten\n")
+
+        time.sleep(.2)
+        self.wait_for_idle(worker)
+        self.assertTrue(self.read_mirrored("log.txt") == b"rewritten\n")
+
+        worker.stop()
+
+    def test_continuous_writer(self):
+        worker = self.start_worker(quiet_secs=.5, max_delay_secs=.5)
+
+        # a file written to every 20 ms never goes quiet, but is uploaded every max_delay_secs
+        self.append_lines("log.txt", 100, .02)
+
+        status = worker.get_status()
+        self.assertTrue(2 <= status["send_count"] <= 8)
+        self.assertTrue(status["send_count"] < status["check_count"])
+
+        # the changes still waiting are uploaded when the worker is stopped
+        worker.stop()
+        self.assertTrue(self.read_mirrored("log.txt") == self.read_local("log.txt"))
+
+    def test_appends_counted_in_blocks(self):
+        handler = MyHandler(self.store, "storage", None, self.WS, "run1", self.RUN_DIR, "logs/**")
+        fn = self.RUN_DIR + "/logs/log.txt"
+
+        # an upload larger than a block is appended as several blocks
+        handler.mark_sent(fn, b"x" * (9*1024*1024), True)
+        self.assertTrue(handler.sent[fn].appends == 3)
+
+        handler.mark_sent(fn, b"step 1\n", False)
+        self.assertTrue(handler.sent[fn].appends == 4)
+
+        handler.executor.shutdown()
+
+    def test_provider_without_append_blob_from_bytes(self):
+        self.provider = AppendlessEmulatorStore({"provider": "store-emulator", "path": self.TEST_DIR + "/store"})
+        self.store.helper.provider = self.provider
+
+        # appends are made by rewriting the blob
+        self.store.append_bytes_to_run_file(self.WS, "run1", "mirrored/log.txt", b"line 1\n")
+        self.store.append_bytes_to_run_file(self.WS, "run1", "mirrored/log.txt", b"line 2\n")
+        self.assertTrue(self.read_mirrored("log.txt") == b"line 1\nline 2\n")
+
+        self.store.append_bytes_to_run_file(self.WS, "run1", "mirrored/log.txt", b"rewritten\n", recreate=True)
+        self.assertTrue(self.read_mirrored("log.txt") == b"rewritten\n")
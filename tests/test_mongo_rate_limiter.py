@@ -0,0 +1,96 @@
+import pymongo.errors
+
+import test_base
+from xtlib.storage import mongo_rate_limiter
+from xtlib.storage.mongo_rate_limiter import MongoRateLimiter, THROTTLED, NETWORK, OTHER, FATAL
+
+class TestMongoRateLimiter(test_base.TestBase):
+    '''
+    the process-wide mongo-db rate limiter: error classification, backoff per error class, and AIMD rate changes.
+    '''
+    def test_classify_errors(self):
+        classify = mongo_rate_limiter.classify_error
+
+        self.assertTrue(classify(pymongo.errors.OperationFailure("throttled", code=16500)) == THROTTLED)
+        self.assertTrue(classify(pymongo.errors.OperationFailure("too many requests", code=429)) == THROTTLED)
+        self.assertTrue(classify(pymongo.errors.OperationFailure('Message: {"Errors":["Request rate is large"]}')) == THROTTLED)
+
+        self.assertTrue(classify(pymongo.errors.AutoReconnect("connection reset")) == NETWORK)
+        self.assertTrue(classify(pymongo.errors.NetworkTimeout("timed out")) == NETWORK)
+        self.assertTrue(classify(pymongo.errors.ServerSelectionTimeoutError("no servers")) == NETWORK)
+
+        self.assertTrue(classify(pymongo.errors.DuplicateKeyError("E11000 duplicate key", code=11000)) == FATAL)
+        self.assertTrue(classify(KeyboardInterrupt()) == FATAL)
+
+        self.assertTrue(classify(pymongo.errors.OperationFailure("bad query", code=2)) == OTHER)
+        self.assertTrue(classify(ValueError("other")) == OTHER)
+
+    def test_backoff(self):
+        limiter = MongoRateLimiter()
+        throttled = pymongo.errors.OperationFailure("throttled", code=16500)
+
+        # jittered exponential backoff, capped by the policy of each error class
+        for attempt in range(12):
+            error_class, backoff = limiter.on_error("find", throttled, attempt)
+            self.assertTrue(error_class == THROTTLED and 0 <= backoff <= min(30, .25 * 2**attempt))
+
+            error_class, backoff = limiter.on_error("find", pymongo.errors.AutoReconnect("reset"), attempt)
+            self.assertTrue(error_class == NETWORK and 0 <= backoff <= min(60, 2**attempt))
+
+        # fatal errors are not retried
+        error_class, backoff = limiter.on_error("insert", pymongo.errors.DuplicateKeyError("E11000", code=11000), 0)
+        self.assertTrue(error_class == FATAL and backoff == 0)
+
+        # the retry-after hint of Cosmos DB is honored (with up to 20% jitter)
+        hinted = pymongo.errors.OperationFailure("Request rate is large. RetryAfterMs=1500", code=16500)
+        self.assertTrue(mongo_rate_limiter.get_retry_after(hinted) == 1.5)
+
+        error_class, backoff = limiter.on_error("find", hinted, 0)
+        self.assertTrue(error_class == THROTTLED and 1.5 <= backoff <= 1.8)
+
+        hinted = pymongo.errors.OperationFailure("throttled", code=16500, details={"errmsg": "RetryAfterMs=250"})
+        self.assertTrue(mongo_rate_limiter.get_retry_after(hinted) == .25)
+        self.assertTrue(mongo_rate_limiter.get_retry_after(throttled) is None)
+
+        metrics = limiter.get_metrics()
+        self.assertTrue(metrics["retries_by_class"] == {THROTTLED: 13, NETWORK: 12})
+        self.assertTrue(metrics["retries_by_name"] == {"find": 25})
+
+    def test_aimd_rate(self):
+        limiter = MongoRateLimiter(initial_rate=10, min_rate=1, max_rate=12, increase=.5, decrease=.5)
+
+        # additive increase on success, up to max_rate
+        for i in range(3):
+            limiter.on_success()
+        self.assertTrue(limiter.rate == 11.5)
+
+        for i in range(10):
+            limiter.on_success()
+        self.assertTrue(limiter.rate == 12)
+
+        # multiplicative decrease when throttled, down to min_rate
+        throttled = pymongo.errors.OperationFailure("throttled", code=16500)
+        limiter.on_error("find", throttled, 0)
+        self.assertTrue(limiter.rate == 6)
+        self.assertTrue(limiter.tokens <= 0)
+
+        for i in range(10):
+            limiter.on_error("find", throttled, 0)
+        self.assertTrue(limiter.rate == 1)
+
+        # other errors don't change the rate
+        limiter.on_error("find", pymongo.errors.AutoReconnect("reset"), 0)
+        limiter.on_error("find", ValueError("other"), 0)
+        self.assertTrue(limiter.rate == 1)
+
+    def test_acquire(self):
+        limiter = MongoRateLimiter(initial_rate=20)
+
+        # the first request is sent at once; the next one waits for a token
+        limiter.acquire()
+        self.assertTrue(limiter.get_metrics()["wait_secs"] == 0)
+
+        limiter.acquire()
+        metrics = limiter.get_metrics()
+        self.assertTrue(metrics["requests"] == 2)
+        self.assertTrue(0 < metrics["wait_secs"] <= 1/20)
@@ -0,0 +1,115 @@
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+import test_base
+from xtlib.storage.mongo_db import MongoWriteBatch
+
+class FakeCollection():
+    ''' records the bulk_write() calls made to a collection '''
+    def __init__(self):
+        self.writes = []
+        self.fail_ids = []      # the doc ids whose next update fails (once each)
+        self.applied = []
+
+    def bulk_write(self, requests, ordered=True):
+        self.writes.append((requests, ordered))
+
+        write_errors = []
+        for index, request in enumerate(requests):
+            doc_id = request._filter["_id"]
+            if doc_id in self.fail_ids:
+                self.fail_ids.remove(doc_id)
+                write_errors.append({"index": index, "code": 16500, "errmsg": "Request rate is large"})
+            else:
+                self.applied.append(doc_id)
+
+        if write_errors:
+            raise BulkWriteError({"writeErrors": write_errors, "writeConcernErrors": [], "nInserted": 0,
+                "nUpserted": 0, "nMatched": len(requests)-len(write_errors), "nModified": 0, "nRemoved": 0, "upserted": []})
+
+class FakeMongo():
+    ''' the subset of MongoDB used by MongoWriteBatch '''
+    def __init__(self):
+        self.mongo_db = {}
+        self.names = []
+
+    def get_collection(self, name):
+        return self.mongo_db.setdefault(name, FakeCollection())
+
+    def mongo_with_retries(self, name, cmd):
+        # retry failed commands (without backoff)
+        self.names.append(name)
+        for i in range(3):
+            try:
+                return cmd()
+            except BulkWriteError:
+                if i == 2:
+                    raise
+
+class TestMongoWriteBatch(test_base.TestBase):
+    '''
+    batched mongo-db updates: the updates for each document are merged into a single update ($set, $inc and $push),
+    and written with one unordered bulk_write per collection.
+    '''
+    def setup_method(self, method):
+        self.mongo = FakeMongo()
+        self.runs = self.mongo.get_collection("ws1")
+        self.jobs = self.mongo.get_collection("__jobs__")
+
+    def test_merge_updates(self):
+        batch = MongoWriteBatch(self.mongo)
+
+        batch.update("ws1", "run1", set_dd={"status": "running", "last_time": "t1"})
+        batch.update("ws1", "run1", set_dd={"status": "completed"}, inc_dd={"restarts": 1})
+        batch.update("ws1", "run1", inc_dd={"restarts": 2, "errors": 1})
+        batch.update("ws1", "run1", push_dd={"log_records": {"event": "started"}})
+        batch.update("ws1", "run1", push_dd={"log_records": {"event": "ended"}, "tags": "best"})
+        batch.update("ws1", "run2", set_dd={"status": "queued"})
+
+        batch.flush("update_runs")
+
+        # later $set values win, $inc values are added, and $push values are appended in order
+        run1 = {
+            "$set": {"status": "completed", "last_time": "t1"},
+            "$inc": {"restarts": 3, "errors": 1},
+            "$push": {"log_records": {"$each": [{"event": "started"}, {"event": "ended"}]}, "tags": {"$each": ["best"]}},
+            }
+
+        self.assertTrue(self.runs.writes == [([UpdateOne({"_id": "run1"}, run1, upsert=False), UpdateOne({"_id": "run2"},
+            {"$set": {"status": "queued"}}, upsert=False)], False)])
+        self.assertTrue(self.mongo.names == ["update_runs"])
+
+    def test_collections_and_upserts(self):
+        batch = MongoWriteBatch(self.mongo)
+
+        batch.update("ws1", "run1", set_dd={"status": "running"})
+        batch.update("__jobs__", "job1", inc_dd={"completed_runs": 1})
+        batch.update("__jobs__", "job2", set_dd={"job_status": "completed"}, upsert=True)
+
+        # updates with nothing to write are dropped
+        batch.update("ws1", "run2")
+        batch.flush()
+
+        # one bulk_write per collection; upsert only where requested
+        self.assertTrue(self.runs.writes == [([UpdateOne({"_id": "run1"}, {"$set": {"status": "running"}}, upsert=False)], False)])
+        self.assertTrue(self.jobs.writes == [([UpdateOne({"_id": "job1"}, {"$inc": {"completed_runs": 1}}, upsert=False),
+            UpdateOne({"_id": "job2"}, {"$set": {"job_status": "completed"}}, upsert=True)], False)])
+
+        # the batch is empty after a flush
+        batch.flush()
+        self.assertTrue(len(self.runs.writes) == 1 and len(self.jobs.writes) == 1)
+        self.assertTrue(self.mongo.names == ["bulk_write", "bulk_write"])
+
+    def test_partial_failure_retries_failed_updates(self):
+        batch = MongoWriteBatch(self.mongo)
+
+        for i in range(5):
+            batch.update("ws1", "run{}".format(i), inc_dd={"restarts": 1}, push_dd={"log_records": {"event": "restarted"}})
+
+        # two updates are throttled: only those are resubmitted, so no $inc or $push is applied twice
+        self.runs.fail_ids = ["run1", "run3"]
+        batch.flush()
+
+        self.assertTrue(sorted(self.runs.applied) == ["run{}".format(i) for i in range(5)])
+        self.assertTrue(len(self.runs.writes) == 2)
+        self.assertTrue([request._filter["_id"] for request in self.runs.writes[1][0]] == ["run1", "run3"])
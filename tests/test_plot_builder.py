@@ -0,0 +1,90 @@
+import numpy as np
+
+import test_base
+from xtlib import plot_builder
+from xtlib.plot_builder import PlotBuilder
+
+def old_smooth(values, weight):
+    # the apply_smooth_factor_core() of earlier builds (applied here to the values of one run)
+    smooth_values = []
+
+    if values:
+        prev = values[0]
+        for value in values:
+            smooth = weight*prev + (1-weight)*value
+            smooth_values.append(smooth)
+            prev = smooth
+
+    return smooth_values
+
+def old_aggregate(dfx, group_by, x_col, y_cols, aggregate, stats):
+    # the get_agg_df() and build_agg_stat() of earlier builds (one groupby().agg() per stat)
+    grouped = dfx.groupby([group_by, x_col])
+    df_out = grouped.agg({col: aggregate for col in y_cols}).reset_index()
+
+    for stat in stats:
+        df_stat = grouped.agg({col: stat for col in y_cols}).reset_index()
+        for col in y_cols:
+            df_out[col + "_{}_".format(stat.upper())] = df_stat[col]
+
+    return df_out
+
+class TestPlotBuilder(test_base.TestBase):
+    '''
+    the data frames of the plot command: smoothing and aggregation give the same values as the PlotBuilder of
+    earlier builds (with smoothing now restarted for each run).
+    '''
+    def make_builder(self, smoothing_factor=None, aggregate=None, group_by=None, error_bars=None, shadow_type=None):
+        rand = np.random.RandomState(1)
+        records = []
+
+        for i in range(6):
+            steps = 20 + 5*i
+            columns = {"step": np.arange(steps), "loss": rand.rand(steps), "acc": rand.rand(steps)}
+            records.append({"_id": "run{}".format(i), "node_index": i % 2, "job_id": "job1", "exper_name": "exper1",
+                "ws": "ws1", "metric_sets": [{"keys": ["step", "loss", "acc"], "columns": columns}]})
+
+        run_names = [record["_id"] for record in records]
+
+        return PlotBuilder(run_names, ["loss", "acc"], "step", None, None, None, True, None, None, smoothing_factor,
+            "line", None, aggregate, shadow_type, .2, records, None, False, None, None, group_by, error_bars, False,
+            None, None, ["#1f77b4"], None, None, None, None)
+
+    def get_data_frame(self, pb):
+        data_frames_by_cols = pb.build_data_frames()
+        self.assertTrue(list(data_frames_by_cols) == [str(["step", "loss", "acc"])])
+        return list(data_frames_by_cols.values())[0]
+
+    def test_smoothing(self):
+        for weight in [.6, 1]:
+            pb = self.make_builder(smoothing_factor=weight)
+            dfx = self.get_data_frame(pb)
+            presmooth = {run: list(dfx[dfx["run"] == run]["loss"]) for run in pb.run_names}
+
+            dfx = pb.pre_preprocess_data_frame(dfx)
+
+            for run in pb.run_names:
+                df_run = dfx[dfx["run"] == run]
+                self.assertTrue(np.allclose(df_run["loss"], old_smooth(presmooth[run], weight)))
+                self.assertTrue(list(df_run["loss" + plot_builder.PRESMOOTH]) == presmooth[run])
+
+    def test_aggregation(self):
+        cases = [("mean", "run", "sem", "min-max"), ("max", "node", "std", "var"), ("median", "node", None, None)]
+
+        for aggregate, group_by, error_bars, shadow_type in cases:
+            pb = self.make_builder(aggregate=aggregate, group_by=group_by, error_bars=error_bars, shadow_type=shadow_type)
+            dfx = self.get_data_frame(pb)
+
+            # the earlier builds had plain (not categorical) identity columns
+            df_old = dfx.astype({col: object for col in plot_builder.ID_COLS})
+            expected = old_aggregate(df_old, group_by, "step", ["loss", "acc"], aggregate, pb.get_stat_names())
+
+            dfx = pb.pre_preprocess_data_frame(dfx)
+
+            self.assertTrue(sorted(dfx.columns) == sorted(expected.columns))
+            self.assertTrue(list(dfx[group_by].astype(str)) == list(expected[group_by].astype(str)))
+            self.assertTrue(list(dfx["step"]) == list(expected["step"]))
+
+            for col in expected.columns:
+                if col not in [group_by, "step"]:
+                    self.assertTrue(np.allclose(dfx[col], expected[col], equal_nan=True))
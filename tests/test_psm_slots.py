@@ -0,0 +1,141 @@
+import os
+import sys
+import time
+import shutil
+import zipfile
+import tempfile
+import subprocess
+
+import test_base
+from xtlib.psm import psm
+
+WRAPPED_SH = '''
+echo $PWD > entry_cwd.txt
+echo $XT_CONTROLLER_CWD >> entry_cwd.txt
+date +%s.%N > started.txt
+sleep 2
+date +%s.%N > ended.txt
+'''
+
+class TestPsmSlots(test_base.TestBase):
+    '''
+    the pool service manager: queued entries run concurrently (one per slot, each in its own dir), and the
+    PSM is woken by changes to its queue dir.
+    '''
+    def setup_method(self, method):
+        self.TEST_DIR = tempfile.mkdtemp()
+
+        # point the PSM at our test dirs
+        self.saved = (psm.PSM_QUEUE, psm.PSM_LOGDIR, psm.PSM_SLOTS_FILE, psm.SLOTS_DIR, psm.TOMBSTONES_DIR)
+        psm.PSM_QUEUE = self.TEST_DIR + "/psm_queue"
+        psm.PSM_LOGDIR = self.TEST_DIR + "/psm_logs"
+        psm.PSM_SLOTS_FILE = self.TEST_DIR + "/psm_slots.txt"
+        psm.SLOTS_DIR = self.TEST_DIR + "/cwd/slots"
+        psm.TOMBSTONES_DIR = self.TEST_DIR + "/cwd/slot-tombstones"
+
+        os.makedirs(psm.PSM_QUEUE)
+        os.makedirs(psm.PSM_LOGDIR)
+
+        self.fn_zip = self.TEST_DIR + "/code.zip"
+        with zipfile.ZipFile(self.fn_zip, "w") as zip:
+            zip.writestr(psm.WRAPPER, WRAPPED_SH)
+
+    def teardown_method(self, method):
+        psm.PSM_QUEUE, psm.PSM_LOGDIR, psm.PSM_SLOTS_FILE, psm.SLOTS_DIR, psm.TOMBSTONES_DIR = self.saved
+        shutil.rmtree(self.TEST_DIR)
+
+    def enqueue(self, run, ticks):
+        fn_entry = "team.job1.{}.node0.{}.zip".format(run, ticks)
+        shutil.copyfile(self.fn_zip, psm.PSM_QUEUE + "/" + fn_entry)
+        return fn_entry
+
+    def read_text(self, fn):
+        with open(fn, "rt") as infile:
+            return infile.read()
+
+    def wait_for_tombstones(self, timeout=30):
+        started = time.time()
+        while os.listdir(psm.TOMBSTONES_DIR) and time.time() - started < timeout:
+            time.sleep(.05)
+
+    def set_slots(self, count):
+        with open(psm.PSM_SLOTS_FILE, "wt") as outfile:
+            outfile.write(str(count))
+
+    def test_concurrent_entries(self):
+        self.set_slots(3)
+        entries = [self.enqueue("run{}".format(i), 1000 + i) for i in range(4)]
+
+        slots = []
+        psm.process_queue(slots, 0)
+
+        # the 3 oldest entries run at once; the 4th waits for a free slot
+        self.assertTrue([slot.fn_entry for slot in slots] == entries[:3])
+        self.assertTrue(os.listdir(psm.PSM_QUEUE) == [entries[3]])
+
+        # each slot records the port of its entry's controller
+        ports = [int(self.read_text(slot.dir + "/" + psm.CURRENT_ENTRY_PORT)) for slot in slots]
+        self.assertTrue(ports == [psm.CONTROLLER_PORT, psm.CONTROLLER_PORT + 1, psm.CONTROLLER_PORT + 2])
+
+        while any([slot.process.poll() is None for slot in slots]):
+            time.sleep(.05)
+
+        times = []
+        for slot in slots:
+            with open(slot.dir + "/entry_cwd.txt") as infile:
+                self.assertTrue(infile.read().split() == [slot.dir, slot.dir])
+
+            times.append([float(self.read_text(slot.dir + "/" + fn)) for fn in ["started.txt", "ended.txt"]])
+
+        # the entries ran at the same time
+        self.assertTrue(max([started for started, ended in times]) < min([ended for started, ended in times]))
+
+        # the slots are freed when their entries exit
+        psm.process_queue(slots, 4)
+
+        self.assertTrue(slots[0].fn_entry == entries[3])
+        self.assertTrue(not slots[1].is_busy() and not slots[2].is_busy())
+        self.assertTrue(not os.path.exists(slots[1].dir + "/" + psm.CURRENT_RUNNING_ENTRY))
+
+        # the previous entry's slot dir was moved aside (and is deleted in the background)
+        self.assertTrue(not os.path.exists(slots[0].dir + "/started.txt"))
+        self.wait_for_tombstones()
+        self.assertTrue(os.listdir(psm.TOMBSTONES_DIR) == [])
+
+        slots[0].process.wait()
+
+    def test_adopt_running_entry(self):
+        # an entry started by an earlier PSM (here, a process that isn't the PSM's child)
+        process = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+
+        slot_dir = psm.SLOTS_DIR + "/slot0"
+        os.makedirs(slot_dir)
+        with open(slot_dir + "/" + psm.CURRENT_RUNNING_ENTRY, "wt") as outfile:
+            outfile.write("team.job1.run1.node0.1000.zip")
+        with open(slot_dir + "/" + psm.CURRENT_ENTRY_PID, "wt") as outfile:
+            outfile.write(str(process.pid))
+
+        slot = psm.Slot(0)
+        self.assertTrue(slot.is_busy() and slot.pid == process.pid)
+
+        process.kill()
+        process.wait()
+
+        slot.check_for_exit()
+        self.assertTrue(not slot.is_busy())
+        self.assertTrue(os.listdir(slot_dir) == [])
+
+    def test_queue_watcher(self):
+        observer = psm.start_queue_watcher()
+        self.assertTrue(observer is not None)
+
+        psm.wake_event.clear()
+        started = time.time()
+        self.enqueue("run1", 1000)
+
+        # woken by the new entry (not by polling)
+        self.assertTrue(psm.wake_event.wait(5))
+        self.assertTrue(time.time() - started < psm.POLL_SECS)
+
+        observer.stop()
+        observer.join()
@@ -0,0 +1,184 @@
+import os
+import shutil
+import tempfile
+
+import test_base
+from xtlib.storage import run_cache
+
+class FakeCollection():
+    ''' the subset of a pymongo collection used by the run cache (find with a filter and a projection) '''
+    def __init__(self):
+        self.docs = {}
+
+    def find(self, filter_dict, fields_dict):
+        return [run_cache.project_fields(doc, fields_dict) for doc in self.docs.values()
+            if run_cache.match_filter(doc, filter_dict)]
+
+class FakeMongo():
+    def __init__(self, ws_name):
+        self.mongo_db = {ws_name: FakeCollection()}
+
+    def mongo_with_retries(self, name, cmd):
+        return cmd()
+
+class CountingRunCache(run_cache.RunCache):
+    def __init__(self, cache_dir, **kwargs):
+        super().__init__(cache_dir, **kwargs)
+        self.save_count = 0
+
+    def _save(self, ws_name, cache):
+        self.save_count += 1
+        super()._save(ws_name, cache)
+
+class TestRunCache(test_base.TestBase):
+    '''
+    the local run summary cache: incremental syncs, invalidation of ended runs, and no rewrites when nothing changed.
+    '''
+    def setup_method(self, method):
+        self.TEST_DIR = tempfile.mkdtemp()
+        self.WS = "ws1"
+        self.mongo = FakeMongo(self.WS)
+        self.db = self.mongo.mongo_db[self.WS]
+
+        for i in range(5):
+            self.add_run("run{}".format(i), end_id=i+1)
+        self.add_run("run5")
+
+    def teardown_method(self, method):
+        shutil.rmtree(self.TEST_DIR)
+
+    def add_run(self, run_id, end_id=None, tags=None):
+        doc = {"_id": run_id, "last_time": "t1", "status": "running", "tags": tags or {}, "log_records": [{"event": "x"}]}
+        if end_id:
+            doc["end_id"] = end_id
+            doc["status"] = "completed"
+        self.db.docs[run_id] = doc
+
+    def get_runs(self, cache):
+        return {doc["_id"]: doc for doc in cache.get_runs(self.mongo, self.WS)}
+
+    def get_error(self, call):
+        try:
+            call()
+        except BaseException as ex:
+            return ex
+
+    def test_incremental_sync(self):
+        cache = CountingRunCache(self.TEST_DIR)
+
+        runs = self.get_runs(cache)
+        self.assertTrue(len(runs) == 6)
+        self.assertTrue(not "log_records" in runs["run0"])
+
+        # nothing changed: the cache file isn't rewritten
+        self.get_runs(cache)
+        self.assertTrue(cache.save_count == 1)
+
+        # an unfinished run logs something and then ends
+        self.db.docs["run5"].update({"last_time": "t2", "status": "completed", "end_id": 6})
+        runs = self.get_runs(cache)
+        self.assertTrue(runs["run5"]["status"] == "completed")
+
+        # a new run
+        self.add_run("run6")
+        runs = self.get_runs(cache)
+        self.assertTrue("run6" in runs)
+
+    def test_ended_runs_are_swept(self):
+        cache = CountingRunCache(self.TEST_DIR, sweep_secs=0)
+        self.get_runs(cache)
+
+        # an ended run (outside the ended window) is deleted, and another is changed, by another client
+        cache.ended_window = 0
+        del self.db.docs["run0"]
+        self.db.docs["run1"].update({"last_time": "t2", "status": "error"})
+
+        runs = self.get_runs(cache)
+        self.assertTrue(not "run0" in runs)
+        self.assertTrue(runs["run1"]["status"] == "error")
+
+    def test_periodic_resync(self):
+        cache = CountingRunCache(self.TEST_DIR)
+        self.get_runs(cache)
+
+        # a tag change by another client doesn't update last_time: only a full resync finds it
+        cache.ended_window = 0
+        self.db.docs["run1"]["tags"] = {"best": True}
+
+        runs = self.get_runs(cache)
+        self.assertTrue(runs["run1"]["tags"] == {})
+
+        cache.resync_secs = 0
+        runs = self.get_runs(cache)
+        self.assertTrue(runs["run1"]["tags"] == {"best": True})
+
+    def test_mark_stale(self):
+        cache = CountingRunCache(self.TEST_DIR)
+        self.get_runs(cache)
+
+        # a local tag update: the run is refetched on the next sync, without rewriting the cache file now
+        cache.ended_window = 0
+        self.db.docs["run1"]["tags"] = {"best": True}
+        cache.mark_stale(self.WS, {"_id": "run1"})
+        self.assertTrue(cache.save_count == 1)
+
+        runs = self.get_runs(cache)
+        self.assertTrue(runs["run1"]["tags"] == {"best": True})
+        self.assertTrue(not os.path.exists(cache.get_stale_fn(self.WS)))
+
+        # stale by filter
+        self.db.docs["run2"]["tags"] = {"best": True}
+        cache.mark_stale(self.WS, {"status": "completed"})
+
+        runs = self.get_runs(cache)
+        self.assertTrue(runs["run2"]["tags"] == {"best": True})
+
+    def test_match_filter(self):
+        match = run_cache.match_filter
+        doc = {"_id": "run1", "status": "completed", "end_id": 5, "score": .75, "job": "job3", "tags": ["best", "v2"],
+            "hparams": {"lr": .01, "opt": "adam"}, "exper_name": None}
+
+        # equality, dotted paths, and array membership
+        self.assertTrue(match(doc, {"status": "completed", "hparams.opt": "adam"}))
+        self.assertTrue(not match(doc, {"status": "running"}))
+        self.assertTrue(match(doc, {"tags": "best"}) and not match(doc, {"tags": "worst"}))
+        self.assertTrue(match(doc, {"tags": ["best", "v2"]}))
+
+        # a missing field (or a null one) equals None
+        self.assertTrue(match(doc, {"parent_name": None}) and match(doc, {"exper_name": None}))
+        self.assertTrue(not match(doc, {"hparams.momentum": .9}))
+
+        # operators
+        self.assertTrue(match(doc, {"end_id": {"$gt": 4, "$lte": 5}}))
+        self.assertTrue(not match(doc, {"end_id": {"$gte": 6}}))
+        self.assertTrue(match(doc, {"status": {"$in": ["completed", "error"]}, "job": {"$nin": ["job1"]}}))
+        self.assertTrue(match(doc, {"status": {"$ne": "running"}}) and not match(doc, {"parent_name": {"$ne": None}}))
+        self.assertTrue(match(doc, {"score": {"$exists": True}, "parent_name": {"$exists": False}}))
+        self.assertTrue(match(doc, {"exper_name": {"$type": 10}}) and not match(doc, {"parent_name": {"$type": "null"}}))
+        self.assertTrue(match(doc, {"job": {"$regex": "^job[0-9]$"}}) and not match(doc, {"end_id": {"$regex": "5"}}))
+
+        # values of different types (or missing values) never match a relational operator
+        self.assertTrue(not match(doc, {"status": {"$gt": 3}}) and not match(doc, {"restarts": {"$lt": 3}}))
+
+        # $or and $and
+        self.assertTrue(match(doc, {"$or": [{"status": "running"}, {"score": {"$gt": .5}}]}))
+        self.assertTrue(not match(doc, {"$and": [{"status": "completed"}, {"score": {"$gt": .8}}]}))
+
+        # filters that can't be evaluated locally (the cache then queries mongo-db)
+        self.assertTrue(isinstance(self.get_error(lambda: match(doc, {"$where": "true"})), run_cache.UnsupportedFilter))
+        self.assertTrue(isinstance(self.get_error(lambda: match(doc, {"tags": {"$all": ["best"]}})), run_cache.UnsupportedFilter))
+        self.assertTrue(isinstance(self.get_error(lambda: match(doc, {"score": {"$type": "double"}})), run_cache.UnsupportedFilter))
+
+    def test_project_fields(self):
+        project = run_cache.project_fields
+        doc = {"_id": "run1", "status": "completed", "hparams": {"lr": .01, "opt": "adam"}, "log_records": [1, 2]}
+
+        self.assertTrue(project(doc, None) is doc)
+        self.assertTrue(project(doc, {"status": 1, "hparams.lr": 1}) == {"_id": "run1", "status": "completed",
+            "hparams": {"lr": .01}})
+        self.assertTrue(project(doc, {"_id": 0, "status": 1, "missing": 1}) == {"status": "completed"})
+
+        # exclusion projections don't change the doc
+        self.assertTrue(project(doc, {"log_records": 0, "hparams.opt": 0}) == {"_id": "run1", "status": "completed",
+            "hparams": {"lr": .01}})
+        self.assertTrue(doc["hparams"] == {"lr": .01, "opt": "adam"} and "log_records" in doc)
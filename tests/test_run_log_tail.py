@@ -0,0 +1,131 @@
+import json
+import shutil
+import tempfile
+
+import test_base
+from xtlib import utils
+from xtlib import constants
+from xtlib.storage.store_file import FileStore
+from xtlib.storage.store_objects import StoreBlobObjs
+
+class RangelessFileStore(FileStore):
+    ''' a provider written before get_blob_range was added (it is optional; see store_interface.py) '''
+    get_blob_range = None
+
+class TestRunLogTailFileStorage(test_base.TestBase):
+    '''
+    tailing a run log: each poll reads only the bytes appended since the last poll, and returns only complete records.
+    '''
+    def setup_class(cls):
+        """
+        Setup once for all tests
+        """
+        cls.TEST_DIR = tempfile.mkdtemp()
+        cls.WS = "tail-test"
+
+        storage_creds = {"provider": "store-file", "path": cls.TEST_DIR}
+        cls.store = StoreBlobObjs(storage_creds, provider_code_path="xtlib.storage.store_file.FileStore")
+        cls.provider = cls.store.provider
+
+        cls.provider.create_container(cls.WS)
+
+    def teardown_class(cls):
+        """
+        Teardown once after all tests
+        """
+        shutil.rmtree(cls.TEST_DIR)
+
+    def make_records(self, count, start=0):
+        records = [{"time": utils.get_time(), "event": "metrics", "data": {"step": start+i, "loss": 1/(1+start+i),
+            "acc": .5}} for i in range(count)]
+        return records
+
+    def append_records(self, run_name, records):
+        text = "".join([json.dumps(record) + "\n" for record in records])
+        self.provider.append_blob(self.WS, self.get_log_path(run_name), text)
+
+    def get_log_path(self, run_name):
+        return constants.RUNS_DIR + "/" + run_name + "/" + constants.RUN_LOG
+
+    def test_tail_partial_records(self):
+        run_name = "run1"
+        self.provider.create_blob(self.WS, self.get_log_path(run_name), "")
+
+        records, offset = self.store.tail_run_log(self.WS, run_name)
+        self.assertTrue(records == [] and offset == 0)
+
+        self.append_records(run_name, self.make_records(3))
+        self.provider.append_blob(self.WS, self.get_log_path(run_name), '{"time": "x", "eve')
+
+        # the partial record is not returned (until it is complete)
+        records, offset = self.store.tail_run_log(self.WS, run_name)
+        self.assertTrue(len(records) == 3)
+
+        self.provider.append_blob(self.WS, self.get_log_path(run_name), 'nt": "ended", "data": null}\n')
+        records, offset = self.store.tail_run_log(self.WS, run_name, offset)
+        self.assertTrue(len(records) == 1 and records[0]["event"] == "ended")
+
+        records, offset2 = self.store.tail_run_log(self.WS, run_name, offset)
+        self.assertTrue(records == [] and offset2 == offset)
+
+        self.assertTrue(len(self.store.get_run_log(self.WS, run_name)) == 4)
+
+    def test_tail_offsets(self):
+        run_name = "run2"
+        path = self.get_log_path(run_name)
+        records = self.make_records(20)
+        lines = [json.dumps(record) + "\n" for record in records]
+
+        self.provider.create_blob(self.WS, path, "")
+        self.append_records(run_name, records[:5])
+
+        # record the ranged reads made by each poll
+        starts = []
+        get_blob_range = self.provider.get_blob_range
+
+        def recording_get_blob_range(container, blob_path, start=0, end=None):
+            starts.append(start)
+            return get_blob_range(container, blob_path, start, end)
+
+        self.provider.get_blob_range = recording_get_blob_range
+
+        try:
+            tailed, offset = self.store.tail_run_log(self.WS, run_name)
+            self.assertTrue(tailed == records[:5])
+            self.assertTrue(offset == len("".join(lines[:5]).encode()))
+
+            # each poll reads only from its offset, and returns only the new records
+            self.append_records(run_name, records[5:20])
+            tailed, offset2 = self.store.tail_run_log(self.WS, run_name, offset)
+            self.assertTrue(tailed == records[5:20])
+            self.assertTrue(offset2 == len("".join(lines).encode()))
+            self.assertTrue(starts == [0, offset])
+
+            tailed, offset3 = self.store.tail_run_log(self.WS, run_name, offset2)
+            self.assertTrue(tailed == [] and offset3 == offset2)
+        finally:
+            del self.provider.get_blob_range
+
+        self.assertTrue(self.store.get_run_log(self.WS, run_name) == records)
+
+    def test_tail_without_get_blob_range(self):
+        run_name = "run3"
+        records = self.make_records(6)
+        lines = [json.dumps(record) + "\n" for record in records]
+
+        store = StoreBlobObjs({"provider": "store-file", "path": self.TEST_DIR}, 
+            provider_code_path="xtlib.storage.store_file.FileStore")
+        store.provider = RangelessFileStore({"provider": "store-file", "path": self.TEST_DIR})
+
+        self.append_records(run_name, records[:2])
+
+        # the whole blob is read, but only the records at or after the offset are returned
+        tailed, offset = store.tail_run_log(self.WS, run_name)
+        self.assertTrue(tailed == records[:2] and offset == len("".join(lines[:2]).encode()))
+
+        self.append_records(run_name, records[2:])
+        tailed, offset = store.tail_run_log(self.WS, run_name, offset)
+        self.assertTrue(tailed == records[2:] and offset == len("".join(lines).encode()))
+
+        self.assertTrue(store.get_run_log(self.WS, run_name) == records)
+        store.close()
@@ -0,0 +1,129 @@
+import os
+import time
+import shutil
+import tempfile
+
+import test_base
+from xtlib import utils
+from xtlib import controller
+from xtlib.helpers.bag import Bag
+
+class RundirController(controller.XTController):
+    '''
+    the controller's rundir allocation and queue processing (no rpyc service, stdout capture, or runs here).
+    '''
+    def __init__(self, cwd):
+        # don't call XTController.__init__
+        self.cwd = cwd
+        self.rundir_parent = cwd + "/rundirs"
+        self.rundirs = {}
+        self.runs = {}
+        self.queue = []
+        self.queue_signalled = False
+        self.concurrent = 1
+        self.tombstones = []
+        self.tombstone_deleter = None
+        self.started_runs = []
+
+        os.makedirs(self.rundir_parent)
+
+    def on_idle(self):
+        pass
+
+    def process_queue_entry(self, run_info):
+        self.started_runs.append(run_info.run_name)
+
+class TestRundirRecycle(test_base.TestBase):
+    '''
+    reusing a rundir: the previous run's files are deleted in the background, not before the next run starts.
+    '''
+    def setup_method(self, method):
+        self.TEST_DIR = tempfile.mkdtemp()
+
+    def teardown_method(self, method):
+        shutil.rmtree(self.TEST_DIR)
+
+    def fill_rundir(self, runpath, files):
+        for i in range(files):
+            fn = "{}/checkpoints/ckpt{}/part{}.bin".format(runpath, i % 100, i)
+            os.makedirs(os.path.dirname(fn), exist_ok=True)
+            with open(fn, "wb") as outfile:
+                outfile.write(b"x" * 1024)
+
+    def wait_for_tombstones(self, ctr, timeout=60):
+        started = time.time()
+        while ctr.tombstones and time.time() - started < timeout:
+            time.sleep(.05)
+
+    def test_reuse_full_rundir(self):
+        files = 200
+        ctr = RundirController(self.TEST_DIR)
+
+        # no deleter thread yet, so the tombstone can be checked before it is deleted
+        ctr.tombstone_parent = self.TEST_DIR + "/" + controller.TOMBSTONES_DIR
+
+        runpath, index = ctr.allocate_rundir("run1")
+        self.fill_rundir(runpath, files)
+        ctr.return_rundir(runpath)
+
+        runpath2, index2 = ctr.allocate_rundir("run2")
+
+        # the reused rundir is empty; its previous contents were moved to a tombstone
+        self.assertTrue(runpath2 == runpath and index2 == index)
+        self.assertTrue(os.listdir(runpath2) == [])
+
+        self.assertTrue(len(ctr.tombstones) == 1)
+        tombstone = ctr.tombstones[0]
+        self.assertTrue(os.path.dirname(tombstone) == ctr.tombstone_parent)
+        self.assertTrue(os.path.basename(tombstone).startswith("rundir1."))
+        self.assertTrue(len(os.listdir(tombstone + "/checkpoints")) == 100)
+
+        # the tombstone is deleted in the background
+        ctr.init_tombstones()
+        self.wait_for_tombstones(ctr)
+        self.assertTrue(not ctr.tombstones)
+        self.assertTrue(not os.path.exists(tombstone))
+        self.assertTrue(os.listdir(ctr.tombstone_parent) == [])
+
+    def test_leftover_tombstones(self):
+        tombstone = self.TEST_DIR + "/" + controller.TOMBSTONES_DIR + "/rundir1.abc"
+        self.fill_rundir(tombstone, 100)
+
+        # a restarted controller deletes the tombstones of the previous controller
+        ctr = RundirController(self.TEST_DIR)
+        ctr.init_tombstones()
+
+        self.wait_for_tombstones(ctr)
+        self.assertTrue(not os.path.exists(tombstone))
+
+    def test_disk_space_watermark(self):
+        ctr = RundirController(self.TEST_DIR)
+
+        run_info = Bag()
+        run_info.run_name = "run1"
+        run_info.workspace = "ws1"
+        run_info.status = "queued"
+        run_info.priority = controller.PRIORITY_NORMAL
+        run_info.run_as_parent = False
+        run_info.parent_prep_needed = False
+
+        # a watermark that is more than the free space on any disk
+        run_info.context = utils.dict_to_object({"rundir_min_free_gb": 1000*1000*1000})
+
+        ctr.add_to_runs(run_info)
+        with controller.queue_lock:
+            ctr.add_to_queue(run_info)
+
+        # no tombstones being deleted: the watermark doesn't hold back the run
+        ctr.tombstones = []
+        self.assertTrue(not ctr.is_waiting_for_disk_space(run_info))
+
+        # held back while a tombstone is being deleted
+        ctr.tombstones = [self.TEST_DIR + "/tombstone"]
+        ctr.queue_check()
+        self.assertTrue(ctr.started_runs == [])
+
+        # ... and started when the tombstones are gone
+        ctr.tombstones = []
+        ctr.queue_check()
+        self.assertTrue(ctr.started_runs == ["run1"])
@@ -0,0 +1,147 @@
+import os
+import time
+import shutil
+import tempfile
+
+import test_base
+from xtlib.storage.store_emulator import EmulatorStore, EmulatorHttpError
+from xtlib.storage.store_objects import StoreBlobObjs
+
+class TestStoreEmulator(test_base.TestBase):
+    '''
+    Azure semantics of the storage emulator, and its injected latency and errors.
+    '''
+    def setup_method(self, method):
+        self.TEST_DIR = tempfile.mkdtemp()
+        self.CONTAINER = "emulator-test"
+
+    def teardown_method(self, method):
+        shutil.rmtree(self.TEST_DIR)
+
+    def make_store(self, retry_func=None, **props):
+        storage_creds = {"provider": "store-emulator", "path": self.TEST_DIR}
+        storage_creds.update(props)
+
+        store = EmulatorStore(storage_creds)
+        store.set_retry(retry_func)
+        store.create_container(self.CONTAINER)
+        return store
+
+    def get_status(self, call):
+        try:
+            call()
+        except EmulatorHttpError as ex:
+            return ex.status_code
+
+    def test_conditional_writes(self):
+        store = self.make_store()
+
+        store.create_blob(self.CONTAINER, "a.txt", "v1", fail_if_exists=True)
+        self.assertTrue(self.get_status(lambda: store.create_blob(self.CONTAINER, "a.txt", "v2", fail_if_exists=True)) == 409)
+
+        etag = store.get_blob_properties(self.CONTAINER, "a.txt").properties.etag
+        store._put_blob(self.CONTAINER, "a.txt", b"v2", if_match=etag)
+        self.assertTrue(self.get_status(lambda: store._put_blob(self.CONTAINER, "a.txt", b"v3", if_match=etag)) == 412)
+        self.assertTrue(store.get_blob_text(self.CONTAINER, "a.txt") == "v2")
+
+        store.append_blob(self.CONTAINER, "names.txt", "run1\n", append_with_rewrite=True)
+        store.append_blob(self.CONTAINER, "names.txt", "run2\n", append_with_rewrite=True)
+        self.assertTrue(store.get_blob_text(self.CONTAINER, "names.txt") == "run1\nrun2\n")
+
+        self.assertTrue(self.get_status(lambda: store.get_blob_text(self.CONTAINER, "missing.txt")) == 404)
+
+    def test_append_blobs(self):
+        store = self.make_store(**{"max-append-blocks": 5})
+
+        for i in range(5):
+            store.append_blob(self.CONTAINER, "run.log", "line {}\n".format(i))
+
+        props = store.get_blob_properties(self.CONTAINER, "run.log").properties
+        self.assertTrue(props.blob_type == "AppendBlob" and props.append_blob_committed_block_count == 5)
+        self.assertTrue(self.get_status(lambda: store.append_blob(self.CONTAINER, "run.log", "more\n")) == 409)
+
+        # appends to a block blob are rejected
+        store.create_blob(self.CONTAINER, "block.txt", "text")
+        self.assertTrue(self.get_status(lambda: store.append_blob(self.CONTAINER, "block.txt", "more")) == 409)
+
+        self.assertTrue(store.get_blob_range(self.CONTAINER, "run.log", 7) == b"line 1\nline 2\nline 3\nline 4\n")
+        self.assertTrue(store.get_blob_range(self.CONTAINER, "run.log", 35) == b"")
+
+    def test_snapshots_and_listing(self):
+        store = self.make_store()
+
+        store.create_blob(self.CONTAINER, "runs/run1/output/model.txt", "v1")
+        store.create_blob(self.CONTAINER, "runs/run2/run.log", "")
+        ss = store.snapshot_blob(self.CONTAINER, "runs/run1/output/model.txt").snapshot
+        store.create_blob(self.CONTAINER, "runs/run1/output/model.txt", "v2")
+
+        fn = os.path.join(self.TEST_DIR, "model.txt")
+        store.get_blob_to_path(self.CONTAINER, "runs/run1/output/model.txt", fn, snapshot=ss)
+        with open(fn) as infile:
+            self.assertTrue(infile.read() == "v1")
+
+        self.assertTrue(store.list_blobs(self.CONTAINER, "runs", recursive=False) == ["runs/run1/", "runs/run2/"])
+        self.assertTrue(store.list_blobs(self.CONTAINER, "runs/run1") == ["runs/run1/output/model.txt"])
+
+        store.delete_blob(self.CONTAINER, "runs/run1/output/model.txt")
+        self.assertTrue(store.list_blobs(self.CONTAINER, "runs") == ["runs/run2/run.log"])
+
+    def test_async_copies(self):
+        store = self.make_store(**{"async-copy-mb": 1, "latency-ms": 10})
+        store.create_blob(self.CONTAINER, "big.bin", "x"*1024*1024)
+
+        self.assertTrue(store.copy_blob(self.CONTAINER, "big.bin", self.CONTAINER, "copy/big.bin") == "pending")
+        time.sleep(.02)
+        self.assertTrue(store.get_copy_statuses(self.CONTAINER, "copy/")["copy/big.bin"][0] == "success")
+
+    def test_injected_throttling_is_retried(self):
+        retries = []
+
+        def retry_func(context):
+            retries.append(context.response.status)
+            return 0 if context.response.status == 503 else None
+
+        store = self.make_store(retry_func, **{"throttle-rate": .3, "seed": 1})
+        for i in range(50):
+            store.create_blob(self.CONTAINER, "blob{}.txt".format(i), "text")
+
+        self.assertTrue(len(store.list_blobs(self.CONTAINER)) == 50)
+        self.assertTrue(retries and set(retries) == {503})
+
+    def test_parallel_upload(self):
+        storage_creds = {"provider": "store-emulator", "path": self.TEST_DIR, "latency-ms": 20}
+        helper = StoreBlobObjs(storage_creds, provider_code_path="xtlib.storage.store_emulator.EmulatorStore")
+        helper.provider.create_container(self.CONTAINER)
+
+        source_dir = os.path.join(self.TEST_DIR, "source")
+        os.makedirs(source_dir)
+        for i in range(40):
+            with open(os.path.join(source_dir, "file{}.txt".format(i)), "wt") as outfile:
+                outfile.write("text{}".format(i))
+
+        helper.transfer_workers = 8
+        helper.provider.reset_request_counts()
+        helper._upload_files(self.CONTAINER, "workers8", source_dir + "/*")
+
+        names = helper.provider.list_blobs(self.CONTAINER, path="workers8")
+        self.assertTrue(sorted(names) == sorted(["workers8/file{}.txt".format(i) for i in range(40)]))
+        self.assertTrue(helper.provider.get_request_counts().get("put_blob") == 40)
+        self.assertTrue(helper.provider.get_blob_text(self.CONTAINER, "workers8/file7.txt") == "text7")
+
+    def test_reads_delayed_once(self):
+        store = self.make_store()
+        store.create_blob(self.CONTAINER, "a.txt", "0123456789")
+
+        delays = []
+        store._delay = lambda size=0: delays.append(size)
+
+        store.get_blob_text(self.CONTAINER, "a.txt")
+        self.assertTrue(delays == [10])
+
+        del delays[:]
+        store.get_blob_range(self.CONTAINER, "a.txt", 2, 5)
+        self.assertTrue(delays == [4])
+
+        del delays[:]
+        store.get_blob_to_path(self.CONTAINER, "a.txt", os.path.join(self.TEST_DIR, "a.txt"))
+        self.assertTrue(delays == [0, 10])
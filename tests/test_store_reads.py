@@ -0,0 +1,126 @@
+import os
+import shutil
+import tempfile
+
+import test_base
+from xtlib import utils
+from xtlib import errors
+from xtlib import constants
+from xtlib.storage import store_objects
+from xtlib.storage.store_file import FileStore
+from xtlib.storage.store_objects import StoreBlobObjs
+
+class CountingFileStore(FileStore):
+    ''' records the read and existence calls made to the provider; can fail its reads '''
+    def __init__(self, storage_creds):
+        super().__init__(storage_creds)
+        self.calls = []
+        self.read_error = None
+
+    def get_blob_text(self, container, blob_path):
+        self.calls.append("get_blob_text")
+        if self.read_error:
+            raise self.read_error
+        return super().get_blob_text(container, blob_path)
+
+    def does_container_exist(self, container):
+        self.calls.append("does_container_exist")
+        return super().does_container_exist(container)
+
+    def does_blob_exist(self, container, blob_path):
+        self.calls.append("does_blob_exist")
+        return super().does_blob_exist(container, blob_path)
+
+class RetryContext():
+    ''' the retry context that the azure storage SDK passes to its retry function '''
+    def __init__(self, status):
+        self.response = utils.PropertyBag()
+        self.response.status = status
+        self.exception = IOError("status={}".format(status))
+
+class TestStoreReads(test_base.TestBase):
+    '''
+    blob reads: optimistic reads (existence is only checked when a read fails), the workspace existence cache,
+    and no retries of non-transient azure statuses.
+    '''
+    def setup_method(self, method):
+        self.TEST_DIR = tempfile.mkdtemp()
+        self.WS = "read-test"
+
+        storage_creds = {"provider": "store-file", "path": self.TEST_DIR + "/store"}
+        self.store = StoreBlobObjs(storage_creds, provider_code_path="xtlib.storage.store_file.FileStore")
+        self.store.provider = self.provider = CountingFileStore(storage_creds)
+
+        self.provider.create_container(self.WS)
+        self.provider.create_blob(self.WS, "info.txt", "hello")
+        self.provider.create_blob(self.WS, "empty.txt", "")
+
+        self.azure_errors_fn = constants.AZURE_ERRORS_FN
+        constants.AZURE_ERRORS_FN = self.TEST_DIR + "/azure_errors.txt"
+
+    def teardown_method(self, method):
+        constants.AZURE_ERRORS_FN = self.azure_errors_fn
+        self.store.close()
+        shutil.rmtree(self.TEST_DIR)
+
+    def get_error(self, call):
+        try:
+            call()
+        except BaseException as ex:
+            return ex
+
+    def test_optimistic_read(self):
+        # a read of an existing blob is a single request
+        self.assertTrue(self.store._read_blob(self.WS, "info.txt") == "hello")
+        self.assertTrue(self.store._read_blob(self.WS, "empty.txt") == "")
+        self.assertTrue(self.provider.calls == ["get_blob_text", "get_blob_text"])
+
+        # failed reads are mapped to friendly errors
+        ex = self.get_error(lambda: self.store._read_blob(self.WS, "missing.txt"))
+        self.assertTrue(isinstance(ex, errors.StoreError) and "blob doesn't exist" in str(ex))
+
+        ex = self.get_error(lambda: self.store._read_blob("missing-ws", "info.txt"))
+        self.assertTrue(isinstance(ex, errors.StoreError) and "container doesn't exist" in str(ex))
+
+        # ... or re-raised, if the blob exists
+        self.provider.read_error = IOError("service unavailable")
+        ex = self.get_error(lambda: self.store._read_blob(self.WS, "info.txt"))
+        self.assertTrue(ex is self.provider.read_error)
+
+    def test_workspace_exists_cache(self):
+        self.assertTrue(self.store.does_workspace_exist(self.WS))
+        self.assertTrue(self.store.does_workspace_exist(self.WS))
+        self.assertTrue(self.provider.calls.count("does_container_exist") == 1)
+
+        # missing workspaces are not cached
+        self.assertTrue(not self.store.does_workspace_exist("new-ws"))
+        self.provider.create_container("new-ws")
+        self.assertTrue(self.store.does_workspace_exist("new-ws"))
+
+        # a failed read (of a deleted workspace) drops the cache entry
+        self.provider.delete_container(self.WS)
+        self.get_error(lambda: self.store._read_blob(self.WS, "info.txt"))
+        self.assertTrue(not self.store.does_workspace_exist(self.WS))
+
+        # entries expire
+        ttl = store_objects.WORKSPACE_EXISTS_TTL
+        store_objects.WORKSPACE_EXISTS_TTL = 0
+        try:
+            count = self.provider.calls.count("does_container_exist")
+            self.store.does_workspace_exist("new-ws")
+            self.assertTrue(self.provider.calls.count("does_container_exist") == count + 1)
+        finally:
+            store_objects.WORKSPACE_EXISTS_TTL = ttl
+
+    def test_non_retryable_status(self):
+        retry = utils.make_retry_func(max_retries=2)
+
+        # not found, condition not met, and bad range (the ranged GET of a 0-length blob) are not retried or logged
+        for status in utils.NON_RETRYABLE_STATUS:
+            self.assertTrue(retry(RetryContext(status)) is None)
+        self.assertTrue(not os.path.exists(constants.AZURE_ERRORS_FN))
+
+        # other errors are logged and retried (up to max_retries)
+        context = RetryContext(503)
+        self.assertTrue([retry(context) for i in range(3)] == [2, 4, None])
+        self.assertTrue(os.path.exists(constants.AZURE_ERRORS_FN))
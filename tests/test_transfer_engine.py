@@ -0,0 +1,162 @@
+import os
+import shutil
+import datetime
+import tempfile
+
+import test_base
+from xtlib import utils
+from xtlib import errors
+from xtlib.storage import transfer_engine
+from xtlib.storage.transfer_engine import TransferEngine, COPIED, SKIPPED, FAILED
+
+class NoBackoffRandom():
+    ''' retries without waiting '''
+    def uniform(self, a, b):
+        return 0
+
+class RecordingProgress():
+    ''' the FeedbackProgress methods used by the transfer engine '''
+    def __init__(self):
+        self.calls = []
+
+    def start(self):
+        self.calls.append("start")
+
+    def end(self):
+        self.calls.append("end")
+
+    def erase_last_msg(self):
+        pass
+
+    def files_progress(self, files_done, files_total, bytes_done, bytes_total):
+        self.calls.append((files_done, files_total, bytes_done, bytes_total))
+
+class FlakyTransfer():
+    ''' a transfer function that fails the first N attempts of each source in 'failures_by_source' (source: N) '''
+    def __init__(self, failures_by_source=None, error=None):
+        self.failures_by_source = dict(failures_by_source or {})
+        self.error = error
+        self.attempts = {}
+        self.copied = []
+
+    def __call__(self, source, dest, progress_callback):
+        self.attempts[source] = 1 + self.attempts.get(source, 0)
+
+        if self.attempts[source] <= self.failures_by_source.get(source, 0):
+            # a partial transfer before the failure
+            progress_callback(5, 10)
+            raise self.error or IOError("injected failure")
+
+        progress_callback(10, 10)
+        self.copied.append(source)
+
+class TestTransferEngine(test_base.TestBase):
+    '''
+    the concurrent transfer of a list of files: per-file retries, resume (skip files that are already current),
+    and aggregate progress.
+    '''
+    def setup_method(self, method):
+        self.TEST_DIR = tempfile.mkdtemp()
+        self.random = transfer_engine.random
+        transfer_engine.random = NoBackoffRandom()
+
+    def teardown_method(self, method):
+        transfer_engine.random = self.random
+        shutil.rmtree(self.TEST_DIR)
+
+    def make_items(self, count):
+        return [("file{}.txt".format(i), "dest/file{}.txt".format(i)) for i in range(count)]
+
+    def get_error(self, call):
+        try:
+            call()
+        except BaseException as ex:
+            return ex
+
+    def make_blob_props(self, size, mtime):
+        props = utils.PropertyBag()
+        props.content_length = size
+        props.last_modified = datetime.datetime.fromtimestamp(mtime)
+
+        blob = utils.PropertyBag()
+        blob.properties = props
+        return blob
+
+    def test_per_file_retry(self):
+        items = self.make_items(20)
+        transfer = FlakyTransfer({"file3.txt": 2, "file7.txt": 1})
+
+        engine = TransferEngine(workers=4, retries=2)
+        results = engine.run(items, transfer)
+
+        # each failed file is retried on its own; results are in the order of the items
+        self.assertTrue(results == [(source, dest, COPIED) for source, dest in items])
+        self.assertTrue(transfer.attempts["file3.txt"] == 3 and transfer.attempts["file7.txt"] == 2)
+        self.assertTrue(transfer.attempts["file0.txt"] == 1)
+        self.assertTrue(sorted(transfer.copied) == sorted([source for source, dest in items]))
+
+    def test_failures_are_reported(self):
+        items = self.make_items(5)
+        transfer = FlakyTransfer({"file1.txt": 10})
+        statuses = {}
+
+        engine = TransferEngine(workers=2, retries=2, file_callback=lambda index, source, dest, status:
+            statuses.update({source: status}))
+        ex = self.get_error(lambda: engine.run(items, transfer))
+
+        # the other files are still copied
+        self.assertTrue(isinstance(ex, errors.StoreError) and "1 of 5 files" in str(ex))
+        self.assertTrue(transfer.attempts["file1.txt"] == 3)
+        self.assertTrue(statuses["file1.txt"] == FAILED and statuses["file4.txt"] == COPIED)
+
+        # user errors are not retried
+        transfer = FlakyTransfer({"file1.txt": 10}, error=errors.UserError("no such blob"))
+        engine = TransferEngine(workers=2, retries=2)
+        ex = self.get_error(lambda: engine.run(items, transfer))
+
+        self.assertTrue(isinstance(ex, errors.StoreError))
+        self.assertTrue(transfer.attempts["file1.txt"] == 1)
+
+    def test_resume_skips_current_files(self):
+        source_fn = self.TEST_DIR + "/model.pt"
+        with open(source_fn, "wb") as outfile:
+            outfile.write(b"x" * 100)
+        mtime = os.path.getmtime(source_fn)
+
+        # a blob copy is current if it has the same size and is not older than the file
+        self.assertTrue(transfer_engine.is_blob_copy_current(source_fn, self.make_blob_props(100, mtime)))
+        self.assertTrue(transfer_engine.is_blob_copy_current(source_fn, self.make_blob_props(100, mtime + 60)))
+        self.assertTrue(not transfer_engine.is_blob_copy_current(source_fn, self.make_blob_props(99, mtime)))
+        self.assertTrue(not transfer_engine.is_blob_copy_current(source_fn, self.make_blob_props(100, mtime - 60)))
+
+        # ... and the same for a local copy of a blob
+        self.assertTrue(transfer_engine.is_local_copy_current(self.make_blob_props(100, mtime), source_fn))
+        self.assertTrue(not transfer_engine.is_local_copy_current(self.make_blob_props(100, mtime + 60), source_fn))
+        self.assertTrue(not transfer_engine.is_local_copy_current(self.make_blob_props(100, mtime), source_fn + ".missing"))
+
+        # current files are skipped by a resumed transfer
+        items = self.make_items(6)
+        transfer = FlakyTransfer()
+        current = set(["file1.txt", "file4.txt"])
+
+        engine = TransferEngine(workers=3)
+        results = engine.run(items, transfer, is_current_func=lambda source, dest: source in current)
+
+        self.assertTrue([status for source, dest, status in results] == [COPIED, SKIPPED, COPIED, COPIED, SKIPPED, COPIED])
+        self.assertTrue(not current.intersection(transfer.copied))
+
+    def test_progress(self):
+        items = self.make_items(8)
+        progress = RecordingProgress()
+        transfer = FlakyTransfer({"file2.txt": 1})
+
+        engine = TransferEngine(workers=4, retries=1, feedback_progress=progress)
+        engine.run(items, transfer, sizes=[10]*len(items))
+
+        # a retried file's partial bytes are not counted twice
+        counts = [call for call in progress.calls if isinstance(call, tuple)]
+        self.assertTrue(progress.calls[0] == "start" and progress.calls[-1] == "end")
+        self.assertTrue(counts[-1] == (8, 8, 80, 80))
+        self.assertTrue(all(bytes_done <= bytes_total for files_done, files_total, bytes_done, bytes_total in counts))
+        self.assertTrue([files_done for files_done, files_total, bytes_done, bytes_total in counts] ==
+            sorted([files_done for files_done, files_total, bytes_done, bytes_total in counts]))
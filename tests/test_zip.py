@@ -0,0 +1,102 @@
+import os
+import random
+import shutil
+import zipfile
+import tempfile
+
+import test_base
+from xtlib.helpers import file_helper
+
+class TestZip(test_base.TestBase):
+    '''
+    zipping a code tree: concurrent compression, and no recompression of compressed formats.
+    '''
+    def setup_class(cls):
+        """
+        Setup once for all tests
+        """
+        cls.TEST_DIR = tempfile.mkdtemp()
+        cls.SOURCE_DIR = cls.TEST_DIR + "/source"
+        cls.FILES = 300
+
+        rand = random.Random(1)
+        words = ["import", "def", "return", "self", "for", "in", "if", "else", "model", "loss", "step", "x", "y"]
+        cls.filenames = []
+
+        for i in range(cls.FILES):
+            text = " ".join([rand.choice(words) for w in range(rand.randint(50, 500))])
+            cls.filenames.append(cls.write_file(cls, "pkg{}/mod{}/file{}.py".format(i % 50, i % 7, i), text.encode()))
+
+        # checkpoints and images are already compressed (here, random bytes)
+        for i in range(3):
+            cls.filenames.append(cls.write_file(cls, "models/model{}.pt".format(i), os.urandom(256*1024)))
+
+    def teardown_class(cls):
+        """
+        Teardown once after all tests
+        """
+        shutil.rmtree(cls.TEST_DIR)
+
+    def write_file(self, name, data):
+        fn = self.SOURCE_DIR + "/" + name
+        os.makedirs(os.path.dirname(fn), exist_ok=True)
+        with open(fn, "wb") as outfile:
+            outfile.write(data)
+        return fn
+
+    def zip_sequential(self, fn_zip):
+        # the zip_up_filenames() of earlier builds
+        with zipfile.ZipFile(fn_zip, "w", compression=zipfile.ZIP_DEFLATED) as zip:
+            for fn in self.filenames:
+                zip.write(fn, arcname=fn[1+len(self.SOURCE_DIR):])
+
+    def test_zip_tree(self):
+        fn_old = self.TEST_DIR + "/old.zip"
+        fn_new = self.TEST_DIR + "/new.zip"
+
+        self.zip_sequential(fn_old)
+        file_helper.zip_up_filenames(fn_new, self.filenames, compress=True, remove_prefix_len=1+len(self.SOURCE_DIR),
+            workers=4)
+
+        # a standard zip file, readable by the existing unzip code
+        with zipfile.ZipFile(fn_new) as zip:
+            self.assertTrue(zip.testzip() is None)
+            self.assertTrue(zip.namelist() == zipfile.ZipFile(fn_old).namelist())
+            self.assertTrue(zip.getinfo("models/model0.pt").compress_type == zipfile.ZIP_STORED)
+            self.assertTrue(zip.getinfo("pkg0/mod0/file0.py").compress_type == zipfile.ZIP_DEFLATED)
+
+        dest_dir = self.TEST_DIR + "/unzipped"
+        names = file_helper.unzip_files(fn_new, dest_dir)
+        self.assertTrue(len(names) == len(self.filenames))
+
+        with open(self.filenames[123], "rb") as infile:
+            with open(dest_dir + "/" + names[123], "rb") as infile2:
+                self.assertTrue(infile.read() == infile2.read())
+
+    def test_compress_level(self):
+        filenames = self.filenames[:100]
+        sizes = {}
+
+        for level in [1, 9]:
+            fn_zip = self.TEST_DIR + "/level{}.zip".format(level)
+            file_helper.zip_up_filenames(fn_zip, filenames, remove_prefix_len=1+len(self.SOURCE_DIR), compress_level=level)
+            sizes[level] = os.path.getsize(fn_zip)
+
+        self.assertTrue(sizes[9] < sizes[1])
+
+    def test_compress_level_of_large_members(self):
+        # every member is over the size limit, so is streamed into the zip by the writer
+        filenames = self.filenames[:100]
+        sizes = {}
+        max_mb = file_helper.ZIP_MEMBER_MAX_MB
+        file_helper.ZIP_MEMBER_MAX_MB = 0
+
+        try:
+            for level in [1, 9]:
+                fn_zip = self.TEST_DIR + "/large{}.zip".format(level)
+                file_helper.zip_up_filenames(fn_zip, filenames, remove_prefix_len=1+len(self.SOURCE_DIR), compress_level=level)
+                sizes[level] = os.path.getsize(fn_zip)
+        finally:
+            file_helper.ZIP_MEMBER_MAX_MB = max_mb
+
+        self.assertTrue(sizes[9] < sizes[1])
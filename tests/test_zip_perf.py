@@ -0,0 +1,77 @@
+import os
+import time
+import random
+import shutil
+import pytest
+import zipfile
+import tempfile
+
+import test_base
+from xtlib.helpers import file_helper
+
+@pytest.mark.benchmark
+@pytest.mark.skipif(os.environ.get("XT_BENCHMARKS", "false").lower() != "true", reason="Skip benchmarks unless explicitly called")
+class TestZipPerf(test_base.TestBase):
+    '''
+    benchmark for zipping a large code tree (50k files), against the sequential zip writer of earlier builds.
+    Run with XT_BENCHMARKS=true.
+    '''
+    def setup_class(cls):
+        """
+        Setup once for all tests
+        """
+        cls.TEST_DIR = tempfile.mkdtemp()
+        cls.SOURCE_DIR = cls.TEST_DIR + "/source"
+        cls.FILES = 50000
+
+        rand = random.Random(1)
+        words = ["import", "def", "return", "self", "for", "in", "if", "else", "model", "loss", "step", "x", "y"]
+        cls.filenames = []
+
+        for i in range(cls.FILES):
+            text = " ".join([rand.choice(words) for w in range(rand.randint(50, 500))])
+            cls.filenames.append(cls.write_file(cls, "pkg{}/mod{}/file{}.py".format(i % 50, i % 7, i), text.encode()))
+
+        # checkpoints and images are already compressed (here, random bytes)
+        for i in range(10):
+            cls.filenames.append(cls.write_file(cls, "models/model{}.pt".format(i), os.urandom(4*1024*1024)))
+
+    def teardown_class(cls):
+        """
+        Teardown once after all tests
+        """
+        shutil.rmtree(cls.TEST_DIR)
+
+    def write_file(self, name, data):
+        fn = self.SOURCE_DIR + "/" + name
+        os.makedirs(os.path.dirname(fn), exist_ok=True)
+        with open(fn, "wb") as outfile:
+            outfile.write(data)
+        return fn
+
+    def zip_sequential(self, fn_zip):
+        # the zip_up_filenames() of earlier builds
+        with zipfile.ZipFile(fn_zip, "w", compression=zipfile.ZIP_DEFLATED) as zip:
+            for fn in self.filenames:
+                zip.write(fn, arcname=fn[1+len(self.SOURCE_DIR):])
+
+    def test_zip_large_tree(self):
+        fn_old = self.TEST_DIR + "/old.zip"
+        fn_new = self.TEST_DIR + "/new.zip"
+
+        started = time.time()
+        self.zip_sequential(fn_old)
+        old_elapsed = time.time() - started
+
+        started = time.time()
+        file_helper.zip_up_filenames(fn_new, self.filenames, compress=True, remove_prefix_len=1+len(self.SOURCE_DIR))
+        new_elapsed = time.time() - started
+
+        print("zip of {:,} files: sequential={:.2f} secs, parallel ({} workers)={:.2f} secs".format(len(self.filenames),
+            old_elapsed, os.cpu_count(), new_elapsed))
+
+        with zipfile.ZipFile(fn_new) as zip:
+            self.assertTrue(zip.testzip() is None)
+            self.assertTrue(len(zip.namelist()) == len(self.filenames))
+
+        self.assertTrue(new_elapsed < old_elapsed)
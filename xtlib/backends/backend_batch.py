@@ -131,7 +131,7 @@ class AzureBatch(BackendBase):
         cmds = []
 
         code_zip = args["code_zip"]
-        if code_zip and code_zip != "none":
+        if code_zip in ["fast", "compress"]:
             # NOTE: usage of $ENVVAR must be surrounded by DOUBLE quotes
             self.append(cmds, 'sudo apt install unzip')
             self.append(cmds, 'unzip -n ' + constants.CODE_ZIP_FN + " > __unzip__.log")
@@ -793,8 +793,12 @@ class AzureBatch(BackendBase):
         wrap up a run from an azure self.  run may have spawned child runs, which also need to be cleaned up.
         '''
         records = self.wrapup_target_run(store, ws, run_name)
+        child_names = store.get_child_run_names(ws, run_name)
+
+        # runs created by older versions of XT logged their children to the parent's run log
+        known_names = set(child_names)
         child_records = [rec for rec in records if rec["event"] == "child_created"]
-        child_names = [rec["data"]["child_name"] for rec in child_records]
+        child_names += [rec["data"]["child_name"] for rec in child_records if not rec["data"]["child_name"] in known_names]
 
         for child_name in child_names:
             self.wrapup_target_run(store, ws, child_name)
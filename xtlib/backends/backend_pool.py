@@ -24,6 +24,7 @@ from xtlib import box_information
 from xtlib.xt_client import XTClient
 
 from xtlib.console import console
+from xtlib.helpers import file_helper
 from xtlib.helpers.feedbackParts import feedback as fb
 from xtlib.psm.local_psm_client import LocalPsmClient
 from xtlib.psm.remote_psm_client import RemotePsmClient
@@ -111,7 +112,7 @@ class PoolBackend(BackendBase):
                 fn_wrapped = super().wrap_user_command(cmd_parts, snapshot_dir, store_data_dir, data_action, 
                     data_writable, store_model_dir, model_action, model_writable, storage_name, storage_key, actions, 
                     is_windows=is_windows, sudo_available=False, pip_freeze=False, setup=setup, post_setup_cmds=post_cmds, 
-                    args=args, nonempty=True)
+                    args=args, nonempty=True, change_dir=False)
 
             # we update each box's command
             script_part = "{} {} {}".format(os.path.basename(fn_wrapped), node_id, run_name)
@@ -140,6 +141,13 @@ class PoolBackend(BackendBase):
                 # if self.core.client.is_controller_running(box_name, box_addr, port):
                 #     errors.config_error("XT controller already running on box: " + box_name)
 
+            if args["code_zip"] == "manifest":
+                # code was uploaded by manifest (and is restored from it for each run), so the PSM entry zip (copied
+                # to each box) only needs the files to start the controller
+                fn_src_zip = os.path.expanduser(constants.CWD_DIR + "/" + constants.CODE_ZIP_FN)
+                filenames = self.get_bootstrap_filenames(snapshot_dir, args)
+                file_helper.zip_up_filenames(fn_src_zip, filenames, compress=False, remove_prefix_len=1+len(snapshot_dir))
+
             # second pass - transfer the main script to each box and start it
             for i, box_runs in enumerate(job_runs):
                 box_info = box_runs[0]["box_info"]
@@ -154,6 +162,21 @@ class PoolBackend(BackendBase):
 
         return job_info, info_by_node
 
+    def get_bootstrap_filenames(self, snapshot_dir, args):
+        '''
+        return the snapshot files needed to start the controller on a box: its script, the multi-run context,
+        the wrapped user cmds, and the xtlib snapshot (when uploaded).
+        '''
+        names = [constants.PY_RUN_CONTROLLER, constants.FN_MULTI_RUN_CONTEXT, constants.FN_WRAPPED_CMDS, "wrapped.bat",
+            "__dockev__.txt"]
+        filenames = [snapshot_dir + "/" + name for name in names if os.path.exists(snapshot_dir + "/" + name)]
+
+        xtlib_dir = snapshot_dir + "/xtlib"
+        if args["xtlib_upload"] and os.path.exists(xtlib_dir):
+            filenames += file_helper.get_filenames_from_include_lists(None, [], recursive=True, from_dir=xtlib_dir)
+
+        return filenames
+
     def run_job_on_box(self, job_id, run_data_list, box_index, box_info, app_info, pool_info,  
             resume_name=None, repeat=None, using_hp=None, exper_name=None, snapshot_dir=None, args=None):
 
@@ -171,6 +194,7 @@ class PoolBackend(BackendBase):
             psm_client = RemotePsmClient(box_addr, is_box_windows)
 
         psm_client.restart_psm_if_needed()
+        psm_client.set_slot_count(box_info.psm_slots)
         #print("psm created for box: " + box_addr)
 
         team = self.config.get("general", "xt-team-name")   
@@ -334,7 +358,7 @@ class PoolBackend(BackendBase):
             {"ip": value, "port": value, "box_name": value}
         '''
         box_name = service_node_info["box_name"]
-        controller_port = constants.CONTROLLER_PORT
+        controller_port = self.get_controller_port(service_node_info)
         tensorboard_port = None
         ssh_port = 22
 
@@ -356,6 +380,23 @@ class PoolBackend(BackendBase):
         cs = {"ip": box_addr, "port": controller_port, "box_name": box_name}
         return cs
     
+    def get_controller_port(self, service_node_info):
+        '''
+        the controller of each PSM slot listens on its own port; the PSM records it in the slot running the node's entry.
+        '''
+        port = None
+        fn_entry = service_node_info.get("fn_entry")
+
+        if fn_entry:
+            psm_client = self.get_psm_client(service_node_info)
+            port = psm_client.get_entry_port(fn_entry)
+
+        if not port:
+            # not running (yet), or started by an earlier PSM (which had a single controller)
+            port = constants.CONTROLLER_PORT
+
+        return port
+
     def view_status(self, run_name, workspace, job, monitor, escape_secs, auto_start, 
             stage_flags, status, max_finished):
 
@@ -565,15 +606,13 @@ class PoolBackend(BackendBase):
     def get_service_queue_entries(self, service_node_info):
 
         psm_client = self.get_psm_client(service_node_info)
-        entries, current = psm_client.enum_queue()
+        entries, running = psm_client.enum_queue()
 
-        queue = []
-        
-        if entries:
-            queue = [{"name": entry, "current": False} for entry in entries]
+        # running entries first
+        queue = [{"name": entry, "current": True} for entry in running]
 
-        if current:
-            queue.insert(0, {"name": current, "current": True})
+        if entries:
+            queue += [{"name": entry, "current": False} for entry in entries]
 
         return queue
 
@@ -18,6 +18,7 @@ class BoxInfo():
     def __init__(self, config, box_name, store, pool_info=None, is_batch_pool=None, args=None):
         self.config = config
         self.box_name = box_name
+        self.psm_slots = 1          # entries that the PSM can run at once (pool boxes only)
 
         self._set_box_info(box_name, store, pool_info, is_batch_pool, args)
 
@@ -97,6 +98,7 @@ class BoxInfo():
             self.address = self.config.expand_system_symbols(box_info["address"])
             self.box_class = box_info["box-class"]
             self.max_runs = box_info["max-runs"] if "max-runs" in box_info else 1
+            self.psm_slots = box_info["psm-slots"] if "psm-slots" in box_info else 1
             self.actions = box_info["actions"] if "actions" in box_info else []
 
         self.shell_launch_prefix = self.config.get("script-launch-prefix", self.box_class)
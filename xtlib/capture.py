@@ -10,10 +10,12 @@ from xtlib import utils
 from .console import console
 from xtlib import constants
 from .helpers import file_helper
+from .helpers import code_manifest
 from .helpers.feedbackParts import feedback as fb
 
 def capture_before_files_zip(store, source_dir, ws_name=None, run_name=None, extra_files = [], rerun_name=None, 
-        job_id=None,  omit_files=None, zip_before="none", store_dest="before", remove_prefix_len=None, upload_type=None):
+        job_id=None,  omit_files=None, zip_before="none", store_dest="before", remove_prefix_len=None, upload_type=None, 
+        zip_level=None):
     
     copied_files = []
     started = time.time()
@@ -42,13 +44,27 @@ def capture_before_files_zip(store, source_dir, ws_name=None, run_name=None, ext
 
         #console.print("zip-before=", zip_before)
 
-        if zip_before in ["fast", "compress"]:
+        if zip_before == "manifest":
+            fb.feedback("uploading {} {} files (by manifest)".format(count, upload_type), add_seperator=False)
+
+            fn_manifest = os.path.expanduser(constants.CWD_DIR + "/" + constants.CODE_MANIFEST_FN)
+            upload_code_blobs(store, ws_name, filenames, remove_prefix_len, fn_manifest)
+
+            before_files = [fn_manifest]
+            omit_files = []
+
+            # look for wrapped cmds script; if found, copy it separately for bootstraping everything (backend=batch needs this)
+            fn_wrapped = source_dir + "/" + constants.FN_WRAPPED_CMDS
+            if os.path.exists(fn_wrapped):
+                before_files.append(fn_wrapped)
+
+        elif zip_before in ["fast", "compress"]:
             fb.feedback("uploading {} {} files (zipped)".format(count, upload_type), add_seperator=False)
 
             zip_name = constants.CODE_ZIP_FN if upload_type == "code" else None
             fn_zip = os.path.expanduser(constants.CWD_DIR + "/" + zip_name)
             use_compress = (zip_before=="compress")
-            file_helper.zip_up_filenames(fn_zip, filenames, use_compress, remove_prefix_len)
+            file_helper.zip_up_filenames(fn_zip, filenames, use_compress, remove_prefix_len, compress_level=zip_level)
 
             before_files = [fn_zip]
             omit_files = []
@@ -79,6 +95,34 @@ def capture_before_files_zip(store, source_dir, ws_name=None, run_name=None, ext
 
     return copied_files
 
+def upload_code_blobs(store, ws_name, filenames, remove_prefix_len, fn_manifest, hash_cache=None):
+    '''
+    upload the files that the workspace's content-addressed store doesn't already have, and
+    write a manifest of all of the files to 'fn_manifest'.  Returns the manifest.
+    '''
+    manifest = code_manifest.build_manifest(filenames, remove_prefix_len, hash_cache)
+
+    # the first file found with each hash is the one we upload
+    sources = {}
+    for fn in filenames:
+        info = manifest["files"].get(code_manifest.get_manifest_name(fn, remove_prefix_len))
+        if info and info["hash"] not in sources:
+            sources[info["hash"]] = (fn, info["size"])
+
+    existing = store.get_code_blob_hashes(ws_name)
+    missing = [fh for fh in sources if fh not in existing]
+
+    items = [(sources[fh][0], fh) for fh in missing]
+    sizes = [sources[fh][1] for fh in missing]
+    store.upload_code_blobs(ws_name, items, sizes=sizes)
+
+    code_manifest.write_manifest(manifest, fn_manifest)
+
+    console.diag("code manifest: {} files, {} unique, {} uploaded ({:,} bytes)".format(len(manifest["files"]), 
+        len(sources), len(items), sum(sizes)))
+
+    return manifest
+
 def download_before_files(store, job_id, ws_name, run_name, dest_dir, silent=False, log_events=True):
     files = []
 
@@ -113,6 +157,7 @@ def download_before_files(store, job_id, ws_name, run_name, dest_dir, silent=Fal
             store.log_run_event(ws_name, run_name, "download_before", {"source": "run", "count": count})
 
     unzip_before_if_found(dest_dir, silent=silent)
+    restore_before_if_found(store, ws_name, dest_dir, silent=silent)
 
     return files
 
@@ -131,6 +176,36 @@ def unzip_before_if_found(dest_dir, remove_after=True, silent=False):
 
     return names
 
+def restore_before_if_found(store, ws_name, dest_dir, remove_after=True, silent=False, cache_dir=constants.CODE_CACHE_DIR):
+    '''
+    if a code manifest was downloaded to 'dest_dir', rebuild the files it describes there, downloading
+    only the blobs that are not already in the local blob cache.
+    '''
+    fn_manifest = dest_dir + "/" + constants.CODE_MANIFEST_FN
+    names = []
+
+    if os.path.exists(fn_manifest):
+        manifest = code_manifest.read_manifest(fn_manifest)
+        cache = code_manifest.BlobCache(cache_dir)
+
+        missing = cache.get_missing(code_manifest.get_manifest_hashes(manifest))
+        if not silent:
+            console.print("restoring {} files from code manifest ({} blobs to download)".format(len(manifest["files"]), 
+                len(missing)))
+
+        items = [(fh, cache.get_temp_path(fh)) for fh in missing]
+        store.download_code_blobs(ws_name, items)
+
+        for fh in missing:
+            cache.add_downloaded(fh)
+
+        names = cache.restore_tree(manifest, dest_dir)
+
+        if remove_after:
+            os.remove(fn_manifest)
+
+    return names
+
 def download_run(store, ws_name, run_name, dest_dir):
     '''
        - first, download entire RUN store
@@ -147,6 +222,7 @@ def download_run(store, ws_name, run_name, dest_dir):
     before_files = store.download_files_from_job(job_id, "before/**", before_dir)
 
     zip_files = unzip_before_if_found(before_dir + "/code", silent=True)
+    zip_files += restore_before_if_found(store, ws_name, before_dir + "/code", silent=True)
     if zip_files:
         files += zip_files
     else:
@@ -370,15 +370,20 @@ class CmdCore():
         context.fn_generated_config = args["fn_generated_config"]
         context.using_hp = using_hp
         context.search_type = args["search_type"]
+        context.suggestion_batch = args["suggestion_batch"]
         context.option_prefix = args["option_prefix"]
 
         context.restart = False
         context.concurrent = args["concurrent"]
+        context.rundir_min_free_gb = args["rundir_min_free_gb"]
         context.xtlib_capture = args["xtlib_upload"]
 
         # for mirroring files to grok server or storage
         context.mirror_dest = args["mirror_dest"]
         context.mirror_files =  args["mirror_files"]
+        context.mirror_quiet_secs = args["mirror_quiet_secs"]
+        context.mirror_max_delay_secs = args["mirror_max_delay_secs"]
+        context.mirror_uploads_per_sec = args["mirror_uploads_per_sec"]
         context.grok_server = None   # args["grok_server"]
 
         context.aggregate_dest = args["aggregate_dest"]
@@ -589,8 +594,9 @@ class CmdCore():
 
         console.diag("before upload of {} to job".format(upload_type.upper()))
   
-        copied_files = capture.capture_before_files_zip(self.store, source_dir=source_dir, omit_files=omit_list, store_dest=store_dir,
-            rerun_name=resume_name, job_id=job_id, zip_before=zip_type, remove_prefix_len=remove_prefix_len, upload_type=upload_type)
+        copied_files = capture.capture_before_files_zip(self.store, source_dir=source_dir, ws_name=args["workspace"], 
+            omit_files=omit_list, store_dest=store_dir, rerun_name=resume_name, job_id=job_id, zip_before=zip_type, remove_prefix_len=remove_prefix_len, upload_type=upload_type, 
+            zip_level=args["code_zip_level"])
 
         #fb.feedback("{} target file(s) uploaded to {}".format(len(copied_files), dest_name))
         fb.feedback("")    # just add comma to indicte current op has completed
@@ -77,6 +77,7 @@ FN_RUN_CONTEXT = "__xt_run_context__.json"
 HP_CONFIG_DIR = "hp-confg-dir"
 HP_CONFIG_FN = "hp_config.txt" 
 HP_SWEEP_LIST_FN = "sweeps-list.json"
+DGD_STATE_FN = "hp-search/dgd_state.json"    # snapshot of DGD search state (job or experiment file)
 
 BOX_WD = "~/xt_run"
 CONTROLLER_PORT = 18861
@@ -87,6 +88,12 @@ CONTROLLER_SCRIPTS_DIR = "~/.xt/controller"
 CWD_DIR = "~/.xt/cwd"
 CODE_ZIP_FN = "xt_code.zip"
 
+# content-addressed code snapshots (code-zip=manifest)
+CODE_MANIFEST_FN = "xt_code_manifest.json"
+CODE_BLOBS_DIR = "code-blobs"                   # hash-named file blobs (stored in workspace)
+FN_CODE_HASHES = "~/.xt/code_hashes.json"       # hashes of local files, by path/size/mtime
+CODE_CACHE_DIR = "~/.xt/code_cache"             # hash-named file blobs (downloaded to node)
+
 # files that capture controller output
 CONTROLLER_SCRIPT_LOG = "~/.xt/cwd/controller_script.log"        # output of batch/script file that launches controller
 CONTROLLER_RUN_LOG = "~/.xt/cwd/controller_run.log"              # output of cmd that runs controller
@@ -131,6 +138,10 @@ PSM = "psm.py"
 PSMLOG = "psm.log"
 PSM_LOGDIR = "~/.xt/psm_logs"
 CURRENT_RUNNING_ENTRY = "_current_running_entry_.txt"
+CURRENT_ENTRY_PID = "_current_entry_pid_.txt"
+CURRENT_ENTRY_PORT = "_current_entry_port_.txt"
+PSM_SLOTS_DIR = "slots"
+PSM_SLOTS_FN = "~/.xt/psm_slots.txt"
 
 # hyperparameter YAML property names
 HPARAM_DIST = "hyperparameter-distributions"
@@ -8,7 +8,9 @@ import os
 import json
 import rpyc
 import copy
+import codecs
 import time
+import uuid
 import shutil 
 import random
 import psutil
@@ -16,7 +18,7 @@ import logging
 import datetime
 import traceback
 import subprocess
-from threading import Thread, Lock
+from threading import Thread, Lock, Condition
 from rpyc.utils.server import ThreadedServer
 from rpyc.utils.authenticators import SSLAuthenticator
 
@@ -25,6 +27,7 @@ from xtlib.helpers.bag import Bag
 from xtlib.console import console
 from xtlib.run_info import RunInfo
 from xtlib.helpers import file_helper
+from xtlib.storage import store_file
 from xtlib.storage.store import store_from_context
 from xtlib.mirror_worker import MirrorWorker
 from xtlib.hparams.hparam_search import HParamSearch
@@ -59,6 +62,27 @@ queue_lock = Lock()
 runs_lock = Lock()            
 rundir_lock = Lock()
 
+# max bytes read from a run's output pipe at once
+PIPE_CHUNK_SIZE = 64*1024
+
+# signalled (with queue_lock held) when runs are queued or exit, or when concurrent changes
+queue_changed = Condition(queue_lock)
+
+# max secs between queue checks when no signal arrives (for idle/shutdown processing)
+QUEUE_POLL_SECS = 1
+
+# queue priorities (higher priority runs are started first; FIFO for runs of the same priority)
+PRIORITY_NORMAL = 0
+PRIORITY_RESUMED = 10
+
+# signalled when rundir tombstones (the renamed contents of recycled rundirs) are added or deleted
+tombstones_changed = Condition()
+
+# the parent dir of rundir tombstones (relative to the controller's cwd; on the same file system as the rundirs)
+TOMBSTONES_DIR = "rundir-tombstones"
+
+GB = 1024*1024*1024
+
 # def wait_for_process_exit(runner, pipe_thread, process, run_info):
 #     '''
 #     we use a separate thread to monitor for abnormal process exit that is 
@@ -77,22 +101,45 @@ rundir_lock = Lock()
 #     runner.exit_handler(run_info, called_from_thread_watcher=True)
     
 def read_from_pipe(pipe, run_info, runner, stdout_is_text):
-
-    # expand any "~" in path
+    '''
+    read the output of the run in chunks (whatever is available, up to PIPE_CHUNK_SIZE), and pass the
+    complete lines of each chunk to the run_info.
+    '''
     try:
         run_name = run_info.run_name
 
+        # read the bytes under a text pipe, and do its decoding and newline translation here
+        reader = pipe.buffer if stdout_is_text else pipe
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        partial = ""
+
         while True:
-            if stdout_is_text:
-                text_msg = pipe.readline()
-            else:
-                binary_msg = pipe.readline()
-                text_msg = binary_msg.decode("utf-8")
+            chunk = reader.read1(PIPE_CHUNK_SIZE)
 
-            if len(text_msg) == 0 or run_info.killing:
+            if len(chunk) == 0 or run_info.killing:
                 break      # EOF / end of process
 
-            run_info.process_run_output(text_msg)
+            text = partial + decoder.decode(chunk)
+            held = ""
+
+            if stdout_is_text:
+                # a "\r" at the end may be the first half of a "\r\n"
+                if text.endswith("\r"):
+                    text, held = text[:-1], "\r"
+                text = text.replace("\r\n", "\n").replace("\r", "\n")
+
+            index = text.rfind("\n")
+            partial = text[index+1:] + held
+
+            if index > -1:
+                run_info.process_run_output(text[0:index+1])
+
+        partial += decoder.decode(b"", final=True)
+        if stdout_is_text:
+            partial = partial.replace("\r", "\n")
+
+        if partial and not run_info.killing:
+            run_info.process_run_output(partial)
 
         # run post-processing
         print("read_from_pipe THREAD EXITING...")
@@ -127,6 +174,8 @@ class XTController(rpyc.Service):
         self.is_aml = is_aml
         self.restarting = False
         self.restart_delay = None
+        self.tombstones = []         # tombstone dirs waiting to be deleted (oldest first)
+        self.tombstone_deleter = None
 
         self.reset_state(start_queue_worker=True)
 
@@ -137,7 +186,8 @@ class XTController(rpyc.Service):
         self.shutdown_requested = None
         self.queue_check_count = 0
         self.runs = {}       # all runs that we know about (queued, spawing, running, or completed)
-        self.queue = []      # runs that are waiting to run (due to concurrent)
+        self.queue = []      # runs that are waiting to run (due to concurrent), in priority order
+        self.queue_signalled = False
         self.mirror_workers = []
         self.restart_is_present = True
         self.running_jobs = {}
@@ -150,7 +200,8 @@ class XTController(rpyc.Service):
         utils.init_logging(constants.FN_CONTROLLER_EVENTS, logger, "XT Controller")
 
         is_windows = pc_utils.is_windows()
-        self.cwd = utils.get_controller_cwd(is_windows, is_local=True)
+        # a controller started in a PSM slot uses the slot's dir
+        self.cwd = os.getenv("XT_CONTROLLER_CWD") or utils.get_controller_cwd(is_windows, is_local=True)
         self.rundir_parent = self.cwd + "/rundirs"
 
         # for backend services (vs. pool jobs)
@@ -181,6 +232,7 @@ class XTController(rpyc.Service):
         console.print("current CONDA env:", os.getenv("CONDA_DEFAULT_ENV"))
 
         file_utils.ensure_dir_exists(self.rundir_parent)
+        self.init_tombstones()
 
         # NOTE: do NOT add "store" as a class or instance member since it may vary by run/client
         # it should just be created when needed (at beginning and end of a run)
@@ -260,12 +312,14 @@ class XTController(rpyc.Service):
         We want any exception here to be logged then force app to exit.
         '''
         while True:
-            # time.sleep(1)
-            # self.queue_check(1)
-
             try:
-                time.sleep(1)
-                self.queue_check(1)
+                # wait for a run to be queued or to exit (or for the poll interval to pass)
+                with queue_changed:
+                    if not self.queue_signalled:
+                        queue_changed.wait(QUEUE_POLL_SECS)
+                    self.queue_signalled = False
+
+                self.queue_check()
             except BaseException as ex:
                 logger.exception("Error in controller.thread_manager, ex={}".format(ex))
                 console.print("** Exception during queue_check(): ex={}".format(ex))
@@ -285,6 +339,26 @@ class XTController(rpyc.Service):
         with queue_lock:
             return len(self.queue)
 
+    def add_to_queue(self, run_info):
+        ''' 
+        insert run_info after the queued runs of the same or higher priority, and wake the queue worker.
+        caller must hold queue_lock.
+        '''
+        index = len(self.queue)
+        while index > 0 and self.queue[index-1].priority < run_info.priority:
+            index -= 1
+
+        self.queue.insert(index, run_info)
+
+        self.queue_signalled = True
+        queue_changed.notify_all()
+
+    def signal_queue(self):
+        ''' wake the queue worker to start as many queued runs as there are free slots '''
+        with queue_changed:
+            self.queue_signalled = True
+            queue_changed.notify_all()
+
     def on_shutdown(self, context):
         console.print("processing shutdown request in queue thread...")
 
@@ -300,6 +374,9 @@ class XTController(rpyc.Service):
             store = store_from_context(context)
             node_num = os.getenv("XT_NODE_ID")[4:]
 
+            if store.mongo:
+                console.print("mongo-db request metrics:", store.mongo.get_retry_metrics())
+
             # write XT event log to job store AFTER
             fn = os.path.expanduser(constants.FN_CONTROLLER_EVENTS)
             console.print("fn=", fn, ", exists=", os.path.exists(fn))
@@ -324,6 +401,9 @@ class XTController(rpyc.Service):
         # give other threads time to wrapup the processing of their runs before
         # we exit
         time.sleep(2)    # wait for 2 secs for any bg thread cleanup
+
+        # os._exit() skips atexit handlers, so flush pending appends of file storage now
+        store_file.close_append_handles()
         console.print("calling os._exit(0)...")
 
         # os._exit will exit all threads without running 'finally' blocks 
@@ -364,19 +444,20 @@ class XTController(rpyc.Service):
             if self.shutdown_requested or (self.multi_run_context_fn and not self.multi_run_hold_open):
                 self.on_shutdown(context)
 
-    def queue_check(self, max_starts=1):
-        ''' see if 1 or more jobs at top of queue can be run '''
+    def queue_check(self, max_starts=None):
+        ''' start runs from the top of the queue, until the free slots (or 'max_starts', if specified) are used '''
 
         # active_count = self.get_active_runs_count()
         # if active_count == 0:
         #     self.on_idle()
 
-        # for responsiveness, limit # of runs can be released in a single check
-        for _ in range(max_starts):       
+        starts = 0
+        while max_starts is None or starts < max_starts:
             running_count = len(self.get_running_names())
 
             if not self.process_top_of_queue(running_count):
                 break
+            starts += 1
 
         # AFTER potentially starting a run, see if we are idle
         names = self.get_running_names()
@@ -392,7 +473,9 @@ class XTController(rpyc.Service):
 
         with queue_lock:
             if len(self.queue):
-                if running_count < self.concurrent or self.concurrent == -1:
+                if (running_count < self.concurrent or self.concurrent == -1) and not \
+                    self.is_waiting_for_disk_space(self.queue[0]):
+
                     run_info = self.queue.pop(0)
 
                     # run_info is ready to run!
@@ -434,8 +517,8 @@ class XTController(rpyc.Service):
 
                 # insert back into queue
                 with queue_lock:
-                    self.queue.append(run_info)
                     run_info.status = "queued"
+                    self.add_to_queue(run_info)
             else:
 
                 # no: parent has completed
@@ -490,8 +573,8 @@ class XTController(rpyc.Service):
 
     def requeue_run(self, run_info):
         with queue_lock:
-            self.queue.append(run_info)
             run_info.status = "queued"
+            self.add_to_queue(run_info)
 
         console.print("run requeued: " + run_info.run_name)
 
@@ -632,6 +715,11 @@ class XTController(rpyc.Service):
         else:
             run_info.is_wrapped_up = True
 
+        run_info.close_console()
+
+        # a slot may now be free
+        self.signal_queue()
+
     def on_connect(self, conn):
         # code that runs when a connection is created
         # (to init the service, if needed)
@@ -751,22 +839,91 @@ class XTController(rpyc.Service):
         rundir_index = int(rundir[start:])
         runpath = self.rundir_parent + "/" + rundir
 
-        # remove and recreate for a clear start for each run
+        # a clear start for each run (the previous contents are deleted in the background)
         try:
-            file_utils.ensure_dir_clean(runpath)
+            self.recycle_rundir(runpath)
         except Exception as ex:    #  AccessDenied:
-            print("Exception deleting rundir, ex=", ex)
-            if allow_retry:
-                #time.sleep(10)    # experiment; see if wating 10 secs helps 
-                #file_utils.ensure_dir_clean(runpath)
-
-                # try just once more (a different directory)
-                self.allocate_rundir(run_name, allow_retry=False)
-            else:
+            print("Exception recycling rundir, ex=", ex)
+            if not allow_retry:
                 raise ex
 
+            # try just once more (a different directory, since this one is still marked as ours)
+            failed_runpath = runpath
+            runpath, rundir_index = self.allocate_rundir(run_name, allow_retry=False)
+            self.return_rundir(failed_runpath)
+
         return runpath, rundir_index
 
+    def recycle_rundir(self, runpath):
+        '''
+        rename the previous contents of 'runpath' to a tombstone dir (to be deleted by the tombstone deleter thread),
+        so that the run doesn't wait for them to be deleted.  then create a new (empty) 'runpath'.
+        '''
+        if os.path.exists(runpath):
+            file_utils.ensure_dir_exists(self.tombstone_parent)
+            tombstone = "{}/{}.{}".format(self.tombstone_parent, os.path.basename(runpath), uuid.uuid4().hex)
+
+            os.rename(runpath, tombstone)
+            self.add_tombstone(tombstone)
+
+        os.makedirs(runpath)
+
+    def init_tombstones(self):
+        self.tombstone_parent = self.cwd + "/" + TOMBSTONES_DIR
+
+        # delete any tombstones left by an earlier controller
+        if os.path.exists(self.tombstone_parent):
+            for name in os.listdir(self.tombstone_parent):
+                self.add_tombstone(self.tombstone_parent + "/" + name)
+
+        if not self.tombstone_deleter:
+            self.tombstone_deleter = Thread(target=self.bg_tombstone_deleter, daemon=True)
+            self.tombstone_deleter.start()
+
+    def add_tombstone(self, tombstone):
+        with tombstones_changed:
+            if not tombstone in self.tombstones:
+                self.tombstones.append(tombstone)
+                tombstones_changed.notify_all()
+
+    def bg_tombstone_deleter(self):
+        while True:
+            with tombstones_changed:
+                while not self.tombstones:
+                    tombstones_changed.wait()
+                tombstone = self.tombstones[0]
+
+            try:
+                file_utils.zap_dir(tombstone)
+            except BaseException as ex:
+                logger.exception("Error deleting rundir tombstone, ex={}".format(ex))
+                console.print("Exception deleting rundir tombstone={}, ex={}".format(tombstone, ex))
+
+            with tombstones_changed:
+                self.tombstones.remove(tombstone)
+                tombstones_changed.notify_all()
+
+            # runs held back for disk space may be able to start now
+            self.signal_queue()
+
+    def is_waiting_for_disk_space(self, run_info):
+        '''
+        while rundir tombstones are being deleted, runs are not started if the free disk space is below
+        the run's rundir-min-free-gb watermark.
+        '''
+        min_free_gb = getattr(run_info.context, "rundir_min_free_gb", None) if run_info.context else None
+
+        if not min_free_gb or not self.tombstones:
+            return False
+
+        free_gb = shutil.disk_usage(self.rundir_parent).free / GB
+        if free_gb >= min_free_gb:
+            return False
+
+        console.diag("holding back run={}: free disk={:.1f} GB, rundir-min-free-gb={}, tombstones={}".format(run_info.run_name,
+            free_gb, min_free_gb, len(self.tombstones)))
+        return True
+
     def return_rundir(self, rundir_path):
         rundir = os.path.basename(rundir_path)
 
@@ -776,7 +933,7 @@ class XTController(rpyc.Service):
                 # mark as no longer used
                 self.rundirs[rundir] = None
 
-    def exposed_queue_job(self, token, json_context, cmd_parts):
+    def exposed_queue_job(self, token, json_context, cmd_parts, priority=None):
         self.validate_request(token)
 
         context = json.loads(json_context)
@@ -786,10 +943,10 @@ class XTController(rpyc.Service):
         cmd_parts = list(cmd_parts)
         context.cmd_parts = cmd_parts
         
-        run_info = self.queue_job_core(context, cmd_parts)
+        run_info = self.queue_job_core(context, cmd_parts, priority=priority)
         return True, run_info.status
 
-    def queue_job_core(self, context, cmd_parts, previously_queue=False, aml_run=None):
+    def queue_job_core(self, context, cmd_parts, previously_queue=False, aml_run=None, priority=None):
 
         run_name = context.run_name
         exper_name = context.exper_name
@@ -813,21 +970,25 @@ class XTController(rpyc.Service):
 
         #debug_break()
 
+        if priority is None:
+            # restarted and resumed runs jump ahead of new runs
+            priority = PRIORITY_RESUMED if (context.restart or context.resume_name) else PRIORITY_NORMAL
+
         run_info = RunInfo(run_name, context.ws, cmd_parts, run_script, context.repeat, context, "queued", True, 
             parent_name=None, parent_prep_needed=parent_prep_needed, mirror_close_func = self.stop_mirror_worker, aml_run=aml_run,
-            node_id=self.node_id, run_index=None)
+            node_id=self.node_id, run_index=None, priority=priority)
 
         # log run QUEUED event 
         store = store_from_context(context)
         store.log_run_event(context.ws, run_name, "queued", {})   # , is_aml=self.is_aml)
 
-        # queue job to be run
+        self.add_to_runs(run_info)
+
+        # queue job to be run (and wake the queue worker)
         with queue_lock:
-            self.queue.append(run_info)
+            self.add_to_queue(run_info)
             console.print("after queuing job, queue=", self.queue)
 
-        self.add_to_runs(run_info)
-
         console.print("------ run QUEUED: " + run_name + " -------")
         
         # before returning - see if this run can be started immediately
@@ -1083,30 +1244,36 @@ class XTController(rpyc.Service):
 
         console.print("------ run STARTED: " + run_name + " -------")
 
-        # tell mongo JOBS that this job has a new run
-        console.diag("calling MONGO job_run_start: job_id={}".format(job_id))
-        mongo = store.get_mongo()
-        mongo.job_run_start(job_id)
-
-        # tell mongo RUNS that this run has started
-        console.diag("calling MONGO run_start: ws={}, run_name={}".format(context.ws, run_name))
-        mongo.run_start(context.ws, run_name)
+        node_start = False
 
         if not job_id in self.running_jobs:
             # this is the first run of this job on this node
             self.running_jobs[job_id] = True
 
-            if not context.restart:
-                # tell mongo the first time this job node starts running
-                console.diag("calling MONGO job_node_start: job_id={}".format(job_id))
-                mongo.job_node_start(job_id)
+            # tell mongo the first time this job node starts running
+            node_start = not context.restart
+
+        # tell mongo RUNS that this run has started and mongo JOBS that this job has a new run (and maybe a new node)
+        console.diag("calling MONGO run_lifecycle_start: ws={}, run_name={}, job_id={}, node_start={}".format(context.ws, 
+            run_name, job_id, node_start))
+        mongo = store.get_mongo()
+        mongo.run_lifecycle_start(context.ws, run_name, job_id, node_start=node_start)
 
         return True
 
     def start_mirror_worker(self, store, run_info, rundir, run_name, context):
         console.print("starting a MIRROR thread: grok={}, mirror-dest={}, mirror-path={}".format(context.grok_server, 
             context.mirror_dest, context.mirror_files))
-        worker = MirrorWorker(store, rundir, context.mirror_dest, context.mirror_files, context.grok_server, context.ws, run_name)
+
+        # contexts of jobs submitted by earlier builds don't have the mirror upload settings
+        mirror_options = {}
+        for name in ["quiet_secs", "max_delay_secs", "uploads_per_sec"]:
+            value = getattr(context, "mirror_" + name, None)
+            if value is not None:
+                mirror_options[name] = value
+
+        worker = MirrorWorker(store, rundir, context.mirror_dest, context.mirror_files, context.grok_server, context.ws, run_name,
+            **mirror_options)
         
         run_info.mirror_worker = worker
         self.mirror_workers.append(worker)
@@ -1120,7 +1287,7 @@ class XTController(rpyc.Service):
 
             if worker in self.mirror_workers:
                 self.mirror_workers.remove(worker)
-            run_info.worker = None
+            run_info.mirror_worker = None
 
     def diag(self, msg):
         console.print(msg)
@@ -1419,6 +1586,9 @@ class XTController(rpyc.Service):
         self.validate_request(token)
         self.concurrent = value
 
+        # more slots may now be free
+        self.signal_queue()
+
     def get_running_names(self):
         with runs_lock:
             running_names = [run.run_name for run in self.runs.values() if run.status == "running"]
@@ -1486,6 +1656,11 @@ def run(concurrent=1, my_ip_addr=None, multi_run_context_fn=constants.FN_MULTI_R
         if philly_port:
             port = int(philly_port) + 15
 
+        # set by the PSM for the controller of each of its slots (the first slot uses constants.CONTROLLER_PORT)
+        slot_port = os.getenv("XT_CONTROLLER_PORT")
+        if slot_port:
+            port = int(slot_port)
+
         # write server cert file JIT from env var values
         fn_server_cert = os.path.expanduser(constants.FN_SERVER_CERT)
         cert64 = os.getenv("XT_SERVER_CERT")
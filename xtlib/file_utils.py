@@ -4,10 +4,12 @@
 #
 # file_utils.py: small function helper code for working with local file system
 import os
+import re
 import stat
 import yaml
 import fnmatch
 import shutil
+import pickle
 import tempfile
 
 from xtlib import console
@@ -17,6 +19,16 @@ def has_wildcards(name):
     has_wild = ("*" in name) or ("?" in name)
     return has_wild
 
+def wildcard_matcher(pattern):
+    ''' compile 'pattern' once; returns a function(name) that matches like fnmatch.fnmatch(name, pattern) '''
+    match = re.compile(fnmatch.translate(os.path.normcase(pattern))).match
+
+    if os.path.normcase("A/B") == "A/B":
+        # posix: names are used as-is
+        return lambda name: match(name) is not None
+
+    return lambda name: match(os.path.normcase(name)) is not None
+
 def get_first_dirnode(path):
     path = path.replace("\\", "/")
     parts = path.split("/")
@@ -78,7 +90,8 @@ def ensure_dir_exists(dir=None, file=None):
         dir = os.path.dirname(file)
     
     if dir and not os.path.exists(dir):
-        os.makedirs(dir)
+        # exist_ok: transfer threads can create the same folder at the same time
+        os.makedirs(dir, exist_ok=True)
 
 def ensure_dir_deleted(dir):
     if os.path.exists(dir):
@@ -0,0 +1,164 @@
+#
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+#
+# code_manifest.py: content-addressed code snapshots (a manifest of file hashes, plus local hash/blob caches)
+import os
+import json
+import shutil
+import hashlib
+import threading
+
+from xtlib import constants
+from xtlib import file_utils
+from ..console import console
+
+MANIFEST_VERSION = 1
+HASH_BLOCK_SIZE = 1024*1024
+
+def hash_file(fn):
+    ''' return the sha256 hex digest of the contents of the local file 'fn' '''
+    hasher = hashlib.sha256()
+
+    with open(fn, "rb") as infile:
+        while True:
+            block = infile.read(HASH_BLOCK_SIZE)
+            if not block:
+                break
+            hasher.update(block)
+
+    return hasher.hexdigest()
+
+def get_manifest_name(fn, remove_prefix_len=None):
+    ''' return the name of the local file 'fn' within a manifest '''
+    name = fn[remove_prefix_len:] if remove_prefix_len else fn
+    return name.replace("\\", "/")
+
+class HashCache():
+    '''
+    Remembers the hash of each local file, keyed by its path, size and modified time, so that
+    files that have not changed since the last snapshot are not read and hashed again.
+    '''
+    def __init__(self, fn=constants.FN_CODE_HASHES):
+        self.fn = os.path.expanduser(fn)
+        self.hashes = {}
+        self.changed = False
+
+        if os.path.exists(self.fn):
+            try:
+                with open(self.fn, "rt") as infile:
+                    self.hashes = json.load(infile)
+            except BaseException as ex:
+                # a damaged cache only costs us a rehash
+                console.diag("ignoring unreadable hash cache: {}, ex={}".format(self.fn, ex))
+
+    def get_hash(self, fn):
+        fn = os.path.realpath(fn)
+        stat = os.stat(fn)
+
+        entry = self.hashes.get(fn)
+        if entry and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+            return entry[2]
+
+        file_hash = hash_file(fn)
+        self.hashes[fn] = [stat.st_size, stat.st_mtime_ns, file_hash]
+        self.changed = True
+
+        return file_hash
+
+    def save(self):
+        if not self.changed:
+            return
+
+        # write to a temp file and rename, so that concurrent submits never see a partial cache
+        file_utils.ensure_dir_exists(file=self.fn)
+        fn_temp = "{}.{}.tmp".format(self.fn, os.getpid())
+
+        with open(fn_temp, "wt") as outfile:
+            json.dump(self.hashes, outfile)
+
+        os.replace(fn_temp, self.fn)
+        self.changed = False
+
+def build_manifest(filenames, remove_prefix_len=None, hash_cache=None):
+    '''
+    return a manifest for the local files 'filenames': a dict whose "files" property maps the relative
+    name of each file (its name without the first 'remove_prefix_len' chars) to its hash, size and mode.
+    '''
+    if not hash_cache:
+        hash_cache = HashCache()
+
+    files = {}
+
+    for fn in filenames:
+        if not os.path.isfile(fn):
+            continue
+
+        name = get_manifest_name(fn, remove_prefix_len)
+        stat = os.stat(fn)
+
+        files[name] = {"hash": hash_cache.get_hash(fn), "size": stat.st_size, "mode": stat.st_mode & 0o777}
+
+    hash_cache.save()
+
+    return {"version": MANIFEST_VERSION, "files": files}
+
+def write_manifest(manifest, fn):
+    file_utils.ensure_dir_exists(file=fn)
+
+    with open(fn, "wt") as outfile:
+        json.dump(manifest, outfile, separators=(",", ":"))
+
+def read_manifest(fn):
+    with open(fn, "rt") as infile:
+        manifest = json.load(infile)
+
+    return manifest
+
+def get_manifest_hashes(manifest):
+    ''' return the unique hashes of the files in 'manifest', with the size of each '''
+    sizes = {}
+
+    for info in manifest["files"].values():
+        sizes[info["hash"]] = info["size"]
+
+    return sizes
+
+class BlobCache():
+    '''
+    A local directory of code blobs, each named by its hash.  Used on compute nodes so that files shared
+    by many runs (and by successive jobs) are downloaded only once.
+    '''
+    def __init__(self, cache_dir=constants.CODE_CACHE_DIR):
+        self.cache_dir = os.path.expanduser(cache_dir)
+
+        file_utils.ensure_dir_exists(self.cache_dir)
+
+    def get_path(self, file_hash):
+        return self.cache_dir + "/" + file_hash
+
+    def get_missing(self, hashes):
+        return [fh for fh in hashes if not os.path.exists(self.get_path(fh))]
+
+    def get_temp_path(self, file_hash):
+        ''' downloads go to a temp name, and are moved into place by add_downloaded() '''
+        return "{}.{}.{}.tmp".format(self.get_path(file_hash), os.getpid(), threading.get_ident())
+
+    def add_downloaded(self, file_hash):
+        os.replace(self.get_temp_path(file_hash), self.get_path(file_hash))
+
+    def restore_tree(self, manifest, dest_dir):
+        ''' write the files of 'manifest' (all of which must be in the cache) to 'dest_dir' '''
+        names = []
+
+        for name, info in manifest["files"].items():
+            fn_dest = dest_dir + "/" + name
+            file_utils.ensure_dir_exists(file=fn_dest)
+
+            # copy (rather than link) so that a run that changes its files can't change the cache
+            shutil.copyfile(self.get_path(info["hash"]), fn_dest)
+            os.chmod(fn_dest, info["mode"])
+
+            names.append(name)
+
+        return names
@@ -64,6 +64,12 @@ class FeedbackProgress():
                 console.print(msg, end="", flush=True, sep="")
                 self.last_len = len(msg)
 
+    def files_progress(self, files_done, files_total, current=0, total=0):
+        ''' show the aggregate progress of a multi-file transfer '''
+        if self.progress_enabled:
+            self.status = "{:,d} of {:,d} files".format(files_done, files_total)
+            self.progress(current, total)
+
     def end(self):
         if self.output_enabled:
             if self.progress_enabled:
@@ -4,13 +4,26 @@
 #
 # file_helper.py: helps collect a list of local files, given lists of files to include and omit
 import os
+import zlib
 import zipfile
 from fnmatch import fnmatch
+from concurrent.futures import ThreadPoolExecutor
 
 from xtlib import utils
 from xtlib import file_utils
 from ..console import console
 
+# files with these extensions are already compressed, so they are stored in zip files as-is
+COMPRESSED_EXTS = [".zip", ".gz", ".tgz", ".bz2", ".xz", ".7z", ".whl", ".npz", ".pt", ".pth", ".ckpt", 
+    ".png", ".jpg", ".jpeg", ".gif", ".webp", ".mp3", ".mp4"]
+
+# files larger than this are streamed into the zip file (by the writer), rather than compressed in memory by a worker
+ZIP_MEMBER_MAX_MB = 64
+
+# small files are compressed in batches (of up to this many files or MB) by each worker task
+ZIP_BATCH_FILES = 64
+ZIP_BATCH_MB = 8
+
 def _wildcard_match_in_list(source, name_list):
     matches = []
 
@@ -90,19 +103,126 @@ def get_filenames_from_include_lists(include_lists, exclude_dirs_and_files=[], r
 
     return filenames
 
-def zip_up_filenames(fn_zip, filenames, compress=True, remove_prefix_len=None):
+def is_compressed_file(fn):
+    return os.path.splitext(fn)[1].lower() in COMPRESSED_EXTS
+
+def _compress_member(fn, arcname, compress, compress_level):
+    ''' read and (optionally) compress a zip file member; returns its ZipInfo (with sizes and CRC set) and data '''
+    zinfo = zipfile.ZipInfo.from_file(fn, arcname)
+
+    with open(fn, "rb") as infile:
+        data = infile.read()
+
+    zinfo.file_size = len(data)
+    zinfo.CRC = zlib.crc32(data)
+
+    if compress and not is_compressed_file(fn):
+        # raw deflate stream (no zlib header), as used by zip files
+        compressor = zlib.compressobj(compress_level, zlib.DEFLATED, -15)
+        data = compressor.compress(data) + compressor.flush()
+        zinfo.compress_type = zipfile.ZIP_DEFLATED
+    else:
+        zinfo.compress_type = zipfile.ZIP_STORED
+
+    zinfo.compress_size = len(data)
+    return zinfo, data
+
+def _write_compressed_member(zip, zinfo, data):
+    ''' append a member whose data was already compressed by _compress_member() '''
+    zip64 = zinfo.file_size > zipfile.ZIP64_LIMIT or zinfo.compress_size > zipfile.ZIP64_LIMIT
+
+    zinfo.header_offset = zip.fp.tell()
+    zip.fp.write(zinfo.FileHeader(zip64))
+    zip.fp.write(data)
+
+    zip.filelist.append(zinfo)
+    zip.NameToInfo[zinfo.filename] = zinfo
+    zip.start_dir = zip.fp.tell()
+
+def _compress_members(members, compress, compress_level):
+    return [_compress_member(fn, fn_dest, compress, compress_level) for fn, fn_dest in members]
+
+def _get_zip_batches(filenames, remove_prefix_len, max_size):
+    '''
+    group the files into batches of (fn, arcname) members, in order.  Each batch of small files is compressed 
+    by one worker task (to keep per-task overhead low); a large file (or directory) is a batch of its own, 
+    marked by a size of None, and is streamed into the zip by the writer.
+    '''
+    batch = []
+    batch_size = 0
+
+    for fn in filenames:
+        fn_dest = fn[remove_prefix_len:] if remove_prefix_len else fn
+        size = None if os.path.isdir(fn) else os.path.getsize(fn)
+
+        if size is None or size > max_size:
+            if batch:
+                yield batch, batch_size
+                batch, batch_size = [], 0
+
+            yield [(fn, fn_dest)], None
+            continue
+
+        batch.append((fn, fn_dest))
+        batch_size += size
+
+        if len(batch) >= ZIP_BATCH_FILES or batch_size >= ZIP_BATCH_MB*1024*1024:
+            yield batch, batch_size
+            batch, batch_size = [], 0
+
+    if batch:
+        yield batch, batch_size
+
+def zip_up_filenames(fn_zip, filenames, compress=True, remove_prefix_len=None, compress_level=None, workers=None):
+    '''
+    write the files 'filenames' to a standard zip file.  Members are read and compressed concurrently by a pool 
+    of 'workers' threads (zlib releases the GIL), and written in order by the calling thread.  Already compressed 
+    formats (see COMPRESSED_EXTS) are stored without recompression.  'compress_level' is the zlib level (0-9).
+    '''
     fn_zip = os.path.expanduser(fn_zip)
     file_utils.ensure_dir_exists(file=fn_zip)
 
     compression = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
-    #console.print("compression=", compression)
-
-    with zipfile.ZipFile(fn_zip, "w", compression=compression) as zip: 
-        # writing each file one by one 
-        for fn in filenames: 
-            #console.print("zipping fn: " + fn)
-            fn_dest = fn[remove_prefix_len:] if remove_prefix_len else fn
-            zip.write(fn, arcname=fn_dest) 
+    if compress_level is None:
+        compress_level = zlib.Z_DEFAULT_COMPRESSION
+
+    workers = workers or os.cpu_count() or 1
+    batches = _get_zip_batches(filenames, remove_prefix_len, ZIP_MEMBER_MAX_MB*1024*1024)
+
+    with zipfile.ZipFile(fn_zip, "w", compression=compression, allowZip64=True) as zip: 
+
+        def write_batch(members, results):
+            if results is None:
+                # a large file or a directory
+                fn, fn_dest = members[0]
+                member_compression = zipfile.ZIP_STORED if is_compressed_file(fn) else compression
+                zip.write(fn, arcname=fn_dest, compress_type=member_compression, compresslevel=compress_level) 
+            else:
+                for zinfo, data in results:
+                    _write_compressed_member(zip, zinfo, data)
+
+        if workers == 1:
+            for members, size in batches:
+                results = None if size is None else _compress_members(members, compress, compress_level)
+                write_batch(members, results)
+            return
+
+        with ThreadPoolExecutor(workers) as executor:
+            # limit the number of batches held in memory to a window of pending batches
+            pending = []
+            window = 2*workers
+
+            for members, size in batches:
+                future = None if size is None else executor.submit(_compress_members, members, compress, compress_level)
+                pending.append((members, future))
+
+                while len(pending) > window or (pending and pending[0][1] is None):
+                    members0, future0 = pending.pop(0)
+                    write_batch(members0, future0.result() if future0 else None)
+
+            # writing each remaining batch, in order
+            for members, future in pending:
+                write_batch(members, future.result() if future else None)
 
 def unzip_files(fn_zip, dest_dir):
 
@@ -3,6 +3,7 @@
 # Licensed under the MIT license.
 #
 # hp_search_bayesian.py: generate next HP set based according to bayesian search algorithm
+import json
 import numpy as np
 from hyperopt import Domain
 from interface import implements
@@ -10,85 +11,171 @@ from hyperopt.utils import coarse_utcnow
 import hyperopt.pyll.stochastic as stochastic
 from hyperopt import hp, tpe, rand, Trials, base
 
+from xtlib import console
 from xtlib import constants
 from xtlib import run_helper
 from xtlib.hparams.hp_search_interface import HpSearchInterface
 
 class BayesianSearch(implements(HpSearchInterface)):
     def __init__(self):
-        pass
+        # TPE state is kept between calls (the controller reuses this instance for each child run), 
+        # so only newly completed runs are added to our Trials 
+        self.space_key = None
+        self.param_space = None
+        self.domain = None
+        self.trials = None
+        self.runs_seen = 0
+        self.max_tid = 0
+        self.rstate = np.random.RandomState()
 
     def need_runs(self):
         return True
 
     def search(self, run_name, store, context, hp_records, runs):
-        
-        def make_trial(tid, arg_dict, loss_value):
-            trial = {"book_time": None, "exp_key": None, "owner": None, "refresh_time": None, "spec": None, "state": 0, "tid": tid, "version": 0}
-            #trial["result"] = {"status": "New"}
-            misc = {}
-            trial["misc"] = misc
+        arg_dicts = self.search_batch(run_name, store, context, hp_records, runs, 1)
+        return arg_dicts[0]
 
-            misc["cmd"] = ("domain_attachment", "FMinIter_Domain")
-            misc["idxs"] = {key: [tid] for key in arg_dict.keys()}
-            misc["tid"] = tid
-            misc["vals"] = arg_dict
+    def search_batch(self, run_name, store, context, hp_records, runs, count):
+        '''
+        return a list of 'count' suggested hparam sets (arg_dicts), using a single update of our TPE state.
+        '''
+        self.update_trials(context, hp_records, runs)
+
+        # get next suggested hyperparameter values from TPE algorithm
+        tid = max(self.max_tid, run_helper.get_int_from_run_name(run_name)) + 1
+        min_trials = 3      # before this, just do rand sampling
+        completed = len(self.trials)
+        arg_dicts = []
+
+        if count > 1:
+            # pending suggestions of this batch are added to a copy of our (completed only) trials
+            trials = Trials()
+            trials.insert_trial_docs(self.trials.trials)
+            trials.refresh()
+        else:
+            trials = self.trials
+
+        for i in range(count):
+            seed = self.rstate.randint(2 ** 31 - 1)
 
-            trial["state"] = 2   # done
-            trial["result"] = {"loss": loss_value, "status": "ok"}
-            #trial["refresh_time"] = coarse_utcnow()
+            if completed < min_trials:
+                new_trials = rand.suggest([tid], self.domain, trials, seed)
+            else:
+                new_trials = tpe.suggest([tid], self.domain, trials, seed)
 
-            return trial
+            # apply the suggested hparam values
+            trial = new_trials[0]
+            arg_dict = self.fixup_hyperopt_hparams(self.param_space, trial["misc"]["vals"])
+            arg_dicts.append(arg_dict)
 
-        dummy_loss = lambda x: None
-        param_space = {r["name"]: r["space_func"] for r in hp_records} 
-        domain = base.Domain(dummy_loss, param_space)
+            if i < count-1:
+                # add the suggestion as a pending trial (no loss), so the next suggestion of the batch differs 
+                trials.insert_trial_docs(new_trials)
+                trials.refresh()
+                tid += 1
 
-        rstate = np.random.RandomState()
+        return arg_dicts
 
-        # convert runs to Trials
+    def update_trials(self, context, hp_records, runs):
+        '''
+        add the runs completed since our last call to our Trials.  'runs' is the (append only) run history of the
+        controller.  If the search space has changed, the Trials and Domain are rebuilt.
+        '''
+        space_key = json.dumps([[r["name"], r["value"]] for r in hp_records])
+
+        if space_key != self.space_key or self.runs_seen > len(runs):
+            dummy_loss = lambda x: None
+            self.param_space = {r["name"]: r["space_func"] for r in hp_records} 
+            self.domain = base.Domain(dummy_loss, self.param_space)
+            self.trials = Trials()
+            self.space_key = space_key
+            self.runs_seen = 0
+            self.max_tid = 0
+
+        # convert new runs to Trials
         trial_list = []
 
-        for run in runs:
-            # don't trip over inappropriate runs
-            if (not "run_name" in run) or (not "hparams" in run) or (not context.primary_metric in run):
-                continue
+        for run in runs[self.runs_seen:]:
+            trial = self.make_trial_from_run(run, context)
+            if trial:
+                trial_list.append(trial)
+                self.max_tid = max(self.max_tid, trial["tid"])
 
-            run_name = run["run_name"]
-            arg_dict = run["hparams"]
+        self.runs_seen = len(runs)
 
-            loss_value = run[context.primary_metric]
-            if context.maximize_metric:
-                loss_value = -loss_value
+        if trial_list:
+            self.trials.insert_trial_docs(trial_list)
+            self.trials.refresh()
 
-            # extract a unique int from run_name   (parent.childnum)
-            tid = run_helper.get_int_from_run_name(run_name)
+        console.print("bayesian search: {:,} trials ({:,} new)".format(len(self.trials), len(trial_list)))
 
-            trial = make_trial(tid, arg_dict, loss_value)
-            trial_list.append(trial)
+    def make_trial_from_run(self, run, context):
+        # don't trip over inappropriate runs
+        if (not "run_name" in run) or (not "hparams" in run):
+            return None
 
-        # finally, add our trial_list to trials
-        trials = Trials()
-        trials.insert_trial_docs(trial_list)
-        trials.refresh()
+        # metrics are returned as a subrecord of the run
+        metrics = run["metrics"] if "metrics" in run else run
+        if not context.primary_metric in metrics:
+            return None
 
-        # get next suggested hyperparameter values from TPE algorithm
-        tid = run_helper.get_int_from_run_name(run_name)
+        vals = self.get_trial_vals(self.param_space, run["hparams"])
+        if vals is None:
+            return None
 
-        min_trials = 3      # before this, just do rand sampling
-        seed =  rstate.randint(2 ** 31 - 1)
+        loss_value = float(metrics[context.primary_metric])
+        if context.maximize_metric:
+            loss_value = -loss_value
 
-        if len(trials) < min_trials:
-            new_trials = rand.suggest([tid], domain, trials, seed)
-        else:
-            new_trials = tpe.suggest([tid], domain, trials, seed)
+        # extract a unique int from run_name   (parent.childnum)
+        tid = run_helper.get_int_from_run_name(run["run_name"])
+
+        return self.make_trial(tid, vals, loss_value)
 
-        # apply the suggested hparam values
-        trial = new_trials[0]
-        arg_dict = trial["misc"]["vals"]
-        arg_dict = self.fixup_hyperopt_hparams(param_space, arg_dict)
+    def make_trial(self, tid, vals, loss_value):
+        trial = {"book_time": None, "exp_key": None, "owner": None, "refresh_time": None, "spec": None, "state": 0, "tid": tid, "version": 0}
+        #trial["result"] = {"status": "New"}
+        misc = {}
+        trial["misc"] = misc
 
-        return arg_dict
+        misc["cmd"] = ("domain_attachment", "FMinIter_Domain")
+        misc["idxs"] = {key: [tid] for key in vals.keys()}
+        misc["tid"] = tid
+        misc["vals"] = vals
+
+        trial["state"] = 2   # done
+        trial["result"] = {"loss": loss_value, "status": "ok"}
+        #trial["refresh_time"] = coarse_utcnow()
+
+        return trial
+
+    def get_trial_vals(self, space, hparams):
+        '''
+        convert the hparam values logged by a run to hyperopt's trial "vals" (a list for each hparam,
+        with hp.choice values converted to their index).  returns None if the run doesn't match the space.
+        '''
+        vals = {}
+
+        for prop, ss in space.items():
+            if not prop in hparams:
+                return None
+            value = hparams[prop]
+
+            if ss.name == "switch":    # hp.choice()
+                choices = [arg._obj if hasattr(arg, "_obj") else None for arg in ss.pos_args[1:]]
+                if isinstance(value, str) and value.startswith('"'):
+                    # undo quoting applied in fixup_hyperopt_hparams
+                    value = value[1:-1]
+
+                matches = [i for i, choice in enumerate(choices) if choice == value or 
+                    (isinstance(choice, str) and choice.strip() == value)]
+                if not matches:
+                    return None
+                value = matches[0]
+
+            vals[prop] = [value]
+
+        return vals
 
     def fixup_hyperopt_hparams(self, space, orig_hp_dict):
         '''
@@ -118,4 +205,3 @@ class BayesianSearch(implements(HpSearchInterface)):
             hp_dict[prop] = value
 
         return hp_dict
-
@@ -30,10 +30,15 @@ from xtlib.hparams.hp_search_interface import HpSearchInterface
 
 dgd_rand = random.Random(time.time())  # For 'truly' random hyperparameter selection.
 
+# min secs between snapshots of the DGD state to the job/experiment store
+SNAPSHOT_INTERVAL = 30
+
 
 class DGDSearch(implements(HpSearchInterface)):
     def __init__(self):
-        pass
+        # the DGD runset index is kept between calls (the controller reuses this instance for each child run)
+        self.dgd = None
+        self.last_snapshot = 0
 
     def need_runs(self):
         return True
@@ -42,14 +47,70 @@ class DGDSearch(implements(HpSearchInterface)):
         '''
         use dgd module to perform dgd search for next hparam set.
         '''
-        dgd = DGD()
-        dgd.build(store, hp_records, runs, context.primary_metric)
+        dgd = self.get_dgd(store, context, hp_records)
+
+        # only the runs that completed since our last call are processed here
+        dgd.add_new_runs(runs, context.primary_metric)
+        dgd.report()
         
         runset = dgd.choose_config()
         arg_dict = dgd.arg_dict_from_runset(runset)
 
+        self.save_snapshot(store, context, dgd)
         return arg_dict
 
+    def get_dgd(self, store, context, hp_records):
+        hp_key = DGD.get_hp_key(hp_records)
+
+        if not self.dgd or self.dgd.hp_key != hp_key:
+            # first call (or hp-config has changed): start from the last snapshot, if available
+            dgd = DGD()
+            dgd.define_hyperparameters(hp_records)
+
+            state = self.load_snapshot(store, context)
+            if state and state["hp_key"] == hp_key and state["dest"] == context.dest_name:
+                dgd.load_state(state)
+                console.print("DGD: resumed from snapshot ({:,} runs, {:,} runsets)".format(dgd.run_count, len(dgd.runsets)))
+
+            self.dgd = dgd
+
+        return self.dgd
+
+    def load_snapshot(self, store, context):
+        state = None
+
+        try:
+            if context.aggregate_dest == "experiment":
+                if store.does_experiment_file_exist(context.ws, context.dest_name, constants.DGD_STATE_FN):
+                    text = store.read_experiment_file(context.ws, context.dest_name, constants.DGD_STATE_FN)
+                    state = json.loads(text)
+            else:
+                if store.does_job_file_exist(context.dest_name, constants.DGD_STATE_FN):
+                    text = store.read_job_file(context.dest_name, constants.DGD_STATE_FN)
+                    state = json.loads(text)
+        except BaseException as ex:
+            console.print("DGD: ignoring unreadable snapshot: {}".format(ex))
+
+        return state
+
+    def save_snapshot(self, store, context, dgd):
+        if not dgd.changed or time.time() - self.last_snapshot < SNAPSHOT_INTERVAL:
+            return
+
+        text = json.dumps(dgd.get_state(context.dest_name))
+
+        try:
+            if context.aggregate_dest == "experiment":
+                store.create_experiment_file(context.ws, context.dest_name, constants.DGD_STATE_FN, text)
+            else:
+                store.create_job_file(context.dest_name, constants.DGD_STATE_FN, text)
+
+            dgd.changed = False
+            self.last_snapshot = time.time()
+        except BaseException as ex:
+            # not fatal; the snapshot is only used to speed up a restarted controller
+            console.print("DGD: unable to save snapshot: {}".format(ex))
+
 class MetricReport(object):
     def __init__(self, metric_dict, primary_metric):
         self.score = float(metric_dict[primary_metric])
@@ -59,11 +120,17 @@ class RunSet(object):
     def __init__(self, hp_id__setting_id__list, config_str):
         self.hp_id__setting_id__list = hp_id__setting_id__list
         self.config_str = config_str
-        self.runs = []
         self.num_runs = 0
+        self.score_sum = 0.
         self.metric = None
         self.id = -1  # For temporary usage.
 
+    def add_score(self, score):
+        # running mean of the run scores (like reward)
+        self.num_runs += 1
+        self.score_sum += score
+        self.metric = self.score_sum / self.num_runs
+
     def report(self, title):
         sz = "{}  {}".format(title, self.config_str)
         if self.metric is not None:
@@ -174,8 +241,23 @@ class Hyperparameter(object):
 class DGD(object):
     def __init__(self, unit_test=False):
         self.unit_test = unit_test
+        self.hp_key = None
         self.runsets = []
         self.configstr_runset_dict = {}
+        self.best_runset = None
+
+        # incremental state
+        self.run_count = 0
+        self.end_id = 0
+        self.runs_seen = 0
+        self.single_run_runsets = 0
+        self.max_runs_per_runset = 0
+        self.changed = False
+
+    @staticmethod
+    def get_hp_key(records):
+        ''' returns a key that identifies the hyperparameter definitions (runsets are only valid for the same key) '''
+        return json.dumps([[record["name"], record["value"]] for record in records])
 
     def build(self, store, records, all_runs, primary_metric, report=True):
         self.store = store
@@ -184,8 +266,7 @@ class DGD(object):
         # Create Hyperparameter objects as defined in config.txt
         self.define_hyperparameters(records)
 
-        self.create_run_objects(all_runs, primary_metric)
-        self.finalize_runsets()
+        self.add_new_runs(all_runs, primary_metric)
 
         if report:
             self.report()
@@ -193,6 +274,7 @@ class DGD(object):
     def define_hyperparameters(self, records):
         self.name_hparam_dict = {}  # This should go away.
         self.hparams = []
+        self.hp_key = self.get_hp_key(records)
 
         # REVIEW: we no longer support sections in this call (all hparams are searcharble)
         in_hp_section = True    #  False
@@ -212,74 +294,137 @@ class DGD(object):
             self.hparams.append(hp)
             self.name_hparam_dict[name_string] = hp
 
-    def create_run_objects(self, run_reports, primary_metric):
-        self.runs = []
+    def add_new_runs(self, all_runs, primary_metric):
+        '''
+        add the runs that we haven't seen yet to their runsets.  'all_runs' is the (append only) run history of 
+        the controller, so we only need to look at the runs after those seen on the previous call (and, after
+        resuming from a snapshot, skip the runs that ended before the snapshot was taken).
+        '''
+        start = self.runs_seen if self.runs_seen <= len(all_runs) else 0
+        new_runs = [run for run in all_runs[start:] if self.unit_test or run.get("end_id", self.end_id + 1) > self.end_id]
+        self.runs_seen = len(all_runs)
+
+        if not new_runs:
+            return
+
+        prev_best = self.best_runset
+        prev_best_metric = prev_best.metric if prev_best else None
+        touched = {}
+
+        for record in new_runs:
+            runset = self.add_run(record, primary_metric)
+            if runset:
+                touched[runset.config_str] = runset
+
+            end_id = None if self.unit_test else record.get("end_id")
+            if isinstance(end_id, int) and end_id > self.end_id:
+                self.end_id = end_id
+
+        # update the best runset from the runsets that changed
+        if prev_best and prev_best.config_str in touched and prev_best.metric < prev_best_metric:
+            # our best got worse; look at all runsets
+            self.find_best_runset()
+        else:
+            for runset in touched.values():
+                if self.best_runset is None or runset.metric >= self.best_runset.metric:
+                    self.best_runset = runset
 
-        for record in run_reports:
-            if self.unit_test:
-                run = Run(json.loads(record))
-            else:
-                run = Run(record, primary_metric)
-            ignore_run = False
-            if len(run.metric_reports) == 0:
-                continue  # Skip parent runs.
-            # Try to assemble a configuration string for this run.
-            hp_id__setting_id__list = []
-            for hp_name, hp_value in run.hpname_hpvalue_list:
+        self.changed = True
 
-                # we no longer require that all run-reported hparams are present in the hp-config file
-                #assert hp_name in self.name_hparam_dict.keys()  # hparams must not be removed from config.txt
-                if not hp_name in self.name_hparam_dict:
-                    continue    
+    def add_run(self, record, primary_metric):
+        if self.unit_test:
+            run = Run(json.loads(record))
+        else:
+            run = Run(record, primary_metric)
 
-                hparam = self.name_hparam_dict[hp_name]
-                if not hparam.in_hp_section:  # Ignore controls.
-                    continue
+        if len(run.metric_reports) == 0:
+            return None  # Skip parent runs.
 
-                if hp_value not in hparam.value_setting_dict:
-                    # REVIEW: why are we landing here?
-                    ignore_run = True
-                    break  # Skip this run. Its value must have been removed from config.txt.
+        # Try to assemble a configuration string for this run.
+        hp_id__setting_id__list = []
+        for hp_name, hp_value in run.hpname_hpvalue_list:
 
-                if hparam.has_multiple_values:  # Filter to HPs with multiple values.
-                    setting = hparam.value_setting_dict[hp_value]
-                    hp_id__setting_id__list.append((hparam.id, setting.id))
-            
-            if ignore_run:
+            # we no longer require that all run-reported hparams are present in the hp-config file
+            #assert hp_name in self.name_hparam_dict.keys()  # hparams must not be removed from config.txt
+            if not hp_name in self.name_hparam_dict:
+                continue    
+
+            hparam = self.name_hparam_dict[hp_name]
+            if not hparam.in_hp_section:  # Ignore controls.
                 continue
 
-            config_str = str(hp_id__setting_id__list)
+            if hp_value not in hparam.value_setting_dict:
+                # REVIEW: why are we landing here?
+                return None  # Skip this run. Its value must have been removed from config.txt.
 
-            # Keep this run in a corresponding runset.
-            self.runs.append(run)
-            if config_str not in self.configstr_runset_dict.keys():
-                runset = RunSet(hp_id__setting_id__list, config_str)
-                self.configstr_runset_dict[config_str] = runset
-                self.runsets.append(runset)
-            runset = self.configstr_runset_dict[config_str]
-            runset.runs.append(run)
+            if hparam.has_multiple_values:  # Filter to HPs with multiple values.
+                setting = hparam.value_setting_dict[hp_value]
+                hp_id__setting_id__list.append((hparam.id, setting.id))
 
-    def finalize_runsets(self):
-        for runset in self.runsets:
-            runset.num_runs = len(runset.runs)
-            # Average the run scores (like reward).
-            sum = 0.
-            for run in runset.runs:
-                sum += run.overall_score
-                runset.metric = sum / runset.num_runs
+        config_str = str(hp_id__setting_id__list)
+
+        # Keep this run in a corresponding runset.
+        runset = self.get_or_add_runset(hp_id__setting_id__list, config_str)
+        self.add_runset_score(runset, run.overall_score)
+
+        return runset
+
+    def get_or_add_runset(self, hp_id__setting_id__list, config_str):
+        if config_str not in self.configstr_runset_dict:
+            runset = RunSet(hp_id__setting_id__list, config_str)
+            self.configstr_runset_dict[config_str] = runset
+            self.runsets.append(runset)
+
+        return self.configstr_runset_dict[config_str]
+
+    def add_runset_score(self, runset, score):
+        runset.add_score(score)
+        self.run_count += 1
+
+        # keep report stats current
+        if runset.num_runs == 1:
+            self.single_run_runsets += 1
+        elif runset.num_runs == 2:
+            self.single_run_runsets -= 1
+
+        if runset.num_runs > self.max_runs_per_runset:
+            self.max_runs_per_runset = runset.num_runs
+
+    def find_best_runset(self):
+        self.best_runset = None
 
-    def report(self):
-        self.max_runs_per_runset = 0
-        n1 = 0
         for runset in self.runsets:
-            num_runs = len(runset.runs)
-            if num_runs > self.max_runs_per_runset:
-                self.max_runs_per_runset = num_runs
+            if self.best_runset is None or runset.metric >= self.best_runset.metric:
+                self.best_runset = runset
+
+    def get_state(self, dest_name):
+        ''' return the runset index as a JSON-compatible dict (for snapshots) '''
+        runsets = [[runset.hp_id__setting_id__list, runset.num_runs, runset.score_sum] for runset in self.runsets]
+
+        return {"hp_key": self.hp_key, "dest": dest_name, "end_id": self.end_id, "runsets": runsets}
+
+    def load_state(self, state):
+        ''' restore the runset index from a snapshot (define_hyperparameters() must be called first) '''
+        for hp_id__setting_id__list, num_runs, score_sum in state["runsets"]:
+            hp_id__setting_id__list = [tuple(pair) for pair in hp_id__setting_id__list]
+            runset = self.get_or_add_runset(hp_id__setting_id__list, str(hp_id__setting_id__list))
+
+            runset.num_runs = num_runs
+            runset.score_sum = score_sum
+            runset.metric = score_sum / num_runs
+            self.run_count += num_runs
+
             if num_runs == 1:
-                n1 += 1
-        console.print("{} runs".format(len(self.runs)))
+                self.single_run_runsets += 1
+            self.max_runs_per_runset = max(self.max_runs_per_runset, num_runs)
+
+        self.end_id = state["end_id"]
+        self.find_best_runset()
+
+    def report(self):
+        console.print("{} runs".format(self.run_count))
         console.print("{} runsets".format(len(self.runsets)))
-        console.print("{} have 1 run".format(n1))
+        console.print("{} have 1 run".format(self.single_run_runsets))
         console.print("{} max runs per runset".format(self.max_runs_per_runset))
         # for runset in self.runsets:
         #     runset.report()
@@ -336,13 +481,8 @@ class DGD(object):
             chosen_runset.report('Random runset   ')
             return chosen_runset
 
-        # Find the best runset so far.
-        best_runset = self.runsets[0]
-        best_metric = best_runset.metric
-        for runset in self.runsets:
-            if runset.metric >= best_metric:
-                best_metric = runset.metric
-                best_runset = runset
+        # The best runset so far (maintained as runs are added).
+        best_runset = self.best_runset
         best_runset.report('Best runset    ')
 
         # Build a neighborhood around (and including) the best runset.
@@ -362,7 +502,7 @@ class DGD(object):
                 neighborhood.append(neighbor)
 
         # Choose one runset, weighted by how many runs it needs to exceed those of the runset with the most.
-        ceiling = max([len(runset.runs) for runset in neighborhood]) + 1
+        ceiling = max([runset.num_runs for runset in neighborhood]) + 1
         console.print("ceiling = {} runs".format(ceiling))
         probs = np.zeros((len(neighborhood)))
         for i, runset in enumerate(neighborhood):
@@ -427,9 +567,10 @@ if __name__ == '__main__':
     for hp in dgd.hparams:
         hp.report()
     console.print()
-    dgd.runs = []
+    dgd.run_count = 0
     dgd.runsets = []
     dgd.configstr_runset_dict = {}
+    dgd.best_runset = None
     chosen_runset = dgd.choose_config()
     chosen_runset.report("Chosen runset")
 
@@ -19,6 +19,7 @@ from xtlib import constants
 from xtlib import run_helper
 from xtlib.console import console
 from xtlib.hparams import hp_helper
+from xtlib.storage.mongo_hp_suggestions import MongoHpSuggestions
 
 class HParamSearch():
 
@@ -27,6 +28,13 @@ class HParamSearch():
         self.run_history = []
         self.end_id = 0
 
+        # search algorithm instances are reused for each child (so they can keep incremental state)
+        self.search_impls = {}
+
+        # the hp-config file is only read and parsed once per controller
+        self.space_key = None
+        self.space_records = None
+
     # main ENTRY POINT 
     def process_child_hparams(self, child_name, store, context, parent):
         '''
@@ -37,14 +45,14 @@ class HParamSearch():
         sweep_text = None
 
         if context.hp_config:
-            # read hp config file from experiment or job
-            if context.aggregate_dest == "experiment":
-                text = store.read_experiment_file(context.ws, context.dest_name, context.hp_config)
-            else:    
-                # assume sweeps file is at the job level
-                text = store.read_job_file(context.dest_name, context.hp_config)
+            suggestion_batch = getattr(context, "suggestion_batch", None)
 
-            arg_dict = self.generate_hparam_set(context.hp_config, text, child_name, cmd_parts, store, context)
+            if suggestion_batch and suggestion_batch > 1:
+                # job-level suggestion service (suggestions are shared by all nodes of the job)
+                arg_dict = self.get_suggested_hparam_set(child_name, store, context, suggestion_batch)
+            else:
+                space_records = self.get_space_records(store, context)
+                arg_dict = self.hp_search_core(context, context.search_type, store, child_name, space_records)
 
             if context.option_prefix != None:
                 self.apply_runset_to_cmd_parts(arg_dict, cmd_parts, context)
@@ -69,12 +77,46 @@ class HParamSearch():
 
         return cmd_parts
 
-    def generate_hparam_set(self, fn_config, search_file_text, run_name, cmd_parts, store, context):
+    def get_space_records(self, store, context):
         '''
-        generate a set of hyperparameter values, based on the algorithm specified by
-        context.search_type.
+        return the parsed search space records of the hp-config file for context (the file is only read 
+        and parsed on the first call).
+        '''
+        space_key = (context.aggregate_dest, context.dest_name, context.hp_config, context.search_type)
+
+        if space_key != self.space_key:
+            # read hp config file from experiment or job
+            if context.aggregate_dest == "experiment":
+                text = store.read_experiment_file(context.ws, context.dest_name, context.hp_config)
+            else:    
+                # assume sweeps file is at the job level
+                text = store.read_job_file(context.dest_name, context.hp_config)
+
+            self.space_records = self.parse_hp_config_text(text, context.search_type)
+            self.space_key = space_key
+
+        return self.space_records
+
+    def get_suggested_hparam_set(self, run_name, store, context, batch_size):
         '''
+        claim the next unclaimed suggestion from the job document.  if there are none, generate a batch of 
+        suggestions: keep the first one for run_name and add the rest to the job document for other runs.
+        '''
+        node_id = utils.node_id(context.node_index)
+        mhs = MongoHpSuggestions(store.mongo, context.job_id, node_id)
+
+        arg_dict = mhs.claim_suggestion(run_name)
+        if arg_dict is None:
+            space_records = self.get_space_records(store, context)
+
+            arg_dicts = self.hp_search_batch(context, context.search_type, store, run_name, space_records, batch_size)
+            arg_dict = arg_dicts[0]
+
+            mhs.add_suggestions(run_name, arg_dict, arg_dicts[1:])
+
+        return arg_dict
 
+    def parse_hp_config_text(self, search_file_text, search_type):
         # parse text into {name: text, value: text, spacefunc: space_func} records
         text = search_file_text.replace("\r", "")
 
@@ -84,17 +126,38 @@ class HParamSearch():
         hparams = hparams[constants.HPARAM_DIST]
 
         # algorithm-specific processing
-        search_type = context.search_type
         records = self.parse_hp_config_yaml(hparams, search_type)
+        return records
+
+    def generate_hparam_set(self, fn_config, search_file_text, run_name, cmd_parts, store, context):
+        '''
+        generate a set of hyperparameter values, based on the algorithm specified by
+        context.search_type.
+        '''
+        search_type = context.search_type
+        records = self.parse_hp_config_text(search_file_text, search_type)
 
         # get code_path for search_type from hpsearch_providers
         arg_dict = self.hp_search_core(context, search_type, store, run_name, records)
         return arg_dict
 
     def hp_search_core(self, context, search_type, store, run_name, space_records):
+        arg_dicts = self.hp_search_batch(context, search_type, store, run_name, space_records, 1)
+        return arg_dicts[0]
+
+    def hp_search_batch(self, context, search_type, store, run_name, space_records, count):
+        '''
+        return a list of 'count' hparam sets (arg_dicts) from the search algorithm (completed runs are only 
+        fetched once for the batch).
+        '''
         # get code_path for search_type from hpsearch_providers
-        search_ctr = utils.get_provider_class_ctr_from_context(context, "hp-search", search_type)
-        impl = search_ctr()
+        if search_type in self.search_impls:
+            impl = self.search_impls[search_type]
+        else:
+            search_ctr = utils.get_provider_class_ctr_from_context(context, "hp-search", search_type)
+            impl = search_ctr()
+            self.search_impls[search_type] = impl
+
         need_runs = impl.need_runs()
         runs = None
 
@@ -105,15 +168,20 @@ class HParamSearch():
             elapsed = time.time() - started
             console.print("hp_search_core: {:,} runs (new={:,}, elapsed: {:.2f} secs)".format(len(runs), self.new_run_count, elapsed), flush=True)
 
-        arg_dict = impl.search(run_name, store, context, space_records, runs=runs)
+        if count > 1 and hasattr(impl, "search_batch"):
+            arg_dicts = impl.search_batch(run_name, store, context, space_records, runs, count)
+        else:
+            arg_dicts = [impl.search(run_name, store, context, space_records, runs=runs) for _ in range(count)]
 
-        # fix up returned values 
-        for key, value in arg_dict.items():
-            if isinstance(value, np.float64):
-                arg_dict[key] = value.item()
+        for arg_dict in arg_dicts:
+            # fix up returned values 
+            for key, value in arg_dict.items():
+                if isinstance(value, np.float64):
+                    arg_dict[key] = value.item()
 
-        console.print("\n---- search_type={}, returned arg_dict={} ----\n".format(search_type, arg_dict))
-        return arg_dict
+            console.print("\n---- search_type={}, returned arg_dict={} ----\n".format(search_type, arg_dict))
+
+        return arg_dicts
 
     def parse_hp_config_yaml(self, hparams, search_type):
         # use original size=() for randint on hyperopt (bayesian) search
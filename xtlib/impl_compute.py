@@ -726,7 +726,8 @@ class ImplCompute(ImplBase):
     @hidden("code-dirs", default="$code.code-dirs", help="paths to the main code directory and dependent directories")
     @hidden("code-omit", default="$code.code-omit", help="the list wildcard patterns to omit uploading from the code files")
     @flag("code-upload", default="$code.code-upload", help="when true, code is uploaded to job and download for each run of job")
-    @hidden("code-zip", default="$code.code-zip", type=str, help="the type zip file to create for the CODE files: none/fast/compress")
+    @hidden("code-zip", default="$code.code-zip", type=str, help="the type zip file to create for the CODE files: none/fast/compress/manifest")
+    @hidden("code-zip-level", default="$code.code-zip-level", type=int, help="the compression level (0-9) for code-zip=compress")
     @option("concurrent", default="$hyperparameter-search.concurrent", type=int, help="the maximum concurrent runs to be allowed on each node")
     @option("data-action", default="$data.data-action", help="the data action to take on the target, before run is started")
     @hidden("data-local", default="$data.data-local", help="the path on the local machine specifying where the data for this job resides")
@@ -761,6 +762,9 @@ class ImplCompute(ImplBase):
     @hidden("maximize-metric", default="$general.maximize-metric", help="whether to minimize or maximize value of primary metric")
     @hidden("mirror-dest", default="$logging.mirror-dest", help="the location where mirrored information is store (none, storage, grok)")
     @hidden("mirror-files", default="$logging.mirror-files", help="the wildcard path that specifies files to be mirrored")
+    @hidden("mirror-max-delay-secs", default="$logging.mirror-max-delay-secs", type=float, help="the most secs a changed file waits to be mirrored")
+    @hidden("mirror-quiet-secs", default="$logging.mirror-quiet-secs", type=float, help="a changed file is mirrored after it is unchanged for this many secs")
+    @hidden("mirror-uploads-per-sec", default="$logging.mirror-uploads-per-sec", type=float, help="the most mirror uploads started per second, for each run")
     @option("model-action", default="$model.model-action", help="the model action to take on the target, before run is started")
     @hidden("model-local", default="$model.model-local", help="the path on the local machine specifying where the model for this job resides")
     @hidden("model-share-path", default="$model.model-share-path", help="the model share name for the model")
@@ -777,6 +781,7 @@ class ImplCompute(ImplBase):
     @hidden("remote-control", default="$general.remote-control", help="specifies if XT controller will listen for XT client commands")
     @hidden("report-rollup", default="$run-reports.report-rollup", help="whether to rollup metrics by primary metric or just use last reported metric set")
     @option("resume-name", help="when resuming a run, this names the previous run")
+    @hidden("rundir-min-free-gb", default="$general.rundir-min-free-gb", type=float, help="while old rundirs are being deleted, runs are held until this much disk space is free")
     @option("runs", default=None, type=int, help="the total number of runs across all nodes (for hyperparameter searches)")
     @option("schedule", default="static", values=["static", "dynamic"], help="specifies if runs are pre-assigned to each node or allocate on demand")
     @option("search-type", values=["random", "grid", "bayesian", "dgd"], default="$hyperparameter-search.search-type", help="the type of hyperparameter search to perform")
@@ -786,6 +791,7 @@ class ImplCompute(ImplBase):
     @hidden("slack-amount", default="$early-stopping.slack-amount", type=float, help="(bandit only) specified as an amount, the delta between this eval and the best performing eval")
     @hidden("storage", default="$xt-services.storage", help="name of storage service to be used for this run")
     @option("submit-logs", default=None, help="specifies a directory to which log files for the submit are saved")
+    @hidden("suggestion-batch", default="$hyperparameter-search.suggestion-batch", type=int, help="when > 1, dynamic search hyperparameter sets are generated in batches of this size and shared by all nodes of the job")
     @option("target", default="$xt-services.target", help="one of the user-defined compute targets on which to run")
     @hidden("truncation-percentage", default="$early-stopping.truncation-percentage", type=float, help="(truncation only) percent of runs to cancel at each eval interval")
     @option("use-gpu", type=bool, default="$aml-options.use-gpu", help="when True, the gpu(s) on the nodes will be used by the run")
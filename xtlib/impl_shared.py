@@ -58,6 +58,13 @@ class ImplShared():
         provider_code_path = self.config.get_storage_provider_code_path(storage_creds)
 
         self.store = Store(storage_creds, provider_code_path=provider_code_path, run_cache_dir=run_cache_dir, mongo_conn_str=mongo_conn_str)
+
+        use_run_cache = self.config.get("general", "use-run-cache")
+        run_cache_max_mb = self.config.get("general", "run-cache-max-mb")
+        self.store.set_run_cache_options(use_run_cache, run_cache_max_mb)
+
+        transfer_workers = self.config.get("general", "transfer-workers")
+        self.store.set_transfer_options(transfer_workers)
         console.diag("end of build_actual_store")
 
         return self.store
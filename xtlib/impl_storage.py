@@ -26,6 +26,7 @@ from xtlib import plot_builder
 from xtlib import box_information
 
 from xtlib.storage.store import Store
+from xtlib.storage import metric_cache
 from xtlib.client import Client
 from xtlib.console import console
 from xtlib.cmd_core import CmdCore
@@ -348,9 +349,12 @@ class ImplStorage(ImplBase):
     @argument(name="target", help="the name of the run or job")
     #@option(name="box", default="local", help="the name of the box to use (for the controller log)")
     @option(name="workspace", default="$general.workspace", help="the workspace that the run resides in")
+    @flag(name="follow", help="when True, new entries of the run log are displayed as they are logged (until the run ends)")
+    @option(name="interval", type=float, default=5, help="the number of seconds between checks for new run log entries (with --follow)")
     @example(task="view the log entries for run26 in the curious workspace", text="xt view log curious/run26")
+    @example(task="view the log entries for run26 as they are logged", text="xt view log run26 --follow")
     @command(kwgroup="view", help="view the run log for specified run")
-    def view_log(self, target, workspace):
+    def view_log(self, target, workspace, follow, interval):
         is_aml = self.is_aml_ws(workspace)
 
         # if target == "controller":
@@ -373,12 +377,24 @@ class ImplStorage(ImplBase):
             # view RUN LOG
             #errors.user_error("must specify a run name, job name, or 'controller'")
             ws, run_name, full_run_name = run_helper.validate_run_name(self.store, workspace, target, parse_only=is_aml)
-            records = self.store.get_run_log(ws, run_name)
+            records, offset = self.store.tail_run_log(ws, run_name)
             console.print("log for {}:\n".format(full_run_name))
 
             for record in records:
                 console.print(record)
 
+            ended = [rr for rr in records if rr["event"] == "ended"]
+
+            while follow and not ended:
+                # only read the part of the log appended since the last check
+                time.sleep(interval)
+                records, offset = self.store.tail_run_log(ws, run_name, offset)
+
+                for record in records:
+                    console.print(record)
+                    
+                ended = [rr for rr in records if rr["event"] == "ended"]
+
     #---- VIEW METRICS command ----
     @argument(name="runs", type="str_list", help="a comma separated list of runs, jobs, or experiments", required=True)
     @argument(name="metrics", type="str_list", required=False, help="optional list of metric names")
@@ -394,12 +410,15 @@ class ImplStorage(ImplBase):
         args = {"run_list": runs, "workspace": workspace, "all": True, "sort_col": "name", 
             "max_runs": None, "columns": ["run", "hparams.*", "metrics.*"]}
 
-        # actual store col names (vs. user-level names) used here
-        col_dict = {"run_name": 1, "node_index": 1, "job_id": 1, "exper_name": 1, "ws": 1, "hparams": 1, "log_records": 1}
+        # actual store col names (vs. user-level names) used here (log_records are read thru the metric cache)
+        col_dict = {"run_name": 1, "node_index": 1, "job_id": 1, "exper_name": 1, "ws": 1, "hparams": 1, "end_id": 1, "last_time": 1}
 
         run_log_records, using_default_last, user_to_actual, available, builder, last, std_cols_desc = \
             run_helper.get_filtered_sorted_limit_runs(self.store, self.config, False, col_dict=col_dict, args=args)
 
+        mc = self.get_metric_cache()
+        sets_by_run = mc.get_metric_sets_for_runs(self.store.get_mongo(), run_log_records)
+
         for rr in run_log_records:
             console.print("\n{}:".format(rr["_id"]), end="")
 
@@ -425,7 +444,7 @@ class ImplStorage(ImplBase):
                     console.print(")\n")
  
             # build the metric sets
-            log_records = rr["log_records"]
+            log_records = metric_cache.column_sets_to_log_records(sets_by_run.get(rr["_id"], []))
             metric_sets = run_helper.build_metrics_sets(log_records, steps, merge, metrics)
             just_one = len(metric_sets) == 1
 
@@ -445,6 +464,10 @@ class ImplStorage(ImplBase):
                     text = "  " + text.replace("\n", "\n  ")
                     console.print(text)
 
+    def get_metric_cache(self):
+        run_cache_dir = self.config.get("general", "run-cache-dir")
+        return metric_cache.MetricCache(run_cache_dir)
+
     #---- PLOT command ----
     # args, flags, options
     @argument(name="runs", type="str_list", help="a comma separated list of runs, jobs, or experiments", required=True)
@@ -472,6 +495,7 @@ class ImplStorage(ImplBase):
     @option(name="smoothing-factor", type="float", help="the smoothing factor to apply to values before plotting (0.0-1.0)")
     @option(name="style", values=["darkgrid", "whitegrid", "dark", "white", "ticks", "none"], default="darkgrid", help="the seaborn plot style to use")
     @option(name="timeout", type=float, help="the maximum number of seconds the window will be held open")
+    @flag(name="timing", help="print a breakdown of the time spent in each phase of building the plot")
     @option(name="title", type="str", help="the title to use for the set of plots")
     @option(name="workspace", default="$general.workspace", help="the workspace for the runs to be displayed")
     @option(name="x", default="$general.step-name", help="the metric to use for plotting along the x axis")
@@ -495,7 +519,7 @@ class ImplStorage(ImplBase):
     def plot(self, runs, col_list, x, layout, break_on, title, show_legend, plot_titles, legend_titles, 
         smoothing_factor, workspace, timeout, aggregate, shadow_type, shadow_alpha, style, 
         show_toolbar, max_runs, max_traces, group_by, error_bars, show_plot, save_to, 
-        x_label, legend_args, plot_args, colors, color_map, color_steps, plot_type="line"):
+        x_label, legend_args, plot_args, colors, color_map, color_steps, timing, plot_type="line"):
 
         # hand-validate break-on values
         if break_on:
@@ -507,24 +531,42 @@ class ImplStorage(ImplBase):
             "max_runs": max_runs, "columns": ["run", "metrics.*"] }
 
         x_col = x
+        started = time.time()
         
-        # store col names used here
+        # store col names used here (metrics are read thru the metric cache, instead of log_records)
         col_dict = {"run_name": 1, "node_index": 1, "job_id": 1, "exper_name": 1, "ws": 1, 
-            "search_style": 1, "log_records": 1}
+            "search_style": 1, "end_id": 1, "last_time": 1}
 
         run_log_records, using_default_last, user_to_actual, available, builder, last, std_cols_desc = \
             run_helper.get_filtered_sorted_limit_runs(self.store, self.config, False, col_dict=col_dict, args=args)
+        fetch_elapsed = time.time() - started
 
         # metric string will later contain calculated expressions
         if not col_list:
             col_list = []
 
+        # only load the requested columns (plus the possible x columns)
+        load_cols = None
+        if col_list:
+            load_cols = col_list + [x_col, constants.STEP_NAME, constants.INDEX, "epoch", "step", "iter", "epochs", "steps", "iters"]
+
+        started = time.time()
+        mc = self.get_metric_cache()
+        sets_by_run = mc.get_metric_sets_for_runs(self.store.get_mongo(), run_log_records, load_cols)
+
+        for rlr in run_log_records:
+            rlr["metric_sets"] = sets_by_run.get(rlr["_id"], [])
+
         run_names = [rlr["_id"] for rlr in run_log_records]
+        metrics_elapsed = time.time() - started
 
         pb = plot_builder.PlotBuilder(run_names, col_list, x_col, layout, break_on, title, show_legend, plot_titles,
             legend_titles, smoothing_factor, plot_type, timeout, aggregate, shadow_type, shadow_alpha, 
             run_log_records, style, show_toolbar, max_runs, max_traces, 
-            group_by, error_bars, show_plot, save_to, x_label, colors, color_map, color_steps, legend_args, plot_args)
+            group_by, error_bars, show_plot, save_to, x_label, colors, color_map, color_steps, legend_args, plot_args,
+            timing=timing)
+
+        pb.timings += [("fetch runs", fetch_elapsed), ("load metrics", metrics_elapsed)]
 
         pb.build()
 
@@ -826,6 +868,7 @@ class ImplStorage(ImplBase):
     @flag(name="child", help="only list child runs")
     @flag(name="outer", help="only outer (top) level runs")
     @flag(name="available", help="show the columns (std, hyperparameter, metrics) available for specified runs")
+    @flag(name="rebuild-cache", help="rebuild the local run cache for the workspace from scratch (when use-run-cache is enabled)")
 
     # examples
     @example("xt list runs", task="display a runs report for the current workspace")
@@ -916,12 +959,15 @@ class ImplStorage(ImplBase):
     @option(name="experiment", help="the experiment that the path is relative to")
     @option(name="run", help="the run name that the path is relative to")
     @flag(name="feedback", default=True, help="when True, incremental feedback will be displayed")
+    @option(name="workers", type=int, default="$general.transfer-workers", help="the number of files to upload concurrently")
+    @flag(name="resume", help="when True, files whose blob already has the same size and a newer modified time are skipped")
     @example(task="copy python files from local directory to the BLOB store area associated with workspace 'curious'", text="xt upload *.py . --share=data --work=curious")
     @example(task="copy the local file 'single_sweeps.txt' as 'sweeps.txt' in the BLOB store area for job2998", text="xt upload single_sweeps.txt sweeps.txt --share=data --job=job2998")
     @example(task="copy MNIST data from local dir to data upload folder name 'my-mnist'", text="xt upload ./mnist/** my-mnist --share=data")
     @command(help="copy local files to an Azure storage location")
-    def upload(self, local_path, store_path, share, workspace, experiment, job, run, feedback):
-        self.impl_storage_api.upload(local_path, store_path, share, workspace, experiment, job, run, feedback, show_output=True)
+    def upload(self, local_path, store_path, share, workspace, experiment, job, run, feedback, workers, resume):
+        self.impl_storage_api.upload(local_path, store_path, share, workspace, experiment, job, run, feedback, show_output=True, 
+            workers=workers, resume=resume)
 
     #---- DOWNLOAD command ----
     @argument(name="store-path", help="the path for the source store blob or wildcard")
@@ -933,10 +979,13 @@ class ImplStorage(ImplBase):
     @option(name="run", help="the run name that the path is relative to")
     @flag(name="feedback", default=True, help="when True, incremental feedback will be displayed")
     @flag(name="snapshot", help="when True, a temporary snapshot of store files will be used for their download")
+    @option(name="workers", type=int, default="$general.transfer-workers", help="the number of files to download concurrently")
+    @flag(name="resume", help="when True, files whose local copy already has the same size and a newer modified time are skipped")
     @example(task="download all blobs in the 'myrecent' folder (and its children) of the BLOB store area for job2998 to local directory ./zip", text="xt download myrecent/** ./zip --job=job2998")
     @command(help="copy Azure store blobs to local files/directory")
-    def download(self, store_path, local_path, share, workspace, experiment, job, run, feedback, snapshot):
-        self.impl_storage_api.download(store_path, local_path, share, workspace, experiment, job, run, feedback, snapshot, show_output=True)
+    def download(self, store_path, local_path, share, workspace, experiment, job, run, feedback, snapshot, workers, resume):
+        self.impl_storage_api.download(store_path, local_path, share, workspace, experiment, job, run, feedback, snapshot, show_output=True, 
+            workers=workers, resume=resume)
 
     #---- LIST BLOBS command ----
     @argument(name="path", required=False, help="the path for the source store blob or wildcard")
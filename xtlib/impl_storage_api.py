@@ -34,6 +34,7 @@ from xtlib import plot_builder
 from xtlib import box_information
 
 from xtlib.storage.store import Store
+from xtlib.storage import transfer_engine
 from xtlib.client import Client
 from xtlib.console import console
 from xtlib.cmd_core import CmdCore
@@ -314,7 +315,8 @@ class ImplStorageApi():
             run=run_id, feedback=False, snapshot=True, show_output=False)
 
     # COMMAND
-    def download(self, store_path, local_path, share, workspace, experiment, job, run, feedback, snapshot, show_output=True):
+    def download(self, store_path, local_path, share, workspace, experiment, job, run, feedback, snapshot, show_output=True, 
+        workers=None, resume=False):
 
         use_blobs = True 
         use_multi = True     # default until we test if store_path exists as a file/blob
@@ -376,19 +378,28 @@ class ImplStorageApi():
             name_width =  1 + max_name_len
             #console.print("max_name_len=", max_name_len, ", name_width=", name_width)
 
-            for f, bn in enumerate(blob_names):
+            items = []
+            for bn in blob_names:
                 dest_fn = file_utils.fix_slashes(local_path + "/" + bn)
+                full_bn = uri + "/" + bn if uri else bn
+                items.append((full_bn, dest_fn))
 
+            def show_file(index, full_bn, dest_fn, status):
                 if show_output:
-                    file_msg = "file {}/{}".format(1+f, len(blob_names))
-                    console.print("  {2:}: {1:<{0:}} ".format(name_width, dest_fn + ":", file_msg), end="", flush=True)
+                    file_msg = "file {}/{}".format(1+index, len(items))
+                    console.print("  {2:}: {1:<{0:}} {3}".format(name_width, dest_fn + ":", file_msg, status), flush=True)
 
-                feedback_progress.start()
-                full_bn = uri + "/" + bn if uri else bn
+            def download_file(full_bn, dest_fn, progress_callback):
                 fs.download_file(full_bn, dest_fn, progress_callback=progress_callback, use_snapshot=use_snapshot)
-                feedback_progress.end()
 
-                download_count += 1
+            def is_current(full_bn, dest_fn):
+                return os.path.isfile(dest_fn) and transfer_engine.is_local_copy_current(fs.get_file_properties(full_bn), dest_fn)
+
+            engine = transfer_engine.TransferEngine(workers or self.store.helper.transfer_workers, 
+                feedback_progress=feedback_progress if feedback else None, file_callback=show_file)
+            results = engine.run(items, download_file, is_current_func=is_current if resume else None)
+
+            download_count += len([r for r in results if r[2] == transfer_engine.COPIED])
         else:
             # download SINGLE blobs/files
             what = "blob" if use_blobs else "file"
@@ -401,6 +412,12 @@ class ImplStorageApi():
             if show_output:
                 console.print("\nfrom {}, downloading {}:".format(uri, what))
                 console.print("  {}:    ".format(local_path), end="", flush=True)
+
+            if resume and os.path.isfile(local_path) and \
+                transfer_engine.is_local_copy_current(fs.get_file_properties(store_path), local_path):
+                if show_output:
+                    console.print(transfer_engine.SKIPPED)
+                return download_count
     
             feedback_progress.start()
             fs.download_file(store_path, local_path, progress_callback=progress_callback, use_snapshot=use_snapshot)
@@ -411,7 +428,8 @@ class ImplStorageApi():
         return download_count
 
     # COMMAND
-    def upload(self, local_path, store_path, share, workspace, experiment, job, run, feedback, show_output=True):
+    def upload(self, local_path, store_path, share, workspace, experiment, job, run, feedback, show_output=True, 
+        workers=None, resume=False):
 
         use_blobs = True
         use_multi = True
@@ -475,19 +493,30 @@ class ImplStorageApi():
             name_width =  1 + max_name_len
             #console.print("max_name_len=", max_name_len, ", name_width=", name_width)
 
-            for f, fn in enumerate(file_names):
+            items = []
+            for fn in file_names:
                 blob_path = self.make_dest_fn(local_path, fn, store_path)
                 actual_fn = file_utils.fix_slashes(fn)
+                items.append((actual_fn, blob_path))
 
+            sizes = [os.path.getsize(actual_fn) for actual_fn, _ in items]
+
+            def show_file(index, actual_fn, blob_path, status):
                 if show_output:
-                    file_msg = "file {}/{}".format(1+f, len(file_names))
-                    console.print("  {2:}: {1:<{0:}} ".format(name_width, actual_fn + ":", file_msg), end="", flush=True)
+                    file_msg = "file {}/{}".format(1+index, len(items))
+                    console.print("  {2:}: {1:<{0:}} {3}".format(name_width, actual_fn + ":", file_msg, status), flush=True)
 
-                feedback_progress.start()
+            def upload_file(actual_fn, blob_path, progress_callback):
                 fs.upload_file(blob_path, actual_fn, progress_callback=progress_callback)
-                feedback_progress.end()
 
-                upload_count += 1
+            def is_current(actual_fn, blob_path):
+                return fs.does_file_exist(blob_path) and transfer_engine.is_blob_copy_current(actual_fn, fs.get_file_properties(blob_path))
+
+            engine = transfer_engine.TransferEngine(workers or self.store.helper.transfer_workers, 
+                feedback_progress=feedback_progress if feedback else None, file_callback=show_file)
+            results = engine.run(items, upload_file, is_current_func=is_current if resume else None, sizes=sizes)
+
+            upload_count += len([r for r in results if r[2] == transfer_engine.COPIED])
         else:
             # upload SINGLE file/blob
             what = "blob" if use_blobs else "file"
@@ -502,6 +531,12 @@ class ImplStorageApi():
                 #console.print("store_path=", store_path, ", local_path=", local_path)
                 console.print("  {}:    ".format(local_path), end="", flush=True)
 
+            if resume and fs.does_file_exist(store_path) and \
+                transfer_engine.is_blob_copy_current(local_path, fs.get_file_properties(store_path)):
+                if show_output:
+                    console.print(transfer_engine.SKIPPED)
+                return upload_count
+
             feedback_progress.start()
             fs.upload_file(store_path, local_path, progress_callback=progress_callback)
             feedback_progress.end()
@@ -5,10 +5,13 @@
 # mirror_worker.py: handles mirroring of files from run box to grok server
 import os
 import sys
+import math
 import time
 import json
 import logging
 from fnmatch import fnmatch
+from threading import Thread, Condition
+from concurrent.futures import ThreadPoolExecutor
 import http.client
 import requests
 import logging
@@ -22,9 +25,18 @@ from .console import console
 
 logger = logging.getLogger(__name__)
 
+MIRROR_QUIET_SECS = 2           # a changed file is uploaded after it has been quiet (no change events) for this long
+MIRROR_MAX_DELAY_SECS = 30      # ... or after it has been waiting this long (for files that are appended to continuously)
+MIRROR_UPLOADS_PER_SEC = 4      # the most uploads started per second (by each worker)
+MIRROR_THREADS = 4              # the uploads that each worker can have in flight
+MAX_BLOB_APPENDS = 40000        # an append blob allows 50,000 blocks; after this many blocks, the blob is rewritten
+APPEND_BLOCK_SIZE = 4*1024*1024 # largest block appended by a single request (larger uploads use several blocks)
+TAIL_SIZE = 4096                # bytes kept from the end of each upload, to check that the next change is an append
+
 
 class MirrorWorker():
-    def __init__(self, store, run_dir, mirror_dest, wildcard_path, grok_url, ws_name, run_name):
+    def __init__(self, store, run_dir, mirror_dest, wildcard_path, grok_url, ws_name, run_name, quiet_secs=MIRROR_QUIET_SECS,
+        max_delay_secs=MIRROR_MAX_DELAY_SECS, uploads_per_sec=MIRROR_UPLOADS_PER_SEC, threads=MIRROR_THREADS):
         # path = '.'
         # wildcard = "*.tfevents.*"
 
@@ -49,7 +61,8 @@ class MirrorWorker():
         # in case program will create dir, but it hasn't yet been created
         file_utils.ensure_dir_exists(path)
 
-        self.event_handler = MyHandler(store, mirror_dest, grok_url, ws_name, run_name, path, wildcard)
+        self.event_handler = MyHandler(store, mirror_dest, grok_url, ws_name, run_name, path, wildcard, quiet_secs=quiet_secs,
+            max_delay_secs=max_delay_secs, uploads_per_sec=uploads_per_sec, threads=threads)
         self.observer = Observer()
         self.observer.schedule(self.event_handler, path, recursive=True)
 
@@ -60,16 +73,26 @@ class MirrorWorker():
 
     def start(self):
         # start observer on his OWN THREAD
+        self.event_handler.start()
         self.observer.start()
 
     def stop(self):
         if self.observer:
             self.observer.stop()
+            self.observer.join()
             self.observer = None
 
-class MyHandler(FileSystemEventHandler):
+            # upload the changes still waiting for their quiet time
+            self.event_handler.stop()
 
-    def __init__(self, store, mirror_dest, grok_url, ws_name, run_name, path, wildcard):
+class MyHandler(FileSystemEventHandler):
+    '''
+    Change events only mark a file as pending.  A scheduler thread uploads each pending file once it has been quiet for
+    'quiet_secs' (or has waited 'max_delay_secs'), starting at most 'uploads_per_sec' uploads per second, on a pool
+    of 'threads' upload threads.  A file that has only grown since its last upload is sent as an append of its new bytes.
+    '''
+    def __init__(self, store, mirror_dest, grok_url, ws_name, run_name, path, wildcard, quiet_secs=MIRROR_QUIET_SECS,
+        max_delay_secs=MIRROR_MAX_DELAY_SECS, uploads_per_sec=MIRROR_UPLOADS_PER_SEC, threads=MIRROR_THREADS):
         super(MyHandler, self).__init__()
 
         self.store = store
@@ -79,48 +102,214 @@ class MyHandler(FileSystemEventHandler):
         self.run_name = run_name
         self.path = os.path.realpath(path)
         self.wildcard = wildcard
-        self.last_modified = {}    # used to ignore duplicate msgs
         self.started = time.time()
         self.file_send_count = 0
         self.file_check_count = 0
+        self.append_count = 0
+        self.bytes_sent = 0
+        self.upload_lag = 0
+
+        self.quiet_secs = quiet_secs
+        self.max_delay_secs = max(quiet_secs, max_delay_secs)
+        self.upload_interval = 1/uploads_per_sec if uploads_per_sec else 0
+        self.next_upload_time = 0
+
+        self.pending = {}          # fn -> [time of first change event, time of last change event]
+        self.uploading = {}        # fn -> time of first change event (for the upload in flight)
+        self.sent = {}             # fn -> the state of the file when it was last uploaded
+        self.pending_changed = Condition()
+        self.stopping = False
+
+        self.executor = ThreadPoolExecutor(max_workers=max(1, threads))
+        self.scheduler = None
 
         # don't console.print detail, fow now
         self.show_calls = False
 
+    def start(self):
+        self.scheduler = Thread(target=self.bg_scheduler, daemon=True)
+        self.scheduler.start()
+
+    def stop(self):
+        with self.pending_changed:
+            self.stopping = True
+            self.pending_changed.notify_all()
+
+        if self.scheduler:
+            self.scheduler.join()
+            self.scheduler = None
+
+        self.executor.shutdown(wait=True)
+
     def get_status(self):
-        elapsed = time.time() - self.started
-        status = {"ws_name": self.ws_name, "run_name": self.run_name, "elapsed": elapsed, "check_count": self.file_check_count, 
-            "send_count": self.file_send_count}
+        now = time.time()
+        elapsed = now - self.started
+
+        with self.pending_changed:
+            first_times = [first for first, last in self.pending.values()] + list(self.uploading.values())
+            queued = list(set(self.pending) | set(self.uploading))
+            counts = {"check_count": self.file_check_count, "send_count": self.file_send_count,
+                "append_count": self.append_count, "bytes_sent": self.bytes_sent}
+
+        # upload lag: how long the oldest change not yet uploaded has been waiting (or the lag of the last upload)
+        upload_lag = now - min(first_times) if first_times else self.upload_lag
+
+        status = {"ws_name": self.ws_name, "run_name": self.run_name, "elapsed": elapsed, "queued_files": len(queued),
+            "queued_bytes": sum([self.get_unsent_size(fn) for fn in queued]), "upload_lag": upload_lag}
+        status.update(counts)
         return status
 
+    def get_unsent_size(self, fn):
+        try:
+            size = os.path.getsize(fn)
+        except OSError:
+            return 0
+
+        sent = self.sent.get(fn)
+        if sent and size >= sent.size:
+            size -= sent.size
+        return size
+
+    def bg_scheduler(self):
+        while True:
+            with self.pending_changed:
+                fn, wait = self.get_next_due()
+
+                while not fn:
+                    if self.stopping and not self.pending:
+                        return
+
+                    self.pending_changed.wait(wait)
+                    fn, wait = self.get_next_due()
+
+                first, last = self.pending.pop(fn)
+                self.uploading[fn] = first
+                self.next_upload_time = max(self.next_upload_time, time.time()) + self.upload_interval
+
+            self.executor.submit(self.upload_file, fn, first)
+
+    def get_next_due(self):
+        '''
+        return the pending file that is due for upload (or None) and the secs to wait before checking again (or None
+        to wait for the next change).  must be called with 'pending_changed' held.
+        '''
+        now = time.time()
+        if not self.stopping and now < self.next_upload_time:
+            return None, self.next_upload_time - now
+
+        due_fn = None
+        wait = None
+
+        for fn, (first, last) in self.pending.items():
+            if fn in self.uploading:
+                # don't let uploads of the same file overlap (appends must be in order)
+                continue
+
+            due_time = now if self.stopping else min(last + self.quiet_secs, first + self.max_delay_secs)
+
+            if due_time <= now:
+                if not due_fn or first < self.pending[due_fn][0]:
+                    due_fn = fn
+            elif wait is None or due_time - now < wait:
+                wait = due_time - now
+
+        return due_fn, wait
+
+    def upload_file(self, fn, first):
+        try:
+            if self.mirror_dest == "grok":
+                # write file to grok server
+                self.send_file_to_grok(fn)
+            else:
+                self.send_file_to_storage(fn)
+        finally:
+            with self.pending_changed:
+                del self.uploading[fn]
+                self.upload_lag = time.time() - first
+                self.pending_changed.notify_all()
+
+    def read_changes(self, fn):
+        '''
+        return (data, recreate) for the next upload of 'fn': the new bytes if the file has only grown since its last upload,
+        or all of its bytes (with recreate=True) if it was rewritten.  returns (None, None) if the file is unchanged.
+        '''
+        sent = self.sent.get(fn)
+
+        if not os.path.exists(fn):
+            # deleted since its change event
+            return None, None
+
+        with open(fn, "rb") as infile:
+            stat = os.fstat(infile.fileno())
+
+            if sent and stat.st_size == sent.size and stat.st_mtime_ns == sent.mtime_ns:
+                return None, None
+
+            if sent and sent.appends < MAX_BLOB_APPENDS and stat.st_size > sent.size:
+                # it is an append if the bytes we last sent are still at the end of what we sent
+                infile.seek(sent.size - len(sent.tail))
+                if infile.read(len(sent.tail)) == sent.tail:
+                    data = infile.read(stat.st_size - sent.size)
+                    return data, False
+
+            data = infile.read(stat.st_size)
+            return data, True
+
+    def mark_sent(self, fn, data, recreate):
+        sent = self.sent.get(fn)
+
+        if recreate or not sent:
+            sent = utils.PropertyBag()
+            sent.size = 0
+            sent.tail = b""
+            sent.appends = 0
+            self.sent[fn] = sent
+
+        sent.size += len(data)
+        sent.tail = (sent.tail + data)[-TAIL_SIZE:]
+        sent.appends += max(1, math.ceil(len(data)/APPEND_BLOCK_SIZE))
+
+        try:
+            sent.mtime_ns = os.stat(fn).st_mtime_ns if sent.size == os.path.getsize(fn) else None
+        except OSError:
+            sent.mtime_ns = None
+
+        with self.pending_changed:
+            self.file_send_count += 1
+            self.bytes_sent += len(data)
+            if not recreate:
+                self.append_count += 1
+
     def send_file_to_grok(self, fn):
         if self.show_calls:
             console.print("mirror: send_file_to_grok: fn=", fn)
 
-        fin = open(fn, 'rb')
-        files = {'file': fin}
-        append = False
-
         # build relative path
         plen = 1 + len(self.path)
         rel_path = os.path.dirname(fn)[plen:]
         rel_path = rel_path.replace("\\", "/")
 
-        payload = {"ws_name": self.ws_name, "run_name": self.run_name, "append": append, "rel_path": rel_path}
-        console.print("mirror: payload=", payload)
-
         try:
+            data, recreate = self.read_changes(fn)
+            if data is None:
+                return
+
+            files = {'file': (os.path.basename(fn), data)}
+            append = not recreate
+
+            payload = {"ws_name": self.ws_name, "run_name": self.run_name, "append": append, "rel_path": rel_path}
+            console.print("mirror: payload=", payload)
+
             result = requests.post(url="http://" + self.grok_url + "/write_file", files=files, params=payload)
             if self.show_calls:
                 console.print("mirror: POST result=", result)
-            self.file_send_count += 1
+
+            self.mark_sent(fn, data, recreate)
         except BaseException as ex:
             logger.exception("Error in send_file_to_grok, ex={}".format(ex))
             console.print("send_file_to_grok EXCEPTION: " + str(ex))
 
     def send_file_to_storage(self, fn):
-        append = False
-
         # build relative path
         plen = 1 + len(self.path)
         rel_path = fn[plen:]
@@ -128,16 +317,21 @@ class MyHandler(FileSystemEventHandler):
 
         blob_path = "mirrored/" + rel_path
 
-        if self.show_calls:
-            console.print("mirror: send_file_to_storage: fn={}, ws={}, run={}, blob_path={}".format(fn, 
-                self.ws_name, self.run_name, blob_path))
-
         try:
-            self.store.upload_file_to_run(self.ws_name, self.run_name, blob_path, fn)
-            self.file_send_count += 1
+            data, recreate = self.read_changes(fn)
+            if data is None:
+                return
+
+            if self.show_calls:
+                console.print("mirror: send_file_to_storage: fn={}, ws={}, run={}, blob_path={}, bytes={}, recreate={}".format(fn,
+                    self.ws_name, self.run_name, blob_path, len(data), recreate))
+
+            # mirrored files are append blobs, so a file that grows is uploaded as just its new bytes
+            self.store.append_bytes_to_run_file(self.ws_name, self.run_name, blob_path, data, recreate=recreate)
+            self.mark_sent(fn, data, recreate)
         except BaseException as ex:
             logger.exception("Error in send_file_to_storage, ex={}".format(ex))
-            console.print("send_file_to_grok EXCEPTION: " + str(ex))
+            console.print("send_file_to_storage EXCEPTION: " + str(ex))
 
     def on_any_event(self, event):
         fn = event.src_path
@@ -146,25 +340,22 @@ class MyHandler(FileSystemEventHandler):
 
         if not is_dir and et in ["modified", "created"]:
             basename = os.path.basename(fn)
-            
+
             if not self.wildcard or fnmatch(basename, self.wildcard):
 
-                self.file_check_count += 1
+                # NOTE: a single change can produce several events; they are all folded into one pending upload
+                now = time.time()
 
-                # NOTE: watch out for multiple notifications for single change
-                (mode, ino, dev, nlink, uid, gid, size, atime, mtime, ctime) = os.stat(fn)
+                with self.pending_changed:
+                    self.file_check_count += 1
 
-                if (not fn in self.last_modified) or mtime != self.last_modified[fn]:
-                    #console.print("last modified: %s" % time.ctime(mtime))
-                    self.last_modified[fn] = mtime
+                    if fn in self.pending:
+                        self.pending[fn][1] = now
+                    else:
+                        self.pending[fn] = [now, now]
 
-                    # to make it simpler, can we check last modified time of file?
-                    elapsed = time.time() - self.started
-                    if self.show_calls:
-                        console.print("fn={}, et={}, is_dir={}, elapsed={:.2f}".format(fn, et, is_dir, elapsed))
+                    self.pending_changed.notify_all()
 
-                    if self.mirror_dest == "grok":
-                        # write file to grok server
-                        self.send_file_to_grok(fn)
-                    else:
-                        self.send_file_to_storage(fn)
+                if self.show_calls:
+                    elapsed = now - self.started
+                    console.print("fn={}, et={}, is_dir={}, elapsed={:.2f}".format(fn, et, is_dir, elapsed))
@@ -21,11 +21,15 @@ MEAN = "_MEAN_"
 MIN = "_MIN_"
 MAX = "_MAX_"
 
+# identity columns added to each metric set (stored as pandas categoricals)
+ID_COLS = ["run", "node", "job", "experiment", "workspace"]
+
 class PlotBuilder():
     def __init__(self, run_names, col_names, x_col, layout, break_on, title, show_legend, plot_titles,
             legend_titles, smoothing_factor, plot_type, timeout,
             aggregate, shadow_type, shadow_alpha, run_log_records, style, show_toolbar, max_runs, max_traces,
-            group_by, error_bars, show_plot, save_to, x_label, colors, color_map, color_steps, legend_args, plot_args):
+            group_by, error_bars, show_plot, save_to, x_label, colors, color_map, color_steps, legend_args, plot_args,
+            timing=False):
         
         self.run_names = run_names
         self.col_names = col_names
@@ -54,6 +58,8 @@ class PlotBuilder():
         self.x_label = x_label
         self.legend_args = legend_args
         self.plot_args = plot_args
+        self.timing = timing
+        self.timings = []
 
         if colors:
             self.colors = colors
@@ -78,30 +84,53 @@ class PlotBuilder():
 
         return colors
 
+    def add_timing(self, name, started):
+        ''' record the elapsed time of a plot phase (for the --timing report) '''
+        self.timings.append((name, time.time() - started))
+
+    def print_timing(self):
+        if self.timing and self.timings:
+            total = sum([elapsed for _, elapsed in self.timings])
+
+            console.print("\nplot timing:")
+            for name, elapsed in self.timings:
+                console.print("  {:<20s} {:8.3f} secs".format(name + ":", elapsed))
+            console.print("  {:<20s} {:8.3f} secs".format("total:", total))
+
     def build(self):
 
+        started = time.time()
         data_frames_by_cols = self.build_data_frames()
+        self.add_timing("build frames", started)
+
         if data_frames_by_cols:
 
+            started = time.time()
             for cols, dfx in data_frames_by_cols.items():
                 dfx = self.pre_preprocess_data_frame(dfx)
                 data_frames_by_cols[cols] = dfx
+            self.add_timing("smooth/aggregate", started)
 
             # this check is to enable faster testing
             if self.show_plot or self.save_to:
+                # plot_data reports the timing before showing the plot window
                 self.plot_data(data_frames_by_cols)
+                return
+
+        self.print_timing()
 
     def build_data_frames(self):
         '''
         1. for each run, collect the reported metrics as metric sets (by reported col list)
 
-        2. append to the dataframe for that col list
+        2. collect the frames for each col list and concatenate them once (appending
+           frame by frame is quadratic in the number of runs)
         '''
         # build "data_frames"
         no_metrics = []
         pp_run_names = []
         used_max = False
-        data_frames_by_cols = {}
+        frames_by_cols = {}
         got_columns = False
 
         for i, record in enumerate(self.run_log_records):
@@ -116,9 +145,12 @@ class PlotBuilder():
                 # parent run with children - skip it
                 continue
 
-            log_records = record["log_records"]
-
-            metric_sets = run_helper.build_metrics_sets(log_records)
+            if "metric_sets" in record:
+                # columnar metric sets (from the metric cache)
+                metric_sets = record["metric_sets"]
+            else:
+                log_records = record["log_records"]
+                metric_sets = run_helper.build_metrics_sets(log_records)
             if not metric_sets:
                 no_metrics.append(run)
                 continue
@@ -143,7 +175,10 @@ class PlotBuilder():
             for metric_set in metric_sets:
 
                 # create a pandas DataFrame
-                df = pd.DataFrame(metric_set["records"])
+                if "columns" in metric_set:
+                    df = pd.DataFrame(metric_set["columns"], columns=metric_set["keys"])
+                else:
+                    df = pd.DataFrame(metric_set["records"])
                 cols = str(list(df.columns))
                 
                 # ensure this df has our x_col 
@@ -160,22 +195,29 @@ class PlotBuilder():
                 if not found_y:
                     continue
 
-                # add run_name column
-                df["run"] = [run] * df.shape[0]
-                df["node"] = [node] * df.shape[0]
-                df["job"] = [job] * df.shape[0]
-                df["experiment"] = [experiment] * df.shape[0]
-                df["workspace"] = [workspace] * df.shape[0]
+                # add run identity columns (as scalars; converted to categoricals after concat)
+                df["run"] = run
+                df["node"] = node
+                df["job"] = job
+                df["experiment"] = experiment
+                df["workspace"] = workspace
 
-                if not cols in data_frames_by_cols:
-                    data_frames_by_cols[cols] = df
-                else:
-                    dfx = data_frames_by_cols[cols]
-                    dfx = dfx.append(df)
-                    data_frames_by_cols[cols] = dfx
+                if not cols in frames_by_cols:
+                    frames_by_cols[cols] = []
+                frames_by_cols[cols].append(df)
 
             pp_run_names.append(run)
 
+        data_frames_by_cols = {}
+
+        for cols, frames in frames_by_cols.items():
+            dfx = pd.concat(frames, ignore_index=True, sort=False)
+
+            for id_col in ID_COLS:
+                dfx[id_col] = dfx[id_col].astype("category")
+
+            data_frames_by_cols[cols] = dfx
+
         if no_metrics:
             console.print("\nnote: following runs were skipped (currently have no logged metrics): \n    {}\n".format(", ".join(no_metrics)))
 
@@ -189,18 +231,19 @@ class PlotBuilder():
 
         return data_frames_by_cols
 
-    def get_agg_df(self, df, agg_op, df_cols):
-        agg_dict = {}
+    def get_stat_names(self):
+        ''' return the aggregate functions needed for --error-bars and --shadow-type (as "col_STAT_" columns) '''
+        stats = []
 
-        for col in self.col_names:
-            if col in df_cols:
-                agg_dict[col] = agg_op
+        if self.error_bars:
+            stats.append(self.error_bars)
 
-        df_out = df.agg(agg_dict)  
-        #df3 = df2.fillna(method='ffill')
-        df_out = df_out.reset_index()
+        if self.shadow_type == "min-max":
+            stats += ["min", "max"]
+        elif self.shadow_type and self.shadow_type != "pre-smooth":
+            stats += ["mean", self.shadow_type]
 
-        return df_out
+        return stats
 
     def pre_preprocess_data_frame(self, dfx):
         '''
@@ -210,85 +253,54 @@ class PlotBuilder():
             - optionally create aggregate VALUE Y-axis cols
             - optionally create aggregate SHADOW Y-axi cols
         '''
-        if self.smoothing_factor:
-            # SMOOTH each column of values
-
-            for col in self.col_names:
-                if col in dfx.columns:
-                    self.apply_smooth_factor(dfx, col, self.smoothing_factor)
+        y_cols = [col for col in self.col_names if col in dfx.columns]
 
-        # get a copy of columns before group-by
-        dfx_pre = dfx
-        df_cols = list(dfx.columns)
+        if self.smoothing_factor:
+            # SMOOTH each column of values (separately for each run)
+            for col in y_cols:
+                self.apply_smooth_factor(dfx, col, self.smoothing_factor)
 
         if self.aggregate:
             # specifying an aggregate hides the the other runs' values (for now)
 
-            if self.group_by:
-                # GROUP data 
-                group_col = self.group_by
-                group_prefix = "node" if self.group_by == "node_index" else ""
-                x_col = self.x_col
-
-                dfx = dfx.groupby([group_col, x_col])
-            
-            # AGGREGATE data
-            df_agg_from = dfx
-            dfx = self.get_agg_df(df_agg_from, self.aggregate, df_cols)
-
-            # ERROR BARS data
-            if self.error_bars:
-                dfx = self.build_agg_stat(df_agg_from, self.error_bars, df_cols, dfx)
-
-            # SHADOW TYPE BARS data
-            if self.shadow_type == "min-max":
-                dfx = self.build_agg_stat(df_agg_from, "min", df_cols, dfx)
-                dfx = self.build_agg_stat(df_agg_from, "max", df_cols, dfx)
-            elif self.shadow_type and self.shadow_type != "pre-smooth":
-                dfx = self.build_agg_stat(df_agg_from, "mean", df_cols, dfx)
-                dfx = self.build_agg_stat(df_agg_from, self.shadow_type, df_cols, dfx)
-
-            # if self.shadow_type:
-            #     self.run_names.append(self.shadow_type)
-
-            #     min_values, max_values = self.range_runs(runs_dict, self.shadow_type)
-            #     runs_dict[self.shadow_type] = (min_values, max_values)
+            # GROUP data and compute the AGGREGATE, ERROR BARS and SHADOW stats in a single pass
+            stat_names = self.get_stat_names()
+            agg_ops = list(dict.fromkeys([self.aggregate] + stat_names))
 
-        return dfx
+            grouped = dfx.groupby([self.group_by, self.x_col], observed=True, sort=True)
+            df_stats = grouped[y_cols].agg(agg_ops)
 
-    def build_agg_stat(self, df_agg_from, stat, df_cols, dfx):
-        df_stat = self.get_agg_df(df_agg_from, stat, df_cols)
-        stat_name = "_{}_".format(stat.upper())
+            dd = {}
+            for col in y_cols:
+                dd[col] = df_stats[(col, self.aggregate)]
 
-        for col in self.col_names:
-            if col in df_stat.columns:
-                # extract stat data for col
-                stat_data = df_stat[col]
+                for stat in stat_names:
+                    dd[col + "_{}_".format(stat.upper())] = df_stats[(col, stat)]
 
-                # add col data as new name to dfx
-                dfx[col + stat_name] = stat_data
+            dfx = pd.DataFrame(dd, index=df_stats.index).reset_index()
 
         return dfx
 
     def apply_smooth_factor(self, data_frame, col, weight):
+        presmooth_values = data_frame[col]
 
-        presmooth_values = list(data_frame[col])
-        smooth_values = self.apply_smooth_factor_core(presmooth_values, weight)
-
-        data_frame[col] = smooth_values
+        data_frame[col] = self.apply_smooth_factor_core(data_frame, col, weight)
         data_frame[col + PRESMOOTH] = presmooth_values
 
-    def apply_smooth_factor_core(self, values, weight):
-        smooth_values = []
+    def apply_smooth_factor_core(self, data_frame, col, weight):
+        '''
+        exponential moving average of 'col', computed separately for each run:
+            smooth[0] = value[0]
+            smooth[i] = weight*smooth[i-1] + (1-weight)*value[i]
+        '''
+        grouped = data_frame.groupby("run", observed=True, sort=False)[col]
 
-        if values:
-            prev = values[0] 
-            for value in values:
-                smooth = weight*prev + (1-weight)*value
-                smooth_values.append(smooth)                       
-                prev = smooth                                 
+        if weight >= 1:
+            # all values are smoothed to the first value
+            return grouped.transform("first")
 
-        return smooth_values
+        alpha = 1 - weight
+        return grouped.transform(lambda values: values.ewm(alpha=alpha, adjust=False).mean())
 
     def calc_actual_layout(self, count, layout):
         if not "x" in layout:
@@ -341,6 +353,7 @@ class PlotBuilder():
 
     def plot_data(self, data_frames_by_cols):
         console.diag("starting to plot data")
+        started = time.time()
 
         # on-demand import for faster XT loading
         import seaborn as sns
@@ -505,6 +518,9 @@ class PlotBuilder():
         if self.save_to:
             plt.savefig(self.save_to)
 
+        self.add_timing("draw plots", started)
+        self.print_timing()
+
         if self.show_plot:
             pylab.show()
 
@@ -654,8 +670,11 @@ class PlotBuilder():
                 continue
 
             if constants.STEP_NAME in keys:
-                records = ms["records"]
-                x_col = records[0][constants.STEP_NAME]
+                if "columns" in ms:
+                    x_col = str(ms["columns"][constants.STEP_NAME][0])
+                else:
+                    records = ms["records"]
+                    x_col = records[0][constants.STEP_NAME]
             elif default_x_col:
                 x_col = default_x_col
             else:
@@ -16,8 +16,6 @@ from xtlib import file_utils
 from xtlib import process_utils
 from xtlib.helpers.xt_config import get_merged_config
 
-CONTROLLER_NAME_PATTERN = "xtlib.controller"
-PY_RUN_CONTROLLER = "__run_controller__.py"
 PSM_NAME_PATTERN = "psm.py"
 
 class LocalPsmClient():
@@ -58,12 +56,15 @@ class LocalPsmClient():
         # list contents of queue
         entries = os.listdir(self.psm_queue_path)
         
-        # get current entry being processed by controller
-        current = self.get_running_entry_name()
-        if not self._get_controller_process():
-            current = None
+        # get the entries running in the PSM's slots
+        running = list(self.get_running_entries())
         
-        return entries, current
+        return entries, running
+
+    def set_slot_count(self, slots):
+        # the PSM reads this before starting queued entries
+        fn_slots = os.path.expanduser(constants.PSM_SLOTS_FN)
+        file_utils.write_text_file(fn_slots, str(slots))
 
     def _is_psm_running(self):
         processes = psutil.process_iter()
@@ -83,25 +84,6 @@ class LocalPsmClient():
             
         return psm_count > 0
 
-    def _get_controller_process(self):
-        processes = psutil.process_iter()
-        controller_process = None
-
-        for p in processes:
-            try:
-                if p.name().lower().startswith("python"):
-                    #print("process name: {}".format(p.name()))
-                    cmd_line = " ".join(p.cmdline())
-
-                    if CONTROLLER_NAME_PATTERN in cmd_line or PY_RUN_CONTROLLER in cmd_line:
-                        controller_process = p
-                        break
-
-            except BaseException as ex:
-                pass
-            
-        return controller_process
-
     def _get_psm_process(self):
         processes = psutil.process_iter()
         psm_process = None
@@ -168,16 +150,52 @@ class LocalPsmClient():
             fn_psm_log = os.path.expanduser("~/.xt/cwd/runpsm.log")
             process_utils.start_async_run_detached(cmd_parts, self.cwd_path, fn_psm_log)
 
-    def get_running_entry_name(self):
-        text = None
+    def get_running_entries(self):
+        '''
+        return a dict of {fn_entry: pid} for the entries running in the PSM's slots (the PSM writes the entry name 
+        and process id to each slot's dir when it starts an entry, and removes them when the entry exits).
+        '''
+        running = {}
+
+        controller_cwd = utils.get_controller_cwd(self.box_is_windows, is_local=True)
+        slots_dir = os.path.join(controller_cwd, constants.PSM_SLOTS_DIR)
+
+        if os.path.exists(slots_dir):
+            for slot in os.listdir(slots_dir):
+                fn_current = os.path.join(slots_dir, slot, constants.CURRENT_RUNNING_ENTRY)
+                fn_pid = os.path.join(slots_dir, slot, constants.CURRENT_ENTRY_PID)
+
+                if os.path.exists(fn_current) and os.path.exists(fn_pid):
+                    fn_entry = file_utils.read_text_file(fn_current).strip()
+                    pid = int(file_utils.read_text_file(fn_pid).strip())
+
+                    # in case the PSM was stopped while the entry was running
+                    if psutil.pid_exists(pid):
+                        running[fn_entry] = pid
+
+        return running
+
+    def get_entry_port(self, fn_entry):
+        '''
+        return the port of the controller started by the running entry 'fn_entry' (each PSM slot has its own port), or
+        None if the entry isn't running in a slot.
+        '''
+        port = None
 
         controller_cwd = utils.get_controller_cwd(self.box_is_windows, is_local=True)
+        slots_dir = os.path.join(controller_cwd, constants.PSM_SLOTS_DIR)
 
-        fn_current = os.path.join(controller_cwd, constants.CURRENT_RUNNING_ENTRY)
-        if os.path.exists(fn_current):
-            text = file_utils.read_text_file(fn_current).strip()
+        if os.path.exists(slots_dir):
+            for slot in os.listdir(slots_dir):
+                fn_current = os.path.join(slots_dir, slot, constants.CURRENT_RUNNING_ENTRY)
+                fn_port = os.path.join(slots_dir, slot, constants.CURRENT_ENTRY_PORT)
 
-        return text
+                if os.path.exists(fn_current) and os.path.exists(fn_port):
+                    if file_utils.read_text_file(fn_current).strip() == fn_entry:
+                        port = int(file_utils.read_text_file(fn_port).strip())
+                        break
+
+        return port
 
     def get_status(self, fn_entry):
         status = "completed"      # unless below finds different
@@ -185,12 +203,8 @@ class LocalPsmClient():
         fn_queue_entry = os.path.join(self.psm_queue_path, fn_entry)
         if os.path.exists(fn_queue_entry):
             status = "queued"
-        else:
-            text = self.get_running_entry_name()
-            if text == fn_entry:
-                # entry might be running; is the controller active?
-                if self._get_controller_process():
-                    status = "running"
+        elif fn_entry in self.get_running_entries():
+            status = "running"
 
         return status
 
@@ -205,13 +219,22 @@ class LocalPsmClient():
             os.remove(fn_queue_entry)
             cancelled = True
         else:
-            text = self.get_running_entry_name()
-            if text == fn_entry:
-                # entry might be running; is the controller active?
-                p = self._get_controller_process()
-                if p:
-                    p.kill()
-                    cancelled = True
+            pid = self.get_running_entries().get(fn_entry)
+            if pid:
+                # kill the entry's wrapper script, its controller, and the controller's runs
+                try:
+                    p = psutil.Process(pid)
+                    processes = p.children(recursive=True) + [p]
+                except psutil.NoSuchProcess:
+                    processes = []
+
+                for p in processes:
+                    try:
+                        p.kill()
+                    except (psutil.NoSuchProcess, psutil.AccessDenied):
+                        pass
+
+                cancelled = True
 
         return cancelled, status
 
@@ -7,16 +7,20 @@
     - this file should not reference xtlib or other non-standard libraries.
     - this is to keep deployment simple: copy & run on dest machine
 
-    - NOTE: we currently use psutil library (non-standard) that may need 
-      to be installed on some systems.  is there an alternative to this?  
+    - NOTE: we currently use psutil library (non-standard) on windows boxes, 
+      that may need to be installed on some systems.  is there an alternative to this?  
 
     - XT docs should include psutil as a prerequisite for each pool box
+
+    - NOTE: when the watchdog library is installed, we use it to watch the queue 
+      directory; otherwise, we poll the queue directory.
 '''
 import os
 import time
 import shutil
 import zipfile
 import datetime
+import threading
 import subprocess
 
 is_windows = (os.name == "nt")
@@ -24,6 +28,7 @@ is_windows = (os.name == "nt")
 
 PSM_QUEUE = os.path.expanduser("~/.xt/psm_queue")
 PSM_LOGDIR = os.path.expanduser("~/.xt/psm_logs")
+PSM_SLOTS_FILE = os.path.expanduser("~/.xt/psm_slots.txt")
 
 if is_windows:
     sys_drive = os.getenv("SystemDrive")
@@ -33,9 +38,22 @@ else:
 
 PSM = "psm.py"
 CURRENT_RUNNING_ENTRY = "_current_running_entry_.txt"
-FN_WRAPPER = os.path.join(CWD, "wrapped.bat" if is_windows else "wrapped.sh")
-CONTROLLER_NAME_PATTERN = "xtlib.controller"
-PY_RUN_CONTROLLER ="__run_controller__.py"
+CURRENT_ENTRY_PID = "_current_entry_pid_.txt"
+CURRENT_ENTRY_PORT = "_current_entry_port_.txt"
+SLOTS_DIR = os.path.join(CWD, "slots")
+TOMBSTONES_DIR = os.path.join(CWD, "slot-tombstones")
+WRAPPER = "wrapped.bat" if is_windows else "wrapped.sh"
+CONTROLLER_PORT = 18861
+
+POLL_SECS = 1              # queue polling interval (when watchdog isn't installed, or for entries of an earlier PSM)
+WATCH_CHECK_SECS = 60      # when watching the queue, we still list it this often (in case an event was missed)
+
+# set when the queue changes or an entry's process exits
+wake_event = threading.Event()
+
+# the old slot dirs (and their rundirs) are deleted on a background thread, so they don't hold up starting entries
+tombstones_changed = threading.Condition()
+tombstone_deleter = None
 
 def log_print(*objects, sep=' '):
     # print to console (which is redirected to psm.log)
@@ -49,41 +67,35 @@ def log_print(*objects, sep=' '):
 
     print(text, flush=True)
 
-def get_controller_wrapped_counts():
-    import psutil
-
-    processes = psutil.process_iter()
-    controller_count = 0
-    wrapped_count = 0
-
+def pid_exists(pid):
     if is_windows:
-        WRAPPED_PARTIAL = "xt\\cwd\\wrapped.bat"
-    else:
-        WRAPPED_PARTIAL = "xt/cwd/wrapped.sh"
+        import psutil
+        return psutil.pid_exists(pid)
 
-    #log_print("  WRAPPED_PARTIAL: " + WRAPPED_PARTIAL)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def get_slot_count():
+    '''
+    the number of entries that can run at once on this box (written by the XT client from the box's "psm-slots" property).
+    '''
+    count = 1
 
-    for p in processes:
+    if os.path.exists(PSM_SLOTS_FILE):
         try:
-            process_name = p.name().lower()
-            #log_print("process_name=", process_name)
-
-            if process_name.startswith("python") or "bash" in process_name:
-                #log_print("process name: {}".format(p.name()))
-                cmd_line = " ".join(p.cmdline())
-                #log_print("  cmd_line: " + cmd_line)
-
-                if CONTROLLER_NAME_PATTERN in cmd_line or PY_RUN_CONTROLLER in cmd_line:
-                    controller_count += 1
-                elif WRAPPED_PARTIAL in cmd_line:
-                    wrapped_count += 1
-
+            with open(PSM_SLOTS_FILE, "rt") as infile:
+                count = max(1, int(infile.read().strip()))
         except BaseException as ex:
-            pass
-        
-    return controller_count, wrapped_count
+            log_print("error reading {}: ex={}".format(PSM_SLOTS_FILE, ex))
+
+    return count
 
-def start_async_run_detached(cmd, working_dir, fn_stdout):
+def start_async_run_detached(cmd, working_dir, fn_stdout, env=None):
     DETACHED_PROCESS = 0x00000008    # if visible else 0
     CREATE_NO_WINDOW = 0x08000000
     
@@ -91,81 +103,265 @@ def start_async_run_detached(cmd, working_dir, fn_stdout):
 
         if is_windows:
             cflags = CREATE_NO_WINDOW  # | DETACHED_PROCESS
-            p = subprocess.Popen(cmd, cwd=working_dir, stdout=output, stderr=subprocess.STDOUT, creationflags=cflags)
+            p = subprocess.Popen(cmd, cwd=working_dir, stdout=output, stderr=subprocess.STDOUT, creationflags=cflags, env=env)
 
         else:
             # linux
-            p = subprocess.Popen(cmd, cwd=working_dir, stdout=output, stderr=subprocess.STDOUT)
+            p = subprocess.Popen(cmd, cwd=working_dir, stdout=output, stderr=subprocess.STDOUT, env=env)
     return p
 
-def start_entry(fn_entry):
+def add_tombstone(path):
+    ''' rename 'path' into the tombstones dir (quick) and have it deleted in the background '''
+    if not os.path.exists(TOMBSTONES_DIR):
+        os.makedirs(TOMBSTONES_DIR)
+
+    tombstone = os.path.join(TOMBSTONES_DIR, "{}.{}".format(os.path.basename(path), time.time()))
+    os.rename(path, tombstone)
+
+    start_tombstone_deleter()
+
+def start_tombstone_deleter():
+    global tombstone_deleter
+
+    with tombstones_changed:
+        if not tombstone_deleter:
+            tombstone_deleter = threading.Thread(target=bg_tombstone_deleter, daemon=True)
+            tombstone_deleter.start()
+
+        tombstones_changed.notify_all()
+
+def bg_tombstone_deleter():
+    failed = set()
+
+    while True:
+        with tombstones_changed:
+            tombstones = os.listdir(TOMBSTONES_DIR) if os.path.exists(TOMBSTONES_DIR) else []
+            tombstones = [tombstone for tombstone in tombstones if not tombstone in failed]
+
+            if not tombstones:
+                tombstones_changed.wait()
+                continue
+
+        for tombstone in tombstones:
+            path = os.path.join(TOMBSTONES_DIR, tombstone)
+            try:
+                shutil.rmtree(path)
+            except BaseException as ex:
+                # don't retry it (until the PSM is restarted)
+                log_print("error deleting tombstone: {}, ex={}".format(path, ex))
+                failed.add(tombstone)
+
+def wait_for_entry_exit(process):
+    process.wait()
+    wake_event.set()
+
+class Slot():
     '''
-    Args:
-        fn_entry: name of .zip file (w/o dir):  team.job.node.ticks.zip
-    Returns:
-        None
+    one of the entries that can run at once on this box.  each slot has its own working dir, and its entry's process
+    is tracked by the PSM that started it (rather than by scanning the process table).
     '''
+    def __init__(self, index):
+        self.index = index
+        self.dir = os.path.join(SLOTS_DIR, "slot{}".format(index))
+        self.port = CONTROLLER_PORT + index     # the port that the entry's controller listens on
+        self.fn_entry = None
+        self.process = None     # the entry's process (a child of this PSM)
+        self.pid = None         # the process id of an entry started by an earlier PSM (not our child)
+
+        self.adopt_running_entry()
+
+    def adopt_running_entry(self):
+        ''' if an earlier PSM started an entry in this slot that is still running, the slot stays busy until it exits '''
+        fn_current = os.path.join(self.dir, CURRENT_RUNNING_ENTRY)
+        fn_pid = os.path.join(self.dir, CURRENT_ENTRY_PID)
+
+        if os.path.exists(fn_current) and os.path.exists(fn_pid):
+            try:
+                with open(fn_current, "rt") as infile:
+                    fn_entry = infile.read().strip()
+                with open(fn_pid, "rt") as infile:
+                    pid = int(infile.read().strip())
+
+                if pid_exists(pid):
+                    log_print("slot{} is still running ENTRY: {} (pid={})".format(self.index, fn_entry, pid))
+                    self.fn_entry = fn_entry
+                    self.pid = pid
+                    return
+            except BaseException as ex:
+                log_print("error reading running entry of slot{}: ex={}".format(self.index, ex))
+
+        self.clear_running_entry()
+
+    def clear_running_entry(self):
+        for fn in [CURRENT_RUNNING_ENTRY, CURRENT_ENTRY_PID, CURRENT_ENTRY_PORT]:
+            path = os.path.join(self.dir, fn)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def is_busy(self):
+        return bool(self.fn_entry)
+
+    def check_for_exit(self):
+        if self.process:
+            exit_code = self.process.poll()
+            if exit_code is None:
+                return
+        elif self.pid:
+            if pid_exists(self.pid):
+                return
+            exit_code = None
+        else:
+            return
+
+        log_print("slot{} ENTRY completed: {} (exit code={})".format(self.index, self.fn_entry, exit_code))
+
+        self.fn_entry = None
+        self.process = None
+        self.pid = None
+        self.clear_running_entry()
+
+    def start_entry(self, fn_entry):
+        '''
+        Args:
+            fn_entry: name of .zip file (w/o dir):  team.job.node.ticks.zip
+        Returns:
+            None
+        '''
+        log_print("PROCESSING: {} (slot{})".format(fn_entry, self.index))
+        fn_entry_path = os.path.join(PSM_QUEUE, fn_entry)
+
+        if os.path.exists(self.dir):
+            # the slot dir holds the previous entry's rundirs (which can be large); delete it in the background
+            log_print("  moving old slot dir to tombstones: {}".format(self.dir))
+            add_tombstone(self.dir)
+        os.makedirs(self.dir)
+
+        # copy/remove entry from queue
+        log_print("  copying entry to slot dir")
+        fn_current = os.path.join(self.dir, "__current_entry__.zip")
+        shutil.copyfile(fn_entry_path, fn_current)
+
+        log_print("  removing entry from queue")
+        os.remove(fn_entry_path)
+
+        try:
+            # UNZIP code from fn_current to the slot dir
+            exists = os.path.exists(fn_current)
+            log_print("  unzipping entry from={}, to={}, exists={}".format(fn_current, self.dir, exists))
+
+            # NOTE: this used to fail with "File is not a zip file" error (operating on partially copied file)
+            with zipfile.ZipFile(fn_current, 'r') as zip:
+                zip.extractall(self.dir)
 
-    log_print("PROCESSING: {}".format(fn_entry))
-    fn_entry_path = os.path.join(PSM_QUEUE, fn_entry)
+            fn_wrapper = os.path.join(self.dir, WRAPPER)
+            if is_windows:
+                # fix slashes
+                fn_wrapper = fn_wrapper.replace("/", "\\")
 
-    log_print("  zapping CWD")
-    shutil.rmtree(CWD)
-    os.makedirs(CWD)
+            # extract script ARGS: node_id, run_name
+            # parts: team, job, run, node, ticks, "zip"
+            parts = fn_entry.split(".")
+            run_name = parts[2]
+            node_id = parts[3]
 
-    # copy/remove entry from queue
-    log_print("  copying entry to CWD")
-    fn_current = os.path.join(CWD, "__current_entry__.zip")
-    shutil.copyfile(fn_entry_path, fn_current)
+            if fn_wrapper.endswith(".bat"):
+                cmd_parts = [fn_wrapper, node_id, run_name]
+            else:
+                #cmd_parts = ["bash", "--login", script_part]
+                cmd_parts = ["bash", "--login", fn_wrapper, node_id, run_name]
 
-    log_print("  removing entry from queue")
-    os.remove(fn_entry_path)
+            fn_base_entry = os.path.splitext(fn_entry)[0]
+            fn_log = os.path.join(PSM_LOGDIR, fn_base_entry + ".log")
 
+            # the controller of each slot uses the slot dir as its cwd (and a port of its own)
+            env = dict(os.environ)
+            env["XT_CONTROLLER_CWD"] = self.dir
+            env["XT_PSM_SLOT"] = str(self.index)
+            env["XT_CONTROLLER_PORT"] = str(self.port)
+
+            # run PSM on remote box
+            log_print("  starting ENTRY, cmd_parts={}".format(cmd_parts))
+            log_print()
+
+            self.process = start_async_run_detached(cmd_parts, self.dir, fn_log, env=env)
+            self.fn_entry = fn_entry
+
+            # write "current job running" files
+            with open(os.path.join(self.dir, CURRENT_RUNNING_ENTRY), "wt") as outfile:
+                outfile.write(fn_entry)
+
+            with open(os.path.join(self.dir, CURRENT_ENTRY_PID), "wt") as outfile:
+                outfile.write(str(self.process.pid))
+
+            # clients connect to the entry's controller on this port
+            with open(os.path.join(self.dir, CURRENT_ENTRY_PORT), "wt") as outfile:
+                outfile.write(str(self.port))
+
+            waiter = threading.Thread(target=wait_for_entry_exit, args=(self.process,), daemon=True)
+            waiter.start()
+
+        except BaseException as ex:
+            # log and move on to next entry
+            log_print("  EXCEPTION processing entry: ex={}".format(ex))
+
+def start_queue_watcher():
+    ''' wake the PSM when the queue dir changes (returns None if watchdog isn't installed, so we poll instead) '''
     try:
-        # UNZIP code from fn_current to CWD
-        exists = os.path.exists(fn_current)
-        log_print("  unzipping entry from={}, to={}, exists={}".format(fn_current, CWD, exists))
+        from watchdog.observers import Observer
+        from watchdog.events import FileSystemEventHandler
+    except ImportError:
+        log_print("watchdog not installed; polling queue every {} secs".format(POLL_SECS))
+        return None
 
-        # NOTE: this used to fail with "File is not a zip file" error (operating on partially copied file)
-        with zipfile.ZipFile(fn_current, 'r') as zip:
-            zip.extractall(CWD)
+    class QueueHandler(FileSystemEventHandler):
+        def on_any_event(self, event):
+            wake_event.set()
 
-        # write "current job running" file
-        log_print("  writing CURRENT_RUNNING_ENTRY")
-        fn_current = os.path.join(CWD, CURRENT_RUNNING_ENTRY)
-        with open(fn_current, "wt") as outfile:
-            outfile.write(fn_entry)
+    observer = Observer()
+    observer.schedule(QueueHandler(), PSM_QUEUE, recursive=False)
+    observer.start()
 
-        fn_wrapper = FN_WRAPPER
-        if is_windows:
-            # fix slashes
-            fn_wrapper = fn_wrapper.replace("/", "\\")
+    log_print("watching queue: {}".format(PSM_QUEUE))
+    return observer
 
-        # extract script ARGS: node_id, run_name
-        # parts: team, job, run, node, ticks, "zip"
-        parts = fn_entry.split(".")
-        run_name = parts[2]
-        node_id = parts[3]
+def process_queue(slots, last_entry_count):
+    ''' start the oldest queued entries in the free slots; returns the count of queued entries '''
+    for slot in slots:
+        slot.check_for_exit()
 
-        if fn_wrapper.endswith(".bat"):
-            cmd_parts = [fn_wrapper, node_id, run_name]
-        else:
-            script_part = "{} {} {}".format(fn_wrapper, node_id, run_name)
-            #cmd_parts = ["bash", "--login", script_part]
-            cmd_parts = ["bash", "--login", fn_wrapper, node_id, run_name]
+    slot_count = get_slot_count()
+    while len(slots) < slot_count:
+        slots.append(Slot(len(slots)))
+
+    # list queue
+    files = os.listdir(PSM_QUEUE)
 
-        fn_base_entry = os.path.splitext(fn_entry)[0]
-        fn_log = os.path.join(PSM_LOGDIR, fn_base_entry + ".log")
+    # only look at .zip files (fully copied)
+    files = [fn for fn in files if fn.endswith(".zip")]
+    entry_count = len(files)
 
-        # run PSM on remote box
-        log_print("  starting ENTRY, cmd_parts={}".format(cmd_parts))
-        log_print()
+    # anything in queue?
+    if entry_count:
+        busy_count = len([slot for slot in slots if slot.is_busy()])
 
-        start_async_run_detached(cmd_parts, ".", fn_log)
+        if last_entry_count != entry_count:
+            log_print("QUEUE changed (queue count={}, busy slots={}, slots={}):".format(len(files), busy_count, slot_count))
 
-    except BaseException as ex:
-        # log and move on to next entry
-        log_print("  EXCEPTION processing entry: ex={}".format(ex))
+            # print queue
+            for entry in files:
+                log_print("  {}".format(entry))
+            log_print()
+
+        # sort job entries by TICKS part of fn   (team.job.run.node.ticks.zip)
+        files.sort( key=lambda fn: int(fn.split(".")[-2]) )
+
+        # start the oldest entries (smallest tick value) in the free slots
+        free_slots = [slot for slot in slots[:slot_count] if not slot.is_busy()]
+
+        for slot, fn_entry in zip(free_slots, files):
+            slot.start_entry(fn_entry)
+
+    return entry_count
 
 def main():
     log_print("PSM starting")
@@ -179,43 +375,22 @@ def main():
     if not os.path.exists(PSM_LOGDIR):
         os.makedirs(PSM_LOGDIR)
 
+    # delete any slot dirs left by an earlier PSM
+    start_tombstone_deleter()
+
+    slots = [Slot(index) for index in range(get_slot_count())]
+    observer = start_queue_watcher()
     last_entry_count = 0
 
     while True:
-        time.sleep(1)
-
-        # list queue
-        files = os.listdir(PSM_QUEUE)
-
-        # only look at .zip files (fully copied)
-        files = [fn for fn in files if fn.endswith(".zip")]
-        entry_count = len(files)
-
-        # anything in queue?
-        if entry_count:
-
-            controller_count, wrapped_count = get_controller_wrapped_counts()
-            
-            if last_entry_count != entry_count:
-                log_print("QUEUE changed (queue count={}, controller_count={}, wrapped_count={}):" \
-                    .format(len(files), controller_count, wrapped_count))
-
-                last_entry_count = entry_count
-
-                # print queue
-                for entry in files:
-                    log_print("  {}".format(entry))
-                log_print()
-
-            if (controller_count + wrapped_count) == 0:
-                # sort job entries by TICKS part of fn   (team.job.run.node.ticks.zip)
-                files.sort( key=lambda fn: int(fn.split(".")[-2]) )
+        # entries of an earlier PSM aren't our children (we can't wait for them), so we poll for their exit
+        polling = not observer or any([slot.pid for slot in slots])
 
-                # use oldest file (smallest tick value) to XT cwd
-                fn_entry = files[0]
+        # wait for the queue to change or an entry to exit
+        wake_event.wait(POLL_SECS if polling else WATCH_CHECK_SECS)
+        wake_event.clear()
 
-                # start processing oldest entry
-                start_entry(fn_entry)
+        last_entry_count = process_queue(slots, last_entry_count)
 
 
 if __name__ == "__main__":
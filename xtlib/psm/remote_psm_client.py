@@ -107,12 +107,17 @@ class RemotePsmClient():
         #exit_code, output = process_utils.sync_run_ssh(self, self.box_addr, box_cmd)
         entries = self.ftp_client.listdir(self.psm_queue_path)
 
-        # get current entry being processed by controller
-        current = self.get_running_entry_name()
-        if not self._get_controller_process_id():
-            current = None
+        # get the entries running in the PSM's slots
+        running = list(self.get_running_entries())
         
-        return entries, current
+        return entries, running
+
+    def set_slot_count(self, slots):
+        # the PSM reads this before starting queued entries
+        fn_slots = self.expand_remote_path(constants.PSM_SLOTS_FN)
+
+        with self.ftp_client.open(fn_slots, "w") as outfile:
+            outfile.write(str(slots))
 
     def run_cmd(self, cmd):
         stdin, stdout, stderr = self.ssh_client.exec_command(cmd)
@@ -137,42 +142,6 @@ class RemotePsmClient():
             process_id = targets[0].split("  ")[1]
         return process_id
 
-    def _get_controller_process_id(self):
-        # current code only supports linux as remote
-        assert not self.box_is_windows
-
-        # run PS on box to determine if PSM is running
-        box_cmd = "ps aux | grep python"
-        #exit_code, output = process_utils.sync_run_ssh(self, self.box_addr, box_cmd)
-        output = self.run_cmd(box_cmd)
-
-        #console.print("result=\n", output)
-        targets = [text for text in output.split("\n") if "__run_controller__.py" in text]
-        #console.print("targets=", targets)
-        process_id = None
-
-        if targets:
-            process_id = targets[0].split("  ")[1]
-        return process_id
-
-    def _get_runner_script_process_id(self):
-        # current code only supports linux as remote
-        assert not self.box_is_windows
-
-        # run PS on box to determine if PSM is running
-        box_cmd = "ps aux | grep bash"
-        #exit_code, output = process_utils.sync_run_ssh(self, self.box_addr, box_cmd)
-        output = self.run_cmd(box_cmd)
-
-        #console.print("result=\n", output)
-        targets = [text for text in output.split("\n") if ".xt/cwd/wrapped.sh" in text]
-        #console.print("targets=", targets)
-        process_id = None
-
-        if targets:
-            process_id = targets[0].split("  ")[1]
-        return process_id
-
     def _make_dir(self, path):
         # use SSH to list contents of queue
         if self.box_is_windows:
@@ -285,15 +254,60 @@ class RemotePsmClient():
         #new_bytes = read_bytes if not error_code else b""
         return new_bytes
 
-    def get_running_entry_name(self):
-        text = None
+    def get_running_entries(self):
+        '''
+        return a dict of {fn_entry: pid} for the entries running in the PSM's slots (the PSM writes the entry name 
+        and process id to each slot's dir when it starts an entry, and removes them when the entry exits).
+        '''
+        running = {}
+        slots_dir = file_utils.path_join(self.controller_cwd, constants.PSM_SLOTS_DIR, for_windows=False)
+
+        try:
+            slots = self.ftp_client.listdir(slots_dir)
+        except IOError:
+            slots = []
 
-        fn_current = file_utils.path_join(self.controller_cwd, constants.CURRENT_RUNNING_ENTRY, for_windows=False)
+        for slot in slots:
+            slot_dir = file_utils.path_join(slots_dir, slot, for_windows=False)
 
-        new_bytes = self.read_file(fn_current, 0, None)
-        text = new_bytes.decode()
-        text = text.strip()         # remove newline, spaces
-        return text
+            fn_entry = self.read_file(slot_dir + "/" + constants.CURRENT_RUNNING_ENTRY, 0, None).decode().strip()
+            pid = self.read_file(slot_dir + "/" + constants.CURRENT_ENTRY_PID, 0, None).decode().strip()
+
+            if fn_entry and pid:
+                running[fn_entry] = int(pid)
+
+        if running:
+            # in case the PSM was stopped while an entry was running
+            output = self.run_cmd("ps -o pid= -p {}".format(",".join([str(pid) for pid in running.values()])))
+            alive = [int(pid) for pid in output.split()]
+
+            running = {fn_entry: pid for fn_entry, pid in running.items() if pid in alive}
+
+        return running
+
+    def get_entry_port(self, fn_entry):
+        '''
+        return the port of the controller started by the running entry 'fn_entry' (each PSM slot has its own port), or
+        None if the entry isn't running in a slot.
+        '''
+        port = None
+        slots_dir = file_utils.path_join(self.controller_cwd, constants.PSM_SLOTS_DIR, for_windows=False)
+
+        try:
+            slots = self.ftp_client.listdir(slots_dir)
+        except IOError:
+            slots = []
+
+        for slot in slots:
+            slot_dir = file_utils.path_join(slots_dir, slot, for_windows=False)
+
+            if self.read_file(slot_dir + "/" + constants.CURRENT_RUNNING_ENTRY, 0, None).decode().strip() == fn_entry:
+                text = self.read_file(slot_dir + "/" + constants.CURRENT_ENTRY_PORT, 0, None).decode().strip()
+                if text:
+                    port = int(text)
+                break
+
+        return port
 
     def get_status(self, fn_entry):
         status = "completed"      # unless below finds different
@@ -307,18 +321,8 @@ class RemotePsmClient():
 
         if result and fn_entry in result:
             status = "queued"
-        else:
-            text = self.get_running_entry_name()
-            if text == fn_entry:
-                # entry might be running; is the runner script OR controller active?
-                if self._get_runner_script_process_id():
-                    status = "running"
-                elif self._get_controller_process_id():
-                    status = "running"
-                else:
-                    console.print("--> runner script and controller processes not running")
-            else:
-                console.print("PSM current job:", text)
+        elif fn_entry in self.get_running_entries():
+            status = "running"
 
         return status
 
@@ -327,20 +331,18 @@ class RemotePsmClient():
         status = "completed"
 
         # don't call get_entry_status - check details JIT to minimize race conditons
-        fn_queue_entry = os.path.join(self.psm_queue_path, fn_entry)
+        fn_queue_entry = file_utils.path_join(self.psm_queue_path, fn_entry, for_windows=False)
 
-        if os.path.exists(fn_queue_entry):
+        if self.remote_file_exists(fn_queue_entry):
             self.ftp_client.remove(fn_queue_entry)
             cancelled = True
         else:
-            text = self.get_running_entry_name()
-            if text == fn_entry:
-                # entry might be running; is the controller active?
-                process_id = self._get_controller_process_id()
-                if process_id:
-                    ssh_cmd = "kill -kill {}".format(process_id)
-                    self.run_cmd(ssh_cmd)
-                    cancelled = True
+            process_id = self.get_running_entries().get(fn_entry)
+            if process_id:
+                # kill the entry's controller (a child of its wrapper script) and the wrapper script
+                ssh_cmd = "pkill -kill -P {0}; kill -kill {0}".format(process_id)
+                self.run_cmd(ssh_cmd)
+                cancelled = True
 
         return cancelled, status
 
@@ -18,6 +18,7 @@ from xtlib import qfe
 from xtlib import utils
 from xtlib import errors
 from xtlib import constants
+from xtlib.storage import run_cache
 
 class ReportBuilder():
     def __init__(self, config, store, client):
@@ -334,9 +335,15 @@ class ReportBuilder():
                 cursor = cursor.limit(first)
             return cursor
 
-        # here is where MONGO does all the hard work for us
-        cursor = mongo.mongo_with_retries("get_mongo_records", fetch)
-        records = list(cursor)
+        if which == "runs" and mongo.run_cache:
+            # filter locally from the incrementally synced run cache, then sort/limit here
+            rebuild = utils.safe_value(args, "rebuild_cache")
+            records = mongo.get_all_runs(None, workspace, None, filter_dict, col_dict, use_cache=True, rebuild_cache=rebuild)
+            records = self.sort_limit_cached_records(records, sort_col, last, first)
+        else:
+            # here is where MONGO does all the hard work for us
+            cursor = mongo.mongo_with_retries("get_mongo_records", fetch)
+            records = list(cursor)
 
         console.diag("after full records retreival, len(records)={}".format(len(records)))
 
@@ -354,6 +361,20 @@ class ReportBuilder():
 
         return records, using_default_last, last
 
+    def sort_limit_cached_records(self, records, sort_col, last, first):
+        # emulate mongo's sort (numbers before strings) and limit for records from the run cache
+        def sort_key(record):
+            value = run_cache.get_path_value(record, sort_col)
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                return (1, str(value))
+            return (0, value)
+
+        records.sort(key=sort_key, reverse=bool(last))
+        if first:
+            records = records[:first]
+
+        return records
+
     def get_user_columns(self, args):
         requested_list = args["columns"]
         add_cols = utils.safe_value(args, "add_columns")
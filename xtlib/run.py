@@ -18,6 +18,7 @@ from xtlib import file_utils
 from xtlib import impl_storage
 
 from xtlib.storage.store import Store
+from xtlib.storage.buffered_run_logger import BufferedRunLogger
 from xtlib.console import console
 from xtlib.helpers.xt_config import get_merged_config
 
@@ -28,7 +29,8 @@ FN_CHECKPOINT_WILD = "checkpoints/*"
 class Run():
 
     def __init__(self, config=None, store=None, xt_logging=True, aml_logging=True, checkpoints_enabled=True,
-        tensorboard_path=None, supress_normal_output=False):
+        tensorboard_path=None, supress_normal_output=False, buffered_logging=False, buffer_max_records=100, 
+        buffer_max_ms=2000, buffer_queue_size=10000):
         ''' 
         this initializes an XT Run object so that ML apps can use XT services from within their app, including:
             - hyperparameter logging
@@ -38,11 +40,17 @@ class Run():
             - checkpoint support
             - explict HP search calls
 
+        when buffered_logging is True, run events logged by the app are queued in memory and written by a background 
+        thread, batching up to buffer_max_records records (or buffer_max_ms milliseconds) per storage/mongo write.  
+        The queue holds at most buffer_queue_size records (extra records are dropped).  Queued records are flushed 
+        by close() or at process exit.
+
         note: Azure ML child runs seem to get their env variables inherited from their parent run 
         correctly, so we no need to use parent run for info. '''
 
         self.store = None
         self.xt_logging = False
+        self.run_logger = None
         self.metric_report_count = 0
         self.metric_names = OrderedDict()
         self.supress_normal_output = supress_normal_output
@@ -152,9 +160,14 @@ class Run():
         if  self.xt_logging and self.direct_run and self.store:
             # log stuff normally done by controller at start of run
             self.store.log_run_event(self.ws_name, self.run_name, "started", {})   
-            self.store.mongo.run_start(self.ws_name, self.run_name)
             if self.context:
-                self.store.mongo.job_run_start(self.context.job_id)
+                self.store.mongo.run_lifecycle_start(self.ws_name, self.run_name, self.context.job_id)
+            else:
+                self.store.mongo.run_start(self.ws_name, self.run_name)
+
+        if buffered_logging and self.xt_logging and self.store:
+            self.run_logger = BufferedRunLogger(self.store, self.ws_name, self.run_name, max_records=buffer_max_records, 
+                max_ms=buffer_max_ms, queue_size=buffer_queue_size, is_aml=self.is_aml)
 
     def init_tensorboard(self):
         # as of Oct-04-2019, to use torch.utils.tensorboard on DSVM systems, we need to do one of the following:
@@ -194,7 +207,26 @@ class Run():
 
         return child_run
 
+    def flush(self):
+        ''' write all buffered run events (and stop buffering). '''
+        if self.run_logger:
+            self.run_logger.close()
+
+    def get_logging_counters(self):
+        ''' return the queued/flushed/dropped counts of the buffered logger (or None if not buffering). '''
+        return self.run_logger.get_counters() if self.run_logger else None
+
+    def _log_run_event(self, event_name, data_dict):
+        if self.run_logger and not self.run_logger.closed:
+            record_dict = {"time": utils.get_time(), "event": event_name, "data": data_dict}
+            self.run_logger.log_record(record_dict)
+        else:
+            self.store.log_run_event(self.ws_name, self.run_name, event_name, data_dict, is_aml=self.is_aml)
+
     def close(self):
+        # buffered records must be written before the run log is rolled up
+        self.flush()
+
         if self.xt_logging and self.direct_run and self.store and self.context:
             context = self.context
             status = "completed"
@@ -236,12 +268,15 @@ class Run():
             self.store.update_mongo_run_at_end(self.ws_name, self.run_name, status, exit_code, restarts, end_time, log_records, 
                 hparams_dict, metrics_rollup_dict)
 
+        if self.store:
+            self.store.close()
+
     def get_store(self):
         return self.store
 
     def log_hparam(self, name, value):
         if self.store and self.xt_logging:
-            self.store.log_run_event(self.ws_name, self.run_name, "hparams", {name: value}, is_aml=self.is_aml)
+            self._log_run_event("hparams", {name: value})
 
         if self.is_aml and self.aml_logging:
             self.aml_run.log(name, value, description)
@@ -250,7 +285,7 @@ class Run():
         #console.print("log_hparam, self.store=", self.store)
 
         if self.store and self.xt_logging:
-            self.store.log_run_event(self.ws_name, self.run_name, "hparams", data_dict, is_aml=self.is_aml)
+            self._log_run_event("hparams", data_dict)
 
         if self.is_aml and self.aml_logging:
             self.aml_run.log_row("hparams", **data_dict)
@@ -298,14 +333,18 @@ class Run():
 
         if self.store and self.xt_logging:
             #console.print("logging run_event for metrics...")
-            self.store.log_run_event(self.ws_name, self.run_name, "metrics", dd, is_aml=self.is_aml)
+            self._log_run_event("metrics", dd)
 
             if metric_names_changed:
                 ddx = {"metric_names": list(self.metric_names)}
                 # if not self.supress_normal_output:
                 #     console.print("updating metric_names: {}".format(ddx))
 
-                self.store.mongo.update_mongo_run_from_dict(self.ws_name, self.run_name, ddx)
+                if self.run_logger and not self.run_logger.closed:
+                    # piggyback on the next batched write
+                    self.run_logger.update_run_props(ddx)
+                else:
+                    self.store.mongo.update_mongo_run_from_dict(self.ws_name, self.run_name, ddx)
 
         if self.is_aml and self.aml_logging:
             for name, value in dd.items():
@@ -343,7 +382,7 @@ class Run():
 
     def log_event(self, event_name, data_dict):
         if self.store and self.xt_logging:
-            self.store.log_run_event(self.ws_name, self.run_name, event_name, data_dict, is_aml=self.is_aml)
+            self._log_run_event(event_name, data_dict)
 
     def is_resuming(self):
         # return a bool using not not
@@ -149,11 +149,11 @@ def list_run_tags(store, mongo, name_list, tag_list, workspace):
 
 def get_run_property_dicts():
     # user-friendly property names for jobs
-    user_to_actual = {"box": "box_name", "created": "create_time", "child": "is_child", "cluster": "cluster",
+    user_to_actual = {"box": "box_name", "created": "create_time", "child": "is_child", "children": "child_count", "cluster": "cluster",
         "description": "description", "experiment": "exper_name", "exit_code": "exit_code", 
         "from_host": "from_computer_name", "from_ip": "from_ip", 
         "guid": "run_guid", "job": "job_id", "last_time": "last_time",
-        "node": "node_index", "outer": "is_outer", "parent": "is_parent", "path": "path", 
+        "node": "node_index", "outer": "is_outer", "parent": "is_parent", "parent_run": "parent_name", "path": "path", 
         "pool": "pool", "repeat": "repeat", "restarts": "restarts", "run": "run_name", "run_num": "run_num", 
         "script": "script", "search": "search_type", "search_style": "search_style", "service_type": "service_type", "sku": "sku",
         "status": "status", "target": "compute", "username": "username", "vc": "vc", "workspace": "ws", "xt_build": "xt_build", 
@@ -170,6 +170,7 @@ def get_run_property_dicts():
         #"app": "the application associated with the run",
         "box": "the name of the box the run executed on",
         "child": "indicates that this run is a child run",
+        "children": "the number of child runs created by the run",
         "created": "the time when the run was created", 
         "cluster": "the name of the service cluster for the run", 
         "ended": "when the run execution ended",
@@ -186,6 +187,7 @@ def get_run_property_dicts():
         "node": "the 0-based node index of the run's box",
         "outer": "indicates this run is not a child run",
         "parent": "indicates that the run spawned child runs",
+        "parent_run": "the name of the parent run (for child runs)",
         "path": "the full path of the run's target script or executable file",
         "pool": "the user-defined name describing the backend service or set of boxes on which the run executed",
         "repeat": "the user-specified repeat-count for the run",
@@ -11,7 +11,8 @@ import time
 import json
 import psutil
 import logging
-from threading import Thread, Lock
+from collections import deque
+from threading import Thread, Lock, Condition, Timer
 
 from xtlib import utils
 from xtlib import errors
@@ -22,9 +23,16 @@ from xtlib.storage.store import store_from_context
 
 logger = logging.getLogger(__name__)
 
+# console output of a run is buffered, and flushed to its console file at least this often (secs)
+CONSOLE_FLUSH_SECS = 1
+CONSOLE_BUFFER_SIZE = 64*1024
+
+# max output chunks waiting to be sent to attached clients (a slow client loses the oldest chunks)
+MAX_CALLBACK_CHUNKS = 1000
+
 class RunInfo():
     def __init__(self, run_name, workspace, cmd_parts, run_script, repeat, context, status, show_output=True, parent_name=None, 
-        parent_prep_needed=False, mirror_close_func=None, aml_run=None, node_id=None, run_index=None, mri=None, mri_entry=None):
+        parent_prep_needed=False, mirror_close_func=None, aml_run=None, node_id=None, run_index=None, mri=None, mri_entry=None, priority=0):
 
         if isinstance(repeat, str):
             repeat = int(repeat)
@@ -64,11 +72,23 @@ class RunInfo():
         self.username = context.username
         self.run_as_parent = context.search_style != "single"
         self.node_id = node_id
+        self.priority = priority        # order in controller's queue (higher runs first)
         self.run_index = run_index
         self.mri = mri
         self.mri_entry = mri_entry
         self.killed_for_restart = False
 
+        # buffered console file (opened on first output)
+        self.console_file = None
+        self.console_lock = Lock()
+        self.console_timer = None
+
+        # output to be sent to attached clients (by the sender thread)
+        self.callback_chunks = deque(maxlen=MAX_CALLBACK_CHUNKS)
+        self.callback_changed = Condition()
+        self.callback_sender = None
+        self.callbacks_closing = False      # set when the run ends: the sender thread exits once no clients are attached
+
         console.print("RunInfo: is_aml=", self.is_aml, ", aml_run=", self.aml_run)
 
         #console.print("mirror_close_func=", mirror_close_func)
@@ -76,6 +96,8 @@ class RunInfo():
         #console.print("run_info ctr: setting self.repeats_remaining=", self.repeats_remaining)
         
     def set_console_fn(self, console_fn):
+        self.close_console()
+
         console_fn = os.path.expanduser(console_fn)
         self.console_fn = console_fn
 
@@ -86,6 +108,7 @@ class RunInfo():
 
 
     def process_run_output(self, text_msg, run_info_is_locked=False):
+        ''' 'text_msg' is one or more lines of output from the run '''
 
         # if self.context.scrape:
         #     # scrape output line for XT log records
@@ -97,31 +120,84 @@ class RunInfo():
         self.update_recent_output(text_msg)
 
         # append to output file
-        with open(self.console_fn, "a") as tfile:
-            tfile.write(text_msg)
+        self.write_console(text_msg)
 
         # send output to attached clients
         if self.show_output:
             # console.print output on CONTROLLER console
-            sys.stdout.write(self.run_name + ": ")
-            sys.stdout.write(text_msg)
-
-            # if run_info_is_locked:
-            #     list2 = list(self.acallbacks)
-            # else:
-            #     with self.lock:
-            #         # make a copy of list for safe enumeration 
-            #         list2 = list(self.acallbacks)
-
-            # semi-thread safe (avoid creating list under a lock for every output line)
-            for i in range(len(self.acallbacks)):
+            prefix = self.run_name + ": "
+            sys.stdout.write("".join([prefix + line for line in text_msg.splitlines(True)]))
+
+            # the sender thread feeds the clients, so a slow client can't stall the run
+            if self.acallbacks:
+                with self.callback_changed:
+                    self.callback_chunks.append(text_msg)
+                    self.callback_changed.notify()
+
+    def write_console(self, text):
+        with self.console_lock:
+            if not self.console_file:
+                self.console_file = open(self.console_fn, "a", buffering=CONSOLE_BUFFER_SIZE)
+
+            # writes of more than the buffer size are flushed by the file itself
+            self.console_file.write(text)
+
+            if not self.console_timer:
+                self.console_timer = Timer(CONSOLE_FLUSH_SECS, self.flush_console)
+                self.console_timer.daemon = True
+                self.console_timer.start()
+
+    def flush_console(self):
+        with self.console_lock:
+            self.console_timer = None
+
+            if self.console_file:
+                self.console_file.flush()
+
+    def close_console(self):
+        ''' flush and close the console file (it is reopened if more output arrives) '''
+        with self.console_lock:
+            if self.console_timer:
+                self.console_timer.cancel()
+                self.console_timer = None
+
+            if self.console_file:
+                self.console_file.close()
+                self.console_file = None
+
+    def send_to_callbacks(self):
+        ''' sender thread: feeds queued output to attached clients (coalescing chunks that arrive while sending) '''
+        while True:
+            with self.callback_changed:
+                while not self.callback_chunks:
+                    if self.callbacks_closing:
+                        with self.lock:
+                            if not self.acallbacks:
+                                # a later attach starts a new sender
+                                self.callback_sender = None
+                                return
+
+                    self.callback_changed.wait()
+
+                text_msg = "".join(self.callback_chunks)
+                self.callback_chunks.clear()
+
+            with self.lock:
+                # make a copy of list for safe enumeration 
+                acallbacks = list(self.acallbacks)
+
+            for callback in acallbacks:
                 try:
-                    callback = self.acallbacks[i]
-                    print("sending text to callback: " + text_msg)
                     callback(self.run_name, text_msg)
                 except BaseException as ex:
                     # if stream is closed unexpectly, treat as non-fatal error and just log
-                    logger.exception("Error in process_run_output, ex={}".format(ex))
+                    logger.exception("Error in send_to_callbacks, ex={}".format(ex))
+
+    def close_callbacks(self):
+        ''' let the sender thread exit (after it sends the queued output) once no clients are attached '''
+        with self.callback_changed:
+            self.callbacks_closing = True
+            self.callback_changed.notify()
 
     def get_core_properties(self):
         dd = {"run_name": self.run_name, "workspace": self.workspace, "cmd_parts": self.cmd_parts, "run_script": self.run_script, 
@@ -146,6 +222,10 @@ class RunInfo():
         with self.lock: 
             self.acallbacks.append(acallback)           
 
+            if not self.callback_sender:
+                self.callback_sender = Thread(target=self.send_to_callbacks, daemon=True)
+                self.callback_sender.start()
+
     def detach(self, callback):
         index = None
 
@@ -157,12 +237,16 @@ class RunInfo():
             else:
                 errors.internal_error("could not find callback to detach")
 
+        # wake the sender thread (it exits if the run has ended and this was the last client)
+        with self.callback_changed:
+            self.callback_changed.notify()
+
         return index
 
     def update_recent_output(self, msg):
-        self.recent_output.append(msg)
+        self.recent_output += msg.splitlines(True)
         if len(self.recent_output) > self.max_recent:
-            self.recent_output = self.recent_output[10:]        # drop oldest 10 lines
+            self.recent_output = self.recent_output[-self.max_recent:]        # keep the newest lines
 
     def wrapup_parent_prep_run(self):
         context = self.context
@@ -174,6 +258,10 @@ class RunInfo():
         '''wrap-up the run (logging, capture)'''
         #console.print("run_wrapup, self.killed_for_restart={}".format(self.killed_for_restart))
         
+        # the console file is mirrored and captured with the after files
+        self.flush_console()
+        self.close_callbacks()
+
         if self.mirror_worker:
             self.mirror_close_func(self)
 
@@ -187,9 +187,10 @@ class Runner():
                 if fn.startswith(code_dir) and fn != code_dir:
                     fn_dest = snapshot_dir + "/" + fn[prefix_len:]
                     file_utils.ensure_dir_exists(file=fn_dest)
-                    shutil.copyfile(fn, fn_dest)
+                    # copy2 keeps the modified time, so hashes of unchanged files are found in the hash cache (code-zip=manifest)
+                    shutil.copy2(fn, fn_dest)
                 else:
-                    shutil.copy(fn, snapshot_dir)
+                    shutil.copy2(fn, snapshot_dir)
                 copy_count += 1
 
             #console.diag("after snapshot copy of {} files".format(copy_count))
@@ -207,25 +208,47 @@ class Runner():
             if file_ext != expected_ext:
                 errors.combo_error("{} file ext='{}' doesn't match box.os='{}'".format(script_name, file_ext, box_info.box_os))
 
+    def check_script_exts(self, run_script_path, parent_script_path, box_info):
+        # check that script file extensions match OS of first box
+        if run_script_path:
+            self.ensure_script_ext_matches_box("run script", run_script_path, box_info)
+
+        if parent_script_path:
+            self.ensure_script_ext_matches_box("parent script", parent_script_path, box_info)
+
     def build_first_run_for_node(self, node_index, box_name, run_script_path, parent_script_path, using_hp, use_aml_hparam, run_specs, 
-            job_id, parent_name, cmds, pool_info, repeat_count, fake_submit, search_style, box_secret, args):
+            job_id, parent_name, cmds, pool_info, repeat_count, fake_submit, search_style, box_secret, args, run_name=None):
+        '''
+        build the run data for the first run of a node ('run_name' is specified when the run has already been created by create_runs)
+        '''
         exper_name = args['experiment']
 
         box_info = box_information.BoxInfo(self.config, box_name, self.store, args=args)
 
         if node_index == 0:
-            # check that script file extensions match OS of first box
-            if run_script_path:
-                self.ensure_script_ext_matches_box("run script", run_script_path, box_info)
-
-            if parent_script_path:
-                self.ensure_script_ext_matches_box("parent script", parent_script_path, box_info)
+            self.check_script_exts(run_script_path, parent_script_path, box_info)
 
         node_id = "node" + str(node_index)
         # if using_hp:
         #     if not node_id in cmds_by_node:
         #         errors.combo_error("you specified more nodes/boxes than hyperparameter search runs")
 
+        # CREATE RUN 
+        if not run_name:
+            actual_parts = self.get_actual_cmd_parts(run_specs, box_info)
+            path = os.path.realpath(args["script"])
+
+            run_name, full_run_name, box_name, pool = \
+                self.create_run(job_id, actual_parts, box_name=box_name, parent_name=parent_name, node_index=node_index, using_hp=using_hp, 
+                    repeat=repeat_count, app_info=None, path=path, exper_name=exper_name, pool_info=pool_info, fake_submit=fake_submit, 
+                    search_style=search_style, args=args)
+
+        run_data = {"run_name": run_name, "run_specs": run_specs, "box_name": box_name, "box_index": node_index, 
+            "box_info": box_info, "repeat": repeat_count, "box_secret": box_secret}
+
+        return run_data
+       
+    def get_actual_cmd_parts(self, run_specs, box_info):
         cmd_parts = run_specs["cmd_parts"]
         actual_parts = None
 
@@ -238,19 +261,50 @@ class Runner():
                 actual_parts[1] = "nvidia-docker"
             #console.print("actual_parts=", actual_parts)
 
-        # CREATE RUN 
-        path = os.path.realpath(args["script"])
+        return actual_parts
+
+    def create_runs(self, job_id, boxes, run_script_path, parent_script_path, run_specs, repeat_count, pool_info, search_style, args):
+        '''
+        bulk version of create_run, for the first run of each of the nodes in 'boxes': the runs are created in the store
+        with a fixed number of requests (rather than a series of requests per run).  Returns the list of run names.
+        '''
+        exper_name = args["experiment"]
+        if not exper_name:
+            exper_name = input("experiment name (for grouping this run): ")
 
-        run_name, full_run_name, box_name, pool = \
-            self.create_run(job_id, actual_parts, box_name=box_name, parent_name=parent_name, node_index=node_index, using_hp=using_hp, 
-                repeat=repeat_count, app_info=None, path=path, exper_name=exper_name, pool_info=pool_info, fake_submit=fake_submit, 
-                search_style=search_style, args=args)
+        sku = args["sku"]
+        if not sku:
+            # make default sku explicit
+            if pool_info and "sku" in pool_info:
+                sku = pool_info["sku"].lower()
 
-        run_data = {"run_name": run_name, "run_specs": run_specs, "box_name": box_name, "box_index": node_index, 
-            "box_info": box_info, "repeat": repeat_count, "box_secret": box_secret}
+        # log NOTES record (same notes for all runs)
+        notes = None
+        if self.config.get("logging", "notes") in ["before", "all"]:
+            notes = input("Notes: ")
+
+        runs = []
+        for node_index, box_name in enumerate(boxes):
+            box_info = box_information.BoxInfo(self.config, box_name, self.store, args=args)
+            if node_index == 0:
+                self.check_script_exts(run_script_path, parent_script_path, box_info)
+
+            actual_parts = self.get_actual_cmd_parts(run_specs, box_info)
+
+            # always log cmd (for re-run purposes)
+            records = [("cmd", {"cmd": actual_parts, "xt_cmd": args["xt_cmd"]})]
+            if notes:
+                records.append(("notes", {"notes": notes}))
+
+            runs.append({"box_name": box_name, "node_index": node_index, "repeat": repeat_count, "records": records})
+
+        run_names = self.store.start_runs(args["workspace"], runs, exper_name=exper_name, description=args["description"], 
+            username=args["username"], is_parent=(search_style != "single"), job_id=job_id, aggregate_dest=args["aggregate_dest"], 
+            path=os.path.realpath(args["script"]), compute=args["target"], service_type=args["service_type"], 
+            search_type=args["search_type"], sku=sku, search_style=search_style)
+
+        return run_names
 
-        return run_data
-       
     def write_hparams_to_files(self, job_id, cmds, fake_submit, using_hp, args):
         # write to job-level sweeps-list file
         #console.print("cmds=", cmds)   
@@ -671,6 +725,13 @@ class Runner():
         run_count = 1 if is_distributed else len(boxes) 
         secrets_by_node = {}
         remote_control = args["remote_control"]
+        run_names = [None]*run_count
+
+        if run_count > 1 and not fake_submit and self.config.get("logging", "log"):
+            # create the runs of all nodes in bulk
+            fb.feedback("creating {} runs".format(run_count), id="node_msg")
+            run_names = self.create_runs(job_id, boxes[0:run_count], target_file, ps_path, run_specs, repeat_count, pool_info, 
+                search_style, args)
 
         for i in range(run_count):
             box_name = boxes[i]
@@ -680,7 +741,7 @@ class Runner():
 
             # build runs for box_name
             run_data = self.build_first_run_for_node(i, boxes[i], target_file, ps_path, using_hp, using_aml_hparam, run_specs, job_id, 
-                parent_name, cmds, pool_info, repeat_count, fake_submit, search_style, box_secret, args)
+                parent_name, cmds, pool_info, repeat_count, fake_submit, search_style, box_secret, args, run_name=run_names[i])
 
             # for now, adhere to the more general design of multiple runs per box
             box_runs = [run_data]      
@@ -740,6 +801,11 @@ class Runner():
             model_local = os.path.realpath(model_local.replace("$scriptdir", script_dir))
             args["model_local"] = model_local
 
+        if args["code_zip"] == "manifest" and self.backend.get_name() != "pool":
+            # only the pool backend rebuilds the code (and the controller files) from a manifest before the run starts
+            errors.config_error("code-zip=manifest is only supported for pool compute targets (not '{}')".format(
+                self.backend.get_name()))
+
         # ADJUST CMDS: this allows backend to write scripts to snapshot dir, if needed, as a way of adjusting/wrapping run commands
         self.backend.adjust_run_commands(job_id, job_runs, using_hp, experiment, service_type, snapshot_dir, args=args)
 
@@ -782,9 +848,8 @@ class Runner():
 
         if not fake_submit:
             # mark runs as QUEUED
-            for runs in runs_by_box.values():
-                first_run = runs[0]
-                self.store.log_run_event(workspace, first_run["run_name"], "status-change", {"status": "queued"}) 
+            first_runs = [runs[0]["run_name"] for runs in runs_by_box.values()]
+            self.store.log_runs_event(workspace, first_runs, "status-change", {"status": "queued"}) 
 
             # write the job info file (now that backend has had a chance to update it)
             job_num = int(job_id[3:])
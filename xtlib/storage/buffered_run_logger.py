@@ -0,0 +1,146 @@
+#
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+#
+# buffered_run_logger.py: background writer that batches run log records for the Store
+import time
+import queue
+import atexit
+import logging
+from threading import Thread, Lock
+
+from xtlib.console import console
+
+logger = logging.getLogger(__name__)
+
+class BufferedRunLogger():
+    '''
+    Queues run log records (metrics, hparams, events) in memory and writes them to the Store from a
+    background thread.  Each flush coalesces up to 'max_records' records (or whatever has arrived within
+    'max_ms' milliseconds) into a single run log blob append and a single mongo-db update.
+
+    The queue is bounded by 'queue_size'; when it is full, new records are dropped (and counted) so that
+    the training thread is never blocked by a slow or throttled service.
+    '''
+    def __init__(self, store, ws_name, run_name, max_records=100, max_ms=2000, queue_size=10000, is_aml=False):
+        self.store = store
+        self.ws_name = ws_name
+        self.run_name = run_name
+        self.max_records = max(1, max_records)
+        self.max_secs = max_ms/1000
+        self.is_aml = is_aml
+
+        self.queue = queue.Queue(maxsize=queue_size)
+
+        # run properties (like metric_names) to be $set with the next flush
+        self.pending_updates = {}
+        self.updates_lock = Lock()
+
+        # counters
+        self.queued_count = 0
+        self.flushed_count = 0
+        self.dropped_count = 0
+        self.flush_count = 0
+        self.error_count = 0
+
+        self.closed = False
+        self.worker = Thread(target=self.bg_writer, daemon=True)
+        self.worker.start()
+
+        # ensure we don't lose records on a normal process exit
+        atexit.register(self.close)
+
+    def log_record(self, record_dict):
+        ''' queue a single run log record; returns False if the record was dropped. '''
+        if self.closed:
+            self.dropped_count += 1
+            return False
+
+        try:
+            self.queue.put_nowait(record_dict)
+            self.queued_count += 1
+            queued = True
+        except queue.Full:
+            self.dropped_count += 1
+            queued = False
+
+        return queued
+
+    def update_run_props(self, dd):
+        ''' merge 'dd' into the run properties that will be set on the mongo run document at the next flush. '''
+        with self.updates_lock:
+            self.pending_updates.update(dd)
+
+    def get_counters(self):
+        return {"queued": self.queued_count, "flushed": self.flushed_count, "dropped": self.dropped_count,
+            "flushes": self.flush_count, "errors": self.error_count, "pending": self.queue.qsize()}
+
+    def _collect_batch(self, first_record):
+        records = [first_record]
+        deadline = time.time() + self.max_secs
+
+        while len(records) < self.max_records:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+
+            try:
+                record = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+
+            if record is None:
+                # close() sentinel: put it back so that bg_writer sees it after this batch
+                self.queue.put(None)
+                break
+
+            records.append(record)
+
+        return records
+
+    def _write_batch(self, records):
+        with self.updates_lock:
+            updates = self.pending_updates
+            self.pending_updates = {}
+
+        if not records and not updates:
+            return
+
+        try:
+            self.store.log_run_events(self.ws_name, self.run_name, records, updates=updates, is_aml=self.is_aml)
+            self.flushed_count += len(records)
+            self.flush_count += 1
+        except BaseException as ex:
+            logger.exception("Error in BufferedRunLogger._write_batch, ex={}".format(ex))
+            console.print("error writing {} buffered run log records: {}".format(len(records), ex))
+            self.error_count += 1
+            self.dropped_count += len(records)
+
+    def bg_writer(self):
+        while True:
+            record = self.queue.get()
+            if record is None:
+                break
+
+            records = self._collect_batch(record)
+            self._write_batch(records)
+
+        # drain anything that arrived before the sentinel
+        records = []
+        while not self.queue.empty():
+            record = self.queue.get_nowait()
+            if record is not None:
+                records.append(record)
+
+        self._write_batch(records)
+
+    def close(self):
+        ''' flush all queued records and stop the background writer. '''
+        if self.closed:
+            return
+
+        self.closed = True
+        self.queue.put(None)
+        self.worker.join()
+
+        atexit.unregister(self.close)
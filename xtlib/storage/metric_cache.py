@@ -0,0 +1,237 @@
+#
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+#
+# metric_cache.py: local, columnar (numpy .npz) cache of the metric sets logged by each run
+import os
+import json
+import time
+import numpy as np
+
+from xtlib import constants
+from xtlib import file_utils
+from xtlib import run_helper
+from xtlib.console import console
+
+METRICS_CACHE_DIR = "metrics/$ws"
+SETS_KEY = "__sets__"
+CACHE_KEY = "__key__"
+OBJECTS_KEY = "__objects__"     # the arrays of object columns (saved as JSON text, so no pickle is needed to load them)
+
+# max number of runs whose log_records are requested from mongo-db in a single query
+FETCH_CHUNK = 100
+
+def get_column_dtype(values):
+    ''' return the numpy dtype for a column of metric values (object, for mixed columns) '''
+    types = set(type(v) for v in values)
+
+    if types == {bool}:
+        return np.bool_
+
+    if types == {int}:
+        return np.int64
+
+    if types <= {int, float, type(None)}:
+        # None values are stored as NaN
+        return np.float64
+
+    if types == {str}:
+        return np.str_
+
+    return object
+
+def make_object_column(values):
+    ''' return a 1-dim numpy object array of 'values' (which can themselves be lists) '''
+    column = np.empty(len(values), dtype=object)
+    for i, value in enumerate(values):
+        column[i] = value
+    return column
+
+def records_to_columns(keys, records):
+    ''' convert the records of a metric set to a dict of numpy arrays (one per key) '''
+    columns = {}
+
+    for key in keys:
+        values = [record.get(key) for record in records]
+        dtype = get_column_dtype(values)
+
+        try:
+            column = make_object_column(values) if dtype is object else np.array(values, dtype=dtype)
+        except OverflowError:
+            # ints too large for int64
+            column = make_object_column(values)
+
+        columns[key] = column
+
+    return columns
+
+def columns_to_records(metric_set):
+    ''' convert a columnar metric set back to a list of dict records '''
+    keys = metric_set["keys"]
+    columns = [metric_set["columns"][key].tolist() for key in keys]
+    records = [dict(zip(keys, values)) for values in zip(*columns)]
+    return records
+
+def column_sets_to_log_records(metric_sets):
+    ''' rebuild the (time-ordered) "metrics" log records of a run from its columnar metric sets '''
+    log_records = []
+
+    for ms in metric_sets:
+        for dd in columns_to_records(ms):
+            log_records.append({"event": "metrics", "time": dd.get(constants.TIME), "data": dd})
+
+    log_records.sort(key=lambda lr: str(lr["time"]))
+    return log_records
+
+def select_keys(keys, col_names, get_column):
+    '''
+    return the keys of a metric set that are in 'col_names', plus the x column named by the set's logged step name
+    (so a custom step column like "batch" is loaded even when it wasn't requested).
+    '''
+    names = set(col_names)
+
+    if constants.STEP_NAME in keys:
+        steps = get_column(constants.STEP_NAME)
+        if len(steps):
+            names.add(str(steps[0]))
+
+    return [key for key in keys if key in names]
+
+def build_column_sets(log_records):
+    ''' build the columnar metric sets of a run from its log records '''
+    metric_sets = run_helper.build_metrics_sets(log_records)
+    return [{"keys": ms["keys"], "columns": records_to_columns(ms["keys"], ms["records"])} for ms in metric_sets]
+
+class MetricCache():
+    '''
+    Caches the metric sets of each run as numpy arrays (one per metric name) in a compressed .npz file.  Each file is
+    tagged with the run's end_id and last_time, so it is rebuilt (from the mongo-db log_records) only when the run has
+    logged something new.  Callers can load just the columns they need.
+    '''
+    def __init__(self, cache_dir):
+        self.cache_dir = os.path.expanduser(cache_dir)
+
+    def get_cache_fn(self, ws_name, run_name):
+        path = self.cache_dir + "/" + METRICS_CACHE_DIR.replace("$ws", ws_name)
+        return "{}/{}.npz".format(path, run_name)
+
+    def get_cache_key(self, run_record):
+        return "{}|{}".format(run_record.get("end_id"), run_record.get("last_time"))
+
+    def load(self, ws_name, run_name, cache_key, col_names=None):
+        ''' return the columnar metric sets for the run (or None if not cached or out of date) '''
+        fn = self.get_cache_fn(ws_name, run_name)
+        if not os.path.exists(fn):
+            return None
+
+        try:
+            with np.load(fn) as npz:
+                if str(npz[CACHE_KEY]) != cache_key:
+                    return None
+
+                set_infos = json.loads(str(npz[SETS_KEY]))
+                object_names = set(json.loads(str(npz[OBJECTS_KEY])))
+                metric_sets = []
+
+                def get_column(si, key):
+                    name = "s{}_c{}".format(si, set_infos[si].index(key))
+                    if name in object_names:
+                        return make_object_column([json.loads(value) for value in npz[name].tolist()])
+                    return npz[name]
+
+                for si, keys in enumerate(set_infos):
+                    if col_names:
+                        # only read the arrays for requested columns
+                        keys = select_keys(keys, col_names, lambda key: get_column(si, key))
+                        if not keys:
+                            continue
+
+                    columns = {key: get_column(si, key) for key in keys}
+                    metric_sets.append({"keys": keys, "columns": columns})
+
+        except BaseException as ex:
+            console.diag("ignoring unreadable metric cache: {}, ex={}".format(fn, ex))
+            return None
+
+        return metric_sets
+
+    def save(self, ws_name, run_name, cache_key, metric_sets):
+        fn = self.get_cache_fn(ws_name, run_name)
+        file_utils.ensure_dir_exists(file=fn)
+
+        arrays = {CACHE_KEY: np.array(cache_key), SETS_KEY: np.array(json.dumps([ms["keys"] for ms in metric_sets]))}
+        object_names = []
+
+        for si, ms in enumerate(metric_sets):
+            for ci, key in enumerate(ms["keys"]):
+                name = "s{}_c{}".format(si, ci)
+                column = ms["columns"][key]
+
+                if column.dtype == object:
+                    column = np.array([json.dumps(value, default=str) for value in column.tolist()], dtype=np.str_)
+                    object_names.append(name)
+
+                arrays[name] = column
+
+        arrays[OBJECTS_KEY] = np.array(json.dumps(object_names))
+
+        # write to a temp file first so readers never see a partial file
+        fn_temp = fn[:-4] + ".tmp.npz"
+        np.savez_compressed(fn_temp, **arrays)
+        os.replace(fn_temp, fn)
+
+    def get_metric_sets_for_runs(self, mongo, run_records, col_names=None):
+        '''
+        return a dict of run_name: columnar metric sets for the specified run records (which must include
+        "_id", "ws", "end_id" and "last_time").  Only the runs that are not cached (or have logged new records
+        since they were cached) have their log_records fetched from mongo-db.
+        '''
+        started = time.time()
+        sets_by_run = {}
+        missing_by_ws = {}
+
+        for record in run_records:
+            ws_name = record["ws"]
+            run_name = record["_id"]
+
+            metric_sets = self.load(ws_name, run_name, self.get_cache_key(record), col_names)
+            if metric_sets is None:
+                if not ws_name in missing_by_ws:
+                    missing_by_ws[ws_name] = []
+                missing_by_ws[ws_name].append(record)
+            else:
+                sets_by_run[run_name] = metric_sets
+
+        fetch_count = 0
+
+        for ws_name, records in missing_by_ws.items():
+            keys_by_run = {record["_id"]: self.get_cache_key(record) for record in records}
+            run_names = list(keys_by_run)
+
+            for i in range(0, len(run_names), FETCH_CHUNK):
+                chunk = run_names[i:i+FETCH_CHUNK]
+                log_docs = mongo.get_info_for_runs(ws_name, {"_id": {"$in": chunk}}, {"log_records": 1})
+                fetch_count += len(log_docs)
+
+                for doc in log_docs:
+                    run_name = doc["_id"]
+                    log_records = doc["log_records"] if "log_records" in doc else []
+
+                    metric_sets = build_column_sets(log_records)
+                    self.save(ws_name, run_name, keys_by_run[run_name], metric_sets)
+
+                    if col_names:
+                        selected = []
+                        for ms in metric_sets:
+                            keys = select_keys(ms["keys"], col_names, ms["columns"].get)
+                            if keys:
+                                selected.append({"keys": keys, "columns": {key: ms["columns"][key] for key in keys}})
+                        metric_sets = selected
+
+                    sets_by_run[run_name] = metric_sets
+
+        elapsed = time.time() - started
+        console.diag("metric cache: {} runs, {} log_records fetched, took: {:.2f} secs".format(len(run_records),
+            fetch_count, elapsed))
+
+        return sets_by_run
@@ -19,11 +19,79 @@ from xtlib import constants
 from xtlib import file_utils
 
 from xtlib.console import console
+from xtlib.storage import run_cache
+from xtlib.storage import mongo_rate_limiter
 
 logger = logging.getLogger(__name__)
 
 MONGO_INFO = "__mongo_info__"
 
+class MongoWriteBatch():
+    '''
+    Collects update operations for a set of documents, merging the updates for the same document into a single
+    update document ($set, $inc and $push), and writes them with one unordered bulk_write() per collection.
+    '''
+    def __init__(self, mongo):
+        self.mongo = mongo
+        self.updates = {}     # collection name -> {doc_id: update_doc}
+        self.upserts = set()
+
+    def update(self, collection, doc_id, set_dd=None, inc_dd=None, push_dd=None, upsert=False):
+        docs = self.updates.setdefault(collection, {})
+        update_doc = docs.setdefault(doc_id, {})
+
+        if set_dd:
+            update_doc.setdefault("$set", {}).update(set_dd)
+
+        if inc_dd:
+            incs = update_doc.setdefault("$inc", {})
+            for name, value in inc_dd.items():
+                incs[name] = incs.get(name, 0) + value
+
+        if push_dd:
+            pushes = update_doc.setdefault("$push", {})
+            for name, value in push_dd.items():
+                pushes.setdefault(name, {"$each": []})["$each"].append(value)
+
+        if upsert:
+            self.upserts.add((collection, doc_id))
+
+    def flush(self, name="bulk_write"):
+        from pymongo import UpdateOne
+
+        for collection, docs in self.updates.items():
+            requests = [UpdateOne({"_id": doc_id}, update_doc, upsert=(collection, doc_id) in self.upserts) 
+                for doc_id, update_doc in docs.items() if update_doc]
+
+            if requests:
+                self.mongo.mongo_with_retries(name, self.make_bulk_write_cmd(collection, requests))
+
+        self.updates = {}
+        self.upserts = set()
+
+    def make_bulk_write_cmd(self, collection, requests):
+        '''
+        return a bulk_write command for mongo_with_retries.  After a partial failure, only the failed requests are
+        resubmitted by a retry ($inc and $push updates are not idempotent, so the ones applied must not be sent again).
+        '''
+        from pymongo.errors import BulkWriteError
+        pending = [requests]
+
+        def cmd():
+            try:
+                return self.mongo.mongo_db[collection].bulk_write(pending[0], ordered=False)
+            except BulkWriteError as ex:
+                write_errors = ex.details.get("writeErrors", []) if ex.details else []
+                if not write_errors:
+                    # only a write concern error: the requests were applied (but their replication wasn't confirmed)
+                    console.print("ignoring mongo-db write concern error: collection={}, ex={}".format(collection, ex))
+                    return ex.details
+
+                pending[0] = [pending[0][we["index"]] for we in write_errors]
+                raise
+
+        return cmd
+
 class MongoDB():
     '''
     We use MongoDB to provide fast query access to a large collection of run data.
@@ -42,6 +110,15 @@ class MongoDB():
 
         self.run_cache_dir = os.path.expanduser(run_cache_dir) if run_cache_dir else None
 
+        # local cache of run summaries (off until enabled by set_run_cache_options)
+        self.run_cache = None
+
+        # create/start times of runs created or started by this process (so durations can be computed without a read)
+        self.run_times = {}
+
+        # workspaces whose "parent_name" index has been ensured by this process
+        self.parent_indexes = set()
+
         # initialize mondo-db now
         self.init_mongo_db_connection()
 
@@ -65,6 +142,13 @@ class MongoDB():
                 # this will create the mongo database called "xtdb", if needed
                 self.mongo_db = self.mongo_client["xtdb"]
 
+    def set_run_cache_options(self, enabled, max_mb=None):
+        ''' enable/disable the local, incrementally synced cache of workspace run summaries (see get_all_runs). '''
+        if enabled and self.run_cache_dir:
+            self.run_cache = run_cache.RunCache(self.run_cache_dir, max_mb)
+        else:
+            self.run_cache = None
+
     def get_mongo_info(self):
         cursor = self.mongo_with_retries("get_mongo_info", lambda: self.mongo_db[MONGO_INFO].find({"_id": 1}, None))
         records = list(cursor) if cursor else [] 
@@ -141,7 +225,8 @@ class MongoDB():
         last_id = utils.safe_cursor_value(cursor, "last_id")
         return last_id
 
-    def get_next_sequential_ws_id(self, ws_name, path, default_next_run):
+    def get_next_sequential_ws_id(self, ws_name, path, default_next_run, count=1):
+        ''' allocate the next 'count' ids of the 'path' counter of the workspace (with a single $inc); returns the first one '''
         db = self.mongo_db
 
         assert not "/" in ws_name 
@@ -161,13 +246,13 @@ class MongoDB():
             info = {"_id": ws_name, "next_run": default_next_run, "next_end": default_next_end, "next_child": {}}
             db.ws_counters.insert_one( info )
 
-        document = db.ws_counters.find_and_modify( {"_id": ws_name}, update={"$inc": {path: 1} }, new=False)
+        document = db.ws_counters.find_and_modify( {"_id": ws_name}, update={"$inc": {path: count} }, new=False)
         next_id = utils.safe_nested_value(document, path)
 
         if not next_id:
             # child id's start at 0; if we got that, skip it and get next one
             document = db.ws_counters.find_and_modify( {"_id": ws_name}, update={"$inc": {path: 1} }, new=False)
-            next_id = utils.safe_nested_value(document, path)
+            next_id = 1 if count > 1 else utils.safe_nested_value(document, path)
      
         return next_id
 
@@ -177,6 +262,11 @@ class MongoDB():
     def get_next_run_id(self, ws_name, default_next=1):
         return self.get_next_sequential_ws_id(ws_name, "next_run", default_next)
 
+    def reserve_run_ids(self, ws_name, count, default_next=1):
+        ''' reserve a contiguous block of 'count' run ids (with a single counter update); returns the list of ids '''
+        first_id = self.get_next_sequential_ws_id(ws_name, "next_run", default_next, count=count)
+        return list(range(first_id, first_id + count))
+
     def get_next_child_id(self, ws_name, run_name, default_next=1):
         return self.get_next_sequential_ws_id(ws_name, "next_child." + run_name, default_next)
 
@@ -184,13 +274,20 @@ class MongoDB():
         return self.get_next_sequential_ws_id(ws_name, "next_end", default_next_run)
 
     def mongo_with_retries(self, name, mongo_cmd, ignore_error=False):
+        '''
+        run mongo_cmd, paced by the process-wide adaptive rate limiter.  failed requests are retried with
+        jittered exponential backoff (per error class), honoring any retry-after hint from Cosmos DB.
+        '''
         retry_count = 25
         result = None
-        import pymongo.errors
+        limiter = mongo_rate_limiter.get_limiter()
 
         for i in range(retry_count):
+            limiter.acquire()
+
             try:
                 result = mongo_cmd()
+                limiter.on_success()
                 break
             # watch out for these exceptions: AutoReconnect, OperationFailure (and ???)
             except BaseException as ex:   # pymongo.errors.OperationFailure as ex:
@@ -202,34 +299,78 @@ class MongoDB():
                 if ignore_error:
                     console.print("ignoring mongo-db error: name={}, ex={}".format(name, ex))
                     break
+
+                error_class, backoff = limiter.on_error(name, ex, i)
                 
-                if i == retry_count-1:
+                if error_class == mongo_rate_limiter.FATAL or i == retry_count-1:
                     # we couldn't recover - signal a hard error/failure
                     raise ex
 
-                # we get hit hard on the "Request rate is large" errors when running 
-                # large jobs (500 simultaneous runs), so beef up the backoff times to
-                # [1,61] so we don't die with a hard failure here
                 if i == 0:
-                    backoff = 1 + 10*np.random.random()
                     self.retry_errors += 1
-                else:
-                    backoff = 1 + 60*np.random.random()
 
                 ex_code = ex.code if hasattr(ex, "code") else ""
                 ex_msg = str(ex)[0:60]+"..."
 
-                console.print("retrying mongo-db: name={}, retry={}/{}, backoff={:.2f}, ex.code={}, ex.msg={}".format(name, i+1, retry_count, backoff, 
-                    ex_code, ex_msg))
+                console.print("retrying mongo-db: name={}, retry={}/{}, class={}, backoff={:.2f}, ex.code={}, ex.msg={}".format(name, 
+                    i+1, retry_count, error_class, backoff, ex_code, ex_msg))
                     
                 time.sleep(backoff)
                 
         return result
 
+    def get_retry_metrics(self):
+        ''' return the request/retry/throttling metrics of the (process-wide) mongo-db rate limiter '''
+        return mongo_rate_limiter.get_limiter().get_metrics()
+
     #---- RUNS ----
 
     def create_mongo_run(self, dd):
         # create run document on Mongo DB
+        run_doc = self._make_run_doc(dd)
+        ws_name = dd["ws"]
+
+        cmd = lambda: self.mongo_db[ws_name].insert_one(run_doc)
+        self.mongo_with_retries("create_mongo_run", cmd, ignore_error=True)
+
+        if "create_time" in run_doc:
+            self.run_times[(ws_name, run_doc["_id"])] = {"create_time": run_doc["create_time"]}
+
+    def create_mongo_runs(self, ws_name, dds, log_records_list):
+        '''
+        bulk version of create_mongo_run + add_run_events: insert the documents of a set of runs (each with its initial
+        log records) with a single insert_many(), and set the run properties implied by the records with one bulk_write().
+        '''
+        run_docs = []
+        batch = MongoWriteBatch(self)
+
+        for dd, log_records in zip(dds, log_records_list):
+            run_doc = self._make_run_doc(dd)
+            run_doc["log_records"] = log_records
+            run_docs.append(run_doc)
+
+            updates = self.get_event_updates(log_records)
+            if updates:
+                batch.update(ws_name, run_doc["_id"], set_dd=updates)
+
+            if "create_time" in run_doc:
+                self.run_times[(ws_name, run_doc["_id"])] = {"create_time": run_doc["create_time"]}
+
+        if run_docs:
+            # unordered: a run that already exists doesn't block the others
+            cmd = lambda: self.mongo_db[ws_name].insert_many(run_docs, ordered=False)
+            self.mongo_with_retries("create_mongo_runs", cmd, ignore_error=True)
+
+        batch.flush("create_mongo_runs")
+
+    def get_existing_run_names(self, ws_name, run_names):
+        ''' return the subset of 'run_names' that already have a run document (with a single query) '''
+        cmd = lambda: self.mongo_db[ws_name].find( {"_id": {"$in": run_names}}, {"_id": 1})
+        cursor = self.mongo_with_retries("get_existing_run_names", cmd)
+
+        return [doc["_id"] for doc in cursor]
+
+    def _make_run_doc(self, dd):
         # copy standard CREATE properties
         run_doc = copy.deepcopy(dd)
 
@@ -247,11 +388,32 @@ class MongoDB():
         run_doc["status"] = "allocating" if is_azure else "created"
         run_doc["duration"] = 0
         
-        # add the new RUN document
-        ws_name = dd["ws"]
+        return run_doc
 
-        cmd = lambda: self.mongo_db[ws_name].insert_one(run_doc)
-        self.mongo_with_retries("create_mongo_run", cmd, ignore_error=True)
+    def add_child_run(self, ws_name, parent_run_name, child_name):
+        '''
+        record the creation of a child run on its parent with a constant-size update (a count, not a log record).  
+        The children of a parent are found thru the (indexed) "parent_name" property of their run documents.
+        '''
+        self.ensure_parent_index(ws_name)
+
+        # last_time changes, so the parent's summary is refetched by run caches (see RunCache.get_runs)
+        update_doc = {"$inc": {"child_count": 1}, "$set": {"last_child": child_name, "last_time": utils.get_time()}}
+        cmd = lambda: self.mongo_db[ws_name].update_one({"_id": parent_run_name}, update_doc)
+        self.mongo_with_retries("add_child_run", cmd)
+
+    def ensure_parent_index(self, ws_name):
+        if not ws_name in self.parent_indexes:
+            cmd = lambda: self.mongo_db[ws_name].create_index("parent_name")
+            self.mongo_with_retries("ensure_parent_index", cmd, ignore_error=True)
+            self.parent_indexes.add(ws_name)
+
+    def get_child_run_names(self, ws_name, parent_run_name):
+        cmd = lambda: self.mongo_db[ws_name].find({"parent_name": parent_run_name}, {"_id": 1})
+        cursor = self.mongo_with_retries("get_child_run_names", cmd)
+
+        child_names = [doc["_id"] for doc in cursor] if cursor else []
+        return child_names
 
     def add_run_event(self, ws_name, run_name, log_record):
 
@@ -283,11 +445,65 @@ class MongoDB():
             #console.print("updating run STATUS=", updates)
             self.update_mongo_run_from_dict(ws_name, run_name, updates)
 
+    def add_run_events(self, ws_name, run_name, log_records, updates=None):
+        '''
+        batched version of add_run_event: push all log_records and set the related run properties
+        with a single update operation.
+        '''
+        update_dd = self.get_event_updates(log_records, updates)
+        update_dd["last_time"] = utils.get_time()
+        update_doc = { "$set": update_dd }
+
+        if log_records:
+            update_doc["$push"] = {"log_records": {"$each": log_records}}
+
+        self.mongo_with_retries("add_run_events", lambda: self.mongo_db[ws_name].update_one( {"_id": run_name}, update_doc, upsert=True) )
+
+    def get_event_updates(self, log_records, updates=None):
+        ''' return the run properties ($set updates) implied by the log records, merged with 'updates' '''
+        update_dd = dict(updates) if updates else {}
+
+        # later records overwrite earlier ones, so the run props reflect the most recent values
+        for log_record in log_records:
+            event_name = log_record["event"]
+            data_dict = log_record["data"]
+
+            if event_name == "hparams":
+                self.flatten_dict_update(update_dd, "hparams", data_dict)
+
+            elif event_name == "metrics":
+                self.flatten_dict_update(update_dd, "metrics", data_dict)
+
+            elif event_name == "started":
+                update_dd["status"] = "running"
+
+            elif event_name == "status-change":
+                update_dd["status"] = data_dict["status"]
+
+        return update_dd
+
+    def add_runs_event(self, ws_name, run_names, log_record):
+        ''' add the same log record to a set of runs (and set the implied run properties) with one bulk_write() '''
+        batch = MongoWriteBatch(self)
+
+        set_dd = self.get_event_updates([log_record])
+        set_dd["last_time"] = utils.get_time()
+
+        for run_name in run_names:
+            batch.update(ws_name, run_name, set_dd=set_dd, push_dd={"log_records": log_record}, upsert=True)
+
+        batch.flush("add_runs_event")
+
     def flatten_dict_update(self, updates, dd_name, dd):
         for key, value in dd.items():
             updates[dd_name + "." + key] = value
 
-    def update_mongo_run_at_end(self, ws_name, run_name, status, exit_code, restarts, end_time, log_records, hparams, metrics):
+    def update_mongo_run_at_end(self, ws_name, run_name, status, exit_code, restarts, end_time, log_records, hparams, metrics,
+        ended_record=None):
+        '''
+        set the end-of-run properties of the run.  if specified, 'ended_record' (the "ended" log record) is 
+        appended to the run's log_records in the same update.
+        '''
         # update run document on Mongo DB
         #run_doc = self.mongo_db[ws_name].find_one( {"_id": run_name} )
         # update properties
@@ -312,7 +528,13 @@ class MongoDB():
         # no longer need this step here (log records are now appended as they are logged)
         #updates["log_records"] = log_records
 
-        self.update_mongo_run_from_dict(ws_name, run_name, updates)
+        if ended_record:
+            updates["last_time"] = utils.get_time()
+            update_doc = {"$set": updates, "$push": {"log_records": ended_record}}
+
+            self.mongo_with_retries("update_mongo_run_at_end", lambda: self.mongo_db[ws_name].update_one( {"_id": run_name}, update_doc) )
+        else:
+            self.update_mongo_run_from_dict(ws_name, run_name, updates)
 
     def update_mongo_run_from_dict(self, ws_name, run_name, dd):
         #console.print("update_mongo_run_from_dict: ws_name={}, run_name={}, dd={}".format(ws_name, run_name, dd))
@@ -356,79 +578,60 @@ class MongoDB():
 
     def get_ws_runs(self, ws_name, filter_dict=None, include_log_records=False, first_count=None, last_count=None, sort_dict=None):
         '''
-        design issue: we cannot use a single cache file for different filter requests.  Possible fixes:
-            - do not cache here (current option)
-            - name cache by filter settings (one cache file per setting) - not ideal
-            - keep all runs for ws in cache and apply filter locally (TODO: this option)
+        when the run cache is enabled, all run summaries for the ws are kept in the local cache and the filter is applied locally.
+        log_records are never cached, so requests for them always go to mongo-db.
         '''
         if include_log_records:
             fields_dict = {"log_records": 1}
-            fn_cache = self.run_cache_dir + "/" + constants.ALL_RUNS_CACHE_FN
         else:
             fields_dict = {"log_records": 0}
-            fn_cache = self.run_cache_dir + "/" + constants.RUN_SUMMARY_CACHE_FN
-
-        fn_cache = fn_cache.replace("$aggregator", ws_name)
 
-        return self.get_all_runs(None, ws_name, None, filter_dict, fields_dict, use_cache=False, fn_cache=fn_cache, first_count=first_count, 
-            last_count=last_count, sort_dict=sort_dict)
+        return self.get_all_runs(None, ws_name, None, filter_dict, fields_dict, use_cache=not include_log_records, 
+            first_count=first_count, last_count=last_count, sort_dict=sort_dict)
 
     def get_all_runs(self, aggregator_dest, ws_name, job_or_exper_name, filter_dict=None, fields_dict=None, use_cache=True, 
-        fn_cache=None, first_count=None, last_count=None, sort_dict=None):
+        fn_cache=None, first_count=None, last_count=None, sort_dict=None, rebuild_cache=False):
         '''
         cache design: 
-            - organized all cached run information by the way it was accessed: a folder for each workspace (created on demand), 
-              and under each, a folder specifying the filter_dict and fields_dict.  This way, we only use cache records for
-              exactly matching query info.
+            - when self.run_cache is set (see set_run_cache_options), the summary (non log_records) part of every run in 
+              the workspace is kept in a local cache file.  Each call only fetches the runs that have ended since the 
+              cached "end_id" watermark and the unfinished runs whose "last_time" has changed (see RunCache.get_runs).
 
-            - whenever sort, first_count, or last_count is used (that is, included in the mongo db query), we should set "use_cache" to False.
+            - filter_dict and fields_dict are then applied locally, so a single cache serves all filter requests.
+
+            - requests that include log_records, or use filter operators we can't evaluate locally, go directly to mongo-db.
 
             - note: since Azure Cosmos version of mongo-db doesn't correctly support sort/first/last (totally busted as of Aug 2019), we never
               include sort/first/last in mongo db query.
 
-            - as of 12/20/2019, the only code that correctly uses the fn_cache is hparam_search.  all other code should call with use_cache=False.
+            - 'fn_cache' is no longer used (kept for API compatibility).
         '''
         # PERF-critical function 
-        # below code not yet cache-compliant
-        use_cache = False
-
-        records = []
-        target = 0
-        cache = None
-
-        if use_cache and not fn_cache:
-            # fn_cache = self.run_cache_dir + "/" + constants.ALL_RUNS_CACHE_FN
-            # fn_cache = fn_cache.replace("$aggregator", ws_name)
-            use_cache = False      # play it safe for now
-
-        if use_cache and os.path.exists(fn_cache):
-            # read CACHED runs
-            started = time.time()
-            cache = utils.load(fn_cache)
-            elapsed = time.time() - started
-
-            target = max([rec["end_id"] if "end_id" in rec else 0 for rec in cache])
-            console.print("loaded {:,} records in {:.2f} secs from cache: {}".format(len(cache), elapsed, fn_cache))
-
         if not filter_dict:
+            filter_dict = {}
             if aggregator_dest == "job":
                 filter_dict = {"job_id": job_or_exper_name}
             elif aggregator_dest == "experiment":
                 filter_dict = {"exper_name": job_or_exper_name}
 
-        # if not fields_dict:
-        #     # by default, do NOT return inner log records
-        #     fields_dict = {"log_records": 0}
+        if use_cache and self.run_cache and not self.wants_log_records(fields_dict):
+            started = time.time()
+            cached_runs = self.run_cache.get_runs(self, ws_name, rebuild=rebuild_cache)
+
+            try:
+                records = [run_cache.project_fields(doc, fields_dict) for doc in cached_runs 
+                    if run_cache.match_filter(doc, filter_dict)]
+                
+                elapsed = time.time() - started
+                console.diag("  run cache returned {} records (of {}), took: {:2f} secs".format(len(records), len(cached_runs), elapsed))
+                return records
 
-        # adjust filter to get only missing records
-        if target:
-            filter_dict["end_id"] = {"$gt": target}
+            except run_cache.UnsupportedFilter as ex:
+                console.diag("  run cache cannot evaluate filter operator: {}; using mongo-db query".format(ex))
 
         #console.print("  mongo: filter: {}, fields: {}, sort: {}".format(filter_dict, fields_dict, sort_dict))
         console.diag("  mongo: filter: {}, fields: {}".format(filter_dict, fields_dict))
 
-        # limit query to avoid "message max exceeded" errors
-        max_query_records = 3000  
         started = time.time()
 
         #records = self.mongo_db[ws_name].find(filter_dict, fields_dict)  
@@ -440,47 +643,19 @@ class MongoDB():
         #   - sort of "test-acc" returns 0 records (if ANY missing values, NO records returned)
         #   - docs say pass a dict, but code wants list of 2-tuples (pymongo library)
 
-        # if sort_dict:
-        #     items = list(sort_dict.items())
-        #     key, value = items[0]
-        #     import pymongo
-        #     cursor = cursor.sort("job", 1)  # key, value)
-
-        # adjust cursor per first_count, last_count
-
-        # because SORT is busted, we can't use mongo for first/last either
-        # if last_count:
-        #     if last_count is True:
-        #         last_count = 25
-        #     avail = cursor.count()
-        #     skip_count = avail - last_count
-        #     if skip_count > 0:
-        #         cursor = cursor.skip(skip_count)
-        # elif first_count:
-        #     if first_count is True:
-        #         first_count = 25
-        #     cursor = cursor.limit(first_count)
-
         records = list(cursor)
 
-        return_count = len(records)
-        total_count = self.mongo_db[ws_name].count()
-
         elapsed = time.time() - started
-        console.diag("  mongo query returned {} records (of {}), took: {:2f} secs".format(return_count, total_count, elapsed))
+        console.diag("  mongo query returned {} records, took: {:2f} secs".format(len(records), elapsed))
 
-        if cache:
-            cache += records
-            records = cache
+        return records
 
-        if return_count and use_cache:
-            # write to cache 
-            started = time.time()
-            utils.save(records, fn_cache)
-            elapsed = time.time() - started
-            console.print("wrote {:,} records to cache, took: {:2f} secs".format(len(records), elapsed))
+    def wants_log_records(self, fields_dict):
+        if not fields_dict:
+            # an empty projection returns the full document
+            return True
 
-        return records
+        return bool(fields_dict.get("log_records", not any(fields_dict.values())))
 
     def update_run_info(self, ws_name, run_id, dd, clear=False, upsert=True):
         if clear:
@@ -491,6 +666,9 @@ class MongoDB():
         # update, create prop if needed
         self.mongo_with_retries("update_run_info", lambda: self.mongo_db[ws_name].update_one( {"_id": run_id}, update_doc, upsert=upsert) )
 
+        if self.run_cache:
+            self.run_cache.mark_stale(ws_name, {"_id": run_id})
+
     def update_runs_from_filter(self, ws_name, filter, dd, clear=False, upsert=True):
         if clear:
             update_doc = { "$unset": dd}
@@ -499,6 +677,10 @@ class MongoDB():
 
         # update, create prop if needed
         result = self.mongo_with_retries("update_runs_from_filter", lambda: self.mongo_db[ws_name].update_many( filter, update_doc, upsert=upsert) )
+
+        if self.run_cache:
+            self.run_cache.mark_stale(ws_name, filter)
+
         return result
 
     #---- JOBS ----
@@ -578,10 +760,8 @@ class MongoDB():
             - increment the job's "running_nodes" property
             - set the "job_status" property to "running"
         '''
-        cmd = lambda: self.mongo_db["__jobs__"].find_and_modify( {"_id": job_id}, update={"$inc": {"running_nodes": 1} })
-        self.mongo_with_retries("job_node_start", cmd)
-
-        cmd = lambda: self.mongo_db["__jobs__"].find_and_modify( {"_id": job_id}, update={"$set": {"job_status": "running"} })
+        update = {"$inc": {"running_nodes": 1}, "$set": {"job_status": "running"}}
+        cmd = lambda: self.mongo_db["__jobs__"].update_one( {"_id": job_id}, update)
         self.mongo_with_retries("job_node_start", cmd)
 
     def job_node_exit(self, job_id):
@@ -590,11 +770,14 @@ class MongoDB():
             - decrement the job's "running_nodes" property 
             - if running_nodes==0, set the "job_status" property to "completed"
         '''
-        cmd = lambda: self.mongo_db["__jobs__"].find_and_modify( {"_id": job_id}, update={"$inc": {"running_nodes": -1} })
-        self.mongo_with_retries("job_node_exit", cmd)
+        cmd = lambda: self.mongo_db["__jobs__"].find_and_modify( {"_id": job_id}, update={"$inc": {"running_nodes": -1} }, 
+            fields={"running_nodes": 1}, new=True)
+        doc = self.mongo_with_retries("job_node_exit", cmd)
 
-        cmd = lambda: self.mongo_db["__jobs__"].find_and_modify( {"_id": job_id, "running_nodes": 0}, update={"$set": {"job_status": "completed"} })
-        self.mongo_with_retries("job_node_exit", cmd)
+        # only the last node to exit needs the 2nd (conditional) update
+        if not doc or doc.get("running_nodes", 0) <= 0:
+            cmd = lambda: self.mongo_db["__jobs__"].find_and_modify( {"_id": job_id, "running_nodes": 0}, update={"$set": {"job_status": "completed"} })
+            self.mongo_with_retries("job_node_exit", cmd)
 
     def update_connect_info_by_node(self, job_id, node_id, connect_info):
         key = "connect_info_by_node." + node_id
@@ -606,8 +789,9 @@ class MongoDB():
         A job's run has started running.  We need to:
             - increment the job's "running_runs" property 
         '''
-        cmd = lambda: self.mongo_db["__jobs__"].find_and_modify( {"_id": job_id}, update={"$inc": {"running_runs": 1} })
-        self.mongo_with_retries("job_run_start", cmd)
+        batch = MongoWriteBatch(self)
+        self.add_job_run_start(batch, job_id)
+        batch.flush("job_run_start")
 
     def job_run_exit(self, job_id, exit_code):
         '''
@@ -616,9 +800,9 @@ class MongoDB():
             - increment the job's "completed_runs" property
             - if exit_code != 0, increment the job's "error_runs" property
         '''
-        error_inc = 1 if exit_code else 0
-        cmd = lambda: self.mongo_db["__jobs__"].find_and_modify( {"_id": job_id}, update={"$inc": {"running_runs": -1, "completed_runs": 1, "error_runs": error_inc} })
-        self.mongo_with_retries("job_run_exit", cmd)
+        batch = MongoWriteBatch(self)
+        self.add_job_run_exit(batch, job_id, exit_code)
+        batch.flush("job_run_exit")
 
     def run_start(self, ws_name, run_name):
         '''
@@ -626,43 +810,93 @@ class MongoDB():
             - set the run "start_time" property to NOW
             - set the run "queue_duration" property to NOW - created_time
         '''
+        batch = MongoWriteBatch(self)
+        self.add_run_start(batch, ws_name, run_name)
+        batch.flush("run_start")
+
+    def run_exit(self, ws_name, run_name):
+        '''
+        A run has finished running.  We need to:
+            - set the run "run_duration" property to NOW - start_time
+        '''
+        batch = MongoWriteBatch(self)
+        self.add_run_exit(batch, ws_name, run_name)
+        batch.flush("run_exit")
+
+    def run_lifecycle_start(self, ws_name, run_name, job_id, node_start=False):
+        '''
+        combines run_start, job_run_start and (optionally) job_node_start into 1 write per collection.
+        '''
+        batch = MongoWriteBatch(self)
+        self.add_run_start(batch, ws_name, run_name)
+        self.add_job_run_start(batch, job_id)
+
+        if node_start:
+            batch.update("__jobs__", job_id, set_dd={"job_status": "running"}, inc_dd={"running_nodes": 1})
+
+        batch.flush("run_lifecycle_start")
+
+    def run_lifecycle_exit(self, ws_name, run_name, job_id, exit_code, is_parent=False):
+        '''
+        combines run_exit and job_run_exit (for child/single runs) into 1 write per collection.
+        '''
+        batch = MongoWriteBatch(self)
+        self.add_run_exit(batch, ws_name, run_name)
+
+        if not is_parent:
+            self.add_job_run_exit(batch, job_id, exit_code)
+
+        batch.flush("run_lifecycle_exit")
+
+    def add_job_run_start(self, batch, job_id):
+        batch.update("__jobs__", job_id, inc_dd={"running_runs": 1})
+
+    def add_job_run_exit(self, batch, job_id, exit_code):
+        error_inc = 1 if exit_code else 0
+        batch.update("__jobs__", job_id, inc_dd={"running_runs": -1, "completed_runs": 1, "error_runs": error_inc})
+
+    def get_run_time(self, ws_name, run_name, prop_name):
+        ''' return the create_time or start_time of the run (from our local cache, when possible) '''
+        times = self.run_times.get((ws_name, run_name), {})
+
+        if not prop_name in times:
+            cmd = lambda: self.mongo_db[ws_name].find({"_id": run_name}, {prop_name: 1})
+            cursor = self.mongo_with_retries("get_run_time", cmd)
+
+            value = utils.safe_cursor_value(cursor, prop_name)
+            if value:
+                times[prop_name] = value
+                self.run_times[(ws_name, run_name)] = times
+
+        return times.get(prop_name)
+
+    def add_run_start(self, batch, ws_name, run_name):
         now = arrow.now()
         now_str = str(now)
 
         # get create_time of run
-        cmd = lambda: self.mongo_db[ws_name].find({"_id": run_name}, {"create_time": 1})
-        cursor = self.mongo_with_retries("run_start", cmd)
-
-        doc = cursor.next()
-        if doc and "create_time" in doc:
-            create_time_str = doc["create_time"]
+        create_time_str = self.get_run_time(ws_name, run_name, "create_time")
+        if create_time_str:
             create_time = arrow.get(create_time_str)
 
             # compute time in "queue" 
             queue_duration = utils.time_diff(now, create_time)
 
-            cmd = lambda: self.mongo_db[ws_name].find_and_modify( {"_id": run_name}, update={"$set": {"start_time": now_str, "queue_duration": queue_duration} })
-            self.mongo_with_retries("run_start", cmd)
+            batch.update(ws_name, run_name, set_dd={"start_time": now_str, "queue_duration": queue_duration})
+            self.run_times.setdefault((ws_name, run_name), {})["start_time"] = now_str
 
-    def run_exit(self, ws_name, run_name):
-        '''
-        A run has finished running.  We need to:
-            - set the run "run_duration" property to NOW - start_time
-        '''
+    def add_run_exit(self, batch, ws_name, run_name):
         now = arrow.now()
-        now_str = str(now)
 
         # get start_time of run
-        cmd = lambda: self.mongo_db[ws_name].find({"_id": run_name}, {"start_time": 1})
-        cursor = self.mongo_with_retries("run_exit", cmd)
-
-        doc = cursor.next()
-        if doc and "start_time" in doc:
-            start_time_str = doc["start_time"]
+        start_time_str = self.get_run_time(ws_name, run_name, "start_time")
+        if start_time_str:
             start_time = arrow.get(start_time_str)
 
             # compute run_duration 
             run_duration = utils.time_diff(now, start_time)
 
-            cmd = lambda: self.mongo_db[ws_name].find_and_modify( {"_id": run_name}, update={"$set": {"run_duration": run_duration} })
-            self.mongo_with_retries("run_exit", cmd)
+            batch.update(ws_name, run_name, set_dd={"run_duration": run_duration})
+
+        # run has ended; don't need its times anymore
+        self.run_times.pop((ws_name, run_name), None)
@@ -0,0 +1,78 @@
+#
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+#
+# mongo_hp_suggestions.py: mongo functions for the job-level queue of pre-generated hyperparameter sets
+import uuid
+import logging
+
+from xtlib import utils
+from xtlib import constants
+
+from xtlib.console import console
+
+logger = logging.getLogger(__name__)
+
+# when the job document has more suggestions than this, the claimed ones are removed (unclaimed ones are never dropped)
+MAX_SUGGESTIONS = 1000
+
+class MongoHpSuggestions():
+    '''
+    Goal: let all nodes of a dynamic hyperparameter search share batches of pre-generated hyperparameter
+    sets (suggestions), stored in the "hp_suggestions" array of the job document.  A node claims a suggestion
+    with a single atomic update, and claimed suggestions are removed when the array grows past MAX_SUGGESTIONS.
+    '''
+    def __init__(self, mongo, job_id, node_id):
+        self.mongo = mongo
+        self.job_id = job_id
+        self.node_id = node_id
+
+    def claim_suggestion(self, run_name):
+        '''
+        atomically claim the first unclaimed suggestion for run_name.  returns its arg_dict (or None if there are
+        no unclaimed suggestions).
+        '''
+        fd = {"_id": self.job_id, "hp_suggestions": {"$elemMatch": {"status": constants.UNSTARTED}}}
+
+        # mongodb workaround: since $ projection operator not working with find_and_modify(),
+        # we add a unique id (guid) so we know which element we have updated
+        guid = str(uuid.uuid4())
+
+        ud = {"hp_suggestions.$.status": constants.STARTED, "hp_suggestions.$.run_name": run_name,
+            "hp_suggestions.$.node_id": self.node_id, "hp_suggestions.$.guid": guid}
+
+        cmd = lambda: self.mongo.mongo_db["__jobs__"].find_and_modify(fd, update={"$set": ud}, fields={"hp_suggestions": 1}, 
+            new=True)
+        result = self.mongo.mongo_with_retries("claim_suggestion", cmd)
+
+        arg_dict = None
+        if result:
+            entry = utils.find_by_property(result["hp_suggestions"], "guid", guid)
+            if entry:
+                arg_dict = entry["arg_dict"]
+                console.print("claimed hp suggestion: run_name={}, arg_dict={}".format(run_name, arg_dict))
+
+        return arg_dict
+
+    def add_suggestions(self, run_name, arg_dict, shared_arg_dicts):
+        '''
+        add a batch of suggestions to the job document (in a single update): 'arg_dict' is recorded as already claimed
+        by run_name, and 'shared_arg_dicts' are left for other runs (on any node) to claim.
+        '''
+        entries = [{"status": constants.STARTED, "run_name": run_name, "node_id": self.node_id,
+            "arg_dict": arg_dict, "created": utils.get_time()}]
+
+        for dd in shared_arg_dicts:
+            entry = {"status": constants.UNSTARTED, "run_name": None, "node_id": None,
+                "arg_dict": dd, "created": utils.get_time()}
+            entries.append(entry)
+
+        update = {"$push": {"hp_suggestions": {"$each": entries}}}
+        cmd = lambda: self.mongo.mongo_db["__jobs__"].update_one({"_id": self.job_id}, update)
+        self.mongo.mongo_with_retries("add_suggestions", cmd)
+
+        # if the array has grown past MAX_SUGGESTIONS, remove the claimed suggestions (unclaimed ones are kept)
+        fd = {"_id": self.job_id, "hp_suggestions.{}".format(MAX_SUGGESTIONS): {"$exists": True}}
+        update = {"$pull": {"hp_suggestions": {"status": constants.STARTED}}}
+        cmd = lambda: self.mongo.mongo_db["__jobs__"].update_one(fd, update)
+        self.mongo.mongo_with_retries("trim_suggestions", cmd)
@@ -0,0 +1,148 @@
+#
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+#
+# mongo_rate_limiter.py: process-wide adaptive (AIMD) rate limiter and retry policy for mongo-db requests
+import re
+import time
+import random
+from threading import Lock
+
+# error classes (each has its own backoff policy)
+THROTTLED = "throttled"
+NETWORK = "network"
+OTHER = "other"
+FATAL = "fatal"
+
+# (base secs, max secs) for jittered exponential backoff, by error class
+BACKOFF_POLICY = {THROTTLED: (.25, 30), NETWORK: (1, 60), OTHER: (1, 60)}
+
+# Cosmos DB returns this code for "Request rate is large" (429)
+THROTTLE_CODES = [16500, 429]
+
+RETRY_AFTER_PATTERN = re.compile(r"RetryAfterMs=(\d+)", re.IGNORECASE)
+
+class MongoRateLimiter():
+    '''
+    A token bucket shared by all threads of a process, whose rate is adjusted with AIMD: each successful
+    request adds 'increase' ops/sec (up to max_rate); each throttled request halves the rate (down to min_rate).
+    This keeps us near the provisioned RU budget, instead of bursting until throttled and then sleeping.
+    '''
+    def __init__(self, initial_rate=100, min_rate=1, max_rate=2000, increase=.5, decrease=.5):
+        self.rate = float(initial_rate)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+
+        self.tokens = 1.0
+        self.last_refill = time.time()
+        self.lock = Lock()
+
+        # metrics
+        self.requests = 0
+        self.retries = 0
+        self.retries_by_class = {}
+        self.retries_by_name = {}
+        self.throttled_secs = 0
+        self.wait_secs = 0
+
+    def acquire(self):
+        ''' wait until a request can be sent at the current rate '''
+        while True:
+            with self.lock:
+                now = time.time()
+                capacity = max(1.0, self.rate)     # allow bursts of up to 1 sec of requests
+
+                self.tokens = min(capacity, self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    self.requests += 1
+                    return
+
+                wait = (1 - self.tokens) / self.rate
+                self.wait_secs += wait
+
+            time.sleep(wait)
+
+    def on_success(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_error(self, name, ex, attempt):
+        '''
+        record a failed request and return (error_class, backoff secs) for the next attempt.
+        '''
+        error_class = classify_error(ex)
+        if error_class == FATAL:
+            return error_class, 0
+
+        base, cap = BACKOFF_POLICY[error_class]
+
+        # full jitter: random value between 0 and the exponential backoff limit
+        backoff = random.uniform(0, min(cap, base * 2**attempt))
+
+        retry_after = get_retry_after(ex)
+        if retry_after:
+            # wait at least as long as the server asked us to
+            backoff = max(backoff, retry_after * (1 + .2*random.random()))
+
+        with self.lock:
+            if error_class == THROTTLED:
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+                self.tokens = min(self.tokens, 0)
+                self.throttled_secs += backoff
+
+            self.retries += 1
+            self.retries_by_class[error_class] = 1 + self.retries_by_class.get(error_class, 0)
+            self.retries_by_name[name] = 1 + self.retries_by_name.get(name, 0)
+
+        return error_class, backoff
+
+    def get_metrics(self):
+        with self.lock:
+            return {"requests": self.requests, "retries": self.retries, "rate": self.rate,
+                "throttled_secs": self.throttled_secs, "wait_secs": self.wait_secs,
+                "retries_by_class": dict(self.retries_by_class), "retries_by_name": dict(self.retries_by_name)}
+
+def classify_error(ex):
+    if isinstance(ex, (KeyboardInterrupt, SystemExit)):
+        return FATAL
+
+    import pymongo.errors
+
+    if isinstance(ex, pymongo.errors.DuplicateKeyError):
+        return FATAL
+
+    code = getattr(ex, "code", None)
+    if code in THROTTLE_CODES or "request rate is large" in str(ex).lower():
+        return THROTTLED
+
+    if isinstance(ex, (pymongo.errors.AutoReconnect, pymongo.errors.NetworkTimeout, pymongo.errors.ConnectionFailure,
+        pymongo.errors.ServerSelectionTimeoutError)):
+        return NETWORK
+
+    return OTHER
+
+def get_retry_after(ex):
+    ''' return the retry-after hint (in secs) from a Cosmos DB error, or None '''
+    texts = [str(ex)]
+
+    details = getattr(ex, "details", None)
+    if isinstance(details, dict):
+        texts.append(str(details.get("errmsg", "")))
+
+    for text in texts:
+        match = RETRY_AFTER_PATTERN.search(text)
+        if match:
+            return int(match.group(1)) / 1000
+
+    return None
+
+# one limiter per process (shared by all MongoDB instances and threads)
+limiter = MongoRateLimiter()
+
+def get_limiter():
+    return limiter
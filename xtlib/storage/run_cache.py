@@ -0,0 +1,379 @@
+#
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+#
+# run_cache.py: local, incrementally synced cache of the run summary documents of a workspace
+import os
+import re
+import time
+
+from xtlib import constants
+from xtlib import file_utils
+from xtlib.console import console
+
+class UnsupportedFilter(Exception):
+    ''' raised when a mongo filter cannot be evaluated locally '''
+    pass
+
+MISSING = object()
+
+SWEEP_SECS = 5*60       # how often the "last_time" of every run (not just unfinished ones) is compared
+RESYNC_SECS = 60*60     # how often all runs are refetched (for changes by other clients that don't update "last_time")
+
+def get_path_value(doc, path):
+    value = doc
+    for part in path.split("."):
+        if isinstance(value, dict) and part in value:
+            value = value[part]
+        else:
+            return MISSING
+    return value
+
+def _compare(value, target, op):
+    try:
+        if op == "$gt":
+            return value > target
+        if op == "$gte":
+            return value >= target
+        if op == "$lt":
+            return value < target
+        return value <= target
+    except TypeError:
+        # like mongo, values of different types never match a relational operator
+        return False
+
+def _eq(value, target):
+    if value is MISSING:
+        return target is None
+    if isinstance(value, list) and not isinstance(target, list):
+        return target in value
+    return value == target
+
+def _match_ops(value, ops):
+    for op, target in ops.items():
+        if op == "$exists":
+            if (value is not MISSING) != bool(target):
+                return False
+        elif op == "$eq":
+            if not _eq(value, target):
+                return False
+        elif op == "$ne":
+            if _eq(value, target):
+                return False
+        elif op == "$in":
+            if not any(_eq(value, t) for t in target):
+                return False
+        elif op == "$nin":
+            if any(_eq(value, t) for t in target):
+                return False
+        elif op in ["$gt", "$gte", "$lt", "$lte"]:
+            if value is MISSING or not _compare(value, target, op):
+                return False
+        elif op == "$type":
+            # only the "null" type is used by XT filters
+            if not target in [10, "null"]:
+                raise UnsupportedFilter(op)
+            if value is not None:
+                return False
+        elif op == "$regex":
+            if not isinstance(value, str) or not re.search(target, value):
+                return False
+        else:
+            raise UnsupportedFilter(op)
+
+    return True
+
+def match_filter(doc, filter_dict):
+    ''' returns True if 'doc' matches the mongo-style 'filter_dict' (supports the subset of operators used by XT) '''
+    for key, target in filter_dict.items():
+        if key == "$or":
+            if not any(match_filter(doc, fd) for fd in target):
+                return False
+        elif key == "$and":
+            if not all(match_filter(doc, fd) for fd in target):
+                return False
+        elif key.startswith("$"):
+            raise UnsupportedFilter(key)
+        else:
+            value = get_path_value(doc, key)
+
+            if isinstance(target, dict) and target and all(k.startswith("$") for k in target):
+                if not _match_ops(value, target):
+                    return False
+            elif not _eq(value, target):
+                return False
+
+    return True
+
+def project_fields(doc, fields_dict):
+    ''' apply a mongo-style projection to 'doc' '''
+    if not fields_dict:
+        return doc
+
+    include_names = [name for name, value in fields_dict.items() if value and name != "_id"]
+
+    if not include_names:
+        # exclusion projection
+        result = dict(doc)
+        for name, value in fields_dict.items():
+            if not value:
+                parent = result
+                parts = name.split(".")
+                for part in parts[:-1]:
+                    if not isinstance(parent.get(part), dict):
+                        parent = None
+                        break
+                    parent[part] = dict(parent[part])
+                    parent = parent[part]
+                if parent is not None and parts[-1] in parent:
+                    del parent[parts[-1]]
+        return result
+
+    # inclusion projection
+    result = {}
+    if fields_dict.get("_id", 1) and "_id" in doc:
+        result["_id"] = doc["_id"]
+
+    for name in include_names:
+        value = get_path_value(doc, name)
+        if value is MISSING:
+            continue
+
+        parent = result
+        parts = name.split(".")
+        for part in parts[:-1]:
+            parent = parent.setdefault(part, {})
+        parent[parts[-1]] = value
+
+    return result
+
+class RunCache():
+    '''
+    Keeps a local copy of all run summary documents (everything except "log_records") for each workspace, so
+    that run queries can be answered locally.  Each sync only fetches from mongo-db:
+        - runs that have ended since our "end_id" watermark
+        - unfinished runs that are new or whose "last_time" has changed
+        - runs that were explicitly marked stale (e.g., after a local tag update)
+
+    Ended runs that change or are deleted by other clients are found by a projection-only "last_time" sweep of all
+    runs (every 'sweep_secs'), and by a full resync (every 'resync_secs') for changes that don't update "last_time".
+    '''
+    def __init__(self, cache_dir, max_mb=500, sweep_secs=SWEEP_SECS, resync_secs=RESYNC_SECS):
+        self.cache_dir = os.path.expanduser(cache_dir)
+        self.max_mb = max_mb
+        self.ended_window = 100
+        self.sweep_secs = sweep_secs
+        self.resync_secs = resync_secs
+
+        # ws_name -> (file mtime, cache): avoids reloading an unchanged cache file on each call
+        self.loaded = {}
+
+    def get_cache_fn(self, ws_name):
+        fn = self.cache_dir + "/" + constants.RUN_SUMMARY_CACHE_FN
+        return fn.replace("$ws", ws_name)
+
+    def get_stale_fn(self, ws_name):
+        return self.get_cache_fn(ws_name) + ".stale"
+
+    def _load(self, ws_name):
+        fn = self.get_cache_fn(ws_name)
+        cache = None
+
+        if os.path.exists(fn):
+            mtime = os.stat(fn).st_mtime_ns
+            loaded = self.loaded.get(ws_name)
+
+            if loaded and loaded[0] == mtime:
+                cache = loaded[1]
+            else:
+                try:
+                    cache = file_utils.load(fn)
+                except BaseException as ex:
+                    console.diag("ignoring unreadable run cache: {}, ex={}".format(fn, ex))
+
+            if cache:
+                # mark as recently used (for eviction)
+                os.utime(fn)
+                self.loaded[ws_name] = (os.stat(fn).st_mtime_ns, cache)
+
+        if not cache:
+            cache = {"end_id": 0, "runs": {}}
+
+        return cache
+
+    def _save(self, ws_name, cache):
+        fn = self.get_cache_fn(ws_name)
+        fn_temp = fn + ".tmp"
+
+        file_utils.save(cache, fn_temp)
+        os.replace(fn_temp, fn)
+        self.loaded[ws_name] = (os.stat(fn).st_mtime_ns, cache)
+
+        self.evict(keep_fn=fn)
+
+    def clear(self, ws_name):
+        file_utils.zap_file(self.get_cache_fn(ws_name))
+        file_utils.zap_file(self.get_stale_fn(ws_name))
+        self.loaded.pop(ws_name, None)
+
+    def mark_stale(self, ws_name, filter_dict):
+        ''' flag cached runs matching filter_dict so they are refetched on the next sync '''
+        fn = self.get_cache_fn(ws_name)
+        if not os.path.exists(fn):
+            return
+
+        run_id = (filter_dict or {}).get("_id")
+
+        if len(filter_dict or {}) == 1 and isinstance(run_id, str):
+            stale = [run_id]
+        elif len(filter_dict or {}) == 1 and isinstance(run_id, dict) and list(run_id) == ["$in"]:
+            stale = list(run_id["$in"])
+        else:
+            cache = self._load(ws_name)
+            try:
+                stale = [run_id for run_id, doc in cache["runs"].items() if match_filter(doc, filter_dict or {})]
+            except UnsupportedFilter:
+                # we can't tell which runs changed
+                self.clear(ws_name)
+                return
+
+        if stale:
+            # appended to a small side file (rather than rewriting the cache file)
+            with open(self.get_stale_fn(ws_name), "at") as outfile:
+                outfile.write("".join([str(run_id) + "\n" for run_id in stale]))
+
+    def take_stale(self, ws_name):
+        ''' return (and remove) the run ids that have been marked stale since the last sync '''
+        fn = self.get_stale_fn(ws_name)
+        if not os.path.exists(fn):
+            return set()
+
+        # rename first, so ids marked stale while we read aren't lost
+        fn_taken = fn + ".taken"
+        os.replace(fn, fn_taken)
+
+        with open(fn_taken, "rt") as infile:
+            stale = set(infile.read().split())
+
+        os.remove(fn_taken)
+        return stale
+
+    def get_runs(self, mongo, ws_name, rebuild=False):
+        ''' sync the cache for 'ws_name' with mongo-db and return all cached run documents '''
+        started = time.time()
+        fields_dict = {"log_records": 0}
+        db = mongo.mongo_db[ws_name]
+
+        cache = None if rebuild else self._load(ws_name)
+        stale = self.take_stale(ws_name)
+
+        if not cache or not cache["runs"] or started - cache.get("synced", 0) > self.resync_secs:
+            # cold build (or periodic full resync)
+            cmd = lambda: db.find({}, fields_dict)
+            records = list(mongo.mongo_with_retries("run_cache_build", cmd))
+
+            runs = {doc["_id"]: doc for doc in records}
+            fetched = len(records)
+            cache = {"synced": started, "swept": started}
+            dirty = True
+        else:
+            runs = cache["runs"]
+            dirty = False
+
+            # runs that have ended since the last sync (plus a window of recently ended runs, since
+            # a few properties, like "run_duration", are set just after the end_id is assigned)
+            watermark = max(0, cache["end_id"] - self.ended_window)
+
+            cmd = lambda: db.find({"end_id": {"$gt": watermark}}, fields_dict)
+            ended = list(mongo.mongo_with_retries("run_cache_ended", cmd))
+            for doc in ended:
+                if runs.get(doc["_id"]) != doc:
+                    runs[doc["_id"]] = doc
+                    dirty = True
+
+            # only compare the timestamps of unfinished runs (or, when sweeping, of all runs); then fetch the new/changed ones
+            sweep = started - cache.get("swept", 0) > self.sweep_secs
+            if sweep:
+                cache["swept"] = started
+                dirty = True
+
+            stamp_filter = {} if sweep else {"end_id": {"$exists": False}}
+            cmd = lambda: db.find(stamp_filter, {"last_time": 1})
+            stamps = list(mongo.mongo_with_retries("run_cache_stamps", cmd))
+            stamp_ids = set()
+            changed = set(stale)
+
+            for stamp in stamps:
+                run_id = stamp["_id"]
+                stamp_ids.add(run_id)
+
+                doc = runs.get(run_id)
+                if not doc or doc.get("last_time") != stamp.get("last_time"):
+                    changed.add(run_id)
+
+            # runs that have disappeared (and didn't end) were deleted
+            ended_ids = set([doc["_id"] for doc in ended])
+            for run_id, doc in list(runs.items()):
+                if (sweep or not "end_id" in doc) and not run_id in stamp_ids and not run_id in ended_ids:
+                    del runs[run_id]
+                    dirty = True
+
+            changed -= ended_ids
+            changed = list(changed)
+            fetched = len(ended) + len(stamps)
+
+            if changed:
+                cmd = lambda: db.find({"_id": {"$in": changed}}, fields_dict)
+                records = list(mongo.mongo_with_retries("run_cache_changed", cmd))
+                fetched += len(records)
+                dirty = True
+
+                found = set()
+                for doc in records:
+                    runs[doc["_id"]] = doc
+                    found.add(doc["_id"])
+
+                for run_id in changed:
+                    if not run_id in found and run_id in runs:
+                        del runs[run_id]
+
+        if dirty:
+            end_ids = [doc["end_id"] for doc in runs.values() if isinstance(doc.get("end_id"), int)]
+            cache["end_id"] = max(end_ids) if end_ids else 0
+            cache["runs"] = runs
+            self._save(ws_name, cache)
+
+        elapsed = time.time() - started
+        console.diag("run cache for {}: {:,} runs, {:,} documents fetched, saved: {}, took: {:.2f} secs".format(ws_name, 
+            len(runs), fetched, dirty, elapsed))
+
+        return list(runs.values())
+
+    def evict(self, keep_fn=None):
+        ''' remove least-recently-used workspace caches until the total size is within max_mb '''
+        if not self.max_mb:
+            return
+
+        summaries_dir = os.path.dirname(os.path.dirname(self.get_cache_fn("x")))
+        if not os.path.exists(summaries_dir):
+            return
+
+        entries = []
+        for ws_dir in os.listdir(summaries_dir):
+            fn = os.path.join(summaries_dir, ws_dir, os.path.basename(self.get_cache_fn("x")))
+            if os.path.exists(fn):
+                st = os.stat(fn)
+                entries.append((st.st_mtime, st.st_size, fn))
+
+        total = sum([size for _, size, _ in entries])
+        max_bytes = self.max_mb * 1024 * 1024
+
+        for _, size, fn in sorted(entries):
+            if total <= max_bytes:
+                break
+            if keep_fn and os.path.abspath(fn) == os.path.abspath(keep_fn):
+                continue
+
+            console.diag("evicting run cache: {}".format(fn))
+            file_utils.zap_file(fn)
+            total -= size
@@ -17,6 +17,7 @@ from xtlib import utils
 from xtlib import errors
 from xtlib import pc_utils
 from xtlib.storage import mongo_db
+from xtlib.storage import transfer_engine
 from xtlib import constants
 from xtlib import file_utils
 
@@ -519,7 +520,7 @@ class Store():
         xt_build = build_parts[1].split(":")[1].strip()
 
         dd = {"ws": ws_name, "run_name": child_name, "run_num": run_num, "run_guid": run_guid, "description": description, "exper_name": exper_name, 
-            "job_id": job_id, "node_index": node_index, "is_outer": False, "is_parent": False, "is_child": True,
+            "job_id": job_id, "node_index": node_index, "is_outer": False, "is_parent": False, "is_child": True, "parent_name": parent_run_name,
             "from_ip": from_ip, "from_computer_name": from_host, "username": username, 
             "box_name": box_name, "app_name": app_name, "repeat": None, "path": path, "script": script, "create_time": create_time,
             "compute": compute, "service_type": service_type, "sku": sku, "search_style": search_style,
@@ -544,8 +545,9 @@ class Store():
         if all_args:
             self.log_run_event(ws_name, child_name, "all_args", {"data": all_args}, is_aml=is_aml)
     
-        # finally, add a "child_created" record to the parent
-        self.log_run_event(ws_name, parent_run_name, "child_created", {"child_name": child_name}, is_aml=is_aml)
+        # finally, count the child on the parent (instead of logging a "child_created" event to the parent, which 
+        # grew its run log and log_records with every child); the child is linked by its "parent_name" property
+        self.mongo.add_child_run(ws_name, parent_run_name, child_name)
         
         return child_name
 
@@ -589,6 +591,35 @@ class Store():
             if not self.does_experiment_exist(ws_name, exper_name):
                 self.create_experiment(ws_name, exper_name)
 
+        dd = self._make_run_dd(ws_name, run_name, exper_name, description, username, box_name, app_name, repeat, is_parent, 
+            job_id, node_index, path, compute, service_type, search_type, sku, search_style, ip, hostname)
+
+        if aml_run_id:
+            dd["aml_run_id"] = aml_run_id
+
+        self.mongo.create_mongo_run(dd)
+
+        self.log_run_event(ws_name, run_name, "created", dd, is_aml=is_aml)
+
+        console.diag("start_run: after log_run_event")
+
+        # append "start" record to workspace summary log
+        dd["time"] = utils.get_time()
+        dd["event"] = "created"
+        text = json.dumps(dd) + "\n"
+
+        # append to summary file in run dir
+        if not is_aml:
+            self.append_run_file(ws_name, run_name, constants.RUN_SUMMARY_LOG, text)
+
+        console.diag("start_run: after append_workspace_file")
+
+        return run_name
+
+    def _make_run_dd(self, ws_name, run_name, exper_name, description, username, box_name, app_name, repeat, is_parent, 
+            job_id, node_index, path, compute, service_type, search_type, sku, search_style, ip, hostname):
+        ''' return the properties of a new (top level) run '''
+
         # for cases where workspaces are deleted, renamed, etc, this gives a truely unique id for the run
         run_guid = str(uuid.uuid4())
         run_num = self.get_run_num(run_name)
@@ -606,27 +637,101 @@ class Store():
             "node": node_index, "compute": compute, "service_type": service_type, "search_type": search_type, "sku": sku,
             "xt_build": xt_build, "xt_version": xt_version, "search_style": search_style, "run_index": None}
 
-        if aml_run_id:
-            dd["aml_run_id"] = aml_run_id
+        return dd
 
-        self.mongo.create_mongo_run(dd)
+    def _reserve_run_names(self, ws_name, count):
+        ''' reserve the names of 'count' new runs, with a single counter update '''
 
-        self.log_run_event(ws_name, run_name, "created", dd, is_aml=is_aml)
+        # is this a legacy workspace?
+        default_next = self.helper.get_legacy_next_run_id(ws_name)
+        if not default_next:
+            default_next = 1
 
-        console.diag("start_run: after log_run_event")
+        for attempt in range(3):
+            run_ids = self.mongo.reserve_run_ids(ws_name, count, default_next=default_next)
+            run_names = ["run{}".format(run_id) for run_id in run_ids]
 
-        # append "start" record to workspace summary log
-        dd["time"] = utils.get_time()
-        dd["event"] = "created"
-        text = json.dumps(dd) + "\n"
+            # ensure we are not somehow overwriting existing runs (a single query for the block)
+            if not self.mongo.get_existing_run_names(ws_name, run_names):
+                return run_names
 
-        # append to summary file in run dir
-        if not is_aml:
-            self.append_run_file(ws_name, run_name, constants.RUN_SUMMARY_LOG, text)
+        errors.internal_error("could not reserve {} new run names in workspace: {}".format(count, ws_name))
 
-        console.diag("start_run: after append_workspace_file")
+    def start_runs(self, ws_name, runs, exper_name=None, description=None, username=None, app_name=None, is_parent=False, 
+            job_id=None, aggregate_dest="none", path=None, compute=None, service_type=None, search_type=None, sku=None,
+            search_style=None):
+        '''
+        Bulk version of start_run, for submitting many runs at once.  'runs' is a list of dicts with the properties of each run 
+        ("box_name", "node_index", "repeat") and an optional list of "records" ((event_name, data_dict) pairs) to log after 
+        its "created" record.  The run ids are reserved with a single counter update, the run documents are inserted with a 
+        single request, and each run's log and summary log are written with one append (concurrently, across runs).
+        Returns the list of run names.
+        '''
+        if not runs:
+            return []
 
-        return run_name
+        ip = pc_utils.get_ip_address()
+        hostname = pc_utils.get_hostname()
+
+        if exper_name:
+            # create the experiement, if it doesn't already exist
+            if not self.does_experiment_exist(ws_name, exper_name):
+                self.create_experiment(ws_name, exper_name)
+
+        run_names = self._reserve_run_names(ws_name, len(runs))
+        dds = []
+        log_records_list = []
+
+        for run_name, run in zip(run_names, runs):
+            box_name = run.get("box_name")
+
+            # always log the true name of the box (since there can be multiple clients which would otherwise produce multiple "local"s)
+            if box_name == "local":
+                box_name = hostname
+
+            dd = self._make_run_dd(ws_name, run_name, exper_name, description, username, box_name, app_name, run.get("repeat"), 
+                is_parent, job_id, run.get("node_index"), path, compute, service_type, search_type, sku, search_style, ip, hostname)
+
+            event_time = utils.get_time()
+            log_records = [{"time": event_time, "event": "created", "data": dict(dd)}]
+
+            for event_name, data_dict in run.get("records", []):
+                log_records.append({"time": event_time, "event": event_name, "data": data_dict})
+
+            dds.append(dd)
+            log_records_list.append(log_records)
+
+        self.mongo.create_mongo_runs(ws_name, dds, log_records_list)
+
+        def write_run_files(run_name, run_index, progress_callback):
+            log_text = "".join([json.dumps(record) + "\n" for record in log_records_list[run_index]])
+
+            dd = dict(dds[run_index])
+            dd["time"] = utils.get_time()
+            dd["event"] = "created"
+
+            self.helper.create_next_run_by_name(ws_name, run_name)
+            self.append_run_file(ws_name, run_name, RUN_LOG, log_text)
+            self.append_run_file(ws_name, run_name, constants.RUN_SUMMARY_LOG, json.dumps(dd) + "\n")
+
+        # no retries: a failed append may have been partially applied
+        engine = transfer_engine.TransferEngine(self.helper.transfer_workers, retries=0)
+        engine.run([(run_name, i) for i, run_name in enumerate(run_names)], write_run_files)
+
+        return run_names
+
+    def log_runs_event(self, ws_name, run_names, event_name, data_dict=None):
+        ''' log the same event to a set of runs: the run logs are appended concurrently, and mongo-db is updated with one request '''
+        record_dict = {"time": utils.get_time(), "event": event_name, "data": data_dict}
+        text = json.dumps(record_dict) + "\n"
+
+        def append(run_name, dest, progress_callback):
+            self.append_run_file(ws_name, run_name, RUN_LOG, text)
+
+        engine = transfer_engine.TransferEngine(self.helper.transfer_workers, retries=0)
+        engine.run([(run_name, None) for run_name in run_names], append)
+
+        self.mongo.add_runs_event(ws_name, run_names, record_dict)
 
     def get_ws_run_names(self, ws_name, filter_dict=None):
         fields_dict = {"_id": 1}
@@ -637,12 +742,16 @@ class Store():
         return items
 
     def end_run(self, ws_name, run_name, status, exit_code, hparams_dict, metrics_rollup_dict, end_time=None, 
-        restarts=0, aggregate_dest=None, dest_name=None, is_aml=False):
+        restarts=0, aggregate_dest=None, dest_name=None, is_aml=False, log_to_mongo=True):
+        '''
+        log the "ended" event for the run.  returns the "ended" log record (when log_to_mongo=False, the caller 
+        is responsible for adding it to the mongo-db run document).
+        '''
         if not end_time:
             end_time = utils.get_time()
 
-        self.log_run_event(ws_name, run_name, "ended", {"status": status, "exit_code": exit_code, \
-            "metrics_rollup": metrics_rollup_dict}, event_time=end_time, is_aml=is_aml)
+        ended_record = self.log_run_event(ws_name, run_name, "ended", {"status": status, "exit_code": exit_code, \
+            "metrics_rollup": metrics_rollup_dict}, event_time=end_time, is_aml=is_aml, log_to_mongo=log_to_mongo)
 
         if not is_aml:
             # append "end" record to workspace summary log
@@ -655,12 +764,15 @@ class Store():
             # append to summary file in run dir
             self.append_run_file(ws_name, run_name, constants.RUN_SUMMARY_LOG, text)
 
+        return ended_record
+
     def delete_run(self, ws_name, run_name):
         return self.helper.delete_run(ws_name, run_name)
 
-    def nest_run_records(self, ws_name, run_name):
+    def nest_run_records(self, ws_name, run_name, records=None):
         ''' return a single record that includes the all of the run_log in the data dictionary '''
-        records = self.get_run_log(ws_name, run_name)    
+        if records is None:
+            records = self.get_run_log(ws_name, run_name)    
         last_end_time = records[-1]["time"]
 
         log_record = {"run_name": run_name, "log": records}
@@ -684,10 +796,13 @@ class Store():
             metrics = {}
             restarts = 0
         else:
+            # read the run log once (for both the ALLRUNS record and the rollup)
+            log_records = self.get_run_log(ws_name, run_name)
+
             # write run to ALLRUNS file
             if aggregate_dest and aggregate_dest != "none":
                 # convert entire run log to a single nested record
-                text, last_end_time = self.nest_run_records(ws_name, run_name)
+                text, last_end_time = self.nest_run_records(ws_name, run_name, log_records)
 
                 # append nested record to the specified all_runs file
                 if dest_name:
@@ -697,16 +812,16 @@ class Store():
                         self.append_job_file(dest_name, constants.ALL_RUNS_FN, text)
 
             # LOG END RUN
-            log_records = self.get_run_log(ws_name, run_name)
-        
             hparams = self._roll_up_hparams(log_records) 
             metrics = self.rollup_metrics_from_records(log_records, primary_metric, maximize_metric, report_rollup) 
             restarts = len([rr["event"] for rr in log_records if rr["event"] == "restarted"])
 
-        self.end_run(ws_name, run_name, status, exit_code, hparams, metrics, restarts=restarts, 
-            end_time=end_time, aggregate_dest=aggregate_dest, dest_name=dest_name, is_aml=is_aml)
+        # the "ended" log record is added to mongo-db with the end-of-run properties (in a single update)
+        ended_record = self.end_run(ws_name, run_name, status, exit_code, hparams, metrics, restarts=restarts, 
+            end_time=end_time, aggregate_dest=aggregate_dest, dest_name=dest_name, is_aml=is_aml, log_to_mongo=False)
 
-        self.mongo.update_mongo_run_at_end(ws_name, run_name, status, exit_code, restarts, end_time, log_records, hparams, metrics)
+        self.mongo.update_mongo_run_at_end(ws_name, run_name, status, exit_code, restarts, end_time, log_records, hparams, metrics,
+            ended_record=ended_record)
 
     def _roll_up_hparams(self, log_records):
         hparams_dict = {}
@@ -777,13 +892,34 @@ class Store():
     
         return rollup_record
 
-    def copy_run(self, ws_name, run_name, ws_name2, run_name2):
-        return self.helper.copy_run(ws_name, run_name, ws_name2, run_name2)
+    def copy_run(self, ws_name, run_name, ws_name2, run_name2, dry_run=False, feedback_progress=None):
+        ''' copy the blobs of a run to a new run; returns the "blobs" count and "bytes" total (of what a dry run would copy) '''
+        return self.helper.copy_run(ws_name, run_name, ws_name2, run_name2, dry_run=dry_run, feedback_progress=feedback_progress)
 
     def get_run_log(self, ws_name, run_name):
         return self.helper.get_run_log(ws_name, run_name)
 
-    def log_run_event(self, ws_name, run_name, event_name, data_dict=None, event_time=None, is_aml=False):
+    def get_code_blob_hashes(self, ws_name):
+        ''' return the hashes of the content-addressed code blobs stored in the workspace '''
+        return self.helper.get_code_blob_hashes(ws_name)
+
+    def upload_code_blobs(self, ws_name, items, sizes=None, feedback_progress=None):
+        ''' upload each (source_fn, file_hash) of 'items' as a content-addressed code blob of the workspace '''
+        return self.helper.upload_code_blobs(ws_name, items, sizes=sizes, feedback_progress=feedback_progress)
+
+    def download_code_blobs(self, ws_name, items):
+        ''' download each (file_hash, dest_fn) of 'items' from the content-addressed code blobs of the workspace '''
+        return self.helper.download_code_blobs(ws_name, items)
+
+    def get_child_run_names(self, ws_name, parent_run_name):
+        ''' return the names of the child runs created by the parent run '''
+        return self.mongo.get_child_run_names(ws_name, parent_run_name)
+
+    def tail_run_log(self, ws_name, run_name, offset=0):
+        ''' return (records, next_offset) for the records appended to the run log since byte 'offset' '''
+        return self.helper.tail_run_log(ws_name, run_name, offset)
+
+    def log_run_event(self, ws_name, run_name, event_name, data_dict=None, event_time=None, is_aml=False, log_to_mongo=True):
         #console.print("log_run_event: ws_name={}, run_name={}, event_name={}".format(ws_name, run_name, event_name))
 
         if not event_time:
@@ -800,7 +936,20 @@ class Store():
             self.append_run_file(ws_name, run_name, RUN_LOG, rd_text + "\n")
 
         # log all backend types to mongo
-        self.mongo.add_run_event(ws_name, run_name, record_dict)
+        if log_to_mongo:
+            self.mongo.add_run_event(ws_name, run_name, record_dict)
+
+        return record_dict
+
+    def log_run_events(self, ws_name, run_name, records, updates=None, is_aml=False):
+        ''' log a batch of run log records (each with "time", "event", and "data" keys) using a single
+        run log append and a single mongo-db update.  'updates' are additional run properties to set.
+        '''
+        if records and not is_aml:
+            text = "".join([json.dumps(record) + "\n" for record in records])
+            self.append_run_file(ws_name, run_name, RUN_LOG, text)
+
+        self.mongo.add_run_events(ws_name, run_name, records, updates)
 
     def get_job_names(self, filter_dict=None, fields_dict=None):
         return self.mongo.get_job_names(filter_dict, fields_dict)
@@ -809,10 +958,24 @@ class Store():
         return self.mongo.get_ws_runs(ws_name, filter_dict, include_log_records, first_count, last_count, sort_dict)
 
     def get_all_runs(self, aggregator_dest, ws_name, job_or_exper_name, filter_dict=None, fields_dict=None, use_cache=False, 
-        fn_cache=None, first_count=None, last_count=None, sort_dict=None):
+        fn_cache=None, first_count=None, last_count=None, sort_dict=None, rebuild_cache=False):
 
         return self.mongo.get_all_runs(aggregator_dest, ws_name, job_or_exper_name, filter_dict, fields_dict, use_cache,
-            fn_cache, first_count, last_count, sort_dict)
+            fn_cache, first_count, last_count, sort_dict, rebuild_cache=rebuild_cache)
+
+    def set_run_cache_options(self, enabled, max_mb=None):
+        ''' enable the local cache of workspace run summaries (stored under run_cache_dir). '''
+        if self.mongo:
+            self.mongo.set_run_cache_options(enabled, max_mb)
+
+    def set_transfer_options(self, workers):
+        ''' set the number of concurrent file transfers used for multi-file uploads/downloads. '''
+        if workers:
+            self.helper.transfer_workers = workers
+
+    def close(self):
+        ''' release the resources held by the storage provider (e.g., pooled append handles of the file provider). '''
+        self.helper.close()
 
     def wrapup_run(self, ws_name, run_name, aggregate_dest, dest_name, status, exit_code, primary_metric, maximize_metric, 
         report_rollup, rundir, after_files_list, log_events=True, capture_files=True, job_id=None, is_parent=False, 
@@ -846,14 +1009,9 @@ class Store():
             elapsed = time.time() - started
             self.log_run_event(ws_name, run_name, "capture_after", {"elapsed": elapsed, "count": len(copied_files)})
 
-        # tell mongo RUNS that this run has completed
-        console.diag("calling MONGO run_exit: ws={}, run_name={}".format(ws_name, run_name))
-        self.mongo.run_exit(ws_name, run_name)
-
-        if not is_parent:
-            # tell mongo this job has a completed run
-            console.diag("calling MONGO job_run_exit: job_id={}".format(job_id))
-            self.mongo.job_run_exit(job_id, exit_code)
+        # tell mongo RUNS that this run has completed (and mongo JOBS that this job has a completed run)
+        console.diag("calling MONGO run_lifecycle_exit: ws={}, run_name={}, job_id={}".format(ws_name, run_name, job_id))
+        self.mongo.run_lifecycle_exit(ws_name, run_name, job_id, exit_code, is_parent=is_parent)
 
     def copy_run_files_to_run(self, ws_name, from_run, run_wildcard, to_run, to_path):
         return self.helper.copy_run_files_to_run(ws_name, from_run, run_wildcard, to_run, to_path)
@@ -882,6 +1040,13 @@ class Store():
         rf = self.run_files(ws_name, run_name, use_blobs=True)
         return rf.append_file(run_fn, text)
 
+    def append_bytes_to_run_file(self, ws_name, run_name, run_fn, data, recreate=False):
+        '''append the bytes 'data' to the run file 'run_fn' (an append blob).  if 'recreate' is True, the
+        run file is first replaced by an empty append blob.
+        '''
+        rf = self.run_files(ws_name, run_name, use_blobs=True)
+        return rf.append_bytes(run_fn, data, recreate=recreate)
+
     def read_run_file(self, ws_name, run_name, run_fn):
         '''return the contents of the run file 'run_fn'.
         '''
@@ -5,11 +5,12 @@
 # store-azure-blob21: Azure Blob Storage API (based on azure-storage-blob==2.1.0)
 import logging
 from interface import implements
+from azure.common import AzureHttpError
 from azure.storage.blob import AppendBlobService, BlockBlobService, PublicAccess
-from azure.storage.blob.models import DeleteSnapshot
+from azure.storage.blob.models import DeleteSnapshot, Include
 
 from xtlib import utils
-from xtlib.storage.store_interface import StoreInterface
+from xtlib.storage.store_interface import StoreInterface, COPY_SUCCESS
 
 logger = logging.getLogger(__name__)
 
@@ -53,6 +54,20 @@ class AzureBlobStore21(implements(StoreInterface)):
     def set_retry(self, value):
         self.bs.retry = value
 
+    def close(self):
+        pass
+
+    def get_copy_statuses(self, container, path=None):
+        # a single listing returns the copy properties of all blobs in the path
+        blobs = self.bs.list_blobs(container, prefix=path or None, include=Include.COPY)
+
+        statuses = {}
+        for blob in blobs:
+            copy = blob.properties.copy
+            statuses[blob.name] = (copy.status or COPY_SUCCESS, copy.status_description) 
+
+        return statuses
+
     # ---- CONTAINER interface ----
 
     def does_container_exist(self, container):
@@ -94,6 +109,15 @@ class AzureBlobStore21(implements(StoreInterface)):
         result = self.bs.create_blob_from_path(container, blob_path, source_fn, progress_callback=progress_callback)
         return result
 
+    def append_blob_from_bytes(self, container, blob_path, data, recreate=False):
+        # create_blob() replaces any existing blob with an empty append blob
+        if recreate or not self.append_bs.exists(container, blob_path):
+            self.append_bs.create_blob(container, blob_path)
+
+        if data:
+            self.append_bs.append_blob_from_bytes(container, blob_path, data)
+        return True
+
     def append_blob(self, container, blob_path, text, append_with_rewrite=False):
         # create blob if it doesn't exist
 
@@ -195,13 +219,10 @@ class AzureBlobStore21(implements(StoreInterface)):
         return self.bs.delete_blob(container, blob_path, delete_snapshots=dss.Include)
 
     def get_blob_text(self, container, blob_path):
-        # watch out for 0-length blobs - they trigger an Azure RETRY error
-        text = ""
-        # azure storage bug workaround: avoid RETRY errors for 0-length blob 
-        blob = self.bs.get_blob_properties(container, blob_path)
-        if blob.properties.content_length:
-            blob = self.bs.get_blob_to_text(container, blob_path)
-            text = blob.content
+        # single request: for 0-length blobs, the ranged GET fails with status=416 (not retried by 
+        # utils.make_retry_func) and the SDK falls back to a normal GET
+        blob = self.bs.get_blob_to_text(container, blob_path)
+        text = blob.content or ""
         return text
 
     def get_blob_to_path(self, container, blob_path, dest_fn, snapshot=None, progress_callback=None):
@@ -223,6 +244,17 @@ class AzureBlobStore21(implements(StoreInterface)):
            
         return text
 
+    def get_blob_range(self, container, blob_path, start=0, end=None):
+        try:
+            blob = self.bs.get_blob_to_bytes(container, blob_path, start_range=start, end_range=end)
+        except AzureHttpError as ex:
+            if ex.status_code == 416:
+                # start is at (or past) the end of the blob
+                return b""
+            raise
+
+        return blob.content or b""
+
     def get_blob_properties(self, container, blob_path):
         props = self.bs.get_blob_properties(container, blob_path)
         return props
@@ -234,8 +266,10 @@ class AzureBlobStore21(implements(StoreInterface)):
     #     return self.bs.set_blob_metadata(container, blob_path, md_dict)
 
     def copy_blob(self, source_container, source_blob_path, dest_container, dest_blob_path):
+        # server-side copy (no data passes thru the client); large blobs may complete asynchronously
         source_blob_url = self.bs.make_blob_url(source_container, source_blob_path)
-        self.bs.copy_blob(dest_container, dest_blob_path, source_blob_url)
+        copy = self.bs.copy_blob(dest_container, dest_blob_path, source_blob_url)
+        return copy.status
 
     def snapshot_blob(self, container, blob_path):
         blob = self.bs.snapshot_blob(container, blob_path)
@@ -0,0 +1,705 @@
+#
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+#
+# store_emulator.py: storage provider that emulates Azure blob storage on local disk (for offline benchmarks and tests)
+import os
+import re
+import json
+import math
+import time
+import uuid
+import random
+import shutil
+import datetime
+import threading
+from interface import implements
+
+from xtlib import utils
+from xtlib import errors
+from xtlib import file_utils
+from xtlib.storage.store_interface import StoreInterface, COPY_SUCCESS, COPY_PENDING
+
+# blob types
+BLOCK_BLOB = "BlockBlob"
+APPEND_BLOB = "AppendBlob"
+
+# service and SDK limits (azure-storage-blob 2.1)
+MAX_BLOCK_SIZE = 4*1024*1024            # largest block uploaded (or appended) in a single request
+MAX_SINGLE_PUT_SIZE = 64*1024*1024      # larger block blobs are uploaded as blocks + a block list
+MAX_SINGLE_GET_SIZE = 32*1024*1024      # larger blobs are downloaded in MAX_BLOCK_SIZE chunks
+MAX_APPEND_BLOCKS = 50000               # committed blocks allowed in an append blob
+LIST_PAGE_SIZE = 5000                   # blobs returned by each list request
+
+CONTAINER_NAME_PATTERN = re.compile(r"^[a-z0-9](?!.*--)[a-z0-9-]{1,61}[a-z0-9]$")
+
+class EmulatorHttpError(Exception):
+    ''' an emulated storage service error (with the HTTP status and error code that Azure would return) '''
+    def __init__(self, status_code, error_code, message=None):
+        super(EmulatorHttpError, self).__init__("{} (status={}){}".format(error_code, status_code,
+            ": " + message if message else ""))
+
+        self.status_code = status_code
+        self.error_code = error_code
+
+class EmulatorStore(implements(StoreInterface)):
+    '''
+    Emulates the Azure blob storage contract on local disk, so that the performance of the Store layer (parallel
+    transfers, retries, listing caches) can be measured and regression tested without network access:
+        - ETags and conditional writes (If-Match, If-None-Match)
+        - block blobs vs. append blobs, including the committed block limit of append blobs
+        - snapshots and (optionally asynchronous) server-side copies
+        - requests issued the way the Azure provider issues them (chunked uploads/downloads, paged listings)
+
+    Each request can be delayed by an injected latency and bandwidth, and can fail with injected throttling (503)
+    or server (500) errors, which are retried thru the function set by set_retry() (as the Azure SDK does).
+
+    Optional properties of the storage service (in the XT config file):
+        latency-ms          per request latency (default: 0)
+        jitter-ms           max random latency added to each request (default: 0)
+        bandwidth-mbps      megabits/sec of data transfers (default: 0, unlimited)
+        throttle-rate       fraction of requests failed with 503/ServerBusy (default: 0)
+        error-rate          fraction of requests failed with 500/InternalError (default: 0)
+        max-append-blocks   committed blocks allowed in an append blob (default: 50000)
+        async-copy-mb       copies of blobs this size or larger complete asynchronously (default: 0, never)
+        seed                random seed, for repeatable error injection
+
+    NOTE: conditional writes are atomic within a process (not across processes sharing the same path).
+    '''
+    def __init__(self, storage_creds):
+        self.path = os.path.expanduser(storage_creds["path"])
+        self.retry = None
+
+        self.latency = storage_creds.get("latency-ms", 0) / 1000
+        self.jitter = storage_creds.get("jitter-ms", 0) / 1000
+        mbps = storage_creds.get("bandwidth-mbps", 0)
+        self.bytes_per_sec = mbps*1000*1000/8 if mbps else 0
+        self.throttle_rate = storage_creds.get("throttle-rate", 0)
+        self.error_rate = storage_creds.get("error-rate", 0)
+        self.max_append_blocks = storage_creds.get("max-append-blocks", MAX_APPEND_BLOCKS)
+        self.async_copy_size = storage_creds.get("async-copy-mb", 0)*1024*1024
+
+        if not (0 <= self.throttle_rate + self.error_rate <= 1):
+            errors.config_error("storage emulator: throttle-rate + error-rate must be between 0 and 1")
+
+        self.random = random.Random(storage_creds.get("seed"))
+        self.lock = threading.RLock()
+        self.request_counts = {}        # operation -> number of requests
+
+        for tree in ["blobs", "meta", "snapshots"]:
+            file_utils.ensure_dir_exists(os.path.join(self.path, tree))
+
+    # ---- HELPER functions ----
+
+    def _blob_path(self, container, blob_path=None):
+        path = os.path.join(self.path, "blobs", container)
+        return os.path.join(path, blob_path) if blob_path else path
+
+    def _meta_path(self, container, blob_path=None):
+        path = os.path.join(self.path, "meta", container)
+        return os.path.join(path, blob_path + ".json") if blob_path else path
+
+    def _snapshot_path(self, container, blob_path=None, snapshot=None):
+        path = os.path.join(self.path, "snapshots", container)
+        if blob_path:
+            path = os.path.join(path, blob_path)
+            if snapshot:
+                path = os.path.join(path, snapshot.replace(":", "-"))
+        return path
+
+    def _make_etag(self):
+        return '"0x8D{}"'.format(uuid.uuid4().hex[0:13].upper())
+
+    def _delay(self, size=0):
+        secs = self.latency
+
+        if self.jitter:
+            with self.lock:
+                secs += self.jitter*self.random.random()
+
+        if size and self.bytes_per_sec:
+            secs += size/self.bytes_per_sec
+
+        if secs > 0:
+            time.sleep(secs)
+
+    def _inject_error(self):
+        if self.throttle_rate or self.error_rate:
+            with self.lock:
+                value = self.random.random()
+
+            if value < self.throttle_rate:
+                raise EmulatorHttpError(503, "ServerBusy", "injected throttling error")
+
+            if value < self.throttle_rate + self.error_rate:
+                raise EmulatorHttpError(500, "InternalError", "injected server error")
+
+    def _request(self, operation, func, size=0):
+        '''
+        issue one emulated request: count it, delay it by the latency and transfer time of 'size' bytes, inject errors,
+        and retry failures as directed by the retry function (which returns the secs to wait, or None to fail).
+        '''
+        context = utils.PropertyBag()
+        context.response = utils.PropertyBag()
+
+        while True:
+            with self.lock:
+                self.request_counts[operation] = 1 + self.request_counts.get(operation, 0)
+
+            # the service is not locked while a request is in flight
+            self._delay(size)
+
+            try:
+                self._inject_error()
+                return func()
+            except EmulatorHttpError as ex:
+                context.response.status = ex.status_code
+                context.exception = ex
+
+                backoff = self.retry(context) if self.retry else None
+                if backoff is None:
+                    raise
+
+                time.sleep(backoff)
+
+    def _check_container(self, container):
+        if not os.path.isdir(self._blob_path(container)):
+            raise EmulatorHttpError(404, "ContainerNotFound", container)
+
+    def _read_meta(self, container, blob_path):
+        fn = self._meta_path(container, blob_path)
+        if not os.path.exists(fn):
+            return None
+
+        with open(fn, "rt") as infile:
+            return json.load(infile)
+
+    def _write_meta(self, container, blob_path, meta):
+        fn = self._meta_path(container, blob_path)
+        file_utils.ensure_dir_exists(file=fn)
+
+        with open(fn, "wt") as outfile:
+            json.dump(meta, outfile)
+
+    def _get_meta(self, container, blob_path):
+        self._check_container(container)
+
+        meta = self._read_meta(container, blob_path)
+        if not meta:
+            raise EmulatorHttpError(404, "BlobNotFound", container + "/" + blob_path)
+
+        return self._update_copy_status(container, blob_path, meta)
+
+    def _update_copy_status(self, container, blob_path, meta):
+        copy = meta.get("copy")
+        if copy and copy["status"] == COPY_PENDING and time.time() >= copy["completion_time"]:
+            copy["status"] = COPY_SUCCESS
+            self._write_meta(container, blob_path, meta)
+
+        return meta
+
+    def _read_data(self, container, blob_path, snapshot=None, start=0, end=None):
+        ''' return the bytes of the blob (or its snapshot) from 'start' thru 'end' (inclusive; None for the end) '''
+        if snapshot:
+            fn = self._snapshot_path(container, blob_path, snapshot)
+            if not os.path.exists(fn):
+                raise EmulatorHttpError(404, "BlobNotFound", "{}/{} (snapshot={})".format(container, blob_path, snapshot))
+        else:
+            self._get_meta(container, blob_path)
+            fn = self._blob_path(container, blob_path)
+
+        with open(fn, "rb") as infile:
+            if start:
+                infile.seek(start)
+
+            return infile.read() if end is None else infile.read(max(0, 1+end-start))
+
+    def _get_read_size(self, container, blob_path, snapshot=None, start=0, end=None):
+        ''' return the number of bytes a read of the blob will transfer (0 if it doesn't exist) '''
+        if snapshot:
+            fn = self._snapshot_path(container, blob_path, snapshot)
+        else:
+            fn = self._blob_path(container, blob_path)
+
+        size = os.path.getsize(fn) if os.path.exists(fn) else 0
+        if end is not None:
+            size = min(size, 1+end)
+
+        return max(0, size-start)
+
+    def _put_blob(self, container, blob_path, data, if_match=None, if_none_match=None):
+        ''' write (or replace) a block blob, honoring the conditional headers '''
+        with self.lock:
+            self._check_container(container)
+            meta = self._read_meta(container, blob_path)
+
+            if if_none_match == "*" and meta:
+                raise EmulatorHttpError(409, "BlobAlreadyExists", container + "/" + blob_path)
+
+            if if_match and (not meta or (if_match != "*" and meta["etag"] != if_match)):
+                raise EmulatorHttpError(412, "ConditionNotMet", container + "/" + blob_path)
+
+            fn = self._blob_path(container, blob_path)
+            file_utils.ensure_dir_exists(file=fn)
+
+            temp_fn = fn + ".__temp__"
+            with open(temp_fn, "wb") as outfile:
+                outfile.write(data)
+            os.replace(temp_fn, fn)
+
+            now = time.time()
+            meta = {"blob_type": BLOCK_BLOB, "size": len(data), "etag": self._make_etag(), "modified": now,
+                "created": meta["created"] if meta else now, "blocks": 0, "metadata": {}}
+            self._write_meta(container, blob_path, meta)
+
+            return self._make_properties(meta)
+
+    def _upload(self, container, blob_path, data, if_none_match=None, progress_callback=None):
+        ''' upload a block blob, as the SDK does (single put, or blocks followed by a block list) '''
+        size = len(data)
+
+        if size <= MAX_SINGLE_PUT_SIZE:
+            result = self._request("put_blob", lambda: self._put_blob(container, blob_path, data,
+                if_none_match=if_none_match), size)
+        else:
+            for start in range(0, size, MAX_BLOCK_SIZE):
+                count = min(MAX_BLOCK_SIZE, size-start)
+                self._request("put_block", lambda: None, count)
+
+                if progress_callback:
+                    progress_callback(start+count, size)
+
+            result = self._request("put_block_list", lambda: self._put_blob(container, blob_path, data,
+                if_none_match=if_none_match))
+
+        if progress_callback:
+            progress_callback(size, size)
+
+        return result
+
+    def _create_append_blob(self, container, blob_path):
+        with self.lock:
+            self._check_container(container)
+
+            fn = self._blob_path(container, blob_path)
+            file_utils.ensure_dir_exists(file=fn)
+            with open(fn, "wb"):
+                pass
+
+            old_meta = self._read_meta(container, blob_path)
+            now = time.time()
+
+            meta = {"blob_type": APPEND_BLOB, "size": 0, "etag": self._make_etag(), "modified": now,
+                "created": old_meta["created"] if old_meta else now, "blocks": 0, "metadata": {}}
+            self._write_meta(container, blob_path, meta)
+
+    def _append_block(self, container, blob_path, data):
+        with self.lock:
+            meta = self._get_meta(container, blob_path)
+
+            if meta["blob_type"] != APPEND_BLOB:
+                raise EmulatorHttpError(409, "InvalidBlobType", container + "/" + blob_path)
+
+            if meta["blocks"] >= self.max_append_blocks:
+                raise EmulatorHttpError(409, "BlockCountExceedsLimit", container + "/" + blob_path)
+
+            with open(self._blob_path(container, blob_path), "ab") as outfile:
+                outfile.write(data)
+
+            meta.update({"size": meta["size"] + len(data), "blocks": meta["blocks"] + 1, "etag": self._make_etag(),
+                "modified": time.time()})
+            self._write_meta(container, blob_path, meta)
+
+    def _make_properties(self, meta):
+        props = utils.PropertyBag()
+
+        props.content_length = meta["size"]
+        props.last_modified = datetime.datetime.fromtimestamp(meta["modified"], datetime.timezone.utc)
+        props.creation_time = datetime.datetime.fromtimestamp(meta["created"], datetime.timezone.utc)
+        props.etag = meta["etag"]
+        props.blob_type = meta["blob_type"]
+        props.append_blob_committed_block_count = meta["blocks"] if meta["blob_type"] == APPEND_BLOB else None
+
+        copy = utils.PropertyBag()
+        copy_meta = meta.get("copy") or {}
+        copy.id = copy_meta.get("id")
+        copy.source = copy_meta.get("source")
+        copy.status = copy_meta.get("status")
+        copy.status_description = None
+        props.copy = copy
+
+        return props
+
+    def _make_blob(self, name, meta, snapshot=None):
+        blob = utils.PropertyBag()
+
+        blob.name = name
+        blob.snapshot = snapshot
+        blob.properties = self._make_properties(meta)
+        blob.metadata = meta.get("metadata", {})
+
+        return blob
+
+    def _walk_blob_names(self, container):
+        base_path = self._blob_path(container)
+        names = []
+
+        for root, dirs, files in os.walk(base_path):
+            rel_root = os.path.relpath(root, base_path).replace("\\", "/")
+            prefix = "" if rel_root == "." else rel_root + "/"
+
+            names += [prefix + fn for fn in files if not fn.endswith(".__temp__")]
+
+        names.sort()
+        return names
+
+    # ---- MISC part of interface ----
+
+    def get_service_name(self):
+        ''' return the unique name of the storage service'''
+        return "store_emulator://" + self.path
+
+    def get_retry(self):
+        return self.retry
+
+    def set_retry(self, value):
+        self.retry = value
+
+    def close(self):
+        pass
+
+    def get_copy_statuses(self, container, path=None):
+        # a single listing returns the copy properties of all blobs in the path
+        blobs = self.list_blobs(container, path, return_names=False)
+
+        statuses = {}
+        for blob in blobs:
+            copy = blob.properties.copy
+            statuses[blob.name] = (copy.status or COPY_SUCCESS, copy.status_description)
+
+        return statuses
+
+    def get_request_counts(self):
+        ''' return a dict of operation name -> number of requests issued (including retries) '''
+        with self.lock:
+            return dict(self.request_counts)
+
+    def reset_request_counts(self):
+        with self.lock:
+            self.request_counts = {}
+
+    # ---- CONTAINER interface ----
+
+    def does_container_exist(self, container):
+        return self._request("get_container_properties", lambda: os.path.isdir(self._blob_path(container)))
+
+    def create_container(self, container):
+        if not CONTAINER_NAME_PATTERN.match(container):
+            raise EmulatorHttpError(400, "InvalidResourceName", container)
+
+        def create():
+            with self.lock:
+                path = self._blob_path(container)
+                if os.path.isdir(path):
+                    return False
+
+                os.makedirs(path)
+                return True
+
+        return self._request("create_container", create)
+
+    def list_containers(self):
+        return self._request("list_containers", lambda: sorted(os.listdir(os.path.join(self.path, "blobs"))))
+
+    def delete_container(self, container):
+        def delete():
+            with self.lock:
+                if not os.path.isdir(self._blob_path(container)):
+                    return False
+
+                for path in [self._blob_path(container), self._meta_path(container), self._snapshot_path(container)]:
+                    if os.path.exists(path):
+                        shutil.rmtree(path)
+                return True
+
+        return self._request("delete_container", delete)
+
+    def get_container_properties(self, container):
+        def get_props():
+            self._check_container(container)
+            path = self._blob_path(container)
+
+            container_obj = utils.PropertyBag()
+            container_obj.name = container
+            container_obj.metadata = {}
+            container_obj.properties = utils.PropertyBag()
+            container_obj.properties.last_modified = datetime.datetime.fromtimestamp(os.path.getmtime(path),
+                datetime.timezone.utc)
+            container_obj.properties.etag = '"0x8D{:013X}"'.format(int(os.path.getmtime(path)*1000))
+
+            return container_obj
+
+        return self._request("get_container_properties", get_props)
+
+    def get_container_metadata(self, container):
+        def get_md():
+            self._check_container(container)
+            return {}
+
+        return self._request("get_container_metadata", get_md)
+
+    # ---- BLOB interface ----
+
+    def does_blob_exist(self, container, blob_path):
+        return self._request("get_blob_properties", lambda: bool(self._read_meta(container, blob_path)))
+
+    def create_blob(self, container, blob_path, text, fail_if_exists=False):
+        ifn = "*" if fail_if_exists else None
+        return self._upload(container, blob_path, text.encode("utf-8"), if_none_match=ifn)
+
+    def create_blob_from_path(self, container, blob_path, source_fn, progress_callback=None):
+        with open(source_fn, "rb") as infile:
+            data = infile.read()
+
+        return self._upload(container, blob_path, data, progress_callback=progress_callback)
+
+    def append_blob(self, container, blob_path, text, append_with_rewrite=False):
+        if append_with_rewrite:
+            return self._append_with_rewrite(container, blob_path, text)
+
+        # same requests as the Azure provider: create the blob if it doesn't exist, then append the blocks
+        if not self.does_blob_exist(container, blob_path):
+            self._request("create_blob", lambda: self._create_append_blob(container, blob_path))
+
+        data = text.encode("utf-8")
+        for start in range(0, len(data), MAX_BLOCK_SIZE):
+            block = data[start:start+MAX_BLOCK_SIZE]
+            self._request("append_block", lambda: self._append_block(container, blob_path, block), len(block))
+
+        return True
+
+    def append_blob_from_bytes(self, container, blob_path, data, recreate=False):
+        if recreate or not self.does_blob_exist(container, blob_path):
+            self._request("create_blob", lambda: self._create_append_blob(container, blob_path))
+
+        for start in range(0, len(data), MAX_BLOCK_SIZE):
+            block = data[start:start+MAX_BLOCK_SIZE]
+            self._request("append_block", lambda: self._append_block(container, blob_path, block), len(block))
+
+        return True
+
+    def _append_with_rewrite(self, container, blob_path, text):
+        ''' append to a block blob by rewriting it, conditioned on its ETag (safe for concurrent writers) '''
+        for i in range(20):
+            try:
+                meta = self._request("get_blob_properties", lambda: self._read_meta(container, blob_path))
+
+                if meta:
+                    old_data = self._request("get_blob", lambda: self._read_data(container, blob_path), meta["size"])
+                    data = old_data + text.encode("utf-8")
+                    self._request("put_blob", lambda: self._put_blob(container, blob_path, data, if_match=meta["etag"]),
+                        len(data))
+                else:
+                    data = text.encode("utf-8")
+                    self._request("put_blob", lambda: self._put_blob(container, blob_path, data, if_none_match="*"),
+                        len(data))
+                return True
+
+            except EmulatorHttpError as ex:
+                if not ex.status_code in [409, 412]:
+                    raise
+
+                # another writer updated the blob since we read it
+                time.sleep(self.random.random()*.1*(i+1))
+
+        errors.service_error("append_with_rewrite failed after 20 conflicts: {}/{}".format(container, blob_path))
+
+    def list_blobs(self, container, path=None, return_names=True, recursive=True):
+        '''
+        NOTE: same semantics as the Azure provider:
+
+        if recursive:
+            - return a flat list of all full path names of all files (no directory entries)
+        else:
+            - return a flat list of all files and all directory names (add "/" to end of directory names)
+
+        if return_names:
+            - return list of names
+        else:
+            - return a list of objects with .name and .properties (directories have only a .name)
+        '''
+        # specific Azure path rules for good results
+        if path:
+            if path.startswith("/"):
+                path = path[1:]
+
+            if path.endswith("*"):
+                path = path[0:-1]
+            elif not path.endswith("/"):
+                path += "/"
+
+        prefix = path or ""
+
+        with self.lock:
+            self._check_container(container)
+            names = [name for name in self._walk_blob_names(container) if name.startswith(prefix)]
+
+        entries = []
+        dirs = set()
+
+        for name in names:
+            if not recursive:
+                slash = name.find("/", len(prefix))
+                if slash > -1:
+                    dir_name = name[0:slash+1]
+                    if not dir_name in dirs:
+                        dirs.add(dir_name)
+                        entries.append(dir_name)
+                    continue
+
+            entries.append(name)
+
+        # one request per page of results
+        pages = max(1, math.ceil(len(entries) / LIST_PAGE_SIZE))
+        for page in range(pages):
+            self._request("list_blobs", lambda: None)
+
+        if return_names:
+            return entries
+
+        blobs = []
+        with self.lock:
+            for name in entries:
+                if name in dirs:
+                    blob = utils.PropertyBag()
+                    blob.name = name
+                else:
+                    meta = self._update_copy_status(container, name, self._read_meta(container, name))
+                    blob = self._make_blob(name, meta)
+
+                blobs.append(blob)
+
+        return blobs
+
+    def delete_blob(self, container, blob_path, snapshot=None):
+        def delete():
+            with self.lock:
+                self._get_meta(container, blob_path)
+
+                if snapshot:
+                    os.remove(self._snapshot_path(container, blob_path, snapshot))
+                else:
+                    # the blob and its snapshots
+                    os.remove(self._blob_path(container, blob_path))
+                    os.remove(self._meta_path(container, blob_path))
+
+                    ss_path = self._snapshot_path(container, blob_path)
+                    if os.path.exists(ss_path):
+                        shutil.rmtree(ss_path)
+
+        return self._request("delete_blob", delete)
+
+    def get_blob_text(self, container, blob_path):
+        size = self._get_read_size(container, blob_path)
+        data = self._request("get_blob", lambda: self._read_data(container, blob_path), size)
+
+        return data.decode("utf-8")
+
+    def get_blob_to_path(self, container, blob_path, dest_fn, snapshot=None, progress_callback=None):
+        # same requests as the Azure provider: properties, then the blob (in chunks, for large blobs)
+        self.get_blob_properties(container, blob_path)
+        size = self._get_read_size(container, blob_path, snapshot)
+        done = min(size, MAX_SINGLE_GET_SIZE)
+
+        data = self._request("get_blob", lambda: self._read_data(container, blob_path, snapshot), done)
+        size = len(data)
+
+        while done < size:
+            count = min(MAX_BLOCK_SIZE, size-done)
+            self._request("get_blob", lambda: None, count)
+            done += count
+
+            if progress_callback:
+                progress_callback(done, size)
+
+        with open(dest_fn, "wb") as outfile:
+            outfile.write(data)
+
+        if progress_callback:
+            progress_callback(size, size)
+
+        return None if size else ""
+
+    def get_blob_range(self, container, blob_path, start=0, end=None):
+        # a start at (or past) the end returns 416 from the service, which the Azure provider maps to empty bytes
+        size = self._get_read_size(container, blob_path, start=start, end=end)
+        data = self._request("get_blob", lambda: self._read_data(container, blob_path, start=start, end=end), size)
+
+        return data
+
+    def get_blob_properties(self, container, blob_path):
+        def get_props():
+            with self.lock:
+                meta = self._get_meta(container, blob_path)
+                return self._make_blob(blob_path, meta)
+
+        return self._request("get_blob_properties", get_props)
+
+    def get_blob_metadata(self, container, blob_path):
+        def get_md():
+            with self.lock:
+                return self._get_meta(container, blob_path).get("metadata", {})
+
+        return self._request("get_blob_metadata", get_md)
+
+    def copy_blob(self, source_container, source_blob_path, dest_container, dest_blob_path):
+        def copy():
+            with self.lock:
+                source_meta = self._get_meta(source_container, source_blob_path)
+                self._check_container(dest_container)
+
+                dest_fn = self._blob_path(dest_container, dest_blob_path)
+                file_utils.ensure_dir_exists(file=dest_fn)
+                shutil.copyfile(self._blob_path(source_container, source_blob_path), dest_fn)
+
+                # server-side copy: no data is transferred by the client, but large copies can complete asynchronously
+                size = source_meta["size"]
+                status = COPY_SUCCESS
+                completion_time = time.time()
+
+                if self.async_copy_size and size >= self.async_copy_size:
+                    status = COPY_PENDING
+                    completion_time += self.latency + (size/self.bytes_per_sec if self.bytes_per_sec else 0)
+
+                meta = dict(source_meta)
+                meta.update({"etag": self._make_etag(), "modified": time.time(), "created": time.time()})
+                meta["copy"] = {"id": str(uuid.uuid4()), "source": source_container + "/" + source_blob_path,
+                    "status": status, "completion_time": completion_time}
+                self._write_meta(dest_container, dest_blob_path, meta)
+
+                return status
+
+        return self._request("copy_blob", copy)
+
+    def snapshot_blob(self, container, blob_path):
+        def snapshot():
+            with self.lock:
+                meta = self._get_meta(container, blob_path)
+
+                # snapshot ids are the (unique) UTC time of the snapshot
+                while True:
+                    snapshot_id = datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f0Z")
+                    ss_fn = self._snapshot_path(container, blob_path, snapshot_id)
+                    if not os.path.exists(ss_fn):
+                        break
+                file_utils.ensure_dir_exists(file=ss_fn)
+                shutil.copyfile(self._blob_path(container, blob_path), ss_fn)
+
+                blob = utils.PropertyBag()
+                blob.snapshot = snapshot_id
+                blob.etag = meta["etag"]
+                blob.last_modified = datetime.datetime.fromtimestamp(meta["modified"], datetime.timezone.utc)
+
+                return blob
+
+        return self._request("snapshot_blob", snapshot)
@@ -9,7 +9,11 @@ import re
 import shutil
 import json
 import time
+import atexit
+import weakref
 import datetime
+import collections
+from threading import RLock, Timer
 from interface import implements
 
 from xtlib import utils
@@ -18,7 +22,124 @@ from xtlib import constants
 from xtlib import file_utils
 
 from xtlib.console import console
-from xtlib.storage.store_interface import StoreInterface
+from xtlib.storage.store_interface import StoreInterface, COPY_SUCCESS
+
+# flush policies for pooled append handles
+FLUSH_WRITE = "write"           # flush after every append (appends are immediately visible to other processes)
+FLUSH_INTERVAL = "interval"     # flush the handles with new appends every "flush-ms" milliseconds
+FLUSH_CLOSE = "close"           # flush only when a handle is closed (evicted, or the store is closed)
+
+FLUSH_POLICIES = [FLUSH_WRITE, FLUSH_INTERVAL, FLUSH_CLOSE]
+
+# all live pools (so buffered appends can be flushed at process exit, without keeping each store alive)
+append_pools = weakref.WeakSet()
+
+def close_append_handles():
+    ''' flush and close the append handles of all file stores in this process (call before os._exit()) '''
+    for pool in list(append_pools):
+        pool.close_all()
+
+atexit.register(close_append_handles)
+
+class AppendHandlePool():
+    '''
+    An LRU pool of open append handles, so that a series of appends to the same file (like the metrics of a run log)
+    doesn't cost an open and close per append (each of which is a metadata round trip on a network file system).
+
+    When 'durable' is True, each append is flushed and fsync'ed before it returns (crash safe).  Otherwise, the 
+    'flush' policy trades the visibility of appends to other processes for throughput.
+    '''
+    def __init__(self, max_handles=32, flush=FLUSH_WRITE, flush_ms=1000, durable=False):
+        if not flush in FLUSH_POLICIES:
+            errors.config_error("unknown file storage flush policy: {} (must be one of: {})".format(flush, 
+                ", ".join(FLUSH_POLICIES)))
+
+        self.max_handles = max(1, max_handles)
+        self.flush = flush
+        self.flush_secs = flush_ms/1000
+        self.durable = durable
+
+        self.handles = collections.OrderedDict()      # path -> open file (most recently used last)
+        self.dirty = set()                            # paths with unflushed appends
+        self.lock = RLock()
+        self.timer = None
+
+        append_pools.add(self)
+
+    def append(self, path, text):
+        with self.lock:
+            outfile = self.handles.get(path)
+            if outfile:
+                self.handles.move_to_end(path)
+            else:
+                outfile = open(path, "at")
+                self.handles[path] = outfile
+
+                while len(self.handles) > self.max_handles:
+                    self._close(next(iter(self.handles)))
+
+            outfile.write(text)
+
+            if self.durable:
+                outfile.flush()
+                os.fsync(outfile.fileno())
+            elif self.flush == FLUSH_WRITE:
+                outfile.flush()
+            else:
+                self.dirty.add(path)
+
+                if self.flush == FLUSH_INTERVAL and not self.timer:
+                    self.timer = Timer(self.flush_secs, self._on_timer)
+                    self.timer.daemon = True
+                    self.timer.start()
+
+    def _on_timer(self):
+        with self.lock:
+            self.timer = None
+            self.flush_all()
+
+    def _close(self, path):
+        outfile = self.handles.pop(path)
+        self.dirty.discard(path)
+        outfile.close()
+
+    def sync(self, path):
+        ''' flush any buffered appends for 'path' (before it is read by this process) '''
+        if path in self.dirty:
+            with self.lock:
+                if path in self.handles:
+                    self.handles[path].flush()
+                self.dirty.discard(path)
+
+    def release(self, path):
+        ''' flush and close the handle for 'path' (before it is replaced, moved, or deleted) '''
+        with self.lock:
+            if path in self.handles:
+                self._close(path)
+
+    def release_dir(self, dir_path):
+        ''' flush and close the handles for all files under 'dir_path' '''
+        prefix = os.path.join(dir_path, "")
+
+        with self.lock:
+            for path in [path for path in self.handles if path.startswith(prefix)]:
+                self._close(path)
+
+    def flush_all(self):
+        with self.lock:
+            for path in list(self.dirty):
+                if path in self.handles:
+                    self.handles[path].flush()
+            self.dirty = set()
+
+    def close_all(self):
+        with self.lock:
+            if self.timer:
+                self.timer.cancel()
+                self.timer = None
+
+            for path in list(self.handles):
+                self._close(path)
 
 class FileStore(implements(StoreInterface)):
     def __init__(self, storage_creds):
@@ -28,6 +149,11 @@ class FileStore(implements(StoreInterface)):
         # create directory, if needed
         file_utils.ensure_dir_exists(self.path)
 
+        # optional properties of the storage service (in the XT config file) control the append handles
+        self.append_handles = AppendHandlePool(max_handles=storage_creds.get("max-handles", 32), 
+            flush=storage_creds.get("flush", FLUSH_WRITE), flush_ms=storage_creds.get("flush-ms", 1000), 
+            durable=storage_creds.get("durable", False))
+
     # ---- HELPERS ----
     def _make_path(self, container=None, blob_path=None, snapshot=None):
         path = self.path
@@ -60,6 +186,14 @@ class FileStore(implements(StoreInterface)):
     def set_retry(self, value):
         self.retry = value
 
+    def close(self):
+        ''' flush and close all pooled append handles '''
+        self.append_handles.close_all()
+
+    def get_copy_statuses(self, container, path=None):
+        # copies complete before copy_blob returns
+        return {name: (COPY_SUCCESS, None) for name in self.list_blobs(container, path)}
+
     # ---- CONTAINER interface ----
 
     def does_container_exist(self, container):
@@ -76,6 +210,7 @@ class FileStore(implements(StoreInterface)):
 
     def delete_container(self, container):
         path = self._make_path(container)
+        self.append_handles.release_dir(path)
         return file_utils.zap_dir(path)
         
     def get_container_properties(self, container):
@@ -100,6 +235,8 @@ class FileStore(implements(StoreInterface)):
         if fail_if_exists and os.path.exists(path):
             errors.service_error("blob already exists: " + blob_path)
 
+        self.append_handles.release(path)
+
         with open(path, "wt") as outfile:
             outfile.write(text)
         return True
@@ -111,6 +248,8 @@ class FileStore(implements(StoreInterface)):
         path = self._make_path(container, blob_path)
         file_utils.ensure_dir_exists(file=path)
 
+        self.append_handles.release(path)
+
         shutil.copyfile(source_fn, path)
         return True
 
@@ -120,10 +259,23 @@ class FileStore(implements(StoreInterface)):
         and not needed in a file-system provider.
         '''
         path = self._make_path(container, blob_path)
+        if not path in self.append_handles.handles:
+            file_utils.ensure_dir_exists(file=path)
+
+        self.append_handles.append(path, text)
+        return True
+
+    def append_blob_from_bytes(self, container, blob_path, data, recreate=False):
+        '''
+        NOTE: the data could be binary, so we don't use the (text mode) append handles here
+        '''
+        path = self._make_path(container, blob_path)
         file_utils.ensure_dir_exists(file=path)
 
-        with open(path, "at") as outfile:
-            outfile.write(text)
+        self.append_handles.release(path)
+
+        with open(path, "wb" if recreate else "ab") as outfile:
+            outfile.write(data)
         return True
 
     def list_blobs(self, container, path=None, return_names=True, recursive=True):
@@ -148,6 +300,9 @@ class FileStore(implements(StoreInterface)):
         base_path = self._make_path(container)
         path_len = 1 + len(base_path)
 
+        # so listed sizes include buffered appends
+        self.append_handles.flush_all()
+
         full_path = self._make_path(container, path)
 
         rel_paths = []
@@ -201,10 +356,12 @@ class FileStore(implements(StoreInterface)):
 
     def delete_blob(self, container, blob_path, snapshot=None):
         path = self._make_path(container, blob_path, snapshot)
+        self.append_handles.release(path)
         return os.remove(path)
 
     def get_blob_text(self, container, blob_path):
         path = self._make_path(container, blob_path)
+        self.append_handles.sync(path)
         with open(path, "rt") as infile:
             text = infile.read()
         return text
@@ -215,6 +372,7 @@ class FileStore(implements(StoreInterface)):
         '''
         path = self._make_path(container, blob_path, snapshot)
         print("get_blob_to_path: full source path={}".format(path))
+        self.append_handles.sync(path)
 
         with open(path, "rb") as infile:
             data = infile.read()
@@ -222,8 +380,18 @@ class FileStore(implements(StoreInterface)):
             outfile.write(data)
         return data
 
+    def get_blob_range(self, container, blob_path, start=0, end=None):
+        path = self._make_path(container, blob_path)
+        self.append_handles.sync(path)
+
+        with open(path, "rb") as infile:
+            infile.seek(start)
+            data = infile.read() if end is None else infile.read(max(0, 1 + end - start))
+        return data
+
     def get_blob_properties(self, container, blob_path):
         path = self._make_path(container, blob_path)
+        self.append_handles.sync(path)
 
         rel_blob_path = self._make_rel_blob_path(container, path)
         blob_obj = self._make_blob_object(path, blob_path)
@@ -236,11 +404,20 @@ class FileStore(implements(StoreInterface)):
     def copy_blob(self, source_container, source_blob_path, dest_container, dest_blob_path):
         from_path = self._make_path(source_container, source_blob_path)
         dest_path = self._make_path(dest_container, dest_blob_path)
-        shutil.copyfile(from_path, dest_path)
-        return True
+
+        # flush our buffered appends to the source (and close our handle on the dest, which is replaced)
+        self.append_handles.release(from_path)
+        self.append_handles.release(dest_path)
+
+        # a real copy (not a hard link): other processes may hold append handles on the source
+        file_utils.ensure_dir_exists(file=dest_path)
+        shutil.copy2(from_path, dest_path)
+
+        return COPY_SUCCESS
 
     def snapshot_blob(self, container, blob_path):
         path = self._make_path(container, blob_path)
+        self.append_handles.sync(path)
         ss_suffix = None
 
         for i in range(1, 1000):
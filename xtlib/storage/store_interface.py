@@ -5,6 +5,28 @@
 # store_interface.py: specifies the interface for storge providers
 from interface import Interface
 
+# status of a blob copy (as returned by copy_blob and get_copy_statuses)
+COPY_SUCCESS = "success"
+COPY_PENDING = "pending"
+
+# OPTIONAL provider methods: these are not part of StoreInterface (so existing custom providers, loaded thru
+# provider-code-path, still load).  StoreBlobObjs uses them when a provider has them, and falls back otherwise:
+#
+#   close(self)
+#       release any resources held by the provider (e.g., open file handles)
+#
+#   get_copy_statuses(self, container, path=None)
+#       return a dict of blob name -> (copy status, status description) for all blobs in 'path' (a blob name prefix), 
+#       so that pending copies can be polled with a single request.
+#
+#   append_blob_from_bytes(self, container, blob_path, data, recreate=False)
+#       append 'data' (bytes) to an append blob, creating the blob if needed.  if 'recreate' is True, any existing
+#       blob is replaced by a new (empty) append blob before 'data' is appended.
+#
+#   get_blob_range(self, container, blob_path, start=0, end=None)
+#       return the bytes of the blob from offset 'start' thru 'end' (inclusive; None means the end of the blob).
+#       returns empty bytes if 'start' is at (or past) the end of the blob.
+
 class StoreInterface(Interface):
     # def __init__(self, storage_creds_dict, *args):
     #     pass
@@ -92,6 +114,10 @@ class StoreInterface(Interface):
         pass
 
     def copy_blob(self, source_container, source_blob_path, dest_container, dest_blob_path):
+        ''' 
+        start a copy of the blob; returns COPY_SUCCESS or COPY_PENDING (the copy is completing asynchronously, and is
+        polled with get_copy_statuses).  other return values (e.g., None) mean the copy has completed.
+        '''
         pass
 
     def snapshot_blob(self, container, blob_path):
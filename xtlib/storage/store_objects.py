@@ -14,10 +14,11 @@ import sys
 import time
 import json
 import shutil
+import tempfile
 import logging
+import threading
 import numpy as np
 import importlib
-from fnmatch import fnmatch
 
 from xtlib import utils
 from xtlib import errors
@@ -25,6 +26,14 @@ from xtlib import constants
 from xtlib import file_utils
 
 from xtlib.console import console
+from xtlib.storage import transfer_engine
+from xtlib.storage.store_interface import COPY_SUCCESS, COPY_PENDING
+
+# secs that a workspace found to exist is assumed to still exist
+WORKSPACE_EXISTS_TTL = 60
+
+# secs between polls of pending (asynchronous) blob copies
+COPY_POLL_INTERVAL = 2
 
 class StoreBlobObjs():
     '''
@@ -46,6 +55,15 @@ class StoreBlobObjs():
         self.max_retries = max_retries
         self.set_retries(max_retries)
 
+        # number of concurrent file transfers for multi-file uploads/downloads
+        self.transfer_workers = transfer_engine.DEFAULT_WORKERS
+
+        # compiled wildcards (by pattern)
+        self.wildcard_matchers = {}
+
+        # time each workspace was last found to exist (by name)
+        self.workspaces_found = {}
+
     def get_name(self):
         storage_name = self.provider.get_service_name()
         return storage_name
@@ -187,16 +205,24 @@ class StoreBlobObjs():
     def _read_blob(self, ws_name, blob_path):
         console.diag("_read_blob: ws_name={}, blob_path={}".format(ws_name, blob_path))
 
-        if not self.does_workspace_exist(ws_name):
-            # avoid 10 retries and unfriendly storage errors
+        # optimistic read: only check for a missing workspace/blob if the read fails
+        try:
+            blob_text = self.provider.get_blob_text(ws_name, blob_path)
+        except Exception as ex:
+            self._raise_read_error(ws_name, blob_path, ex)
+
+        return blob_text
+
+    def _raise_read_error(self, ws_name, blob_path, ex):
+        ''' map a failed blob read to a friendly error (if the workspace or blob is missing), else re-raise ex '''
+        if not self.provider.does_container_exist(ws_name):
+            self._forget_workspace(ws_name)
             errors.store_error("container doesn't exist: " + ws_name)
 
         if not self.provider.does_blob_exist(ws_name, blob_path):
-            # avoid 10 retries and unfriendly storage errors
             errors.store_error("blob doesn't exist: container={}, path={}".format(ws_name, blob_path))
 
-        blob_text = self.provider.get_blob_text(ws_name, blob_path)
-        return blob_text
+        raise ex
 
     def _list_wild_blobs(self, container, path, wc_target, include_folder_names=False):
         '''
@@ -228,7 +254,9 @@ class StoreBlobObjs():
             #console.print("case 2   : prefix=", wild_dir)
             names = self.provider.list_blobs(container, path=path, recursive=False)
             #console.print("before fnmatch, names=", names)
-            names = [name for name in names if fnmatch(name, wc_target)]
+            # wc_target is the last node of the path (and names are full blob paths)
+            is_match = file_utils.wildcard_matcher(wc_target)
+            names = [name for name in names if is_match(name.rstrip("/").rsplit("/", 1)[-1])]
         else:
             # case 1: wild_base has no wildcards
             # use delimiter-trick to limit listing to target directory only
@@ -252,21 +280,41 @@ class StoreBlobObjs():
 
         return delete_count
 
+    def _get_wildcard_matcher(self, wildcard):
+        # compile each wildcard only once
+        if not wildcard in self.wildcard_matchers:
+            self.wildcard_matchers[wildcard] = file_utils.wildcard_matcher(wildcard)
+        return self.wildcard_matchers[wildcard]
+
     def _wildcard_match_in_list(self, source, name_list):
         matches = []
 
         if name_list:
-            matches = [name for name in name_list if fnmatch(source, name)]
+            matches = [name for name in name_list if self._get_wildcard_matcher(name)(source)]
             
         return len(matches) > 0
 
     def _upload_files(self, ws_name, ws_path, source_wildcard, recursive=False, exclude_dirs_and_files=[]):
-        copied_files = []
-
         # ensure the container exists
         if not self.does_workspace_exist(ws_name):
             self.create_workspace(ws_name, description=None)
 
+        items = self._collect_upload_files(ws_path, source_wildcard, recursive, exclude_dirs_and_files)
+
+        upload = lambda source_fn, blob_path, progress_callback: \
+            self.provider.create_blob_from_path(ws_name, blob_path, source_fn)
+
+        engine = transfer_engine.TransferEngine(self.transfer_workers)
+        engine.run(items, upload)
+
+        copied_files = [source_fn for source_fn, _ in items]
+        #console.print("copied_files=", copied_files)
+        return copied_files
+
+    def _collect_upload_files(self, ws_path, source_wildcard, recursive, exclude_dirs_and_files):
+        ''' return a list of (source_fn, blob_path) for the files matching source_wildcard '''
+        items = []
+
         if source_wildcard.endswith("**"):
             # handle special "**" for recursive copy
             recursive = True
@@ -292,19 +340,14 @@ class StoreBlobObjs():
             if os.path.isfile(source_fn):
                 console.detail("uploading FILE: " + source_fn)
                 blob_path = ws_path + "/" + source_name
-                #console.print("ws_name=", ws_name, ", blob_path=", blob_path, ", source_fn=", source_fn)
-                result = self.provider.create_blob_from_path(ws_name, blob_path, source_fn)
-                #console.print("after bs.create_blob_from_path, result=", result)
-                copied_files.append(source_fn)
+                items.append((source_fn, blob_path))
             elif os.path.isdir(source_fn) and recursive:
                 # copy subdir
                 console.detail("uploading DIR: " + source_fn)
-                copied  = self._upload_files(ws_name, ws_path + "/" + source_name, source_fn + "/*", recursive=recursive, 
-                    exclude_dirs_and_files=exclude_dirs_and_files)
-                copied_files = copied_files + copied
+                items += self._collect_upload_files(ws_path + "/" + source_name, source_fn + "/*", recursive, 
+                    exclude_dirs_and_files)
 
-        #console.print("copied_files=", copied_files)
-        return copied_files
+        return items
 
     def _get_blob_dir(self, path):
         index = path.rfind("/")
@@ -326,14 +369,21 @@ class StoreBlobObjs():
         bd_index = 1 + len(blob_dir)   # add for for trailing slash
         #console.print("blob_dir=", blob_dir, ", bd_index=", bd_index)
 
+        items = []
         for bn in names:
             base_bn = bn[bd_index:]
             dest_fn = dest_folder + "/" + base_bn
             console.detail("_download_files: bn=", bn, ", dest_fn=", dest_fn)
 
+            items.append((bn, dest_fn))
+            files_copied.append(dest_fn)    
+
+        def download(bn, dest_fn, progress_callback):
             file_utils.ensure_dir_exists(file=dest_fn)
             self.provider.get_blob_to_path(container, bn, dest_fn)
-            files_copied.append(dest_fn)    
+
+        engine = transfer_engine.TransferEngine(self.transfer_workers)
+        engine.run(items, download)
 
         return files_copied
 
@@ -346,22 +396,68 @@ class StoreBlobObjs():
         #console.print("_copy_files: container=", container, ", ws_wildcard=", ws_wildcard, ", to_path=", to_path)
         names = self._list_wild_blobs(container, from_path, from_wc_target)
         #console.print("names=", names)
-        blob_dir = path
+        blob_dir = from_path.rstrip("/")
         bd_index = 1 + len(blob_dir)   # add for for trailing slash
         #console.print("blob_dir=", blob_dir, ", bd_index=", bd_index)
+        items = []
 
         for bn in names:
-            base_bn = bn[bd_index:]
+            base_bn = bn[bd_index:].lstrip("/")
             #console.print("blob_dir=", blob_dir, ", bd_index=", bd_index, ", base_bn=", base_bn)
             dest_path = to_path + "/" + base_bn
 
-            # COPY BLOB
-            self.provider.copy_blob(container, bn, container, dest_path)
-
+            items.append((container + "/" + bn, container + "/" + dest_path))
             files_copied.append(base_bn)
 
+        # COPY BLOBS
+        self._copy_blobs(items)
+
         return files_copied
 
+    def _copy_blobs(self, items, sizes=None, feedback_progress=None):
+        '''
+        copy blobs within the storage service, using a pool of workers.  'items' is a list of (source, dest) pairs, 
+        where each is a "container/blob_path" string.  Returns after all copies (including asynchronous ones) complete.
+        '''
+        pending = {}     # dest container -> blob paths of pending copies
+        lock = threading.Lock()
+
+        def copy(source, dest, progress_callback):
+            source_container, source_path = source.split("/", 1)
+            dest_container, dest_path = dest.split("/", 1)
+
+            status = self.provider.copy_blob(source_container, source_path, dest_container, dest_path)
+            # get_copy_statuses() is optional for providers (see store_interface.py)
+            if status == COPY_PENDING and getattr(self.provider, "get_copy_statuses", None):
+                with lock:
+                    pending.setdefault(dest_container, set()).add(dest_path)
+
+        engine = transfer_engine.TransferEngine(self.transfer_workers, feedback_progress=feedback_progress)
+        engine.run(items, copy, sizes=sizes)
+
+        for container, paths in pending.items():
+            self._wait_for_copies(container, paths)
+
+    def _wait_for_copies(self, container, paths):
+        ''' poll the pending copies of the blobs 'paths' (all in 'container') until they complete '''
+        # poll all copies with one listing of their common folder
+        prefix = os.path.commonprefix(list(paths))
+        prefix = prefix[0:1+prefix.rfind("/")]
+
+        while paths:
+            time.sleep(COPY_POLL_INTERVAL)
+            statuses = self.provider.get_copy_statuses(container, prefix)
+
+            for path in list(paths):
+                status, description = statuses.get(path, (None, "blob not found"))
+                if status == COPY_PENDING:
+                    continue
+
+                if status != COPY_SUCCESS:
+                    errors.store_error("copy to {}/{} failed: status={}, {}".format(container, path, status, description))
+
+                paths.remove(path)
+
     def _list_directories(self, container, path, wc_target, subdirs=0):
         console.diag("_list_directories: container={}, path={}, wc_target={}, subdirs={}".format(
             container, path, wc_target, subdirs))
@@ -398,7 +494,8 @@ class StoreBlobObjs():
 
             if wc_target:
                 # apply filter
-                blobs = [blob for blob in blobs if fnmatch(blob.name, wc_target)]
+                is_match = file_utils.wildcard_matcher(wc_target)
+                blobs = [blob for blob in blobs if is_match(blob.name)]
 
             console.diag("list_blobs returned: len(blobs)={}".format(len(blobs)))
 
@@ -434,8 +531,28 @@ class StoreBlobObjs():
         return first_dir, rest
 
     def _build_folders_from_blobs(self, blobs, ws_name, base_path, subdirs):
+        '''
+        build the list of folders (with their "dirs" and "files") for 'blobs' in a single pass.  The child dir names 
+        of each folder are also indexed in a set, and the walk up the parent folders of a blob stops at the first 
+        folder that already has the child dir (its ancestors were linked when that child was first added).
+        '''
         folders_by_name = {}
         folders = []    # ordered list of folders
+        dir_sets = {}   # id(folder) -> set of its child dir names
+
+        def add_dir(folder, child_name):
+            ''' add child_name to folder's dirs; returns False if it was already there '''
+            names = dir_sets.get(id(folder))
+            if names is None:
+                names = set(folder["dirs"])
+                dir_sets[id(folder)] = names
+
+            if child_name in names:
+                return False
+
+            names.add(child_name)
+            folder["dirs"].append(child_name)
+            return True
 
         base_len = len(base_path)
         if base_path.endswith("*"):
@@ -452,7 +569,6 @@ class StoreBlobObjs():
             #console.print("full_blob_path=", full_blob_path)
 
             file_path = os.path.dirname(full_blob_path)
-            parent_path = os.path.dirname(file_path)
 
             if subdirs or file_path == base_path:
                 # add file to its folder
@@ -467,6 +583,7 @@ class StoreBlobObjs():
             if subdirs:
                 # add all path parts to their parent folders
                 child_path = file_path
+                parent_path = os.path.dirname(file_path)
 
                 while len(parent_path) >= len(base_path):    # and parent_path != "/":
                     #console.print("  parent_path=", parent_path, ", child_path=", child_path, ", base_path=", base_path)
@@ -475,11 +592,10 @@ class StoreBlobObjs():
                     else:
                         parent_folder = base_folder
 
-                    # add child dir, if needed
+                    # add child dir, if needed (if already there, all of the levels above are already linked)
                     child_name = os.path.basename(child_path)
-                    dirs = parent_folder["dirs"]
-                    if not child_name in dirs:
-                        dirs.append(child_name)
+                    if not add_dir(parent_folder, child_name):
+                        break
 
                     # stop when base_path folder has been added to
                     if parent_path == base_path:
@@ -495,10 +611,7 @@ class StoreBlobObjs():
                 #console.print("FIRST left_most_path=", left_most_path, ", rest=", rest)
                 if left_most_path:
                     # add child dir, if needed
-                    dirs = base_folder["dirs"]
-                    child_name = os.path.basename(left_most_path)
-                    if not child_name in dirs:
-                        dirs.append(child_name)
+                    add_dir(base_folder, os.path.basename(left_most_path))
         
         return folders
 
@@ -547,6 +660,46 @@ class StoreBlobObjs():
         self.provider.set_retry(utils.make_retry_func(count))
 
         return old_count
+
+    def close(self):
+        ''' release resources held by the storage provider (flushes pending appends for the file provider) '''
+        # close() is optional for providers (see store_interface.py)
+        close = getattr(self.provider, "close", None)
+        if close:
+            close()
+
+    def _get_blob_range(self, container, blob_path, start=0, end=None):
+        ''' return the bytes of the blob from offset 'start' thru 'end' (inclusive; None means the end of the blob) '''
+        get_blob_range = getattr(self.provider, "get_blob_range", None)
+        if get_blob_range:
+            return get_blob_range(container, blob_path, start, end)
+
+        # providers without the (optional) get_blob_range: read the whole blob
+        with tempfile.TemporaryDirectory() as temp_dir:
+            fn = os.path.join(temp_dir, "blob")
+            self.provider.get_blob_to_path(container, blob_path, fn)
+
+            with open(fn, "rb") as infile:
+                data = infile.read()
+
+        return data[start:] if end is None else data[start:end+1]
+
+    def _append_blob_bytes(self, container, blob_path, data, recreate=False):
+        ''' append 'data' (bytes) to the blob (replacing any existing blob if 'recreate' is True) '''
+        append_blob_from_bytes = getattr(self.provider, "append_blob_from_bytes", None)
+        if append_blob_from_bytes:
+            return append_blob_from_bytes(container, blob_path, data, recreate=recreate)
+
+        # providers without the (optional) append_blob_from_bytes: rewrite the whole blob
+        if not recreate and self.provider.does_blob_exist(container, blob_path):
+            data = self._get_blob_range(container, blob_path) + data
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            fn = os.path.join(temp_dir, "blob")
+            with open(fn, "wb") as outfile:
+                outfile.write(data)
+
+            return self.provider.create_blob_from_path(container, blob_path, fn)
         
     def list_blobs(self, container, blob_path, return_names=True):
         blobs  = self.provider.list_blobs(container, path=blob_path, return_names=return_names)
@@ -617,7 +770,21 @@ class StoreBlobObjs():
     def does_workspace_exist(self, ws_name):
         #console.print("does_workspace_exist: ws_name=", ws_name)
         self._check_ws_name(ws_name)
-        return self.provider.does_container_exist(ws_name)
+
+        # only existing workspaces are cached (so a newly created workspace is seen right away)
+        checked = self.workspaces_found.get(ws_name)
+        if checked and time.time() - checked < WORKSPACE_EXISTS_TTL:
+            return True
+
+        exists = self.provider.does_container_exist(ws_name)
+        if exists:
+            self.workspaces_found[ws_name] = time.time()
+
+        return exists
+
+    def _forget_workspace(self, ws_name):
+        if ws_name in self.workspaces_found:
+            del self.workspaces_found[ws_name]
 
     def ensure_workspace_exists(self, ws_name, flag_as__error=True):
         self._check_ws_name(ws_name)
@@ -667,6 +834,7 @@ class StoreBlobObjs():
             self.provider.delete_blob(constants.INFO_CONTAINER, name)
 
     def delete_workspace(self, ws_name):
+        self._forget_workspace(ws_name)
         result = self.provider.delete_container(ws_name)    
 
         if not result:
@@ -735,46 +903,77 @@ class StoreBlobObjs():
         for blob in blobs:
             self.provider.delete_blob(ws_name, blob)   
 
-    def copy_run(self, source_workspace_name, source_run_name, dest_workspace_name, dest_run_name):
+    def copy_run(self, source_workspace_name, source_run_name, dest_workspace_name, dest_run_name, dry_run=False, 
+        feedback_progress=None):
+        '''
+        copy the blobs of a run to a new run (concurrently, and server-side when supported by the provider).  
+        returns a dict with the number of "blobs" and total "bytes" of the run; when 'dry_run' is True, nothing is copied.
+        '''
         if self.does_run_exist(dest_workspace_name, dest_run_name):
              errors.store_error("destination run already exists: ws={}, run={}".format(dest_workspace_name, dest_run_name))
 
-        # copy a single blob at a time
-        #for source_blob_path in self.bs.list_blob_names(source_workspace_name, source_run_name):
-        for source_blob in self.provider.list_blobs(source_workspace_name, path=self._run_path(source_run_name)  + "/"):
-            dest_blob_path = self._run_path(dest_run_name)  + "/" + self._remove_first_node(source_blob)
+        source_path = self._run_path(source_run_name) + "/"
+        dest_path = self._run_path(dest_run_name) + "/"
 
-            # copy single blob within same storage service
-            self.provider.copy_blob(source_workspace_name, source_blob, dest_workspace_name, dest_blob_path)
+        blobs = self.provider.list_blobs(source_workspace_name, path=source_path, return_names=False)
+        sizes = [blob.properties.content_length for blob in blobs]
+        totals = {"blobs": len(blobs), "bytes": sum(sizes)}
 
-    def get_run_log(self, ws_name, run_name):
+        if not dry_run:
+            items = [(source_workspace_name + "/" + blob.name, dest_workspace_name + "/" + dest_path + blob.name[len(source_path):]) 
+                for blob in blobs]
+
+            self._copy_blobs(items, sizes, feedback_progress)
+
+        return totals
+
+    def _read_run_log_range(self, ws_name, run_name, start=0):
+        ''' return the bytes of the run log, starting at byte offset 'start' '''
         blob_path = self._run_path(run_name) + "/" + constants.RUN_LOG
-        
-        if not self.provider.does_blob_exist(ws_name, blob_path):
-            # limited support for old-style run logging 
-            blob_path = run_name + "/" + constants.RUN_LOG
 
-        #console.print("blob_path=", blob_path)
-        if not self.provider.does_blob_exist(ws_name, blob_path):
-            errors.store_error("unknown run: ws={}, run_name={}".format(ws_name, run_name))
+        # optimistic read (the provider handles 0-length blobs)
+        try:
+            data = self._get_blob_range(ws_name, blob_path, start)
+        except Exception as ex:
+            if self.provider.does_blob_exist(ws_name, blob_path):
+                raise ex
+
+            # limited support for old-style run logging 
+            legacy_path = run_name + "/" + constants.RUN_LOG
+            if not self.provider.does_blob_exist(ws_name, legacy_path):
+                errors.store_error("unknown run: ws={}, run_name={}".format(ws_name, run_name))
 
-        #console.print("get_run_log: ws_name=", ws_name, ", blob_path=", blob_path)
+            data = self._get_blob_range(ws_name, legacy_path, start)
 
-        # watch out for 0-length blobs (azure will throw retryable exception if you use "get_blob_to_text")
-        blob = self.provider.get_blob_properties(ws_name, blob_path)
-        #console.print("blob.properties.content_length=", blob.properties.content_length)
-        lines = []
+        return data
 
-        if blob.properties.content_length:
-            text = self.provider.get_blob_text(ws_name, blob_path)
-            #console.print("get_run_log: text=", text)
+    def get_run_log(self, ws_name, run_name):
+        data = self._read_run_log_range(ws_name, run_name)
+        #console.print("get_run_log: ws_name=", ws_name, ", run_name=", run_name)
 
-            lines = text.split("\n")
-            #console.print("lines=", lines)
-            lines = [json.loads(line) for line in lines if line.strip()]
+        lines = data.decode("utf-8").split("\n") if data else []
+        #console.print("lines=", lines)
+        lines = [json.loads(line) for line in lines if line.strip()]
 
         return lines
 
+    def tail_run_log(self, ws_name, run_name, offset=0):
+        '''
+        return (records, next_offset) for the complete records appended to the run log at or after byte 'offset'.  
+        Only this part of the log is read (a ranged read), so the cost of each poll doesn't grow with the size of the log.
+        '''
+        data = self._read_run_log_range(ws_name, run_name, offset)
+
+        # only consume complete lines (a record may be in the middle of being appended)
+        end = data.rfind(b"\n")
+        if end == -1:
+            return [], offset
+
+        lines = data[:end].decode("utf-8").split("\n")
+        records = [json.loads(line) for line in lines if line.strip()]
+
+        return records, offset + end + 1
+
     # def create_run_directory(self, ws_name, run_name):
     #     pass   # nothing to do for blobs here
 
@@ -875,6 +1074,29 @@ class StoreBlobObjs():
             run_names = []
         return run_names
 
+    # ---- CODE BLOBS ----
+
+    def get_code_blob_hashes(self, ws_name):
+        ''' return the set of hashes of the content-addressed code blobs already stored in the workspace '''
+        names = self.provider.list_blobs(ws_name, path=constants.CODE_BLOBS_DIR + "/")
+        return set([os.path.basename(name) for name in names])
+
+    def upload_code_blobs(self, ws_name, items, sizes=None, feedback_progress=None):
+        ''' upload each (source_fn, file_hash) of 'items' as the code blob for that hash, using a pool of workers '''
+        upload = lambda source_fn, file_hash, progress_callback: \
+            self.provider.create_blob_from_path(ws_name, constants.CODE_BLOBS_DIR + "/" + file_hash, source_fn)
+
+        engine = transfer_engine.TransferEngine(self.transfer_workers, feedback_progress=feedback_progress)
+        engine.run(items, upload, sizes=sizes)
+
+    def download_code_blobs(self, ws_name, items):
+        ''' download each (file_hash, dest_fn) of 'items' from the code blobs of the workspace, using a pool of workers '''
+        download = lambda file_hash, dest_fn, progress_callback: \
+            self.provider.get_blob_to_path(ws_name, constants.CODE_BLOBS_DIR + "/" + file_hash, dest_fn)
+
+        engine = transfer_engine.TransferEngine(self.transfer_workers)
+        engine.run(items, download)
+
     # ---- DIRECT ACCESS ----
 
     def read_store_file(self, ws, path):
@@ -955,6 +1177,10 @@ class BlobsObject():
         path = self._expand_path(fn)
         return self.store._append_blob(self.container, path, text)
 
+    def append_bytes(self, fn, data, recreate=False):
+        path = self._expand_path(fn)
+        return self.store._append_blob_bytes(self.container, path, data, recreate=recreate)
+
     def read_file(self, fn):
         path = self._expand_path(fn)
         return self.store._read_blob(self.container, path)
@@ -1125,6 +1351,14 @@ class BlobsObject():
 
         return self.store.provider.does_blob_exist(container, path)
 
+    def get_file_properties(self, fn):
+        ''' return the blob object (with .properties.content_length and .properties.last_modified) for fn '''
+        container, path, wc_target = self._get_container_path_target(fn)
+        if wc_target:
+            errors.internal_error("wildcard cannot be specified here")
+
+        return self.store.provider.get_blob_properties(container, path)
+
     def list_directories(self, path, subdirs=0):
         container, path, wc_target = self._get_container_path_target(path)
 
@@ -0,0 +1,186 @@
+#
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+#
+# transfer_engine.py: concurrent multi-file upload/download (per-file retries, aggregate progress, resume)
+import os
+import time
+import random
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from xtlib import errors
+from xtlib.console import console
+
+DEFAULT_WORKERS = 8
+DEFAULT_RETRIES = 3
+
+# status of each file after a transfer
+COPIED = "copied"
+SKIPPED = "skipped"
+FAILED = "failed"
+
+# allowed clock skew (secs) between local files and storage blobs, when comparing modified times
+MTIME_TOLERANCE = 2
+
+# min secs between redraws of the aggregate progress line
+PROGRESS_INTERVAL = .25
+
+def get_timestamp(dt):
+    ''' return the POSIX timestamp of a datetime (naive values are treated as local time) '''
+    return dt.timestamp() if dt else 0
+
+def is_copy_current(source_size, source_mtime, dest_size, dest_mtime):
+    ''' a destination file is current if it has the same size as its source and is not older than it '''
+    return source_size == dest_size and dest_mtime + MTIME_TOLERANCE >= source_mtime
+
+def is_local_copy_current(blob_props, dest_fn):
+    ''' returns True if the local file 'dest_fn' is a current copy of the blob described by 'blob_props' '''
+    if not os.path.isfile(dest_fn):
+        return False
+
+    props = blob_props.properties
+    return is_copy_current(props.content_length, get_timestamp(props.last_modified),
+        os.path.getsize(dest_fn), os.path.getmtime(dest_fn))
+
+def is_blob_copy_current(source_fn, blob_props):
+    ''' returns True if the blob described by 'blob_props' is a current copy of the local file 'source_fn' '''
+    props = blob_props.properties
+    return is_copy_current(os.path.getsize(source_fn), os.path.getmtime(source_fn),
+        props.content_length, get_timestamp(props.last_modified))
+
+class TransferEngine():
+    '''
+    Copies a list of files with a pool of worker threads, so that transfers of many small files are
+    not bound by the latency of each storage request.  Each file is retried (with jittered backoff) on failure,
+    and progress is reported for the transfer as a whole (files and bytes) thru an optional FeedbackProgress.
+    '''
+    def __init__(self, workers=DEFAULT_WORKERS, retries=DEFAULT_RETRIES, feedback_progress=None, file_callback=None):
+        self.workers = max(1, workers or DEFAULT_WORKERS)
+        self.retries = retries
+        self.feedback_progress = feedback_progress
+        self.file_callback = file_callback
+
+        self.lock = Lock()
+        self.cancelled = False
+
+    def run(self, items, transfer_func, is_current_func=None, sizes=None):
+        '''
+        copy each (source, dest) pair in 'items' by calling transfer_func(source, dest, progress_callback).
+
+        if 'is_current_func' is specified (resume mode), it is called as is_current_func(source, dest) and files for
+        which it returns True are skipped.  'sizes' is an optional list of file sizes (in bytes), used to report byte
+        progress.  Returns a list of (source, dest, status) tuples, in the order of 'items'.
+        '''
+        self.files_total = len(items)
+        self.files_done = 0
+        self.sizes = sizes
+        self.bytes_total = sum(sizes) if sizes else 0
+        self.bytes_by_file = [0]*len(items)
+        self.last_progress = 0
+        self.cancelled = False
+
+        results = [None]*len(items)
+        failures = []
+
+        if self.feedback_progress:
+            self.feedback_progress.start()
+
+        def process(index):
+            source, dest = items[index]
+            status, ex = self.transfer_with_retries(index, source, dest, transfer_func, is_current_func)
+            results[index] = (source, dest, status)
+
+            if ex:
+                failures.append((source, ex))
+
+            self.on_file_done(index, source, dest, status)
+
+        workers = min(self.workers, len(items))
+        if workers <= 1:
+            for index in range(len(items)):
+                process(index)
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(process, index) for index in range(len(items))]
+                try:
+                    for future in as_completed(futures):
+                        future.result()
+                except BaseException:
+                    # stop workers from starting new files (e.g., on Ctrl-C)
+                    self.cancelled = True
+                    for future in futures:
+                        future.cancel()
+                    raise
+
+        if self.feedback_progress:
+            self.update_progress(force=True)
+            self.feedback_progress.end()
+
+        if failures:
+            source, ex = failures[0]
+            errors.store_error("{} of {} files could not be transferred (first error: {}: {})".format(len(failures),
+                len(items), source, ex))
+
+        return results
+
+    def transfer_with_retries(self, index, source, dest, transfer_func, is_current_func):
+        if self.cancelled:
+            return FAILED, Exception("transfer cancelled")
+
+        def progress_callback(current=0, total=0, status=None):
+            if not status:
+                with self.lock:
+                    self.bytes_by_file[index] = current
+                self.update_progress()
+
+        for attempt in range(1 + self.retries):
+            try:
+                if is_current_func and is_current_func(source, dest):
+                    return SKIPPED, None
+
+                transfer_func(source, dest, progress_callback)
+                return COPIED, None
+
+            except errors.XTUserException as ex:
+                # not a transient error
+                return FAILED, ex
+
+            except Exception as ex:
+                if attempt >= self.retries:
+                    return FAILED, ex
+
+                backoff = random.uniform(0, min(30, 2**attempt))
+                console.diag("transfer of {} failed (attempt {}), retrying in {:.2f} secs: {}".format(source, 1+attempt,
+                    backoff, ex))
+
+                with self.lock:
+                    self.bytes_by_file[index] = 0
+                time.sleep(backoff)
+
+    def on_file_done(self, index, source, dest, status):
+        with self.lock:
+            self.files_done += 1
+            if self.sizes and status != FAILED:
+                self.bytes_by_file[index] = self.sizes[index]
+
+            if self.feedback_progress:
+                self.feedback_progress.erase_last_msg()
+
+            if self.file_callback:
+                self.file_callback(index, source, dest, status)
+
+        self.update_progress(force=True)
+
+    def update_progress(self, force=False):
+        if not self.feedback_progress:
+            return
+
+        with self.lock:
+            now = time.time()
+            if not force and now - self.last_progress < PROGRESS_INTERVAL:
+                return
+            self.last_progress = now
+
+            bytes_done = sum(self.bytes_by_file)
+            self.feedback_progress.files_progress(self.files_done, self.files_total, bytes_done, self.bytes_total)
@@ -141,6 +141,9 @@ def format_elapsed_hms(elapsed, include_fraction=False):
 
     return value
 
+# azure storage response codes that will not succeed on retry: 404 (not found), 412 (condition not met), 416 (bad range)
+NON_RETRYABLE_STATUS = [404, 412, 416]
+
 def make_retry_func(max_retries=8):
     #max_retries = 8     # 95 secs total retry time
     #console.print("received max_retries=", max_retries)
@@ -156,6 +159,10 @@ def make_retry_func(max_retries=8):
         if context.response and context.response.status:
             status = context.response.status
 
+        if status in NON_RETRYABLE_STATUS:
+            # expected answers (e.g., blob not found, or the ranged GET of a 0-length blob); let the caller handle them
+            return None
+
         with open(constants.AZURE_ERRORS_FN, "a") as errfile:
             error_time = time.time()
             exception_msg = sys.exc_info()[1]